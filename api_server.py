@@ -1,7 +1,22 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, redirect, stream_with_context
+import argparse
 import time
 import logging
 
+from autoscaler import Autoscaler, parse_shape
+from cluster_state import DEFAULT_PRIORITY, PRIORITY_CLASSES, ClusterState
+from health_monitor import HealthMonitor
+from metrics import CONTENT_TYPE, REGISTRY, Counter, Gauge, Histogram
+from pending import PendingQueue
+from preemption import Preemptor
+from resources import normalize_resources, parse_count, parse_resources
+from scheduler import Scheduler, POLICIES
+from usage import UsageStore
+from watch import (EventLog, ResourceVersionExpired, SSE_KEEPALIVE,
+                   format_expired, format_sse, parse_watch_params)
+from wal import WriteAheadLog
+from replication import Replicator
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -11,247 +26,820 @@ logger = logging.getLogger('api_server')
 
 app = Flask(__name__)
 
-nodes = []  # List of all registered nodes
-pods = []   # List of all pods launched
-node_heartbeat = {}  # Track heartbeats: {node_id: last_seen_timestamp}
-node_id_counter = 1
-pod_id_counter = 1
+state = ClusterState()  # Indexed store of all nodes, pods and heartbeats
+scheduler = Scheduler(state)  # Capacity-indexed pod placement
+pending = PendingQueue(state, scheduler)  # Pods waiting for capacity
+preemptor = Preemptor(state, scheduler, pending)  # Evicts lower-priority pods to make room
+monitor = HealthMonitor(state, scheduler=scheduler, queue=pending)  # Marks nodes unhealthy and reschedules their pods
+events = EventLog(state)  # Change feed served by /watch
+usage = UsageStore(state)  # CPU cores each pod actually uses, from heartbeats
+wal = None  # WriteAheadLog once persistence is enabled
+replica = None  # Replicator once replication is enabled
+autoscaler = None  # Autoscaler once autoscaling is enabled
+commit_logs = []  # Logs a change must reach before its request is answered
+commit_timeout = 10  # Seconds a write waits for its commit before failing with a 503
+
+# Reply to a write whose commit did not happen in time; it may still take effect later
+COMMIT_FAILED = "The change was not committed: leadership was lost or no majority answered in time"
+
+REQUESTS = Counter("cluster_http_requests_total", "Requests served, by route, method and status",
+                   ("route", "method", "status"))
+REQUEST_SECONDS = Histogram("cluster_http_request_duration_seconds",
+                            "Time to serve a request, including the wait for its commit", ("route", "method"))
+HEARTBEATS = Counter("cluster_heartbeats_total", "Heartbeats recorded from registered nodes")
+USAGE_SAMPLES = Counter("cluster_pod_usage_samples_total", "Pod CPU usage samples recorded from heartbeats")
+
+def _summary_metric(read):
+    return lambda: read(state.summary())
+
+Gauge("cluster_nodes", "Registered nodes by health status",
+      _summary_metric(lambda s: {("Healthy",): s["healthy_nodes"], ("Unhealthy",): s["unhealthy_nodes"]}),
+      ("status",))
+Gauge("cluster_cpu_cores", "CPU cores of all nodes, total and still free",
+      _summary_metric(lambda s: {("total",): s["total_cores"], ("available",): s["available_cores"]}),
+      ("state",))
+Gauge("cluster_cpu_utilization", "Fraction of all CPU cores held by pods",
+      _summary_metric(lambda s: s["utilization"]))
+Gauge("cluster_resources", "Non-CPU resources of all nodes, total and still free",
+      _summary_metric(lambda s: {(name, kind): amounts[kind] for name, amounts in s["resources"].items()
+                                 for kind in ("total", "available")}),
+      ("resource", "state"))
+Gauge("cluster_pods", "Pods placed on nodes", _summary_metric(lambda s: s["total_pods"]))
+Gauge("cluster_pending_pods", "Pods waiting in the pending queue by priority class",
+      lambda: {(priority,): depth for priority, depth in pending.depth.items()}, ("priority",))
+Gauge("cluster_pending_oldest_wait_seconds", "How long the oldest pending pod has waited",
+      lambda: next((time.time() - entry["enqueued_at"] for entry in pending.iter_entries()), 0.0))
+Gauge("cluster_pods_reporting_usage", "Pods with CPU usage samples", lambda: len(usage.rows))
+
+# Seconds between keepalive comments on an idle watch stream
+WATCH_KEEPALIVE = 15
+
+# (path, method, handler) for every endpoint. Handlers take the request data
+# (JSON body or query arguments) and return (body, status); they are served
+# by the Flask app below and by async_server.py, always under the state lock.
+ROUTES = []
+
+# Replica-to-replica endpoints, registered the same way. They are served by
+# every replica and never wait for commits.
+INTERNAL_ROUTES = []
+
+def route(path, method='GET', internal=False):
+    """Register a handler for an endpoint"""
+    def register(handler):
+        (INTERNAL_ROUTES if internal else ROUTES).append((path, method, handler))
+        return handler
+    return register
+
+def enable_persistence(data_dir, fsync=True, snapshot_every=100000):
+    """
+    Recover the cluster from data_dir and log every later change there
+
+    Must be called before the server starts handling requests.
+    """
+    global wal
+    wal = WriteAheadLog(state, data_dir, fsync=fsync, snapshot_every=snapshot_every)
+    wal.start()
+    commit_logs.append(wal)
+    return wal
+
+def enable_replication(self_url, peers):
+    """
+    Run this server as one replica of a replicated control plane
+
+    The replica elects a leader with its peers; only the leader accepts
+    writes and runs the health monitor. Call start_background() to begin.
+    """
+    global replica
+    replica = Replicator(state, monitor, self_url, peers)
+    commit_logs.append(replica)
+    return replica
+
+def enable_autoscaling(manager, **options):
+    """
+    Add and remove nodes through a NodeManager as demand changes
+
+    Options are passed to Autoscaler. With replication, only the leader
+    acts. Call start_background() to begin.
+    """
+    global autoscaler
+    autoscaler = Autoscaler(state, scheduler, pending, manager,
+                            active=lambda: replica is None or replica.is_leader(), **options)
+    return autoscaler
+
+def enable_usage_packing(overcommit):
+    """
+    Pack CPU-only pods by the cores they actually use, up to overcommit times each node's cores
+
+    Pending pods are retried whenever usage estimates change.
+    """
+    with state.lock:
+        scheduler.pack_by_usage(usage, overcommit)
+        usage.subscribe(lambda changes: pending.capacity_changed())
+
+def add_server_arguments(parser):
+    """Add the persistence and replication options shared by every server mode"""
+    parser.add_argument("--data-dir", help="Persist the cluster state in this directory")
+    parser.add_argument("--no-fsync", action="store_true",
+                        help="Do not force log commits to disk (faster, may lose recent changes on a crash)")
+    parser.add_argument("--peers", nargs="+", default=[],
+                        help="URLs of the other replicas; enables replication")
+    parser.add_argument("--advertise", help="URL peers reach this replica at (default http://127.0.0.1:PORT)")
+    parser.add_argument("--commit-timeout", type=float, default=10,
+                        help="Seconds a write waits for a majority of replicas (or the disk) before failing")
+    parser.add_argument("--autoscale", choices=["docker", "fake"],
+                        help="Add and remove nodes automatically, as Docker containers or in-process fakes")
+    parser.add_argument("--node-shapes", nargs="+", default=["8"],
+                        help="Node shapes the autoscaler may add, e.g. 4 16 32:memory=131072")
+    parser.add_argument("--min-nodes", type=int, default=0, help="Fewest nodes the autoscaler keeps")
+    parser.add_argument("--max-nodes", type=int, default=100, help="Most nodes the autoscaler grows to")
+    parser.add_argument("--warm-nodes", type=int, default=0,
+                        help="Idle nodes of each shape the autoscaler keeps launched, so adding a node only claims one")
+    parser.add_argument("--overcommit", type=float, metavar="RATIO",
+                        help="Place CPU-only pods by their observed usage, requesting up to RATIO times each node's cores")
+
+def configure(args):
+    """Apply the options added by add_server_arguments"""
+    global commit_timeout
+    commit_timeout = args.commit_timeout
+    if args.data_dir:
+        enable_persistence(args.data_dir, fsync=not args.no_fsync)
+    if args.peers:
+        enable_replication(args.advertise or "http://127.0.0.1:{}".format(args.port), args.peers)
+    if args.autoscale:
+        from node_manager import DockerBackend, FakeBackend, NodeManager
+        backend = DockerBackend() if args.autoscale == "docker" else FakeBackend()
+        shapes = [parse_shape(shape) for shape in args.node_shapes]
+        manager = NodeManager(backend, pool_size=args.warm_nodes, shapes=shapes)
+        enable_autoscaling(manager, shapes=shapes,
+                           min_nodes=args.min_nodes, max_nodes=args.max_nodes)
+    if args.overcommit:
+        enable_usage_packing(args.overcommit)
+
+def start_background():
+    """Start the health monitor, or the replica, which runs it while leading, and the autoscaler"""
+    if replica:
+        replica.start()
+    else:
+        monitor.start()
+    if autoscaler:
+        autoscaler.manager.fill_pool()
+        autoscaler.start()
+
+def stop_background():
+    if autoscaler:
+        autoscaler.stop()
+        autoscaler.manager.shutdown()
+    if replica:
+        replica.stop()
+    else:
+        monitor.stop()
+    if wal:
+        wal.stop()
+
+def execute(handler, data):
+    """
+    Run a handler under the cluster state lock
+
+    Pending pods are then placed in the same critical section if the
+    handler freed or added capacity, so they wait no longer than the
+    request that made room for them.
+
+    Returns:
+        (body, status, [(log, position its changes must reach before replying)])
+    """
+    with state.lock:
+        before = [log.lsn for log in commit_logs]
+        body, status = handler(data)
+        if replica is None or replica.is_leader():
+            pending.drain()
+        # Only requests that changed something wait for a commit
+        return body, status, [(log, log.lsn) for log, lsn in zip(commit_logs, before) if log.lsn != lsn]
+
+def observe_request(path, method, status, started):
+    """Count a served request and record its latency from a perf_counter() start"""
+    REQUESTS.labels(path, method, status).inc()
+    REQUEST_SECONDS.labels(path, method).observe(time.perf_counter() - started)
+
+def render_metrics():
+    """Return every metric in the Prometheus text format"""
+    with state.lock:
+        return REGISTRY.render()
+
+def wait_committed(positions, timeout=None):
+    """
+    Wait until each log reaches its position
+
+    Returns:
+        False if one never will, or not within timeout seconds (default commit_timeout)
+    """
+    deadline = time.time() + (commit_timeout if timeout is None else timeout)
+    return all(log.wait_durable(lsn, max(0, deadline - time.time())) for log, lsn in positions)
+
+def dispatch(handler, data):
+    """Run a handler under the cluster state lock and wait until its changes are committed"""
+    body, status, positions = execute(handler, data)
+    # Outside the lock, so requests arriving meanwhile join the same commit
+    if not wait_committed(positions):
+        return {"message": COMMIT_FAILED}, 503
+    return body, status
+
+def forward_to(path, method):
+    """
+    Return where a request must be sent instead of being served here
+
+    Followers serve reads themselves but forward writes to the leader.
+
+    Returns:
+        None to serve the request here, the leader URL, or "" if no leader is known
+    """
+    if replica is None or method != 'POST' or replica.is_leader():
+        return None
+    return replica.leader_url or ""
 
 @app.route('/')
 def home():
     return "Welcome to the Cluster API Server"
 
-@app.route('/add_node', methods=['POST'])
-def add_node():
-    global node_id_counter
-    data = request.get_json()
+@route('/add_node', 'POST')
+def add_node(data):
     cpu_cores = data.get('cpu_cores')
 
     if cpu_cores is None:
-        return jsonify({"message": "CPU cores must be provided"}), 400
+        return {"message": "CPU cores must be provided"}, 400
     
     try:
-        cpu_cores = int(cpu_cores)
-    except ValueError:
-        return jsonify({"message": "CPU cores must be an integer"}), 400
-
-    node = {
-        "id": "node-{}".format(node_id_counter),
-        "cpu_cores": cpu_cores,
-        "available_cores": cpu_cores,
-        "pods": []
-    }
-    node_id_counter += 1
-    nodes.append(node)
-    node_heartbeat[node["id"]] = time.time()  # Initialize heartbeat
+        cpu_cores = parse_count(cpu_cores, "CPU cores")
+    except ValueError as e:
+        return {"message": str(e)}, 400
 
-    logger.info("Node added: {} with {} CPU cores".format(node["id"], cpu_cores))
-    return jsonify({"message": "Node added successfully", "node_id": node["id"]}), 200
+    try:
+        resources = parse_resources(data)
+    except ValueError as e:
+        return {"message": str(e)}, 400
+
+    node = state.add_node(cpu_cores, resources=resources)
 
-@app.route('/remove_node', methods=['POST'])
-def remove_node():
-    data = request.get_json()
+    logger.info("Node added: {} with {} CPU cores{}".format(
+        node.id, cpu_cores, " and {}".format(resources) if resources else ""))
+    return {"message": "Node added successfully", "node_id": node.id}, 200
+
+@route('/remove_node', 'POST')
+def remove_node(data):
     node_id = data.get("node_id")
     
     if not node_id:
-        return jsonify({"message": "Node ID must be provided"}), 400
-    
-    # Find the node to remove
-    node_to_remove = None
-    for node in nodes:
-        if node["id"] == node_id:
-            node_to_remove = node
-            break
+        return {"message": "Node ID must be provided"}, 400
+    if not isinstance(node_id, str):
+        return {"message": "Node ID must be a string"}, 400
     
+    node_to_remove = state.get_node(node_id)
     if not node_to_remove:
-        return jsonify({"message": "Node not found"}), 404
+        return {"message": "Node not found"}, 404
     
     # Check if the node has pods
-    if node_to_remove["pods"]:
+    if node_to_remove.pods:
         force = data.get("force", False)
         if not force:
-            return jsonify({
+            return {
                 "message": "Node has pods. Use force=true to remove anyway.",
-                "pods": node_to_remove["pods"]
-            }), 409
+                "pods": list(node_to_remove.pods)
+            }, 409
         
-        # Handle pods on the node being removed
-        for pod_id in node_to_remove["pods"]:
-            # Find the pod
-            pod_to_reschedule = None
-            for pod in pods:
-                if pod["id"] == pod_id:
-                    pod_to_reschedule = pod
-                    break
-            
-            if pod_to_reschedule:
-                # Try to reschedule the pod
-                rescheduled = False
-                for other_node in nodes:
-                    # Skip the node being removed
-                    if other_node["id"] == node_id:
-                        continue
-                    
-                    # If the node has enough resources, reschedule the pod
-                    if other_node["available_cores"] >= pod_to_reschedule["cpu_cores"]:
-                        # Update pod assignment
-                        pod_to_reschedule["assigned_node"] = other_node["id"]
-                        
-                        # Update node resources
-                        other_node["available_cores"] -= pod_to_reschedule["cpu_cores"]
-                        other_node["pods"].append(pod_id)
-                        
-                        rescheduled = True
-                        logger.info("Pod {} rescheduled from node {} to node {}".format(
-                            pod_id, node_id, other_node["id"]))
-                        break
-                
-                # If pod couldn't be rescheduled, remove it
-                if not rescheduled:
-                    pods.remove(pod_to_reschedule)
-                    logger.warning("Pod {} removed because no suitable node available".format(pod_id))
+        # Keep new placements off the node being removed
+        scheduler.cordon(node_id)
+
+        # Reschedule the node's pods as one batch, largest first
+        pod_ids = list(node_to_remove.pods)
+        unplaced = scheduler.reschedule(pod_ids)
+        logger.info("{} pods rescheduled from node {}".format(len(pod_ids) - len(unplaced), node_id))
+        for pod_id in unplaced:
+            # If pod couldn't be rescheduled, remove it
+            state.remove_pod(pod_id)
+            logger.warning("Pod {} removed because no suitable node available".format(pod_id))
     
     # Remove the node
-    nodes.remove(node_to_remove)
-    if node_id in node_heartbeat:
-        del node_heartbeat[node_id]
+    state.remove_node(node_id)
     
     logger.info("Node {} removed from the cluster".format(node_id))
-    return jsonify({"message": "Node removed successfully"}), 200
+    return {"message": "Node removed successfully"}, 200
 
-@app.route('/heartbeat', methods=['POST'])
-def heartbeat():
-    data = request.get_json()
+def _node_pods(node_id):
+    """Return {pod_id: cpu_cores} of the pods on a node, so its agent knows what to report"""
+    return {pod_id: state.pods[pod_id].cpu_cores for pod_id in state.pods_on_node(node_id)}
+
+@route('/heartbeat', 'POST')
+def heartbeat(data):
     node_id = data.get("node_id")
-    if node_id not in node_heartbeat:
-        return jsonify({"message": "Node not found"}), 404
+    current_time = time.time()
+    try:
+        # When the node sent it (a heartbeat may be delayed in transit); never in the future
+        timestamp = min(float(data.get("timestamp", current_time)), current_time)
+    except (TypeError, ValueError):
+        return {"message": "Heartbeat timestamp must be a number"}, 400
+    # Pods not on the node are ignored, so nothing is stored for an unknown node
+    try:
+        samples = usage.record(node_id, data["usage"], timestamp) if data.get("usage") is not None else 0
+    except ValueError as e:
+        return {"message": str(e)}, 400
+    if not state.record_heartbeat(node_id, timestamp, data.get("metrics")):
+        return {"message": "Node not found"}, 404
+    HEARTBEATS.inc()
+    USAGE_SAMPLES.inc(samples)
+
+    return {"message": "Heartbeat received", "pods": _node_pods(node_id)}, 200
+
+@route('/heartbeats', 'POST')
+def heartbeats(data):
+    entries = data.get("heartbeats")
+
+    if not isinstance(entries, list):
+        return {"message": "A list of heartbeats is required"}, 400
+
+    # Coalesce duplicates so each node is updated once with its latest heartbeat
+    current_time = time.time()
+    latest = {}
+    for entry in entries:
+        if not isinstance(entry, dict):
+            entry = {"node_id": entry}
+        node_id = entry.get("node_id")
+        try:
+            # Client clocks may run ahead; never accept a future timestamp
+            timestamp = min(float(entry.get("timestamp", current_time)), current_time)
+        except (TypeError, ValueError):
+            return {"message": "Heartbeat timestamps must be numbers"}, 400
+        previous = latest.get(node_id)
+        if previous is None or timestamp >= previous[0]:
+            latest[node_id] = (timestamp, entry.get("metrics"), entry.get("usage"))
+
+    unknown = []
+    pods = {}
+    samples = 0
+    for node_id, (timestamp, metrics, pod_usage) in latest.items():
+        if pod_usage is not None:
+            try:
+                samples += usage.record(node_id, pod_usage, timestamp)
+            except ValueError as e:
+                return {"message": str(e)}, 400
+        if not state.record_heartbeat(node_id, timestamp, metrics):
+            unknown.append(node_id)
+        elif data.get("include_pods"):
+            pods[node_id] = _node_pods(node_id)
+    HEARTBEATS.inc(len(latest) - len(unknown))
+    USAGE_SAMPLES.inc(samples)
 
-    node_heartbeat[node_id] = time.time()
-    return jsonify({"message": "Heartbeat received"}), 200
+    body = {
+        "message": "Heartbeats received",
+        "received": len(latest) - len(unknown),
+        "unknown": unknown
+    }
+    if data.get("include_pods"):
+        body["pods"] = pods
+    return body, 200
 
-@app.route('/launch_pod', methods=['POST'])
-def launch_pod():
-    global pod_id_counter
-    data = request.get_json()
+@route('/launch_pod', 'POST')
+def launch_pod(data):
     cpu_req = data.get("cpu_cores")
 
     if cpu_req is None:
-        return jsonify({"message": "CPU cores required for pod"}), 400
+        return {"message": "CPU cores required for pod"}, 400
     
     try:
-        cpu_req = int(cpu_req)
-    except ValueError:
-        return jsonify({"message": "CPU cores must be an integer"}), 400
-
-    # First-fit scheduler: find first node with enough CPU
-    for node in nodes:
-        # Skip unhealthy nodes
-        if node["id"] not in node_heartbeat or time.time() - node_heartbeat[node["id"]] > 15:
-            continue
-            
-        if node["available_cores"] >= cpu_req:
-            pod = {
-                "id": "pod-{}".format(pod_id_counter),
-                "cpu_cores": cpu_req,
-                "assigned_node": node["id"],
-                "creation_time": time.time()
-            }
-            node["available_cores"] -= cpu_req
-            node["pods"].append(pod["id"])
-            pods.append(pod)
-            pod_id_counter += 1
-            
-            logger.info("Pod {} scheduled on node {}".format(pod["id"], node["id"]))
-            return jsonify({"message": "Pod launched", "pod": pod}), 200
-
-    return jsonify({"message": "No suitable node available"}), 503
-
-@app.route('/remove_pod', methods=['POST'])
-def remove_pod():
-    data = request.get_json()
+        cpu_req = parse_count(cpu_req, "CPU cores")
+    except ValueError as e:
+        return {"message": str(e)}, 400
+
+    try:
+        resources = parse_resources(data)
+    except ValueError as e:
+        return {"message": str(e)}, 400
+
+    queue = bool(data.get("queue", False))
+    priority = data.get("priority", DEFAULT_PRIORITY)
+    # Checked first: an unhashable value (a list or object) would raise in the lookup
+    if not isinstance(priority, str) or priority not in PRIORITY_CLASSES:
+        return {"message": "Unknown priority class: {}".format(priority),
+                "priorities": list(PRIORITY_CLASSES)}, 400
+
+    # Place the pod with the requested policy, or the server-wide default
+    try:
+        pod = scheduler.schedule(cpu_req, data.get("policy"), resources, priority)
+    except ValueError as e:
+        return {"message": str(e)}, 400
+
+    if not pod and data.get("preempt", True):
+        pod, evicted = preemptor.preempt(cpu_req, priority, resources)
+        if pod:
+            logger.debug("Pod %s scheduled on node %s by preempting %d pods",
+                         pod.id, pod.assigned_node, len(evicted))
+            return {
+                "message": "Pod launched by preemption",
+                "pod": pod.to_dict(),
+                "preempted": [
+                    {"id": pod_id, "status": "Rescheduled" if node_id else "Pending", "assigned_node": node_id}
+                    for pod_id, node_id in evicted
+                ]
+            }, 200
+
+    if not pod:
+        if not queue:
+            if autoscaler:
+                autoscaler.record_unplaceable(cpu_req, resources)
+            return {"message": "No suitable node available"}, 503
+        entry = pending.add(cpu_req, priority, resources)
+        if autoscaler:
+            autoscaler.notify()
+        logger.debug("Pod %s queued until a node has %d free CPU cores", entry["id"], cpu_req)
+        return {"message": "Pod queued", "pod": _pending_info(entry)}, 202
+
+    logger.debug("Pod %s scheduled on node %s", pod.id, pod.assigned_node)
+    return {"message": "Pod launched", "pod": pod.to_dict()}, 200
+
+@route('/launch_pods', 'POST')
+def launch_pods(data):
+    cpu_reqs = data.get("cpu_cores")
+
+    if not isinstance(cpu_reqs, list) or not cpu_reqs:
+        return {"message": "A list of CPU cores is required"}, 400
+
+    try:
+        cpu_reqs = [parse_count(cpu_req, "CPU cores") for cpu_req in cpu_reqs]
+    except ValueError as e:
+        return {"message": str(e)}, 400
+
+    # One resources object for every pod, or a list aligned with cpu_cores
+    resources = data.get("resources")
+    try:
+        if isinstance(resources, list):
+            if len(resources) != len(cpu_reqs):
+                raise ValueError("resources must have one entry per pod")
+            resources = [normalize_resources(r) for r in resources]
+        elif resources is not None:
+            resources = [normalize_resources(resources)] * len(cpu_reqs)
+    except ValueError as e:
+        return {"message": str(e)}, 400
+
+    gang = bool(data.get("gang", False))
+    queue = bool(data.get("queue", False)) and not gang
+    priority = data.get("priority", DEFAULT_PRIORITY)
+    if not isinstance(priority, str) or priority not in PRIORITY_CLASSES:
+        return {"message": "Unknown priority class: {}".format(priority),
+                "priorities": list(PRIORITY_CLASSES)}, 400
+
+    # Bin-pack the whole batch in one pass, largest pods first
+    try:
+        placed = scheduler.schedule_batch(cpu_reqs, data.get("policy"), gang=gang, resources=resources,
+                                          priority=priority)
+    except ValueError as e:
+        return {"message": str(e)}, 400
+
+    results = []
+    for i, (cpu_req, pod) in enumerate(zip(cpu_reqs, placed)):
+        if pod:
+            results.append({"cpu_cores": cpu_req, "status": "scheduled", "pod": pod.to_dict()})
+        elif queue:
+            entry = pending.add(cpu_req, priority, resources[i] if resources else None)
+            results.append({"cpu_cores": cpu_req, "status": "pending", "pod": _pending_info(entry)})
+        else:
+            results.append({"cpu_cores": cpu_req, "status": "unschedulable"})
+            if autoscaler:
+                autoscaler.record_unplaceable(cpu_req, resources[i] if resources else None)
+
+    scheduled = sum(1 for pod in placed if pod)
+    queued = len(cpu_reqs) - scheduled if queue else 0
+    if autoscaler and queued:
+        autoscaler.notify()
+    logger.debug("Batch of %d pods: %d scheduled, %d queued%s",
+                 len(cpu_reqs), scheduled, queued, " (gang)" if gang else "")
+
+    body = {
+        "results": results,
+        "scheduled": scheduled,
+        "pending": queued,
+        "failed": len(cpu_reqs) - scheduled - queued
+    }
+    if queued:
+        body["message"] = "Pods launched, some queued"
+        return body, 202
+    if scheduled == 0:
+        body["message"] = "No suitable node available"
+        return body, 503
+
+    body["message"] = "Pods launched"
+    return body, 200
+
+@route('/scheduling_policy', 'GET')
+def get_scheduling_policy(data):
+    return {"policy": scheduler.policy, "policies": list(POLICIES)}, 200
+
+@route('/scheduling_policy', 'POST')
+def set_scheduling_policy(data):
+    try:
+        scheduler.set_policy(data.get("policy"))
+    except ValueError as e:
+        return {"message": str(e), "policies": list(POLICIES)}, 400
+
+    logger.info("Scheduling policy set to {}".format(scheduler.policy))
+    return {"message": "Scheduling policy updated", "policy": scheduler.policy}, 200
+
+@route('/remove_pod', 'POST')
+def remove_pod(data):
     pod_id = data.get("pod_id")
 
     if not pod_id:
-        return jsonify({"message": "Pod ID must be provided"}), 400
-
-    # Find the pod
-    pod_to_remove = None
-    for pod in pods:
-        if pod["id"] == pod_id:
-            pod_to_remove = pod
-            break
+        return {"message": "Pod ID must be provided"}, 400
+    if not isinstance(pod_id, str):
+        return {"message": "Pod ID must be a string"}, 400
 
+    # Remove the pod and free up CPU on the assigned node
+    pod_to_remove = state.remove_pod(pod_id)
     if not pod_to_remove:
-        return jsonify({"message": "Pod not found"}), 404
+        if pending.remove(pod_id):
+            logger.debug("Pending pod %s cancelled", pod_id)
+            return {"message": "Pending pod cancelled"}, 200
+        return {"message": "Pod not found"}, 404
 
-    # Free up CPU on the assigned node
-    assigned_node_id = pod_to_remove["assigned_node"]
-    node = next((n for n in nodes if n["id"] == assigned_node_id), None)
-    
-    if node:
-        node["available_cores"] += pod_to_remove["cpu_cores"]
-        if pod_id in node["pods"]:
-            node["pods"].remove(pod_id)
+    logger.debug("Pod %s removed from node %s", pod_id, pod_to_remove.assigned_node)
+    return {"message": "Pod removed successfully"}, 200
 
-    pods.remove(pod_to_remove)
+def _pending_info(entry):
+    """Describe a queued pod"""
+    return {
+        "id": entry["id"],
+        "cpu_cores": entry["cpu_cores"],
+        "resources": entry["resources"].copy(),
+        "priority": entry["priority"],
+        "status": "Pending",
+        "displaced": entry["displaced"],
+        "wait_seconds": round(time.time() - entry["enqueued_at"], 3)
+    }
 
-    logger.info("Pod {} removed from node {}".format(pod_id, assigned_node_id))
-    return jsonify({"message": "Pod removed successfully"}), 200
+def _page_params(data):
+    """
+    Parse the limit and cursor pagination parameters
+
+    Raises:
+        ValueError: If limit is not a positive integer
+    """
+    limit = data.get("limit")
+    if limit is not None:
+        limit = int(limit)
+        if limit <= 0:
+            raise ValueError("limit must be positive")
+    return limit, data.get("cursor") or None
+
+def _paginate(items, limit):
+    """Take up to limit items, returning (page, cursor of the next page or None)"""
+    page = []
+    for item in items:
+        if limit is not None and len(page) == limit:
+            return page, page[-1].id
+        page.append(item)
+    return page, None
+
+@route('/cluster_summary', 'GET')
+def cluster_summary(data):
+    return state.summary(), 200
+
+@route('/list_nodes', 'GET')
+def list_nodes(data):
+    try:
+        limit, cursor = _page_params(data)
+        min_free_cores = int(data["min_free_cores"]) if "min_free_cores" in data else None
+    except ValueError as e:
+        return {"message": "Invalid query parameter: {}".format(e)}, 400
+
+    nodes = state.iter_nodes(cursor)
+    status = data.get("status")
+    if status:
+        nodes = (n for n in nodes if n.status.lower() == status.lower())
+    if min_free_cores is not None:
+        nodes = (n for n in nodes if n.available_cores >= min_free_cores)
+
+    try:
+        page, next_cursor = _paginate(nodes, limit)
+    except ValueError as e:
+        return {"message": "Invalid cursor: {}".format(e)}, 400
 
-@app.route('/list_nodes', methods=['GET'])
-def list_nodes():
-    current_time = time.time()
     node_info = []
-    
-    for node in nodes:
-        # Calculate node health status
-        if node["id"] not in node_heartbeat:
-            status = "Unknown"
-        elif current_time - node_heartbeat[node["id"]] <= 15:
-            status = "Healthy"
-        else:
-            status = "Unhealthy"
-        
+    for node in page:
         node_info.append({
-            "id": node["id"],
-            "cpu_cores": node["cpu_cores"],
-            "available_cores": node["available_cores"],
-            "pods": node["pods"],
-            "status": status
+            "id": node.id,
+            "cpu_cores": node.cpu_cores,
+            "available_cores": node.available_cores,
+            "resources": node.resources,
+            "available_resources": node.available_resources,
+            "pods": list(node.pods),
+            "status": node.status,
+            "metrics": state.node_metrics.get(node.id, {})
         })
     
-    return jsonify({
+    return {
         "nodes": node_info,
-        "total_nodes": len(nodes),
-        "healthy_nodes": sum(1 for n in node_info if n["status"] == "Healthy")
-    }), 200
+        "total_nodes": len(state.nodes),
+        "healthy_nodes": state.healthy_nodes,
+        "next_cursor": next_cursor,
+        "resource_version": events.resource_version
+    }, 200
+
+@route('/list_pods', 'GET')
+def list_pods(data):
+    try:
+        limit, cursor = _page_params(data)
+    except ValueError as e:
+        return {"message": "Invalid query parameter: {}".format(e)}, 400
+
+    pods = state.iter_pods(cursor, data.get("node"))
+    status = data.get("status")
+    if status:
+        pods = (p for p in pods if state.node_status(p.assigned_node).lower() == status.lower())
 
-@app.route('/list_pods', methods=['GET'])
-def list_pods():
+    try:
+        page, next_cursor = _paginate(pods, limit)
+    except ValueError as e:
+        return {"message": "Invalid cursor: {}".format(e)}, 400
+
+    current_time = time.time()
     pod_info = []
     
-    for pod in pods:
-        # Find the node this pod is assigned to
-        node = next((n for n in nodes if n["id"] == pod["assigned_node"]), None)
-        
+    for pod in page:
         # Calculate pod age
-        age_seconds = time.time() - pod.get("creation_time", time.time())
+        age_seconds = current_time - pod.creation_time
         
         pod_info.append({
-            "id": pod["id"],
-            "cpu_cores": pod["cpu_cores"],
-            "assigned_node": pod["assigned_node"],
-            "node_status": "Unknown" if not node else 
-                           "Healthy" if time.time() - node_heartbeat.get(node["id"], 0) <= 15 else 
-                           "Unhealthy",
+            "id": pod.id,
+            "cpu_cores": pod.cpu_cores,
+            "resources": pod.resources.copy(),
+            "priority": pod.priority,
+            "assigned_node": pod.assigned_node,
+            "node_status": state.node_status(pod.assigned_node),
             "age": "{}m {}s".format(int(age_seconds / 60), int(age_seconds % 60))
         })
     
-    return jsonify({
+    return {
         "pods": pod_info,
-        "total_pods": len(pods)
-    }), 200
+        "total_pods": len(state.pods),
+        "next_cursor": next_cursor,
+        "resource_version": events.resource_version
+    }, 200
+
+@route('/pending_pods', 'GET')
+def pending_pods(data):
+    try:
+        limit, _ = _page_params(data)
+    except ValueError as e:
+        return {"message": "Invalid query parameter: {}".format(e)}, 400
+
+    # Oldest first; the queue is bounded by demand rather than cluster size
+    page = []
+    for entry in pending.iter_entries():
+        if limit is not None and len(page) == limit:
+            break
+        page.append(_pending_info(entry))
+
+    body = pending.stats()
+    body["pods"] = page
+    return body, 200
+
+@route('/pod_usage', 'GET')
+def pod_usage(data):
+    pod_id = data.get("pod_id")
+    if not pod_id:
+        return {"message": "Pod ID must be provided"}, 400
+    pod = state.pods.get(pod_id)
+    if pod is None:
+        return {"message": "Pod not found"}, 404
+
+    try:
+        resolution = int(data.get("resolution", 0))
+        samples = usage.history(pod_id, resolution)
+    except ValueError as e:
+        return {"message": "Invalid resolution: {}".format(e)}, 400
+
+    return {
+        "pod_id": pod_id,
+        "cpu_cores": pod.cpu_cores,
+        "assigned_node": pod.assigned_node,
+        "estimate": usage.get_estimate(pod_id),
+        "percentile": usage.percentile,
+        "resolution": resolution,
+        "resolutions": usage.resolutions(),
+        "samples": samples
+    }, 200
+
+@route('/autoscaler', 'GET')
+def autoscaler_status(data):
+    if autoscaler is None:
+        return {"message": "Autoscaling is not enabled"}, 404
+    return autoscaler.status(), 200
+
+@route('/replication/status', 'GET')
+def replication_status(data):
+    if replica is None:
+        return {"message": "Replication is not enabled"}, 404
+    return replica.status(), 200
+
+@route('/replication/vote', 'POST', internal=True)
+def replication_vote(data):
+    if replica is None:
+        return {"message": "Replication is not enabled"}, 404
+    return replica.handle_vote(data), 200
+
+@route('/replication/append', 'POST', internal=True)
+def replication_append(data):
+    if replica is None:
+        return {"message": "Replication is not enabled"}, 404
+    return replica.handle_append(data), 200
+
+@route('/replication/snapshot', 'POST', internal=True)
+def replication_snapshot(data):
+    if replica is None:
+        return {"message": "Replication is not enabled"}, 404
+    return replica.handle_snapshot(data), 200
+
+def _flask_view(handler, path, method):
+    def view():
+        started = time.perf_counter()
+        leader = forward_to(path, method)
+        if leader is not None:
+            if not leader:
+                observe_request(path, method, 503, started)
+                return jsonify({"message": "No leader elected yet"}), 503
+            observe_request(path, method, 307, started)
+            # 307 keeps the method and body, so clients simply retry at the leader
+            return redirect(leader + request.full_path.rstrip('?'), code=307)
+        if method == 'POST':
+            data = request.get_json(silent=True) or {}
+        else:
+            data = request.args.to_dict()
+        body, status = dispatch(handler, data)
+        observe_request(path, method, status, started)
+        return jsonify(body), status
+    return view
+
+def run_internal(handler, data):
+    """Run a replication handler under the cluster state lock; it is never forwarded or waited on"""
+    if not isinstance(data, dict):
+        return {"message": "Request body must be a JSON object"}, 400
+    with state.lock:
+        return handler(data)
+
+def _flask_internal_view(handler):
+    def view():
+        body, status = run_internal(handler, request.get_json(silent=True))
+        return jsonify(body), status
+    return view
+
+for path, method, handler in ROUTES:
+    app.add_url_rule(path, handler.__name__, _flask_view(handler, path, method), methods=[method])
+for path, method, handler in INTERNAL_ROUTES:
+    app.add_url_rule(path, handler.__name__, _flask_internal_view(handler), methods=[method])
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Serve counters, latency histograms and cluster gauges for Prometheus"""
+    return Response(render_metrics(), content_type=CONTENT_TYPE)
+
+@app.route('/watch', methods=['GET'])
+def watch():
+    """Stream node and pod changes after a resource version as Server-Sent Events"""
+    try:
+        resource_version, kind = parse_watch_params(request.args, request.headers.get("Last-Event-ID"))
+        events.since(resource_version)
+    except ValueError as e:
+        return jsonify({"message": "Invalid watch request: {}".format(e)}), 400
+    except ResourceVersionExpired:
+        return jsonify({"message": "Resource version {} is too old; list again".format(resource_version)}), 410
+
+    def stream():
+        version = resource_version
+        while True:
+            try:
+                batch, version = events.since(version, kind)
+            except ResourceVersionExpired:
+                yield format_expired(version)
+                return
+            if batch:
+                yield "".join(format_sse(event) for event in batch)
+            else:
+                events.wait(version, WATCH_KEEPALIVE)
+                if events.resource_version <= version:
+                    yield SSE_KEEPALIVE
+
+    return Response(stream_with_context(stream()), mimetype='text/event-stream',
+                    headers={"Cache-Control": "no-cache"})
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Cluster API server")
+    parser.add_argument("--host", default="0.0.0.0", help="Interface to listen on")
+    parser.add_argument("--port", type=int, default=5002, help="Port to listen on")
+    add_server_arguments(parser)
+    args = parser.parse_args()
+
     logger.info("Starting API Server...")
-    app.run(debug=True, host="0.0.0.0", port=5002)
+    configure(args)
+    start_background()
+    # The reloader would fork a second process with its own monitor
+    try:
+        app.run(debug=True, use_reloader=False, host=args.host, port=args.port)
+    finally:
+        stop_background()
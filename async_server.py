@@ -0,0 +1,140 @@
+import argparse
+import asyncio
+import logging
+import time
+
+from aiohttp import web
+
+from api_server import (COMMIT_FAILED, INTERNAL_ROUTES, ROUTES, WATCH_KEEPALIVE, add_server_arguments, configure,
+                        events, execute, forward_to, observe_request, render_metrics, run_internal,
+                        start_background, stop_background, wait_committed)
+from metrics import CONTENT_TYPE
+from watch import (ResourceVersionExpired, SSE_KEEPALIVE,
+                   format_expired, format_sse, parse_watch_params)
+
+logger = logging.getLogger('async_server')
+
+def _make_view(handler, path, method):
+    async def view(request):
+        started = time.perf_counter()
+        leader = forward_to(path, method)
+        if leader is not None:
+            if not leader:
+                observe_request(path, method, 503, started)
+                return web.json_response({"message": "No leader elected yet"}, status=503)
+            observe_request(path, method, 307, started)
+            raise web.HTTPTemporaryRedirect(leader + str(request.rel_url))
+        if method == 'POST':
+            try:
+                data = await request.json()
+            except ValueError:
+                data = None
+            if not isinstance(data, dict):
+                data = {}
+        else:
+            data = dict(request.query)
+        body, status, positions = execute(handler, data)
+        if any(log.durable_lsn < lsn for log, lsn in positions):
+            # Wait for the commit without blocking the event loop
+            if not await asyncio.get_event_loop().run_in_executor(None, wait_committed, positions):
+                body, status = {"message": COMMIT_FAILED}, 503
+        observe_request(path, method, status, started)
+        return web.json_response(body, status=status)
+    return view
+
+def _make_internal_view(handler):
+    async def view(request):
+        try:
+            data = await request.json()
+        except ValueError:
+            data = None
+        # Applying a batch of entries or a snapshot holds the state lock for a while; keep it off the event loop
+        body, status = await asyncio.get_event_loop().run_in_executor(None, run_internal, handler, data)
+        return web.json_response(body, status=status)
+    return view
+
+async def home(request):
+    return web.Response(text="Welcome to the Cluster API Server")
+
+async def metrics(request):
+    """Serve counters, latency histograms and cluster gauges for Prometheus"""
+    # aiohttp rejects a charset inside content_type, so the full header is set directly
+    return web.Response(text=render_metrics(), headers={"Content-Type": CONTENT_TYPE})
+
+async def watch(request):
+    """Stream node and pod changes after a resource version as Server-Sent Events"""
+    try:
+        resource_version, kind = parse_watch_params(request.query, request.headers.get("Last-Event-ID"))
+        events.since(resource_version)
+    except ValueError as e:
+        return web.json_response({"message": "Invalid watch request: {}".format(e)}, status=400)
+    except ResourceVersionExpired:
+        return web.json_response(
+            {"message": "Resource version {} is too old; list again".format(resource_version)}, status=410)
+
+    response = web.StreamResponse(headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache"})
+    await response.prepare(request)
+
+    waiter = (asyncio.get_event_loop(), asyncio.Event())
+    events.async_waiters.add(waiter)
+    try:
+        version = resource_version
+        while True:
+            waiter[1].clear()
+            try:
+                batch, version = events.since(version, kind)
+            except ResourceVersionExpired:
+                await response.write(format_expired(version).encode())
+                break
+            if batch:
+                await response.write("".join(format_sse(event) for event in batch).encode())
+                continue
+            try:
+                await asyncio.wait_for(waiter[1].wait(), WATCH_KEEPALIVE)
+            except asyncio.TimeoutError:
+                await response.write(SSE_KEEPALIVE.encode())
+    except (ConnectionResetError, asyncio.CancelledError):
+        pass
+    finally:
+        events.async_waiters.discard(waiter)
+    return response
+
+async def _start_background(app):
+    start_background()
+
+async def _stop_background(app):
+    stop_background()
+
+def create_app():
+    """
+    Build an aiohttp application serving the same endpoints as api_server.py
+
+    Handlers, cluster state and the health monitor are shared with the
+    Flask app. Handlers run directly on the event loop: they only touch
+    in-memory indexes, so one process avoids both the development server's
+    per-request thread and the overhead of Flask's request machinery.
+    """
+    app = web.Application()
+    app.router.add_get('/', home)
+    app.router.add_get('/metrics', metrics)
+    app.router.add_get('/watch', watch)
+    for path, method, handler in ROUTES:
+        app.router.add_route(method, path, _make_view(handler, path, method))
+    for path, method, handler in INTERNAL_ROUTES:
+        app.router.add_route(method, path, _make_internal_view(handler))
+    app.on_startup.append(_start_background)
+    app.on_cleanup.append(_stop_background)
+    return app
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Asynchronous cluster API server")
+    parser.add_argument("--host", default="0.0.0.0", help="Interface to listen on")
+    parser.add_argument("--port", type=int, default=5002, help="Port to listen on")
+    parser.add_argument("--access-log", action="store_true", help="Log every request")
+    add_server_arguments(parser)
+    args = parser.parse_args()
+
+    logger.info("Starting async API Server...")
+    configure(args)
+    web.run_app(create_app(), host=args.host, port=args.port,
+                access_log=logger if args.access_log else None)
@@ -0,0 +1,429 @@
+import functools
+import itertools
+import logging
+import math
+import threading
+import time
+
+from cluster_state import id_sequence
+from metrics import Counter, Histogram
+from resources import normalize_resources
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger('autoscaler')
+
+SCALING_ACTIONS = Counter("cluster_autoscaler_actions_total",
+                          "Nodes the autoscaler added or removed, by action and result", ("action", "result"))
+PROVISION_SECONDS = Histogram("cluster_autoscaler_provision_seconds",
+                              "Time from deciding to add a node to the node joining the cluster",
+                              buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300))
+
+
+def parse_shape(text):
+    """
+    Read a node shape such as "8" or "16:memory=65536,gpu=1"
+
+    Returns:
+        (cpu_cores, {resource: amount})
+
+    Raises:
+        ValueError: If the shape is malformed
+    """
+    cores, _, rest = text.partition(":")
+    resources = {}
+    for item in filter(None, rest.split(",")):
+        name, separator, amount = item.partition("=")
+        if not separator:
+            raise ValueError("Node shape resources are given as name=amount: {}".format(item))
+        resources[name.strip()] = amount
+    try:
+        cores = int(cores)
+    except ValueError:
+        raise ValueError("A node shape starts with its CPU cores: {}".format(text))
+    if cores <= 0:
+        raise ValueError("A node shape needs at least one CPU core: {}".format(text))
+    return cores, normalize_resources(resources)
+
+
+def _fit_count(free, size):
+    """How many pods of a size ((cpu_cores, resources tuple)) fit in free [cpu_cores, {resource: amount}]"""
+    cpu, resources = size
+    count = free[0] // cpu if cpu else math.inf
+    for name, amount in resources:
+        count = min(count, free[1].get(name, 0) // amount)
+    return count
+
+
+def _take(free, size, count):
+    cpu, resources = size
+    free[0] -= cpu * count
+    for name, amount in resources:
+        free[1][name] -= amount * count
+
+
+def plan_nodes(demand, shapes, in_flight=(), limit=None):
+    """
+    Choose the node shapes to provision for a backlog of pod requests
+
+    Requests are packed first-fit-decreasing: largest first, each into the
+    first planned node with room, where nodes already being provisioned
+    come first. A new node gets the smallest shape with at least as many
+    cores as all the demand still unpacked, or the largest shape that fits
+    the request if none has, so a small backlog gets a small node and a
+    large one is packed into large nodes. Requests are packed a size at a
+    time, and no more than limit new nodes are planned, so the cost grows
+    with distinct sizes times nodes rather than with the number of pods.
+
+    Args:
+        demand: {(cpu_cores, resources tuple): number of pods}
+        shapes: (cpu_cores, {resource: amount}) node shapes, fewest cores first
+        in_flight: Shapes of the nodes already being provisioned
+        limit: Most new nodes to plan (no limit if None)
+
+    Returns:
+        (list of shapes to provision, number of pods left unpacked)
+    """
+    bins = [[cores, dict(resources)] for cores, resources in in_flight]
+    new = []
+    left = 0
+    remaining = sum(size[0] * count for size, count in demand.items())
+    for size in sorted(demand, reverse=True):
+        count = demand[size]
+        remaining -= size[0] * count
+        for free in bins:
+            if not count:
+                break
+            fits = min(count, _fit_count(free, size))
+            _take(free, size, fits)
+            count -= fits
+        fitting = [shape for shape in shapes if _fit_count([shape[0], shape[1]], size) >= 1]
+        while count and fitting and (limit is None or len(new) < limit):
+            needed = remaining + size[0] * count
+            shape = next((shape for shape in fitting if shape[0] >= needed), fitting[-1])
+            free = [shape[0], dict(shape[1])]
+            fits = min(count, _fit_count(free, size))
+            _take(free, size, fits)
+            count -= fits
+            bins.append(free)
+            new.append(shape)
+        left += count
+    return new, left
+
+
+class Autoscaler:
+    def __init__(self, state, scheduler, queue, manager, shapes=((8, {}),), min_nodes=0, max_nodes=100,
+                 scale_out_utilization=0.85, scale_in_utilization=0.3, scale_in_after=60,
+                 interval=5, heartbeat_interval=5, active=None):
+        """
+        Control loop that adds nodes for unmet demand and drains idle ones
+
+        Each evaluation reads aggregates only: the pending queue's count of
+        waiting pods per request size, the requests rejected for lack of
+        room since the last evaluation, and the cluster totals from
+        ClusterState.summary(). Demand is packed onto the configured node
+        shapes (see plan_nodes()), counting nodes already being provisioned,
+        and the chosen nodes are launched concurrently on the node manager's
+        thread pool. Without demand, a node is added when CPU utilization
+        exceeds scale_out_utilization. Rejected requests are planned for
+        once; a retry while the node is still launching packs into it.
+
+        Scale-in only considers nodes the autoscaler provisioned itself,
+        since it can only tear those down. Once the cluster is below
+        scale_in_utilization, with nothing pending or launching, the least
+        used such node that has stayed under that utilization for
+        scale_in_after seconds is cordoned and drained, but only if every
+        one of its pods fits elsewhere and the rest of the cluster stays
+        under scale_out_utilization. One node is removed per evaluation.
+
+        The node manager's nodes run no agent, so the autoscaler sends
+        their heartbeats while the manager reports them running; a node
+        whose container dies is then failed by the health monitor as usual.
+
+        Evaluations run every interval seconds, and immediately when
+        notify() or record_unplaceable() reports new demand or a launch
+        completes. Bookkeeping is guarded by the cluster state lock.
+
+        Args:
+            state: ClusterState nodes are added to and removed from
+            scheduler: Scheduler used to drain nodes
+            queue: PendingQueue whose demand drives scale-out
+            manager: NodeManager that launches and removes nodes
+            shapes: (cpu_cores, {resource: amount}) node shapes that may be launched
+            min_nodes: Fewest nodes the cluster is kept at
+            max_nodes: Most nodes the cluster may grow to, counting launches in flight
+            scale_out_utilization: CPU utilization above which a node is added
+            scale_in_utilization: CPU utilization below which nodes are drained
+            scale_in_after: Seconds a node must stay underused before it is drained
+            interval: Seconds between evaluations
+            heartbeat_interval: Seconds between heartbeats for provisioned nodes
+            active: Callable returning False while this server must not act (e.g. a follower replica)
+        """
+        if not shapes:
+            raise ValueError("At least one node shape is required")
+        self.state = state
+        self.scheduler = scheduler
+        self.queue = queue
+        self.manager = manager
+        self.shapes = sorted(((cores, dict(resources)) for cores, resources in shapes), key=lambda shape: shape[0])
+        self.min_nodes = min_nodes
+        self.max_nodes = max_nodes
+        self.scale_out_utilization = scale_out_utilization
+        self.scale_in_utilization = scale_in_utilization
+        self.scale_in_after = scale_in_after
+        self.interval = interval
+        self.heartbeat_interval = heartbeat_interval
+        self.active = active or (lambda: True)
+
+        self.provisioned = {}      # {node_id: manager node id} of nodes the autoscaler added
+        self.provisioning = {}     # {ticket: (shape, perf_counter() when decided)} launches in flight
+        self.tickets = itertools.count()
+        self.unplaceable = {}      # {(cpu_cores, resources tuple): rejected requests since the last evaluation}
+        self.underused_since = {}  # {node_id: clock time it fell under scale_in_utilization}
+        self.unfit = 0             # Pods in the last evaluation's demand that fit no shape
+        self.capped = 0            # Pods in it left without a node by max_nodes
+
+        self.wake = threading.Event()
+        self.running = False
+        self.stopped = False
+        self.thread = None
+
+        with state.lock:
+            state.subscribe(self._on_state_change)
+
+    def start(self):
+        """Start the control loop thread"""
+        self.running = True
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+        logger.info("Autoscaler started with node shapes %s", self.shapes)
+
+    def stop(self):
+        """Stop the control loop; nodes still launching are removed once they are up"""
+        self.running = False
+        self.stopped = True
+        self.wake.set()
+        if self.thread:
+            self.thread.join(timeout=1)
+        logger.info("Autoscaler stopped")
+
+    def notify(self):
+        """Evaluate now rather than at the next interval (e.g. pods were queued)"""
+        self.wake.set()
+
+    def record_unplaceable(self, cpu_cores, resources=None):
+        """Count a request rejected for lack of room as demand (state lock held)"""
+        size = (cpu_cores, tuple(sorted((resources or {}).items())))
+        self.unplaceable[size] = self.unplaceable.get(size, 0) + 1
+        self.wake.set()
+
+    def _run(self):
+        next_heartbeat = 0.0
+        while self.running:
+            self.wake.clear()
+            if time.monotonic() >= next_heartbeat:
+                self.heartbeat()
+                next_heartbeat = time.monotonic() + self.heartbeat_interval
+            try:
+                self.evaluate()
+            except Exception:
+                logger.exception("Autoscaler evaluation failed")
+            self.wake.wait(min(self.interval, max(next_heartbeat - time.monotonic(), 0)))
+
+    def evaluate(self):
+        """
+        Make one round of scaling decisions
+
+        Returns:
+            (shapes of the nodes being launched, id of the node drained or None)
+        """
+        with self.state.lock:
+            if not self.active():
+                self.unplaceable.clear()
+                return [], None
+            demand = self._demand()
+            launches = self._plan_scale_out(demand)
+            for shape in launches:
+                ticket = next(self.tickets)
+                self.provisioning[ticket] = (shape, time.perf_counter())
+                self.manager.submit_add(*shape).add_done_callback(functools.partial(self._joined, ticket, shape))
+            if launches and demand:
+                logger.info("Scaling out by %d nodes for %d pending pods", len(launches), sum(demand.values()))
+            elif launches:
+                logger.info("Scaling out by %d nodes for headroom (CPU utilization %.0f%%)",
+                            len(launches), 100 * self.state.summary()["utilization"])
+
+            drained = None
+            if not demand and not self.provisioning:
+                drained = self._scale_in()
+            else:
+                self.underused_since.clear()
+            return launches, drained
+
+    def _demand(self):
+        """Return {(cpu_cores, resources tuple): pods} pending or rejected since the last call (state lock held)"""
+        demand = dict(self.queue.demand)
+        for size, count in self.unplaceable.items():
+            demand[size] = demand.get(size, 0) + count
+        self.unplaceable.clear()
+        return demand
+
+    def _plan_scale_out(self, demand):
+        """Return the shapes to launch for the demand, or for headroom (state lock held)"""
+        in_flight = [shape for shape, _ in self.provisioning.values()]
+        nodes = len(self.state.nodes) + len(self.provisioning)
+        room = max(self.max_nodes - nodes, 0)
+        if demand:
+            launches, left = plan_nodes(demand, self.shapes, in_flight, room)
+            unfit = sum(count for size, count in demand.items()
+                        if not any(_fit_count([cores, resources], size) for cores, resources in self.shapes))
+            if unfit and unfit != self.unfit:
+                logger.warning("%d pending pods fit no node shape and cannot be scaled for", unfit)
+            if left > unfit and left - unfit != self.capped:
+                logger.warning("%d pending pods need more nodes than max_nodes (%d) allows",
+                               left - unfit, self.max_nodes)
+            self.unfit = unfit
+            self.capped = left - unfit
+        else:
+            launches = []
+            self.unfit = self.capped = 0
+            summary = self.state.summary()
+            total = summary["total_cores"] + sum(shape[0] for shape in in_flight)
+            if total and summary["used_cores"] / total > self.scale_out_utilization:
+                needed = summary["used_cores"] / self.scale_out_utilization - total
+                launches = [next((shape for shape in self.shapes if shape[0] >= needed), self.shapes[-1])]
+
+        launches.extend([self.shapes[0]] * (self.min_nodes - nodes - len(launches)))
+        return launches[:room]
+
+    def _joined(self, ticket, shape, future):
+        """Register a launched node with the cluster (runs when the manager's launch completes)"""
+        cores, resources = shape
+        try:
+            launched = future.result()
+        except Exception:
+            logger.exception("Launching a node with %d CPU cores failed", cores)
+            launched = None
+
+        with self.state.lock:
+            decided = self.provisioning.pop(ticket)[1]
+            # Leadership may have moved, or the autoscaler stopped, during the launch
+            orphaned = launched is not None and (self.stopped or not self.active())
+            if launched is not None and not orphaned:
+                node = self.state.add_node(cores, resources=resources)
+                self.provisioned[node.id] = launched["id"]
+                self.queue.drain()
+        if orphaned:
+            removed = self.manager.remove_node(launched["id"])
+            SCALING_ACTIONS.labels("remove", "succeeded" if removed else "failed").inc()
+            return
+        if launched is None:
+            SCALING_ACTIONS.labels("add", "failed").inc()
+            self.wake.set()
+            return
+        SCALING_ACTIONS.labels("add", "succeeded").inc()
+        PROVISION_SECONDS.observe(time.perf_counter() - decided)
+        logger.info("Node %s added with %d CPU cores (%s, %s)", node.id, cores, launched["id"],
+                    "warm" if launched.get("warm") else "cold")
+        # Demand may remain, and this node now counts for headroom
+        self.wake.set()
+
+    def _scale_in(self):
+        """Drain the emptiest long-underused provisioned node, if the cluster can spare it (state lock held)"""
+        summary = self.state.summary()
+        if summary["total_nodes"] <= self.min_nodes or summary["utilization"] >= self.scale_in_utilization:
+            self.underused_since.clear()
+            return None
+
+        now = self.state.clock()
+        candidate = None
+        for node_id in self.provisioned:
+            node = self.state.nodes[node_id]
+            used = node.cpu_cores - node.available_cores
+            if node.status != "Healthy" or used > self.scale_in_utilization * node.cpu_cores:
+                self.underused_since.pop(node_id, None)
+                continue
+            since = self.underused_since.setdefault(node_id, now)
+            if now - since >= self.scale_in_after and (candidate is None or used < candidate[1]):
+                candidate = (node_id, used)
+        if candidate is None:
+            return None
+
+        node = self.state.nodes[candidate[0]]
+        remaining = summary["total_cores"] - node.cpu_cores
+        if not remaining or summary["used_cores"] / remaining > self.scale_out_utilization:
+            return None
+        return self._drain(node.id)
+
+    def _drain(self, node_id):
+        """Move every pod off a node and remove it, or leave it alone if some pod fits nowhere else"""
+        pod_ids = sorted(self.state.pods_on_node(node_id), key=id_sequence)
+        pods = [self.state.pods[pod_id] for pod_id in pod_ids]
+        self.scheduler.cordon(node_id)
+        plan = self.scheduler.plan_batch([pod.cpu_cores for pod in pods],
+                                         resources=[pod.resources for pod in pods])
+        self.scheduler.release_plan(plan)
+        if None in plan:
+            self.scheduler.uncordon(node_id)
+            self.underused_since.pop(node_id, None)  # Try again after another full period
+            logger.info("Node %s is underused but its pods fit nowhere else", node_id)
+            return None
+
+        self.scheduler.reschedule(pod_ids)
+        handle = self.provisioned.pop(node_id)
+        self.underused_since.pop(node_id, None)
+        self.state.remove_node(node_id)
+        self._remove(node_id, handle)
+        logger.info("Scaling in: node %s drained (%d pods moved)", node_id, len(pod_ids))
+        return node_id
+
+    def _remove(self, node_id, handle):
+        """Remove a node through the manager in the background"""
+        self.manager.submit_remove(handle).add_done_callback(functools.partial(self._removed, node_id, handle))
+
+    @staticmethod
+    def _removed(node_id, handle, future):
+        removed = future.exception() is None and future.result()
+        if not removed:
+            logger.warning("Node %s (%s) left the cluster but could not be removed", node_id, handle)
+        SCALING_ACTIONS.labels("remove", "succeeded" if removed else "failed").inc()
+
+    def heartbeat(self):
+        """Send heartbeats for the provisioned nodes the manager reports running"""
+        with self.state.lock:
+            if not self.active():
+                return
+            nodes = list(self.provisioned.items())
+        # The manager may be slow (a Docker API call per node), so ask outside the lock
+        running = [node_id for node_id, handle in nodes if self.manager.is_running(handle)]
+        with self.state.lock:
+            for node_id in running:
+                self.state.record_heartbeat(node_id)
+
+    def _on_state_change(self, kind, event_type, obj):
+        """Tear down provisioned nodes removed through the API (state lock held)"""
+        if kind != "node" or event_type != "DELETED":
+            return
+        self.underused_since.pop(obj.id, None)
+        handle = self.provisioned.pop(obj.id, None)
+        if handle is not None and not self.stopped:
+            self._remove(obj.id, handle)
+
+    def status(self):
+        """Return the autoscaler's configuration and what it is doing (state lock held)"""
+        return {
+            "shapes": [{"cpu_cores": cores, "resources": resources} for cores, resources in self.shapes],
+            "min_nodes": self.min_nodes,
+            "max_nodes": self.max_nodes,
+            "scale_out_utilization": self.scale_out_utilization,
+            "scale_in_utilization": self.scale_in_utilization,
+            "provisioned_nodes": sorted(self.provisioned, key=id_sequence),
+            "launching": sorted(shape[0] for shape, _ in self.provisioning.values()),
+            "pending_pods": sum(self.queue.demand.values()),
+            "unfit_pods": self.unfit,
+            "pods_over_max_nodes": self.capped
+        }
@@ -0,0 +1,144 @@
+"""
+Simulation benchmark of the autoscaler, without Docker
+
+Decision cost: --pending pods wait in the queue of a full cluster that is
+already at max_nodes, so each evaluation plans the backlog but launches
+nothing. The Autoscaler reads the queue's per-size demand counts; the
+rescanning variant rebuilds them from every queued pod.
+
+Reaction time: a burst of --burst pods is queued in a full cluster and the
+autoscaler thread provisions nodes through a NodeManager whose fake
+backend launches take --launch-delay seconds, with each of the --warm-nodes
+pool sizes (per node shape) filled beforehand. Reported are the time until the first node
+joins and until every pod is placed.
+
+Usage:
+    python -m benchmarks.bench_autoscaler --pending 1000 100000 --burst 2000 --launch-delay 0 0.5 --warm-nodes 0 200
+"""
+import argparse
+import concurrent.futures
+import logging
+import random
+import time
+
+logging.disable(logging.CRITICAL)
+
+from autoscaler import Autoscaler  # noqa: E402
+from cluster_state import ClusterState  # noqa: E402
+from node_manager import FakeBackend, NodeManager  # noqa: E402
+from pending import PendingQueue  # noqa: E402
+from scheduler import Scheduler  # noqa: E402
+
+SHAPES = ((8, {}), (32, {}), (64, {}))
+
+
+class RescanningAutoscaler(Autoscaler):
+    """Rebuilds the demand from every queued pod on each evaluation"""
+
+    def _demand(self):
+        demand = {}
+        for entry in self.queue.iter_entries():
+            size = (entry["cpu_cores"], tuple(sorted(entry["resources"].items())))
+            demand[size] = demand.get(size, 0) + 1
+        return demand
+
+
+def build(node_count, seed):
+    """Return (state, scheduler, queue) for a cluster of 32-core nodes filled to the last core"""
+    rng = random.Random(seed)
+    state = ClusterState()
+    scheduler = Scheduler(state)
+    queue = PendingQueue(state, scheduler)
+    with state.lock:
+        for _ in range(node_count):
+            node = state.add_node(32)
+            while node.available_cores:
+                state.add_pod(min(rng.randint(1, 8), node.available_cores), node.id)
+    return state, scheduler, queue
+
+
+def decision_cost(autoscaler_class, pending_count, evaluations, seed=7):
+    """Return the mean evaluation time in microseconds with pending_count pods queued"""
+    state, scheduler, queue = build(100, seed)
+    rng = random.Random(seed + 1)
+    with state.lock:
+        for _ in range(pending_count):
+            queue.add(rng.randint(1, 8))
+    manager = NodeManager(FakeBackend())
+    autoscaler = autoscaler_class(state, scheduler, queue, manager, shapes=SHAPES, max_nodes=len(state.nodes))
+    start = time.perf_counter()
+    for _ in range(evaluations):
+        autoscaler.evaluate()
+    elapsed = time.perf_counter() - start
+    manager.shutdown()
+    return elapsed / evaluations * 1e6
+
+
+def reaction_time(burst, launch_delay, pool_size=0, seed=7):
+    """
+    Queue a burst of pods in a full cluster and wait for the autoscaler to place them
+
+    Returns:
+        (seconds to the first node joining, seconds to every pod placed, nodes added)
+    """
+    state, scheduler, queue = build(100, seed)
+    rng = random.Random(seed + 1)
+    nodes_before = len(state.nodes)
+    manager = NodeManager(FakeBackend(launch_delay=launch_delay), pool_size=pool_size, shapes=SHAPES)
+    concurrent.futures.wait(manager.fill_pool())
+    autoscaler = Autoscaler(state, scheduler, queue, manager, shapes=SHAPES, max_nodes=10000, interval=5)
+    autoscaler.start()
+    try:
+        start = time.perf_counter()
+        with state.lock:
+            for _ in range(burst):
+                queue.add(rng.randint(1, 8))
+        autoscaler.notify()
+
+        first = None
+        while True:
+            with state.lock:
+                joined = len(state.nodes) > nodes_before
+                waiting = len(queue)
+            now = time.perf_counter()
+            if joined and first is None:
+                first = now - start
+            if not waiting:
+                return first, now - start, len(state.nodes) - nodes_before
+            time.sleep(0.001)
+    finally:
+        autoscaler.stop()
+        manager.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark autoscaler decisions and scale-up reaction time")
+    parser.add_argument("--pending", type=int, nargs="+", default=[1000, 10000, 100000],
+                        help="Queued pods for the decision cost")
+    parser.add_argument("--evaluations", type=int, default=20, help="Evaluations timed per queue size")
+    parser.add_argument("--burst", type=int, default=2000, help="Pods queued at once for the reaction time")
+    parser.add_argument("--launch-delay", type=float, nargs="+", default=[0, 0.1, 1.0],
+                        help="Seconds each fake node launch takes")
+    parser.add_argument("--warm-nodes", type=int, nargs="+", default=[0, 200], help="Warm pool sizes, per node shape")
+    args = parser.parse_args()
+
+    print("{:<10} {:<12} {:>14}".format("PENDING", "DEMAND", "EVALUATE us"))
+    print("-" * 38)
+    for pending_count in args.pending:
+        for name, autoscaler_class in (("aggregate", Autoscaler), ("rescan", RescanningAutoscaler)):
+            print("{:<10} {:<12} {:>14.1f}".format(
+                pending_count, name, decision_cost(autoscaler_class, pending_count, args.evaluations)))
+
+    print()
+    print("{:<8} {:>10} {:>6} {:>14} {:>14} {:>8}".format(
+        "BURST", "LAUNCH s", "WARM", "FIRST NODE s", "ALL PLACED s", "NODES"))
+    print("-" * 65)
+    for delay in args.launch_delay:
+        for pool_size in args.warm_nodes:
+            first, placed, added = reaction_time(args.burst, delay, pool_size)
+            print("{:<8} {:>10.2f} {:>6} {:>14.3f} {:>14.3f} {:>8}".format(
+                args.burst, delay, pool_size, first, placed, added))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+Throughput benchmark of the cluster_client SDK against per-call requests
+
+Starts a server mode in a subprocess (or targets --url), registers --nodes
+nodes with room for every pod launched, then issues --requests calls of
+GET /cluster_summary and POST /launch_pod in each of these ways:
+
+    per-call        requests.get/post for every call, as client.make_request
+                    did: a new connection per request
+    per-call xN     the same from --concurrency threads
+    pooled          ClusterClient, one keep-alive connection reused
+    pooled xN       ClusterClient.map_parallel on --concurrency threads
+    async xN        AsyncClusterClient.map_concurrent, --concurrency in flight
+
+and finally launches --requests pods with one bulk /launch_pods call.
+Reported are the calls per second and the speedup over per-call. The
+Flask development server answers in HTTP/1.0 and closes every connection,
+so pooling only pays off against the async or wsgi modes.
+
+Usage:
+    python -m benchmarks.bench_client --mode async --requests 2000 --concurrency 16
+    python -m benchmarks.bench_client --url http://localhost:5002
+"""
+import argparse
+import asyncio
+import concurrent.futures
+import threading
+import time
+
+import requests
+
+from benchmarks.bench_server import SERVER_COMMANDS, start_server
+from cluster_client import AsyncClusterClient, ClusterClient
+
+# Endpoints driven: (label, method, endpoint, body)
+WORKLOADS = [
+    ("summary", "GET", "/cluster_summary", None),
+    ("launch_pod", "POST", "/launch_pod", {"cpu_cores": 1}),
+]
+
+
+def per_call(url, method, endpoint, data):
+    if method == "GET":
+        response = requests.get(url + endpoint, timeout=5)
+    else:
+        response = requests.post(url + endpoint, json=data, timeout=5)
+    return response.json()
+
+
+def keep_alive(client, node_ids, stop, interval=2):
+    """Heartbeat every node until stop is set, so none is marked unhealthy during the run"""
+    batch = [{"node_id": node_id} for node_id in node_ids]
+    while not stop.wait(interval):
+        client.heartbeats(batch)
+
+
+def timed(fn):
+    """Return the seconds fn takes"""
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def run_workload(url, method, endpoint, data, count, concurrency):
+    """Return [(way, seconds)] for count calls of one endpoint"""
+    calls = range(count)
+    results = []
+
+    results.append(("per-call", timed(lambda: [per_call(url, method, endpoint, data) for _ in calls])))
+
+    def per_call_threads():
+        with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(lambda _: per_call(url, method, endpoint, data), calls))
+    results.append(("per-call x{}".format(concurrency), timed(per_call_threads)))
+
+    with ClusterClient(url, pool_size=concurrency) as client:
+        results.append(("pooled", timed(lambda: [client.request(method, endpoint, data) for _ in calls])))
+        results.append(("pooled x{}".format(concurrency),
+                        timed(lambda: client.map_parallel(lambda _: client.request(method, endpoint, data),
+                                                          calls))))
+
+    async def concurrent_calls():
+        async with AsyncClusterClient(url, pool_size=concurrency) as client:
+            await client.map_concurrent(lambda _: client.request(method, endpoint, data), calls)
+    results.append(("async x{}".format(concurrency), timed(lambda: asyncio.run(concurrent_calls()))))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the pooled client SDK against per-call requests")
+    parser.add_argument("--mode", default="async", choices=sorted(SERVER_COMMANDS), help="Server mode to start")
+    parser.add_argument("--url", help="Benchmark an already running server instead")
+    parser.add_argument("--port", type=int, default=5103, help="Port for the started server")
+    parser.add_argument("--nodes", type=int, default=100, help="Nodes registered before the run")
+    parser.add_argument("--requests", type=int, default=2000, help="Calls per endpoint and way")
+    parser.add_argument("--concurrency", type=int, default=16, help="Threads or requests in flight")
+    args = parser.parse_args()
+
+    process = None
+    url = args.url
+    if url is None:
+        process, url = start_server(args.mode, args.port)
+    stop = threading.Event()
+    try:
+        with ClusterClient(url) as client:
+            # Room for every pod each way launches, plus the bulk launch
+            cores = -(-args.requests * 6 // args.nodes)
+            node_ids = [client.add_node(cores)["node_id"] for _ in range(args.nodes)]
+            threading.Thread(target=keep_alive, args=(ClusterClient(url), node_ids, stop), daemon=True).start()
+
+            print("{:<12} {:<14} {:>12} {:>10}".format("ENDPOINT", "CLIENT", "CALLS/S", "SPEEDUP"))
+            print("-" * 51)
+            for label, method, endpoint, data in WORKLOADS:
+                results = run_workload(url, method, endpoint, data, args.requests, args.concurrency)
+                baseline = results[0][1]
+                for way, seconds in results:
+                    print("{:<12} {:<14} {:>12,.0f} {:>9.1f}x".format(
+                        label, way, args.requests / seconds, baseline / seconds))
+
+            seconds = timed(lambda: client.launch_pods([1] * args.requests))
+            print("{:<12} {:<14} {:>12,.0f} {:>10}".format("launch_pods", "bulk (pods/s)",
+                                                          args.requests / seconds, "-"))
+    finally:
+        stop.set()
+        if process:
+            process.terminate()
+            process.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Benchmark of sustained heartbeat ingestion
+
+Measures how many heartbeats per second one server process absorbs when
+each heartbeat is its own /heartbeat request versus batched /heartbeats
+requests. By default requests go through Flask's in-process test client,
+which measures server-side handling cost only; pass --url to drive a
+running server over HTTP with one keep-alive connection instead.
+
+Usage:
+    python -m benchmarks.bench_heartbeats --nodes 5000 --duration 5
+    python -m benchmarks.bench_heartbeats --url http://localhost:5002
+"""
+import argparse
+import logging
+import time
+
+logging.disable(logging.CRITICAL)
+
+
+class InProcessTarget:
+    def __init__(self):
+        import api_server
+        self.client = api_server.app.test_client()
+
+    def post(self, endpoint, data):
+        return self.client.post(endpoint, json=data).get_json()
+
+
+class HttpTarget:
+    def __init__(self, url):
+        import requests
+        self.url = url
+        self.session = requests.Session()
+
+    def post(self, endpoint, data):
+        return self.session.post(self.url + endpoint, json=data, timeout=30).json()
+
+
+def register_nodes(target, count):
+    return [target.post('/add_node', {"cpu_cores": 4})["node_id"] for _ in range(count)]
+
+
+def run_single(target, node_ids, duration):
+    sent = 0
+    end = time.perf_counter() + duration
+    while time.perf_counter() < end:
+        for node_id in node_ids[:100]:
+            target.post('/heartbeat', {"node_id": node_id, "metrics": {"cpu_load": 0.5}})
+        sent += min(100, len(node_ids))
+    return sent
+
+
+def run_batched(target, node_ids, duration, batch_size):
+    sent = 0
+    start = 0
+    end = time.perf_counter() + duration
+    while time.perf_counter() < end:
+        chunk = node_ids[start:start + batch_size] or node_ids[:batch_size]
+        start = (start + batch_size) % len(node_ids)
+        now = time.time()
+        target.post('/heartbeats', {"heartbeats": [
+            {"node_id": node_id, "timestamp": now, "metrics": {"cpu_load": 0.5}} for node_id in chunk
+        ]})
+        sent += len(chunk)
+    return sent
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark heartbeat ingestion rate")
+    parser.add_argument("--url", help="Running API server (default: in-process test client)")
+    parser.add_argument("--nodes", type=int, default=5000, help="Registered nodes")
+    parser.add_argument("--duration", type=float, default=5, help="Seconds per mode")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[100, 1000], help="Batch sizes to test")
+    args = parser.parse_args()
+
+    target = HttpTarget(args.url) if args.url else InProcessTarget()
+    node_ids = register_nodes(target, args.nodes)
+
+    # A node heartbeating every 5 seconds needs 0.2 heartbeats/s
+    row = "{:<22} {:>14,.0f} {:>16,.0f}"
+    print("{:<22} {:>14} {:>16}".format("MODE", "HEARTBEATS/S", "NODES @ 5s"))
+    print("-" * 54)
+    rate = run_single(target, node_ids, args.duration) / args.duration
+    print(row.format("single /heartbeat", rate, rate * 5))
+    for batch_size in args.batch_sizes:
+        rate = run_batched(target, node_ids, args.duration, batch_size) / args.duration
+        print(row.format("/heartbeats x{}".format(batch_size), rate, rate * 5))
+
+
+if __name__ == "__main__":
+    main()
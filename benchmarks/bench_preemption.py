@@ -0,0 +1,118 @@
+"""
+Simulation benchmark of scheduling latency under a full cluster
+
+Fills --nodes nodes completely with low and normal priority pods, then
+launches --pods high and normal priority pods. None of them fit, so each
+launch preempts lower-priority pods; the evicted pods end up in the
+pending queue. Launch latency is reported for the Preemptor, which keeps
+per-node priority groups and per-rank capacity indexes, and for a brute
+force search that regroups every pod and scores every node on each launch.
+
+Usage:
+    python -m benchmarks.bench_preemption --nodes 1000 10000 --pods 2000
+"""
+import argparse
+import logging
+import random
+import time
+
+logging.disable(logging.CRITICAL)
+
+from cluster_state import PRIORITY_CLASSES, ClusterState  # noqa: E402
+from pending import PendingQueue  # noqa: E402
+from preemption import Preemptor  # noqa: E402
+from scheduler import Scheduler  # noqa: E402
+
+
+class BruteForcePreemptor(Preemptor):
+    """Regroups every pod and scores every node on each search"""
+
+    def find(self, cpu_req, priority="normal", resources=None):
+        limit = PRIORITY_CLASSES[priority]
+        groups = {}
+        for pod in self.state.pods.values():
+            rank = PRIORITY_CLASSES[pod.priority]
+            if rank < limit:
+                groups.setdefault(pod.assigned_node, {}).setdefault(rank, []).append(pod.id)
+
+        best = None
+        for node in self.state.nodes.values():
+            if node.status != "Healthy":
+                continue
+            for rank in range(limit):
+                victims = self.victims(node, groups.get(node.id, {}), rank, cpu_req, resources or {})
+                if victims is not None:
+                    cost = (rank, len(victims), sum(pod.cpu_cores for pod in victims))
+                    if best is None or cost < best[0]:
+                        best = (cost, node.id, victims)
+                    break
+        return None if best is None else (best[1], best[2])
+
+
+def build(node_count, seed, preemptor_class):
+    """Return (state, scheduler, preemptor) for a cluster filled to the last core"""
+    rng = random.Random(seed)
+    state = ClusterState()
+    scheduler = Scheduler(state)
+    queue = PendingQueue(state, scheduler)
+    preemptor = preemptor_class(state, scheduler, queue)
+    with state.lock:
+        for _ in range(node_count):
+            node = state.add_node(32)
+            while node.available_cores:
+                cpu = min(rng.randint(1, 8), node.available_cores)
+                state.add_pod(cpu, node.id, priority=rng.choice(("low", "low", "normal")))
+    return state, scheduler, preemptor
+
+
+def run(node_count, pod_count, preemptor_class, seed=7):
+    """
+    Launch pod_count pods into the full cluster
+
+    Returns:
+        (sorted launch latencies in microseconds, pods placed, pods evicted)
+    """
+    state, scheduler, preemptor = build(node_count, seed, preemptor_class)
+    rng = random.Random(seed + 1)
+    latencies = []
+    placed = 0
+    for _ in range(pod_count):
+        cpu = rng.randint(1, 8)
+        priority = rng.choice(("high", "normal"))
+        start = time.perf_counter()
+        with state.lock:
+            pod = scheduler.schedule(cpu, priority=priority)
+            if pod is None:
+                pod, _ = preemptor.preempt(cpu, priority)
+        latencies.append((time.perf_counter() - start) * 1e6)
+        placed += pod is not None
+    return sorted(latencies), placed, preemptor.evicted
+
+
+def percentile(values, fraction):
+    return values[int(fraction * (len(values) - 1))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark launch latency with preemption in a full cluster")
+    parser.add_argument("--nodes", type=int, nargs="+", default=[1000, 10000], help="Cluster sizes")
+    parser.add_argument("--pods", type=int, default=2000, help="Pods launched into the full cluster")
+    parser.add_argument("--skip-brute-force", action="store_true", help="Only run the indexed preemptor")
+    args = parser.parse_args()
+
+    print("{:<8} {:<12} {:>10} {:>10} {:>10} {:>8} {:>8}".format(
+        "NODES", "SEARCH", "MEAN us", "P50 us", "P99 us", "PLACED", "EVICTED"))
+    print("-" * 72)
+    variants = [("indexed", Preemptor)]
+    if not args.skip_brute_force:
+        variants.append(("brute force", BruteForcePreemptor))
+    for node_count in args.nodes:
+        for name, preemptor_class in variants:
+            latencies, placed, evicted = run(node_count, args.pods, preemptor_class)
+            print("{:<8} {:<12} {:>10.1f} {:>10.1f} {:>10.1f} {:>8,} {:>8,}".format(
+                node_count, name, sum(latencies) / len(latencies), percentile(latencies, 0.5),
+                percentile(latencies, 0.99), placed, evicted))
+
+
+if __name__ == "__main__":
+    main()
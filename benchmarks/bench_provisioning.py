@@ -0,0 +1,109 @@
+"""
+Benchmark of node-add latency through NodeManager, cold versus warm
+
+Sequential: --nodes nodes are added one after another, with no warm pool
+(every node launched cold) and with a pool of --pool warm nodes filled
+beforehand (claims only name a node; each claim launches a replacement in
+the background). Burst: --nodes adds are submitted at once and timed until
+every node is up, then all of them are removed concurrently.
+
+By default nodes come from the in-process fake backend, whose launches
+take --launch-delay seconds and claims --assign-delay seconds, standing in
+for a container start and a rename. --docker uses real containers.
+
+Usage:
+    python -m benchmarks.bench_provisioning --nodes 40 --pool 40 --launch-delay 0.5
+    python -m benchmarks.bench_provisioning --docker --nodes 10 --pool 10
+"""
+import argparse
+import concurrent.futures
+import logging
+import time
+
+logging.disable(logging.CRITICAL)
+
+from node_manager import DockerBackend, FakeBackend, NodeManager  # noqa: E402
+
+
+def percentile(values, fraction):
+    return values[int(fraction * (len(values) - 1))]
+
+
+def sequential(backend, count, pool_size, workers):
+    """
+    Add count nodes one at a time
+
+    Returns:
+        (sorted add latencies in milliseconds, nodes that came warm)
+    """
+    manager = NodeManager(backend, pool_size=pool_size, workers=workers, prefix="bench", shapes=[(4, {})])
+    try:
+        concurrent.futures.wait(manager.fill_pool())
+        latencies = []
+        warm = 0
+        for _ in range(count):
+            start = time.perf_counter()
+            node = manager.add_node(4)
+            latencies.append((time.perf_counter() - start) * 1e3)
+            warm += node["warm"]
+        for node_id in list(manager.nodes):
+            manager.remove_node(node_id)
+        return sorted(latencies), warm
+    finally:
+        manager.shutdown()
+
+
+def burst(backend, count, pool_size, workers):
+    """
+    Add count nodes at once, then remove them all at once
+
+    Returns:
+        (seconds until every node is up, seconds until every node is removed, nodes that came warm)
+    """
+    manager = NodeManager(backend, pool_size=pool_size, workers=workers, prefix="bench", shapes=[(4, {})])
+    try:
+        concurrent.futures.wait(manager.fill_pool())
+        start = time.perf_counter()
+        nodes = [future.result() for future in [manager.submit_add(4) for _ in range(count)]]
+        added = time.perf_counter() - start
+        start = time.perf_counter()
+        concurrent.futures.wait([manager.submit_remove(node["id"]) for node in nodes])
+        return added, time.perf_counter() - start, sum(node["warm"] for node in nodes)
+    finally:
+        manager.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark node-add latency, cold versus warm")
+    parser.add_argument("--nodes", type=int, default=40, help="Nodes added per run")
+    parser.add_argument("--pool", type=int, default=40, help="Warm nodes kept ready in the warm runs")
+    parser.add_argument("--workers", type=int, default=8, help="Launches and removals run at the same time")
+    parser.add_argument("--launch-delay", type=float, default=0.5, help="Seconds a fake launch takes")
+    parser.add_argument("--assign-delay", type=float, default=0.005, help="Seconds claiming a fake warm node takes")
+    parser.add_argument("--docker", action="store_true", help="Launch real Docker containers")
+    args = parser.parse_args()
+
+    def backend():
+        if args.docker:
+            return DockerBackend()
+        return FakeBackend(launch_delay=args.launch_delay, assign_delay=args.assign_delay,
+                           teardown_delay=args.launch_delay / 2)
+
+    print("{:<6} {:>6} {:>10} {:>10} {:>10} {:>6}".format("POOL", "NODES", "MEAN ms", "P50 ms", "P95 ms", "WARM"))
+    print("-" * 54)
+    for pool_size in (0, args.pool):
+        latencies, warm = sequential(backend(), args.nodes, pool_size, args.workers)
+        print("{:<6} {:>6} {:>10.1f} {:>10.1f} {:>10.1f} {:>6}".format(
+            pool_size, args.nodes, sum(latencies) / len(latencies), percentile(latencies, 0.5),
+            percentile(latencies, 0.95), warm))
+
+    print()
+    print("{:<6} {:>6} {:>12} {:>12} {:>6}".format("POOL", "BURST", "ALL UP s", "ALL GONE s", "WARM"))
+    print("-" * 48)
+    for pool_size in (0, args.nodes):
+        added, removed, warm = burst(backend(), args.nodes, pool_size, args.workers)
+        print("{:<6} {:>6} {:>12.3f} {:>12.3f} {:>6}".format(pool_size, args.nodes, added, removed, warm))
+
+
+if __name__ == "__main__":
+    main()
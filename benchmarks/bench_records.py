@@ -0,0 +1,116 @@
+"""
+Memory and latency benchmark of the cluster state at scale
+
+Registers --nodes nodes and places --pods pods on them directly through
+ClusterState (no scheduling decisions), then reports the memory the state
+holds (resident set growth, and bytes per pod) and the time a full garbage
+collection takes with it alive. Latencies are then timed on the full
+cluster: placing and removing a pod through the scheduler, moving a pod,
+and serving /list_pods and /list_nodes through the API handlers, one page
+and the whole listing, including encoding the response as JSON.
+
+Usage:
+    python -m benchmarks.bench_records --nodes 100000 --pods 1000000
+"""
+import argparse
+import gc
+import json
+import logging
+import random
+import time
+
+logging.disable(logging.CRITICAL)
+
+import api_server  # noqa: E402
+
+
+def resident_mb():
+    """Return the resident set size of this process in MB"""
+    with open("/proc/self/statm") as f:
+        pages = int(f.read().split()[1])
+    return pages * 4096 / 2**20
+
+
+def timed(fn, repeat):
+    """Return the mean microseconds per call of fn over repeat calls"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def build(state, node_count, pod_count, seed):
+    rng = random.Random(seed)
+    with state.lock:
+        node_ids = [state.add_node(64).id for _ in range(node_count)]
+        for i in range(pod_count):
+            state.add_pod(rng.randint(1, 4), node_ids[i % node_count])
+    return node_ids
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark cluster state memory and latency at scale")
+    parser.add_argument("--nodes", type=int, default=100000, help="Nodes registered")
+    parser.add_argument("--pods", type=int, default=1000000, help="Pods placed")
+    parser.add_argument("--repeat", type=int, default=20000, help="Calls timed per single-pod operation")
+    parser.add_argument("--page", type=int, default=500, help="Items per listing page")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    state = api_server.state
+    scheduler = api_server.scheduler
+    gc.collect()
+    before = resident_mb()
+    start = time.perf_counter()
+    node_ids = build(state, args.nodes, args.pods, args.seed)
+    built = time.perf_counter() - start
+    gc.collect()
+    held = resident_mb() - before
+    start = time.perf_counter()
+    gc.collect()
+    collect = time.perf_counter() - start
+
+    print("{:<10} {:>10} {:>10} {:>12} {:>14} {:>10}".format(
+        "NODES", "PODS", "BUILD s", "STATE MB", "BYTES/POD", "GC ms"))
+    print("-" * 72)
+    print("{:<10} {:>10} {:>10.2f} {:>12.1f} {:>14.0f} {:>10.1f}".format(
+        args.nodes, args.pods, built, held, held * 2**20 / max(args.pods, 1), collect * 1e3))
+
+    rng = random.Random(args.seed + 1)
+    pod_ids = list(state.pods)
+
+    def place_and_remove():
+        with state.lock:
+            pod = scheduler.schedule(2)
+            state.remove_pod(pod.id)
+
+    def move():
+        with state.lock:
+            state.move_pod(rng.choice(pod_ids), rng.choice(node_ids))
+
+    def listing(handler, data):
+        def call():
+            with state.lock:
+                body, _ = handler(data)
+            json.dumps(body)
+        return call
+
+    page = {"limit": str(args.page)}
+    results = [
+        ("schedule + remove pod", timed(place_and_remove, args.repeat)),
+        ("move pod", timed(move, args.repeat)),
+        ("/list_pods page of {}".format(args.page), timed(listing(api_server.list_pods, page), 200)),
+        ("/list_nodes page of {}".format(args.page), timed(listing(api_server.list_nodes, page), 200)),
+        ("/list_pods on one node", timed(listing(api_server.list_pods, {"node": node_ids[0]}), 2000)),
+        ("/list_pods all", timed(listing(api_server.list_pods, {}), 1)),
+        ("/list_nodes all", timed(listing(api_server.list_nodes, {}), 1)),
+    ]
+    print()
+    print("{:<28} {:>14}".format("OPERATION", "MEAN us"))
+    print("-" * 43)
+    for name, micros in results:
+        print("{:<28} {:>14.1f}".format(name, micros))
+
+
+if __name__ == "__main__":
+    main()
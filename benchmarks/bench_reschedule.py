@@ -0,0 +1,97 @@
+"""
+Benchmark of rescheduling after a mass node failure
+
+Builds a cluster where --fail of the nodes together hold --pods pods,
+lets those nodes miss their heartbeats, and times the health monitor
+failing them and moving every displaced pod. For comparison the same
+failure is handled by the previous per-pod first-fit scan over all nodes.
+
+Usage:
+    python -m benchmarks.bench_reschedule --nodes 10000 --pods 50000 --fail 0.1
+"""
+import argparse
+import logging
+import random
+import time
+
+logging.disable(logging.CRITICAL)
+
+from cluster_state import ClusterState  # noqa: E402
+from health_monitor import HealthMonitor  # noqa: E402
+from scheduler import Scheduler  # noqa: E402
+
+
+def build(node_count, pod_count, fail_fraction, seed):
+    """
+    Return (state, scheduler, monitor, failed node ids, time the failure is detected)
+
+    Failed nodes hold pod_count pods; the survivors are half full.
+    """
+    rng = random.Random(seed)
+    state = ClusterState()
+    scheduler = Scheduler(state)
+    monitor = HealthMonitor(state, heartbeat_timeout=15, scheduler=scheduler)
+    failed_count = int(node_count * fail_fraction)
+    with state.lock:
+        nodes = [state.add_node(256).id for _ in range(node_count)]
+        failed, survivors = nodes[:failed_count], nodes[failed_count:]
+        for i in range(pod_count):
+            state.add_pod(rng.randint(1, 4), failed[i % len(failed)])
+        for node_id in survivors:
+            while state.nodes[node_id].available_cores > 128:
+                state.add_pod(rng.randint(1, 4), node_id)
+        now = time.time()
+        for node_id in survivors:
+            state.record_heartbeat(node_id, now + 10)
+    return state, scheduler, monitor, failed, now + 16
+
+
+def legacy_reschedule(state, failed):
+    """The previous behaviour: a first-fit scan over every node for each pod"""
+    with state.lock:
+        for node_id in failed:
+            state.set_node_status(node_id, "Unhealthy")
+        for failed_id in failed:
+            for pod_id in list(state.pods_on_node(failed_id)):
+                cpu_req = state.pods[pod_id].cpu_cores
+                for node in state.nodes.values():
+                    if node.id == failed_id or node.status != "Healthy":
+                        continue
+                    if node.available_cores >= cpu_req:
+                        state.move_pod(pod_id, node.id)
+                        break
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark rescheduling after a mass node failure")
+    parser.add_argument("--nodes", type=int, default=10000, help="Nodes in the cluster")
+    parser.add_argument("--pods", type=int, default=50000, help="Pods on the failed nodes")
+    parser.add_argument("--fail", type=float, default=0.1, help="Fraction of nodes that fail")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed")
+    parser.add_argument("--skip-legacy", action="store_true", help="Do not run the per-pod scan")
+    args = parser.parse_args()
+
+    state, scheduler, monitor, failed, detected_at = build(args.nodes, args.pods, args.fail, args.seed)
+    print("{:,} nodes, {:,} pods; failing {:,} nodes holding {:,} pods".format(
+        len(state.nodes), len(state.pods), len(failed), args.pods))
+
+    start = time.perf_counter()
+    expired = monitor.check_expired(detected_at)
+    elapsed = time.perf_counter() - start
+    moved = sum(1 for pod in state.pods.values() if state.is_healthy(pod.assigned_node))
+    assert len(expired) == len(failed)
+    print("batch (capacity index)  {:>8.2f}s  {:>10,.0f} pods/s  {:,} pending".format(
+        elapsed, args.pods / elapsed, len(monitor.queue)))
+    if moved != len(state.pods) - len(monitor.queue):
+        raise SystemExit("FAILED: displaced pods unaccounted for")
+
+    if not args.skip_legacy:
+        state, scheduler, monitor, failed, detected_at = build(args.nodes, args.pods, args.fail, args.seed)
+        start = time.perf_counter()
+        legacy_reschedule(state, failed)
+        elapsed = time.perf_counter() - start
+        print("per-pod linear scan     {:>8.2f}s  {:>10,.0f} pods/s".format(elapsed, args.pods / elapsed))
+
+
+if __name__ == "__main__":
+    main()
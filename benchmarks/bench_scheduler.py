@@ -0,0 +1,93 @@
+"""
+Micro-benchmark of the scheduling policies
+
+Compares the capacity-indexed Scheduler against a linear scan over all
+nodes for first-fit, best-fit and worst-fit placement.
+
+Usage:
+    python -m benchmarks.bench_scheduler --nodes 10000 50000 --pods 20000
+"""
+import argparse
+import logging
+import random
+import time
+
+from cluster_state import ClusterState
+from scheduler import Scheduler, FIRST_FIT, BEST_FIT, WORST_FIT
+
+logging.disable(logging.CRITICAL)
+
+
+def linear_select(state, policy, cpu_req):
+    """Reference placement by scanning every node"""
+    if policy == FIRST_FIT:
+        for node in state.nodes.values():
+            if node.available_cores >= cpu_req:
+                return node
+        return None
+    fits = [n for n in state.nodes.values() if n.available_cores >= cpu_req]
+    if not fits:
+        return None
+    if policy == BEST_FIT:
+        return min(fits, key=lambda n: n.available_cores)
+    return max(fits, key=lambda n: n.available_cores)
+
+
+def build_state(node_count, seed):
+    rng = random.Random(seed)
+    state = ClusterState()
+    for _ in range(node_count):
+        state.add_node(rng.choice((4, 8, 16, 32, 64)))
+    return state
+
+
+def run(node_count, pod_count, policy, indexed, seed=42):
+    """
+    Launch pod_count pods, removing a random pod every third launch
+
+    Returns:
+        (microseconds per placement, number of pods placed)
+    """
+    rng = random.Random(seed)
+    state = build_state(node_count, seed)
+    scheduler = Scheduler(state, policy) if indexed else None
+    live = []
+    placed = 0
+
+    start = time.perf_counter()
+    for i in range(pod_count):
+        cpu_req = rng.randint(1, 8)
+        if indexed:
+            node = scheduler.select_node(cpu_req)
+        else:
+            node = linear_select(state, policy, cpu_req)
+        if node is not None:
+            live.append(state.add_pod(cpu_req, node.id).id)
+            placed += 1
+        if i % 3 == 2 and live:
+            j = rng.randrange(len(live))
+            live[j], live[-1] = live[-1], live[j]
+            state.remove_pod(live.pop())
+    elapsed = time.perf_counter() - start
+    return elapsed / pod_count * 1e6, placed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark scheduling policies")
+    parser.add_argument("--nodes", type=int, nargs="+", default=[10000, 50000], help="Cluster sizes")
+    parser.add_argument("--pods", type=int, default=20000, help="Pods launched per run")
+    args = parser.parse_args()
+
+    print("{:<8} {:<10} {:>14} {:>14} {:>9}".format(
+        "NODES", "POLICY", "LINEAR us/pod", "INDEX us/pod", "SPEEDUP"))
+    print("-" * 60)
+    for node_count in args.nodes:
+        for policy in (FIRST_FIT, BEST_FIT, WORST_FIT):
+            linear_us, _ = run(node_count, args.pods, policy, indexed=False)
+            index_us, _ = run(node_count, args.pods, policy, indexed=True)
+            print("{:<8} {:<10} {:>14.2f} {:>14.2f} {:>8.1f}x".format(
+                node_count, policy, linear_us, index_us, linear_us / index_us))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+Load-generation benchmark for the API server modes
+
+Starts each server mode in a subprocess (or targets --url), registers a
+set of nodes, then drives each endpoint with concurrent keep-alive
+clients and reports requests/s and p50/p99 latency per endpoint.
+
+Modes:
+    flask   python api_server.py (Flask development server)
+    async   python async_server.py (aiohttp)
+    wsgi    gunicorn wsgi:app with one worker and many threads (if installed)
+
+Usage:
+    python -m benchmarks.bench_server --modes flask async --duration 5
+    python -m benchmarks.bench_server --url http://localhost:5002
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import subprocess
+import sys
+import time
+import urllib.request
+
+import aiohttp
+
+from stats import percentile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SERVER_COMMANDS = {
+    "flask": lambda port: [sys.executable, "api_server.py", "--port", str(port)],
+    "async": lambda port: [sys.executable, "async_server.py", "--port", str(port)],
+    "wsgi": lambda port: ["gunicorn", "--workers", "1", "--threads", "16",
+                          "--bind", "127.0.0.1:{}".format(port), "wsgi:app"],
+}
+
+
+def start_server(mode, port):
+    """Start a server mode in a subprocess and wait until it answers"""
+    process = subprocess.Popen(SERVER_COMMANDS[mode](port), cwd=ROOT,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = "http://127.0.0.1:{}".format(port)
+    deadline = time.time() + 15
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(url + "/", timeout=1)
+            return process, url
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError("{} server did not start".format(mode))
+
+
+async def drive(session, url, endpoint, make_request, concurrency, duration):
+    """Send requests from concurrency workers for duration seconds"""
+    latencies = []
+    errors = 0
+    end = time.perf_counter() + duration
+
+    async def worker(worker_id):
+        nonlocal errors
+        i = 0
+        while time.perf_counter() < end:
+            method, data = make_request(worker_id, i)
+            i += 1
+            start = time.perf_counter()
+            async with session.request(method, url + endpoint, json=data) as response:
+                await response.read()
+                if response.status >= 500 and response.status != 503:
+                    errors += 1
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(worker(w) for w in range(concurrency)))
+    latencies.sort()
+    return len(latencies) / duration, percentile(latencies, 50), percentile(latencies, 99), errors
+
+
+async def run_mode(url, nodes, concurrency, duration):
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        node_ids = []
+        for _ in range(nodes):
+            async with session.post(url + "/add_node", json={"cpu_cores": 1000000}) as response:
+                node_ids.append((await response.json())["node_id"])
+
+        workloads = [
+            ("/heartbeat", lambda w, i: ("POST", {"node_id": node_ids[(w + i) % len(node_ids)]})),
+            ("/launch_pod", lambda w, i: ("POST", {"cpu_cores": 1})),
+            ("/list_nodes", lambda w, i: ("GET", None)),
+            ("/add_node", lambda w, i: ("POST", {"cpu_cores": 4})),
+        ]
+        results = []
+        for endpoint, make_request in workloads:
+            results.append((endpoint,) + await drive(session, url, endpoint, make_request, concurrency, duration))
+        return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark API server modes")
+    parser.add_argument("--modes", nargs="+", default=["flask", "async"], choices=sorted(SERVER_COMMANDS),
+                        help="Server modes to start and benchmark")
+    parser.add_argument("--url", help="Benchmark an already running server instead")
+    parser.add_argument("--port", type=int, default=5102, help="Port for started servers")
+    parser.add_argument("--nodes", type=int, default=100, help="Nodes registered before the run")
+    parser.add_argument("--concurrency", type=int, default=32, help="Concurrent clients")
+    parser.add_argument("--duration", type=float, default=5, help="Seconds per endpoint")
+    args = parser.parse_args()
+
+    targets = [("url", args.url)] if args.url else [(mode, None) for mode in args.modes]
+
+    print("{:<7} {:<13} {:>10} {:>10} {:>10} {:>7}".format(
+        "MODE", "ENDPOINT", "REQ/S", "P50 ms", "P99 ms", "ERRORS"))
+    print("-" * 62)
+    for mode, url in targets:
+        process = None
+        if url is None:
+            if mode == "wsgi" and not shutil.which("gunicorn"):
+                print("{:<7} skipped: gunicorn is not installed".format(mode))
+                continue
+            process, url = start_server(mode, args.port)
+        try:
+            results = asyncio.run(run_mode(url, args.nodes, args.concurrency, args.duration))
+        finally:
+            if process:
+                process.terminate()
+                process.wait()
+        for endpoint, rate, p50, p99, errors in results:
+            print("{:<7} {:<13} {:>10,.0f} {:>10.2f} {:>10.2f} {:>7}".format(
+                mode, endpoint, rate, p50 * 1000, p99 * 1000, errors))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Benchmark of pod usage tracking and usage-based packing, without a server
+
+Recording: --nodes nodes, each with --pods-per-node pods, report one usage
+sample per pod per heartbeat; reported are the time to record a heartbeat
+and the samples stored per second, including the estimate updates.
+
+Packing: pods that request 1 to 8 cores but use only a fraction of it
+(drawn per pod around --usage-fraction) are launched until the cluster is
+full, first by requests and then with usage packing at each --overcommit
+ratio after every pod has reported --samples heartbeats. Reported are the
+pods placed, requested cores per core and the busiest node's actual usage.
+
+Usage:
+    python -m benchmarks.bench_usage --nodes 1000 --pods-per-node 20 --overcommit 1.5 2
+"""
+import argparse
+import logging
+import random
+import time
+
+logging.disable(logging.CRITICAL)
+
+from cluster_state import ClusterState  # noqa: E402
+from scheduler import Scheduler  # noqa: E402
+from usage import UsageStore  # noqa: E402
+
+
+def record_cost(node_count, pods_per_node, heartbeats, seed=7):
+    """Return (microseconds per heartbeat, samples per second)"""
+    rng = random.Random(seed)
+    clock = [0.0]
+    state = ClusterState(clock=lambda: clock[0])
+    store = UsageStore(state)
+    reports = []
+    with state.lock:
+        for _ in range(node_count):
+            node = state.add_node(pods_per_node)
+            pods = [state.add_pod(1, node.id).id for _ in range(pods_per_node)]
+            reports.append((node.id, pods))
+
+    elapsed = 0.0
+    for _ in range(heartbeats):
+        clock[0] += 5
+        for node_id, pods in reports:
+            usage = {pod_id: rng.random() for pod_id in pods}
+            start = time.perf_counter()
+            with state.lock:
+                store.record(node_id, usage)
+            elapsed += time.perf_counter() - start
+    count = heartbeats * node_count
+    return elapsed / count * 1e6, count * pods_per_node / elapsed
+
+
+def packing(node_count, overcommit, usage_fraction, samples, seed=7):
+    """
+    Launch pods until none fits
+
+    Returns:
+        (pods placed, requested cores per core, highest actual usage of a node as a fraction of its cores)
+    """
+    rng = random.Random(seed)
+    clock = [0.0]
+    state = ClusterState(clock=lambda: clock[0])
+    scheduler = Scheduler(state)
+    store = UsageStore(state)
+    fractions = {}  # {pod_id: fraction of its request it uses}
+    with state.lock:
+        for _ in range(node_count):
+            state.add_node(32)
+        if overcommit:
+            scheduler.pack_by_usage(store, overcommit)
+
+        failures = 0
+        while failures < 20:
+            pod = scheduler.schedule(rng.randint(1, 8))
+            if pod is None:
+                failures += 1
+                continue
+            fractions[pod.id] = min(1.0, max(0.05, rng.gauss(usage_fraction, 0.1)))
+            if overcommit:
+                # The new pod reports its usage for a while before the next launch
+                for _ in range(samples):
+                    clock[0] += 5
+                    store.record(pod.assigned_node, {pod.id: pod.cpu_cores * fractions[pod.id]})
+
+        requested = sum(pod.cpu_cores for pod in state.pods.values())
+        used = {}
+        for pod in state.pods.values():
+            used[pod.assigned_node] = used.get(pod.assigned_node, 0) + pod.cpu_cores * fractions[pod.id]
+    return len(state.pods), requested / (32 * node_count), max(used.values()) / 32
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark pod usage tracking and usage-based packing")
+    parser.add_argument("--nodes", type=int, default=1000, help="Nodes reporting usage")
+    parser.add_argument("--pods-per-node", type=int, default=20, help="Pods per reporting node")
+    parser.add_argument("--heartbeats", type=int, default=10, help="Heartbeats per node timed")
+    parser.add_argument("--packing-nodes", type=int, default=50, help="32-core nodes filled in the packing runs")
+    parser.add_argument("--usage-fraction", type=float, default=0.4, help="Mean fraction of its request a pod uses")
+    parser.add_argument("--samples", type=int, default=6, help="Usage samples each pod reports before the next launch")
+    parser.add_argument("--overcommit", type=float, nargs="+", default=[1.5, 2.0, 3.0],
+                        help="Overcommit ratios of the usage packing runs")
+    args = parser.parse_args()
+
+    per_heartbeat, rate = record_cost(args.nodes, args.pods_per_node, args.heartbeats)
+    print("{:<8} {:>10} {:>16} {:>16}".format("NODES", "PODS/NODE", "HEARTBEAT us", "SAMPLES/s"))
+    print("-" * 54)
+    print("{:<8} {:>10} {:>16.1f} {:>16.0f}".format(args.nodes, args.pods_per_node, per_heartbeat, rate))
+
+    print()
+    print("{:<12} {:>8} {:>16} {:>18}".format("PACKING", "PODS", "REQUESTED/CORE", "PEAK NODE USAGE"))
+    print("-" * 58)
+    for overcommit in [None] + args.overcommit:
+        placed, requested, peak = packing(args.packing_nodes, overcommit, args.usage_fraction, args.samples)
+        label = "requests" if overcommit is None else "usage x{:g}".format(overcommit)
+        print("{:<12} {:>8} {:>16.2f} {:>18.2f}".format(label, placed, requested, peak))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""
+Benchmark of the write-ahead log: write throughput and recovery time
+
+Write throughput runs /launch_pod and /remove_pod handlers from several
+threads, each request waiting until its change is durable (as the servers
+do), in four modes:
+
+    memory      no persistence
+    wal         logged, commits left to the OS page cache (--no-fsync)
+    wal+fsync   logged, every group commit fsynced
+    unbatched   fsync per request while holding the lock (for comparison)
+
+Recovery builds a cluster of --pods pods, then times a restart from the
+log alone and from a snapshot.
+
+Usage:
+    python -m benchmarks.bench_wal --requests 20000 --threads 8 --pods 100000
+"""
+import argparse
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+logging.disable(logging.CRITICAL)
+
+from cluster_state import ClusterState  # noqa: E402
+from health_monitor import HealthMonitor  # noqa: E402
+from scheduler import Scheduler  # noqa: E402
+from wal import WriteAheadLog  # noqa: E402
+
+
+class Cluster:
+    """A standalone state/scheduler pair, optionally persisted"""
+
+    def __init__(self, directory=None, fsync=True, unbatched=False, snapshot_every=10 ** 9):
+        self.state = ClusterState()
+        self.scheduler = Scheduler(self.state)
+        self.monitor = HealthMonitor(self.state, scheduler=self.scheduler)
+        self.wal = None
+        self.unbatched = unbatched
+        if directory:
+            self.wal = WriteAheadLog(self.state, directory, fsync=fsync, snapshot_every=snapshot_every)
+            self.wal.start()
+
+    def request(self, operation):
+        with self.state.lock:
+            operation()
+            lsn = self.wal.lsn if self.wal else 0
+            if self.unbatched:
+                self.wal._commit()
+        if self.wal:
+            self.wal.wait_durable(lsn)
+
+    def close(self):
+        if self.wal:
+            self.wal.stop()
+
+
+def write_throughput(cluster, requests, threads):
+    """Launch and remove pods from several threads; returns requests/s"""
+    with cluster.state.lock:
+        for _ in range(100):
+            cluster.state.add_node(1000)
+
+    def worker(count):
+        pods = []
+        for i in range(count):
+            if i % 2 == 0:
+                cluster.request(lambda: pods.append(cluster.scheduler.schedule(1).id))
+            else:
+                cluster.request(lambda: cluster.state.remove_pod(pods.pop()))
+
+    per_thread = requests // threads
+    workers = [threading.Thread(target=worker, args=(per_thread,)) for _ in range(threads)]
+    start = time.perf_counter()
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    elapsed = time.perf_counter() - start
+    return per_thread * threads / elapsed
+
+
+def build_cluster(directory, pods):
+    """Fill a persisted cluster with pods (16 per node) and close it"""
+    cluster = Cluster(directory, fsync=False)
+    with cluster.state.lock:
+        for _ in range(pods // 16 + 1):
+            cluster.state.add_node(64)
+        for _ in range(pods):
+            cluster.scheduler.schedule(4)
+    cluster.close()
+    return cluster
+
+
+def time_recovery(directory):
+    start = time.perf_counter()
+    cluster = Cluster(directory)
+    elapsed = time.perf_counter() - start
+    cluster.close()
+    return elapsed, len(cluster.state.pods)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark write-ahead log throughput and recovery")
+    parser.add_argument("--requests", type=int, default=20000, help="Requests per write mode")
+    parser.add_argument("--threads", type=int, default=8, help="Concurrent request threads")
+    parser.add_argument("--pods", type=int, default=100000, help="Pods in the recovery benchmark")
+    args = parser.parse_args()
+
+    print("{:<12} {:>12}".format("MODE", "REQ/S"))
+    print("-" * 25)
+    modes = [
+        ("memory", {}),
+        ("wal", {"fsync": False}),
+        ("wal+fsync", {"fsync": True}),
+        ("unbatched", {"fsync": True, "unbatched": True}),
+    ]
+    for name, options in modes:
+        directory = tempfile.mkdtemp() if options else None
+        try:
+            cluster = Cluster(directory, **options)
+            rate = write_throughput(cluster, args.requests, args.threads)
+            cluster.close()
+        finally:
+            if directory:
+                shutil.rmtree(directory)
+        print("{:<12} {:>12,.0f}".format(name, rate))
+
+    directory = tempfile.mkdtemp()
+    try:
+        cluster = build_cluster(directory, args.pods)
+        log_size = sum(os.path.getsize(os.path.join(directory, f)) for f in os.listdir(directory))
+        elapsed, recovered = time_recovery(directory)
+        print("\nRecovery of {:,} pods from the log ({:.1f} MB): {:.2f}s".format(
+            recovered, log_size / 1e6, elapsed))
+
+        cluster = Cluster(directory)
+        cluster.wal.snapshot()
+        cluster.close()
+        snapshot_size = os.path.getsize(os.path.join(directory, "snapshot.json"))
+        elapsed, recovered = time_recovery(directory)
+        print("Recovery of {:,} pods from a snapshot ({:.1f} MB): {:.2f}s".format(
+            recovered, snapshot_size / 1e6, elapsed))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""
+Integration test of the replicated control plane: replication, read
+scaling and leader failover
+
+Starts --replicas API server processes on localhost that elect a leader,
+writes nodes and pods through a follower (which forwards writes to the
+leader), and checks every replica serves the same data. It then measures
+/list_nodes throughput against the leader alone and spread over all
+replicas (followers answer reads without the leader, so this only grows
+when the machine has a core per replica and reader process), kills the leader with SIGKILL and measures how long it takes
+until the survivors elect a new leader and accept writes again, and
+checks no acknowledged write was lost. Exits non-zero on any failure.
+
+Usage:
+    python -m benchmarks.failover --replicas 3 --mode async
+"""
+import argparse
+import asyncio
+import os
+import signal
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import aiohttp
+import requests
+
+from benchmarks.bench_server import drive
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SERVERS = {"flask": "api_server.py", "async": "async_server.py"}
+
+
+def start_replicas(mode, ports):
+    urls = ["http://127.0.0.1:{}".format(port) for port in ports]
+    processes = []
+    for port, url in zip(ports, urls):
+        peers = [peer for peer in urls if peer != url]
+        command = [sys.executable, SERVERS[mode], "--host", "127.0.0.1", "--port", str(port), "--peers"] + peers
+        processes.append(subprocess.Popen(command, cwd=ROOT, stdout=subprocess.DEVNULL,
+                                          stderr=subprocess.DEVNULL))
+    return processes, urls
+
+
+def find_leader(urls, timeout=15, exclude=None):
+    """Return the URL every reachable replica agrees is leader (other than exclude)"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        leaders = set()
+        for url in urls:
+            try:
+                status = requests.get(url + "/replication/status", timeout=0.5).json()
+            except (requests.exceptions.RequestException, ValueError):
+                continue
+            leaders.add(status.get("leader"))
+        if len(leaders) == 1 and not leaders & {None, exclude}:
+            return leaders.pop()
+        time.sleep(0.05)
+    raise RuntimeError("No leader elected within {}s".format(timeout))
+
+
+def counts(url):
+    summary = requests.get(url + "/cluster_summary", timeout=2).json()
+    return summary["total_nodes"], summary["total_pods"]
+
+
+def wait_replicated(urls, expected, timeout=10):
+    """Wait until every replica reports the expected (nodes, pods); returns seconds taken"""
+    start = time.time()
+    while time.time() - start < timeout:
+        if all(counts(url) == expected for url in urls):
+            return time.time() - start
+        time.sleep(0.01)
+    raise RuntimeError("Replicas did not converge: {}".format([counts(url) for url in urls]))
+
+
+async def _read(url, concurrency, duration):
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        return (await drive(session, url, "/list_nodes?limit=100",
+                            lambda w, i: ("GET", None), concurrency, duration))[0]
+
+
+def _read_process(url, concurrency, duration):
+    return asyncio.run(_read(url, concurrency, duration))
+
+
+def read_throughput(urls, concurrency, duration):
+    """Total /list_nodes req/s of one client process per URL, run in parallel"""
+    with ProcessPoolExecutor(max_workers=len(urls)) as pool:
+        return sum(pool.map(_read_process, urls, [concurrency] * len(urls), [duration] * len(urls)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replication and failover test of the API server")
+    parser.add_argument("--replicas", type=int, default=3, help="Number of API server processes")
+    parser.add_argument("--mode", default="async", choices=sorted(SERVERS), help="Server mode to run")
+    parser.add_argument("--port", type=int, default=5301, help="Port of the first replica")
+    parser.add_argument("--nodes", type=int, default=200, help="Nodes written before failover")
+    parser.add_argument("--pods", type=int, default=1000, help="Pods written before failover")
+    parser.add_argument("--concurrency", type=int, default=16, help="Concurrent readers per replica")
+    parser.add_argument("--duration", type=float, default=3, help="Seconds per read benchmark")
+    args = parser.parse_args()
+
+    processes, urls = start_replicas(args.mode, range(args.port, args.port + args.replicas))
+    failed = False
+    try:
+        start = time.time()
+        leader = find_leader(urls)
+        print("Leader {} elected in {:.2f}s".format(leader, time.time() - start))
+
+        # Write through a follower to exercise forwarding to the leader
+        follower = next(url for url in urls if url != leader)
+        session = requests.Session()
+        start = time.time()
+        for _ in range(args.nodes):
+            session.post(follower + "/add_node", json={"cpu_cores": 64}).raise_for_status()
+        session.post(follower + "/launch_pods", json={"cpu_cores": [1] * args.pods}).raise_for_status()
+        print("Wrote {} nodes and {} pods through a follower in {:.2f}s".format(
+            args.nodes, args.pods, time.time() - start))
+        lag = wait_replicated(urls, (args.nodes, args.pods))
+        print("All replicas converged {:.0f}ms after the last write".format(lag * 1000))
+
+        # The same client processes, all against the leader, then one per replica
+        single = read_throughput([leader] * len(urls), args.concurrency, args.duration)
+        spread = read_throughput(urls, args.concurrency, args.duration)
+        print("/list_nodes: {:,.0f} req/s from the leader, {:,.0f} req/s across {} replicas".format(
+            single, spread, len(urls)))
+        cores = os.cpu_count() or 1
+        if cores < 2 * len(urls):
+            print("  ({} CPU cores for {} replicas and {} reader processes: reads cannot scale here)".format(
+                cores, len(urls), len(urls)))
+
+        leader_process = processes[urls.index(leader)]
+        survivors = [url for url in urls if url != leader]
+        leader_process.send_signal(signal.SIGKILL)
+        killed = time.time()
+
+        new_leader = find_leader(survivors, exclude=leader)
+        elected = time.time() - killed
+        while True:
+            try:
+                response = session.post(survivors[0] + "/add_node", json={"cpu_cores": 64}, timeout=1)
+                if response.status_code == 200:
+                    break
+            except requests.exceptions.RequestException:
+                pass
+            time.sleep(0.01)
+        writable = time.time() - killed
+        print("Killed leader; {} elected after {:.0f}ms, writes accepted after {:.0f}ms".format(
+            new_leader, elected * 1000, writable * 1000))
+
+        wait_replicated(survivors, (args.nodes + 1, args.pods))
+        print("OK: no acknowledged write was lost")
+    except RuntimeError as e:
+        print("FAILED: {}".format(e))
+        failed = True
+    finally:
+        for process in processes:
+            process.kill()
+            process.wait()
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
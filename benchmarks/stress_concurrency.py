@@ -0,0 +1,193 @@
+"""
+Concurrent stress test of the API server and health monitor
+
+Several threads hammer /launch_pod, /remove_pod, /heartbeat and
+/remove_node through Flask test clients while a chaos thread stops and
+resumes heartbeats so the HealthMonitor keeps failing nodes and
+rescheduling their pods. At the end the CPU accounting of every node is
+checked against the pods bound to it. Exits non-zero on any violation.
+
+Usage:
+    python -m benchmarks.stress_concurrency --duration 10 --nodes 50 --workers 8
+"""
+import argparse
+import logging
+import random
+import sys
+import threading
+import time
+
+logging.disable(logging.CRITICAL)
+
+import api_server  # noqa: E402
+
+
+def check_invariants(state, scheduler):
+    """Return a list of accounting violations (empty if consistent)"""
+    errors = []
+    with state.lock:
+        for node_id, node in state.nodes.items():
+            used = 0
+            for pod_id in node.pods:
+                pod = state.pods.get(pod_id)
+                if pod is None:
+                    errors.append("{} lists missing pod {}".format(node_id, pod_id))
+                    continue
+                if pod.assigned_node != node_id:
+                    errors.append("{} lists {} assigned to {}".format(node_id, pod_id, pod.assigned_node))
+                used += pod.cpu_cores
+            if node.available_cores != node.cpu_cores - used:
+                errors.append("{} available {} != {} - {}".format(
+                    node_id, node.available_cores, node.cpu_cores, used))
+            if node.available_cores < 0:
+                errors.append("{} overcommitted: {}".format(node_id, node.available_cores))
+
+            indexed = scheduler.index.available_cores(node_id)
+            if node.status == "Healthy" and node_id not in scheduler.cordoned:
+                if indexed != node.available_cores:
+                    errors.append("{} indexed with {} cores, has {}".format(
+                        node_id, indexed, node.available_cores))
+            elif indexed is not None:
+                errors.append("{} is {} but still indexed".format(node_id, node.status))
+
+        summary = state.summary()
+        expected = {
+            "total_cores": sum(n.cpu_cores for n in state.nodes.values()),
+            "available_cores": sum(n.available_cores for n in state.nodes.values()),
+            "healthy_nodes": sum(1 for n in state.nodes.values() if n.status == "Healthy"),
+        }
+        for key, value in expected.items():
+            if summary[key] != value:
+                errors.append("summary {} is {}, recount gives {}".format(key, summary[key], value))
+
+        for pod_id, pod in state.pods.items():
+            node = state.nodes.get(pod.assigned_node)
+            if node is None or pod_id not in node.pods:
+                errors.append("{} not listed on {}".format(pod_id, pod.assigned_node))
+    return errors
+
+
+class Stress:
+    def __init__(self, node_count, workers, heartbeat_timeout, seed):
+        self.app = api_server.app
+        self.node_count = node_count
+        self.workers = workers
+        self.heartbeat_timeout = heartbeat_timeout
+        self.rng = random.Random(seed)
+        self.alive = set()      # Nodes currently sending heartbeats
+        self.alive_lock = threading.Lock()
+        self.stop = threading.Event()
+        self.requests = 0
+        self.counter_lock = threading.Lock()
+
+    def _count(self, n=1):
+        with self.counter_lock:
+            self.requests += n
+
+    def add_node(self, client, rng):
+        response = client.post('/add_node', json={"cpu_cores": rng.choice((4, 8, 16))})
+        with self.alive_lock:
+            self.alive.add(response.get_json()["node_id"])
+
+    def worker(self, seed):
+        rng = random.Random(seed)
+        client = self.app.test_client()
+        launched = []
+        while not self.stop.is_set():
+            action = rng.random()
+            if action < 0.55:
+                response = client.post('/launch_pod', json={"cpu_cores": rng.randint(1, 4)})
+                if response.status_code == 200:
+                    launched.append(response.get_json()["pod"]["id"])
+            elif action < 0.6:
+                client.post('/launch_pods', json={
+                    "cpu_cores": [rng.randint(1, 4) for _ in range(5)], "gang": rng.random() < 0.5})
+            elif action < 0.95 and launched:
+                pod_id = launched.pop(rng.randrange(len(launched)))
+                client.post('/remove_pod', json={"pod_id": pod_id})
+            elif action < 0.97:
+                with self.alive_lock:
+                    node_id = rng.choice(sorted(self.alive)) if self.alive else None
+                    self.alive.discard(node_id)
+                if node_id:
+                    client.post('/remove_node', json={"node_id": node_id, "force": True})
+                self.add_node(client, rng)
+                self._count()
+            else:
+                client.get('/list_pods')
+            self._count()
+
+    def heartbeater(self):
+        client = self.app.test_client()
+        while not self.stop.is_set():
+            with self.alive_lock:
+                alive = list(self.alive)
+            for node_id in alive:
+                client.post('/heartbeat', json={"node_id": node_id})
+            self._count(len(alive))
+            time.sleep(self.heartbeat_timeout / 4)
+
+    def chaos(self):
+        """Stop and resume heartbeats of random nodes"""
+        stopped = set()
+        while not self.stop.is_set():
+            with self.alive_lock:
+                if self.alive and self.rng.random() < 0.6:
+                    node_id = self.rng.choice(sorted(self.alive))
+                    self.alive.discard(node_id)
+                    stopped.add(node_id)
+                elif stopped:
+                    node_id = stopped.pop()
+                    if node_id in api_server.state.nodes:
+                        self.alive.add(node_id)
+            time.sleep(self.heartbeat_timeout / 2)
+
+    def run(self, duration):
+        client = self.app.test_client()
+        for _ in range(self.node_count):
+            self.add_node(client, self.rng)
+
+        threads = [threading.Thread(target=self.worker, args=(i,)) for i in range(self.workers)]
+        threads.append(threading.Thread(target=self.heartbeater))
+        threads.append(threading.Thread(target=self.chaos))
+        for t in threads:
+            t.start()
+        time.sleep(duration)
+        self.stop.set()
+        for t in threads:
+            t.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent stress test of cluster accounting")
+    parser.add_argument("--duration", type=float, default=10, help="Seconds to run")
+    parser.add_argument("--nodes", type=int, default=50, help="Initial node count")
+    parser.add_argument("--workers", type=int, default=8, help="Concurrent client threads")
+    parser.add_argument("--heartbeat-timeout", type=float, default=0.5, help="Monitor timeout in seconds")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed")
+    args = parser.parse_args()
+
+    api_server.monitor.heartbeat_timeout = args.heartbeat_timeout
+    api_server.monitor.start()
+
+    stress = Stress(args.nodes, args.workers, args.heartbeat_timeout, args.seed)
+    stress.run(args.duration)
+    api_server.monitor.stop()
+
+    state = api_server.state
+    errors = check_invariants(state, api_server.scheduler)
+    unhealthy = sum(1 for node in state.nodes.values() if node.status != "Healthy")
+    print("{} requests in {:.0f}s ({:.0f} req/s)".format(
+        stress.requests, args.duration, stress.requests / args.duration))
+    print("{} nodes ({} unhealthy), {} pods".format(len(state.nodes), unhealthy, len(state.pods)))
+
+    if errors:
+        print("FAILED: {} accounting violations".format(len(errors)))
+        for error in errors[:20]:
+            print("  " + error)
+        sys.exit(1)
+    print("OK: core accounting is exact")
+
+
+if __name__ == "__main__":
+    main()
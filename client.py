@@ -1,12 +1,15 @@
-import requests
 import time
 import argparse
 import os
-import sys
+
+from cluster_client import ClusterClient, ClusterError, PAGE_SIZE
 
 # API server URL
 API_SERVER_URL = "http://localhost:5002"
 
+# Pooled connection to the API server shared by every menu action
+client = ClusterClient(API_SERVER_URL)
+
 def clear_screen():
     """Clear the terminal screen"""
     os.system('cls' if os.name == 'nt' else 'clear')
@@ -30,81 +33,70 @@ def make_request(endpoint, method="GET", data=None, verbose=True):
     Returns:
         Response JSON or None if request failed
     """
-    url = "{}{}".format(API_SERVER_URL, endpoint)
-    
-    try:
-        if method == "GET":
-            response = requests.get(url, timeout=5)
-        elif method == "POST":
-            response = requests.post(url, json=data, timeout=5)
-        else:
-            if verbose:
-                print("Unsupported method: {}".format(method))
-            return None
-            
-        # Check if response is successful
-        if response.status_code >= 400:
-            if verbose:
-                print("Error: {} - {}".format(response.status_code, response.text))
-            return None
-            
-        # Try to parse JSON, handle case where response might not be JSON
-        try:
-            return response.json()
-        except ValueError:
-            if verbose:
-                print("Warning: Response is not valid JSON: {}".format(response.text))
-            return {"message": response.text}
-        
-    except requests.exceptions.ConnectionError:
-        if verbose:
-            print("Connection error: Could not connect to the API server at {}".format(API_SERVER_URL))
-            print("Make sure the server is running and the URL is correct.")
-        return None
-    except requests.exceptions.Timeout:
+    if method not in ("GET", "POST"):
         if verbose:
-            print("Timeout error: The API server took too long to respond.")
+            print("Unsupported method: {}".format(method))
         return None
-    except requests.exceptions.RequestException as e:
+
+    try:
+        return client.request(method, endpoint, data)
+    except ClusterError as e:
         if verbose:
-            print("Request failed: {}".format(e))
+            print("Error: {}".format(e))
+            if e.status is None:
+                print("Make sure the server is running and the URL is correct.")
         return None
 
+def iter_pages(endpoint, key, page_size=PAGE_SIZE, **filters):
+    """
+    Yield every item of a paginated list endpoint, one page per request
+
+    Args:
+        endpoint: List endpoint to call (e.g. /list_nodes)
+        key: Response field holding the items (e.g. nodes)
+        page_size: Items requested per page
+        filters: Extra query parameters (e.g. status="Healthy")
+    """
+    try:
+        yield from client.iter_pages(endpoint, key, page_size, **filters)
+    except ClusterError as e:
+        print("Error: {}".format(e))
+
 def show_cluster_status():
     """Display overall cluster status"""
     print_header("Cluster Status")
     
-    response = make_request("/list_nodes")
-    if not response:
+    summary = make_request("/cluster_summary")
+    if not summary:
         print("Failed to get cluster status.")
         return
     
-    nodes = response.get('nodes', [])
-    
     # Nodes section
-    total_nodes = len(nodes)
-    healthy_nodes = sum(1 for node in nodes if node.get('status') == 'Healthy')
-    
     print("Nodes: {} total, {} healthy, {} unhealthy".format(
-        total_nodes, healthy_nodes, total_nodes - healthy_nodes))
+        summary.get('total_nodes', 0), summary.get('healthy_nodes', 0), summary.get('unhealthy_nodes', 0)))
     
     # Resources section
-    total_cores = sum(node.get('cpu_cores', 0) for node in nodes)
-    available_cores = sum(node.get('available_cores', 0) for node in nodes)
-    used_cores = total_cores - available_cores
-    utilization = (used_cores / total_cores * 100) if total_cores > 0 else 0
-    
     print("CPU Resources: {}/{} cores used ({:.1f}% utilization)".format(
-        used_cores, total_cores, utilization))
+        summary.get('used_cores', 0), summary.get('total_cores', 0), summary.get('utilization', 0) * 100))
     
     # Pods section
-    pod_response = make_request("/list_pods", verbose=False)
-    if pod_response:
-        total_pods = pod_response.get('total_pods', 0)
-        print("Pods: {} total".format(total_pods))
+    print("Pods: {} total".format(summary.get('total_pods', 0)))
     
     print("\nFetch complete cluster information with 'list nodes' and 'list pods'")
 
+def read_memory(prompt):
+    """Ask for an optional amount of memory in MiB; returns 0 if none"""
+    try:
+        memory_input = input(prompt).strip()
+        memory = int(memory_input) if memory_input else 0
+    except ValueError:
+        print("Invalid input. No memory will be requested.")
+        return 0
+    if memory < 0:
+        print("Memory must not be negative. No memory will be requested.")
+        return 0
+    return memory
+
 def add_node():
     """Add a node to the cluster"""
     print_header("Add Node")
@@ -121,8 +113,13 @@ def add_node():
     except ValueError:
         print("Invalid input. Using default value of 4 CPU cores.")
     
-    print("Adding node with {} CPU cores...".format(cpu_cores))
-    response = make_request("/add_node", "POST", {"cpu_cores": cpu_cores})
+    data = {"cpu_cores": cpu_cores}
+    memory = read_memory("Enter memory (MiB) for the node (or press Enter for none): ")
+    if memory:
+        data["memory"] = memory
+    
+    print("Adding node with {} CPU cores{}...".format(cpu_cores, " and {} MiB memory".format(memory) if memory else ""))
+    response = make_request("/add_node", "POST", data)
     
     if response:
         print("Node added successfully with ID: {}".format(response.get('node_id', 'unknown')))
@@ -134,13 +131,11 @@ def remove_node():
     print_header("Remove Node")
     
     # First, get list of nodes
-    response = make_request("/list_nodes")
-    if not response or not response.get('nodes'):
+    nodes = list(iter_pages("/list_nodes", "nodes"))
+    if not nodes:
         print("No nodes available to remove.")
         return
     
-    nodes = response.get('nodes', [])
-    
     # Display nodes
     print("Available nodes:")
     for i, node in enumerate(nodes):
@@ -196,22 +191,18 @@ def list_nodes():
     """List all nodes in the cluster"""
     print_header("Cluster Nodes")
     
-    response = make_request("/list_nodes")
-    if not response:
-        print("Failed to get node list.")
-        return
-    
-    nodes = response.get('nodes', [])
-    if not nodes:
-        print("No nodes found in the cluster.")
-        return
+    status_filter = input("Filter by status (Healthy/Unhealthy, or press Enter for all): ").strip()
     
     # Print as a simple table
     print(" {:<15} {:<10} {:<15} {:<10}".format(
         "NODE ID", "STATUS", "AVAILABLE/TOTAL", "PODS"))
     print("-" * 55)
     
-    for node in nodes:
+    count = 0
+    healthy = 0
+    for node in iter_pages("/list_nodes", "nodes", status=status_filter):
+        count += 1
+        healthy += node.get('status') == 'Healthy'
         available = node.get('available_cores', 0)
         total = node.get('cpu_cores', 0)
         status = node.get('status', 'Unknown')
@@ -223,31 +214,26 @@ def list_nodes():
             len(node.get('pods', []))
         ))
     
-    print("\nTotal: {} nodes, {} healthy".format(
-        len(nodes), 
-        sum(1 for node in nodes if node.get('status') == 'Healthy')
-    ))
+    if not count:
+        print("No nodes found in the cluster.")
+        return
+    
+    print("\nTotal: {} nodes, {} healthy".format(count, healthy))
 
 def list_pods():
     """List all pods in the cluster"""
     print_header("Cluster Pods")
     
-    response = make_request("/list_pods")
-    if not response:
-        print("Failed to get pod list.")
-        return
-    
-    pods = response.get('pods', [])
-    if not pods:
-        print("No pods found in the cluster.")
-        return
+    node_filter = input("Filter by node ID (or press Enter for all): ").strip()
     
     # Print as a simple table
     print(" {:<15} {:<15} {:<15} {:<10} {:<10}".format(
         "POD ID", "NODE", "STATUS", "CPU CORES", "AGE"))
     print("-" * 70)
     
-    for pod in pods:
+    count = 0
+    for pod in iter_pages("/list_pods", "pods", node=node_filter):
+        count += 1
         print(" {:<15} {:<15} {:<15} {:<10} {:<10}".format(
             pod.get('id', 'unknown'),
             pod.get('assigned_node', 'unknown'),
@@ -256,7 +242,11 @@ def list_pods():
             pod.get('age', 'unknown')
         ))
     
-    print("\nTotal: {} pods".format(len(pods)))
+    if not count:
+        print("No pods found in the cluster.")
+        return
+    
+    print("\nTotal: {} pods".format(count))
 
 def launch_pod():
     """Launch a pod in the cluster"""
@@ -274,8 +264,13 @@ def launch_pod():
     except ValueError:
         print("Invalid input. Using default value of 1 CPU core.")
     
-    print("Launching pod requiring {} CPU cores...".format(cpu_cores))
-    response = make_request("/launch_pod", "POST", {"cpu_cores": cpu_cores})
+    data = {"cpu_cores": cpu_cores}
+    memory = read_memory("Enter memory (MiB) required for the pod (or press Enter for none): ")
+    if memory:
+        data["memory"] = memory
+    
+    print("Launching pod requiring {} CPU cores{}...".format(cpu_cores, " and {} MiB memory".format(memory) if memory else ""))
+    response = make_request("/launch_pod", "POST", data)
     
     if response:
         pod = response.get('pod', {})
@@ -284,17 +279,64 @@ def launch_pod():
     else:
         print("Failed to launch pod. No suitable node may be available.")
 
+def launch_pods_bulk(cpu_requests, gang=False, policy=None, verbose=True):
+    """
+    Launch a batch of pods with a single request
+
+    Args:
+        cpu_requests: List of CPU cores required by each pod
+        gang: If True, the server places either every pod or none
+        policy: Scheduling policy override for this batch
+        verbose: Whether to print error messages
+
+    Returns:
+        Response JSON or None if request failed
+    """
+    try:
+        return client.launch_pods(cpu_requests, gang=gang, policy=policy)
+    except ClusterError as e:
+        if verbose:
+            print("Error: {}".format(e))
+        return None
+
+def launch_pods():
+    """Launch several pods in the cluster with one request"""
+    print_header("Launch Pods (Bulk)")
+
+    try:
+        cpu_input = input("Enter CPU cores for each pod, separated by spaces (e.g. 1 2 2 4): ")
+        cpu_requests = [int(value) for value in cpu_input.split()]
+    except ValueError:
+        print("Invalid input. CPU cores must be integers.")
+        return
+
+    if not cpu_requests or any(cpu_cores <= 0 for cpu_cores in cpu_requests):
+        print("CPU cores must be positive integers.")
+        return
+
+    gang = input("Require all pods to be placed together (gang)? (y/n): ").lower() == 'y'
+
+    print("Launching {} pods...".format(len(cpu_requests)))
+    response = launch_pods_bulk(cpu_requests, gang=gang)
+
+    if response:
+        for result in response.get('results', []):
+            pod = result.get('pod', {})
+            print(" {:<15} {:<15} {:<10}".format(
+                pod.get('id', '-'), pod.get('assigned_node', '-'), result.get('cpu_cores', 0)))
+        print("\n{} scheduled, {} failed".format(response.get('scheduled', 0), response.get('failed', 0)))
+    else:
+        print("Failed to launch pods. No suitable node may be available.")
+
 def remove_pod():
     """Remove a pod interactively"""
     print_header("Remove Pod")
 
-    pods_response = make_request("/list_pods")
-    if not pods_response or not pods_response.get('pods'):
+    pods = list(iter_pages("/list_pods", "pods"))
+    if not pods:
         print("No pods available to remove.")
         return
 
-    pods = pods_response.get('pods', [])
-
     print("Available pods:")
     for i, pod in enumerate(pods):
         print(f"{i+1}. {pod.get('id', 'unknown')} (Node: {pod.get('assigned_node', 'unknown')}, CPU: {pod.get('cpu_cores', 0)})")
@@ -327,6 +369,40 @@ def remove_pod():
     except Exception as e:
         print(f"Error: {e}")
 
+def change_scheduling_policy():
+    """Change the server-wide scheduling policy"""
+    print_header("Scheduling Policy")
+
+    response = make_request("/scheduling_policy")
+    if not response:
+        print("Failed to get scheduling policy.")
+        return
+
+    policies = response.get('policies', [])
+    print("Current policy: {}\n".format(response.get('policy', 'unknown')))
+    for i, policy in enumerate(policies):
+        print("{}. {}".format(i+1, policy))
+
+    try:
+        choice = input("\nEnter policy number (or 0 to cancel): ").strip()
+        if not choice.isdigit() or int(choice) == 0:
+            print("Operation cancelled.")
+            return
+
+        index = int(choice) - 1
+        if index < 0 or index >= len(policies):
+            print("Invalid selection.")
+            return
+
+        response = make_request("/scheduling_policy", "POST", {"policy": policies[index]})
+        if response:
+            print("Scheduling policy set to {}".format(response.get('policy')))
+        else:
+            print("Failed to change scheduling policy.")
+
+    except ValueError:
+        print("Invalid input.")
+
 
 def main_menu():
     """Display the main menu and handle user input"""
@@ -338,6 +414,8 @@ def main_menu():
         "5": ("List all pods", list_pods),
         "6": ("Launch a pod", launch_pod),
 	"7": ("Remove a pod", remove_pod),
+        "8": ("Change scheduling policy", change_scheduling_policy),
+        "9": ("Launch pods in bulk", launch_pods),
         "q": ("Quit", None)
     }
     
@@ -380,6 +458,7 @@ if __name__ == "__main__":
     
     # Set the API server URL
     API_SERVER_URL = args.server
+    client = ClusterClient(API_SERVER_URL)
     
     # Start the client
     main_menu()
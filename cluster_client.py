@@ -0,0 +1,415 @@
+import asyncio
+import concurrent.futures
+import json
+import logging
+import random
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+logger = logging.getLogger('cluster_client')
+
+# API server URL used when none is given
+DEFAULT_URL = "http://localhost:5002"
+
+# Items fetched per request when listing nodes and pods
+PAGE_SIZE = 500
+
+# Statuses worth retrying for requests that are safe to repeat: the server
+# (or a replica without a leader yet) could not answer right now
+RETRY_STATUSES = (502, 503, 504)
+
+
+class ClusterError(Exception):
+    def __init__(self, message, status=None, body=None):
+        """
+        A request to the API server failed
+
+        Args:
+            message: What went wrong
+            status: HTTP status of the response (None if no response arrived)
+            body: Parsed response body, if any
+        """
+        super().__init__(message)
+        self.status = status
+        self.body = body
+
+
+class _ClientBase:
+    def __init__(self, url=DEFAULT_URL, timeout=5, retries=3, backoff=0.1, max_backoff=2.0):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+    def _delay(self, attempt):
+        """Seconds to wait before retry number attempt (1-based): exponential with full jitter"""
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** (attempt - 1)))
+
+    def _should_retry(self, attempt, idempotent, status=None, connect_failed=False):
+        """
+        True if a failed attempt should be repeated
+
+        A request that never reached the server (the connection could not
+        be made) is always safe to repeat. Anything else is repeated only
+        if it is idempotent, for transport errors and RETRY_STATUSES.
+        """
+        if attempt > self.retries:
+            return False
+        if connect_failed:
+            return True
+        return idempotent and (status is None or status in RETRY_STATUSES)
+
+    @staticmethod
+    def _decode(status, text):
+        """Return the parsed body of a response, raising ClusterError for an error status"""
+        try:
+            body = json.loads(text)
+        except ValueError:
+            body = {"message": text}
+        if status >= 400:
+            message = body.get("message", text) if isinstance(body, dict) else text
+            raise ClusterError("{} - {}".format(status, message), status, body)
+        return body
+
+    @staticmethod
+    def _clean(params):
+        return {name: value for name, value in (params or {}).items() if value not in (None, "")}
+
+    # ---- Endpoints ----
+    # Each returns the response body (ClusterClient) or a coroutine of it (AsyncClusterClient)
+
+    def ping(self):
+        """Reach the server's root endpoint"""
+        return self.request("GET", "/")
+
+    def summary(self):
+        """Return the cluster-wide totals of /cluster_summary"""
+        return self.request("GET", "/cluster_summary")
+
+    def add_node(self, cpu_cores, resources=None):
+        """Register a node with resources besides CPU, e.g. {"memory": 8192, "gpu": 2}"""
+        data = self._clean({"resources": resources})
+        data["cpu_cores"] = cpu_cores
+        return self.request("POST", "/add_node", data)
+
+    def remove_node(self, node_id, force=False):
+        return self.request("POST", "/remove_node", {"node_id": node_id, "force": force})
+
+    def launch_pod(self, cpu_cores, resources=None, priority=None, policy=None, queue=None, preempt=None):
+        """Launch one pod, with resources as for add_node(); raises ClusterError with status 503 if it fits nowhere"""
+        data = self._clean({"resources": resources, "priority": priority, "policy": policy, "queue": queue,
+                            "preempt": preempt})
+        data["cpu_cores"] = cpu_cores
+        return self.request("POST", "/launch_pod", data)
+
+    def launch_pods(self, cpu_requests, gang=False, policy=None, resources=None, priority=None, queue=None):
+        """Launch a batch of pods with one /launch_pods request, placed in one pass"""
+        data = self._clean({"policy": policy, "resources": resources, "priority": priority, "queue": queue})
+        data["cpu_cores"] = list(cpu_requests)
+        data["gang"] = gang
+        return self.request("POST", "/launch_pods", data)
+
+    def remove_pod(self, pod_id):
+        return self.request("POST", "/remove_pod", {"pod_id": pod_id})
+
+    def scheduling_policy(self):
+        return self.request("GET", "/scheduling_policy")
+
+    def set_scheduling_policy(self, policy):
+        return self.request("POST", "/scheduling_policy", {"policy": policy}, idempotent=True)
+
+    def heartbeat(self, node_id, metrics=None, usage=None, timestamp=None):
+        """Send one node's heartbeat, sent at timestamp (default now); the response lists the node's pods"""
+        data = self._clean({"metrics": metrics, "usage": usage, "timestamp": timestamp})
+        data["node_id"] = node_id
+        return self.request("POST", "/heartbeat", data, idempotent=True)
+
+    def heartbeats(self, batch, include_pods=False):
+        """Send many nodes' heartbeats in one /heartbeats request"""
+        return self.request("POST", "/heartbeats", {"heartbeats": batch, "include_pods": include_pods},
+                            idempotent=True)
+
+    def pod_usage(self, pod_id, resolution=0):
+        return self.request("GET", "/pod_usage", params={"pod_id": pod_id, "resolution": resolution})
+
+    def pending_pods(self, limit=None):
+        return self.request("GET", "/pending_pods", params=self._clean({"limit": limit}))
+
+    def list_page(self, endpoint, limit=None, cursor=None, **filters):
+        """Return one page of a list endpoint (/list_nodes or /list_pods)"""
+        params = self._clean(filters)
+        params.update(self._clean({"limit": limit, "cursor": cursor}))
+        return self.request("GET", endpoint, params=params)
+
+
+class ClusterClient(_ClientBase):
+    def __init__(self, url=DEFAULT_URL, timeout=5, retries=3, backoff=0.1, max_backoff=2.0, pool_size=10):
+        """
+        Client of the cluster API server over one pool of keep-alive connections
+
+        Every request reuses a pooled connection rather than opening a new
+        one. Requests that never reached the server are retried, as are
+        idempotent ones (GETs, heartbeats) that failed in transit or got a
+        502/503/504, with exponential backoff and jitter between attempts.
+        Error responses raise ClusterError. The client is thread-safe: the
+        *_parallel helpers run requests on up to pool_size threads.
+
+        Args:
+            url: URL of the API server
+            timeout: Seconds to wait for a response
+            retries: Retries after the first attempt
+            backoff: Seconds before the first retry, doubling after each one
+            max_backoff: Longest wait between retries
+            pool_size: Connections kept open to the server
+        """
+        super().__init__(url, timeout, retries, backoff, max_backoff)
+        self.pool_size = pool_size
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def request(self, method, endpoint, data=None, params=None, idempotent=None):
+        """
+        Send a request and return its parsed JSON body
+
+        Args:
+            method: HTTP method (GET, POST)
+            endpoint: Path such as /launch_pod
+            data: JSON body
+            params: Query parameters
+            idempotent: Whether the request may be repeated after a transport
+                error (default: only for GET)
+
+        Raises:
+            ClusterError: If the server answered with an error or could not be reached
+        """
+        if idempotent is None:
+            idempotent = method == "GET"
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                response = self.session.request(method, self.url + endpoint, json=data, params=params,
+                                                timeout=self.timeout)
+            except requests.exceptions.RequestException as e:
+                if not self._should_retry(attempt, idempotent, connect_failed=_never_sent(e)):
+                    raise ClusterError("Could not reach the API server at {}: {}".format(self.url, e)) from e
+            else:
+                if response.status_code < 400 or not self._should_retry(attempt, idempotent,
+                                                                        response.status_code):
+                    return self._decode(response.status_code, response.text)
+            time.sleep(self._delay(attempt))
+
+    def iter_pages(self, endpoint, key, page_size=PAGE_SIZE, **filters):
+        """
+        Yield every item of a paginated list endpoint, one page per request
+
+        Args:
+            endpoint: List endpoint to call (e.g. /list_nodes)
+            key: Response field holding the items (e.g. nodes)
+            page_size: Items requested per page
+            filters: Extra query parameters (e.g. status="Healthy")
+        """
+        cursor = None
+        while True:
+            page = self.list_page(endpoint, page_size, cursor, **filters)
+            yield from page.get(key, [])
+            cursor = page.get("next_cursor")
+            if not cursor:
+                return
+
+    def list_nodes(self, **filters):
+        """Return every node, e.g. list_nodes(status="Healthy")"""
+        return list(self.iter_pages("/list_nodes", "nodes", **filters))
+
+    def list_pods(self, **filters):
+        """Return every pod, e.g. list_pods(node="node-3")"""
+        return list(self.iter_pages("/list_pods", "pods", **filters))
+
+    def map_parallel(self, call, items, workers=None):
+        """
+        Run call(item) for every item on a thread pool sharing this client's connections
+
+        Returns:
+            Results in the order of items; a failed call's ClusterError takes its place
+        """
+        def attempt(item):
+            try:
+                return call(item)
+            except ClusterError as e:
+                return e
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers or self.pool_size) as executor:
+            return list(executor.map(attempt, items))
+
+    def launch_pods_parallel(self, cpu_requests, workers=None, **options):
+        """
+        Launch pods with one /launch_pod request each, many at a time
+
+        Unlike launch_pods(), each pod is placed (or preempts, or queues)
+        on its own. Options are those of launch_pod().
+
+        Returns:
+            The response for each pod, or its ClusterError
+        """
+        return self.map_parallel(lambda cpu_cores: self.launch_pod(cpu_cores, **options), cpu_requests, workers)
+
+    def remove_pods_parallel(self, pod_ids, workers=None):
+        return self.map_parallel(self.remove_pod, pod_ids, workers)
+
+    def watch(self, kind=None, resource_version=None, timeout=60):
+        """
+        Yield change events from /watch as they arrive
+
+        Args:
+            kind: "node" or "pod" to receive only that kind
+            resource_version: Resume after this version (None for new events only)
+            timeout: Seconds the stream may stay silent before the connection is dropped
+
+        Raises:
+            ClusterError: With status 410 if the version is no longer held (list again)
+        """
+        params = self._clean({"kind": kind, "resource_version": resource_version})
+        try:
+            with self.session.get(self.url + "/watch", params=params, stream=True, timeout=timeout) as response:
+                if response.status_code >= 400:
+                    self._decode(response.status_code, response.text)
+                event_type = None
+                # A larger chunk_size would hold back the latest event until more data arrives
+                for line in response.iter_lines(chunk_size=1, decode_unicode=True):
+                    if line.startswith("event:"):
+                        event_type = line[len("event:"):].strip()
+                    elif line.startswith("data:"):
+                        event = json.loads(line[len("data:"):])
+                        if event_type == "ERROR":
+                            raise ClusterError(event.get("message", "Watch failed"), 410, event)
+                        yield event
+        except requests.exceptions.RequestException as e:
+            raise ClusterError("Watch of {} failed: {}".format(self.url, e)) from e
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _never_sent(error):
+    """True if a requests error happened before the request was sent (connection refused or timed out)"""
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], "reason", None) if error.args else None
+    return isinstance(reason, NewConnectionError)
+
+
+class AsyncClusterClient(_ClientBase):
+    def __init__(self, url=DEFAULT_URL, timeout=5, retries=3, backoff=0.1, max_backoff=2.0, pool_size=100):
+        """
+        asyncio counterpart of ClusterClient, on one pooled aiohttp session
+
+        Methods are coroutines with the same arguments, retries and errors
+        as ClusterClient's. The session is opened on first use; use the
+        client as an async context manager or call close().
+
+        Args:
+            url: URL of the API server
+            timeout: Seconds to wait for a response
+            retries: Retries after the first attempt
+            backoff: Seconds before the first retry, doubling after each one
+            max_backoff: Longest wait between retries
+            pool_size: Connections kept open to the server, and the default
+                number of requests the *_concurrent helpers keep in flight
+        """
+        super().__init__(url, timeout, retries, backoff, max_backoff)
+        self.pool_size = pool_size
+        self.session = None
+
+    def _session(self):
+        import aiohttp
+        if self.session is None:
+            self.session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.pool_size),
+                                                 timeout=aiohttp.ClientTimeout(total=self.timeout))
+        return self.session
+
+    async def request(self, method, endpoint, data=None, params=None, idempotent=None):
+        """Send a request and return its parsed JSON body (see ClusterClient.request)"""
+        import aiohttp
+        if idempotent is None:
+            idempotent = method == "GET"
+        session = self._session()
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                async with session.request(method, self.url + endpoint, json=data, params=params) as response:
+                    status, text = response.status, await response.text()
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                connect_failed = isinstance(e, aiohttp.ClientConnectorError)
+                if not self._should_retry(attempt, idempotent, connect_failed=connect_failed):
+                    raise ClusterError("Could not reach the API server at {}: {}".format(self.url, e)) from e
+            else:
+                if status < 400 or not self._should_retry(attempt, idempotent, status):
+                    return self._decode(status, text)
+            await asyncio.sleep(self._delay(attempt))
+
+    async def iter_pages(self, endpoint, key, page_size=PAGE_SIZE, **filters):
+        """Yield every item of a paginated list endpoint (async generator)"""
+        cursor = None
+        while True:
+            page = await self.list_page(endpoint, page_size, cursor, **filters)
+            for item in page.get(key, []):
+                yield item
+            cursor = page.get("next_cursor")
+            if not cursor:
+                return
+
+    async def list_nodes(self, **filters):
+        return [node async for node in self.iter_pages("/list_nodes", "nodes", **filters)]
+
+    async def list_pods(self, **filters):
+        return [pod async for pod in self.iter_pages("/list_pods", "pods", **filters)]
+
+    async def map_concurrent(self, call, items, concurrency=None):
+        """
+        Await call(item) for every item, at most concurrency at a time
+
+        Returns:
+            Results in the order of items; a failed call's ClusterError takes its place
+        """
+        limit = asyncio.Semaphore(concurrency or self.pool_size)
+
+        async def attempt(item):
+            async with limit:
+                try:
+                    return await call(item)
+                except ClusterError as e:
+                    return e
+
+        return await asyncio.gather(*(attempt(item) for item in items))
+
+    async def launch_pods_concurrent(self, cpu_requests, concurrency=None, **options):
+        """Launch pods with one /launch_pod request each, many in flight at once"""
+        return await self.map_concurrent(lambda cpu_cores: self.launch_pod(cpu_cores, **options),
+                                         cpu_requests, concurrency)
+
+    async def remove_pods_concurrent(self, pod_ids, concurrency=None):
+        return await self.map_concurrent(self.remove_pod, pod_ids, concurrency)
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
@@ -0,0 +1,483 @@
+import argparse
+import heapq
+import json
+import logging
+import math
+import random
+import time
+
+from cluster_state import ClusterState
+from fleet_sim import parse_core_distribution
+from health_monitor import HealthMonitor
+from pending import PendingQueue
+from scheduler import Scheduler, POLICIES
+from stats import percentile
+
+logger = logging.getLogger('cluster_sim')
+
+HOUR = 3600.0
+DAY = 24 * HOUR
+
+class VirtualClock:
+    """Clock the simulated cluster reads instead of time.time()"""
+
+    def __init__(self, start=0.0):
+        self.now = start
+
+    def __call__(self):
+        return self.now
+
+class Lifetime:
+    def __init__(self, mean, shape=1.0):
+        """
+        Distribution of the time until an event, such as a failure or a repair
+
+        Shape 1 is the exponential distribution (a constant failure rate, as
+        with NodeFailureSimulator's fixed per-check probability). Below 1
+        events cluster early (infant mortality); above 1 they come with age
+        (wear-out). The mean is kept whatever the shape.
+
+        Args:
+            mean: Mean time in seconds, or None if the event never happens
+            shape: Weibull shape parameter
+        """
+        self.mean = mean
+        self.shape = shape
+        self.scale = mean / math.gamma(1 + 1 / shape) if mean else None
+
+    def sample(self, rng):
+        if not self.mean:
+            return math.inf
+        if self.shape == 1:
+            return rng.expovariate(1 / self.mean)
+        return rng.weibullvariate(self.scale, self.shape)
+
+class FailureModel:
+    def __init__(self, node_mtbf=30 * DAY, node_mttr=1800, racks=1, rack_mtbf=None, rack_mttr=HOUR,
+                 shape=1.0):
+        """
+        Seeded failure and recovery model for nodes and the racks they share
+
+        Every node fails independently after an up time drawn from its MTBF
+        and is repaired after a time drawn from its MTTR. Nodes are spread
+        over racks; a rack failure (a switch or power feed) takes down every
+        node in it at once until the rack is repaired, which is what makes
+        failures correlated.
+
+        Args:
+            node_mtbf: Mean seconds a node runs between failures (None: never fails)
+            node_mttr: Mean seconds to repair a failed node (None: never repaired)
+            racks: Number of racks the nodes are spread over
+            rack_mtbf: Mean seconds between failures of one rack (None: racks never fail)
+            rack_mttr: Mean seconds to repair a failed rack
+            shape: Weibull shape of node up times (1 is exponential)
+        """
+        self.racks = racks
+        self.node_uptime = Lifetime(node_mtbf, shape)
+        self.node_repair = Lifetime(node_mttr)
+        self.rack_uptime = Lifetime(rack_mtbf)
+        self.rack_repair = Lifetime(rack_mttr)
+
+    @classmethod
+    def from_probabilities(cls, failure_probability, recovery_probability, check_interval=5, **kwargs):
+        """
+        Model matching NodeFailureSimulator's per-check probabilities
+
+        A node that fails with probability p at each check, every
+        check_interval seconds, stays up for check_interval / p seconds on
+        average; recovery works the same way.
+        """
+        return cls(node_mtbf=check_interval / failure_probability if failure_probability else None,
+                   node_mttr=check_interval / recovery_probability if recovery_probability else None,
+                   **kwargs)
+
+class Workload:
+    def __init__(self, arrival_rate, mean_duration, cores, weights):
+        """
+        Pods arriving as a Poisson process and running for exponential durations
+
+        Args:
+            arrival_rate: Pods arriving per second
+            mean_duration: Mean seconds a pod runs once placed
+            cores: Possible CPU core requests
+            weights: Relative weight of each core request
+        """
+        self.arrival_rate = arrival_rate
+        self.mean_duration = mean_duration
+        self.cores = cores
+        self.weights = weights
+
+    @classmethod
+    def for_load(cls, load, total_cores, mean_duration, cores, weights):
+        """Workload whose running pods would use load x total_cores cores on average"""
+        mean_cores = sum(c * w for c, w in zip(cores, weights)) / sum(weights)
+        return cls(load * total_cores / (mean_duration * mean_cores), mean_duration, cores, weights)
+
+    def next_arrival(self, rng):
+        return rng.expovariate(self.arrival_rate)
+
+    def sample(self, rng):
+        """Return (CPU cores, run time) of a new pod"""
+        return rng.choices(self.cores, self.weights)[0], rng.expovariate(1 / self.mean_duration)
+
+class ClusterSimulation:
+    def __init__(self, node_cores, failures, workload, heartbeat_timeout=15, heartbeat_interval=5,
+                 policy=None, seed=0):
+        """
+        Discrete-event simulation of the cluster on a virtual clock
+
+        The real ClusterState, Scheduler, PendingQueue and HealthMonitor run
+        in-process; only time is simulated. Events (pod arrivals and
+        completions, node and rack failures and repairs) are processed in
+        time order from a heap, and between them the clock jumps straight
+        to the next event or heartbeat deadline, so weeks of cluster time
+        take seconds.
+
+        Heartbeats are not simulated one by one: when a node comes up its
+        failure time is already drawn, so it records a single heartbeat
+        stamped with the last one it would send before failing. The health
+        monitor then detects the failure at exactly the heartbeat deadline
+        it would have reached in a live cluster, including its detection
+        lag, and a node repaired before the deadline is never marked failed.
+
+        Runs are deterministic for a given seed.
+
+        Args:
+            node_cores: CPU cores of each node
+            failures: FailureModel for nodes and racks
+            workload: Workload of arriving pods
+            heartbeat_timeout: Seconds without a heartbeat before a node fails
+            heartbeat_interval: Seconds between a node's heartbeats
+            policy: Scheduling policy (defaults to the scheduler's)
+            seed: Seed of every random draw
+
+        Raises:
+            ValueError: If heartbeats are sent less often than the timeout allows
+        """
+        if heartbeat_interval > heartbeat_timeout:
+            raise ValueError("The heartbeat interval must not exceed the heartbeat timeout")
+        self.failures = failures
+        self.workload = workload
+        self.heartbeat_interval = heartbeat_interval
+        self.rng = random.Random(seed)
+
+        self.clock = VirtualClock()
+        self.state = ClusterState(clock=self.clock)
+        self.scheduler = Scheduler(self.state)
+        if policy:
+            self.scheduler.set_policy(policy)
+        self.queue = PendingQueue(self.state, self.scheduler, wait_samples=None)
+        self.monitor = HealthMonitor(self.state, heartbeat_timeout, self.scheduler, self.queue)
+        self.state.subscribe(self._on_state_change)
+
+        self.events = []         # Min-heap of (time, seq, handler, args)
+        self.seq = 0
+        self.epoch = {}          # {node_id: count of up/down changes}; older events are stale
+        self.rack_of = {}        # {node_id: rack}
+        self.rack_nodes = [[] for _ in range(failures.racks)]
+        self.rack_failure = {}   # {rack: time of its next failure}
+        self.racks_down = set()
+        self.broken = set()      # Nodes whose own hardware failed
+        self.down_since = {}     # {node_id: when it went down}, while down
+        self.location = {}       # {pod_id: node_id}
+        self.runtime = {}        # {pod_id: run time} of queued new pods
+
+        self.stats = {
+            "events": 0, "arrived": 0, "placed_at_once": 0, "queued": 0, "completed": 0,
+            "node_failures": 0, "rack_failures": 0, "detected": 0, "repaired_before_detection": 0,
+            "displaced": 0, "rescheduled_at_once": 0, "displaced_queued": 0
+        }
+        self.pending_waits = []     # Seconds each queued new pod waited
+        self.detection_lags = []    # Seconds from a failure to its detection
+        self.pod_recoveries = []    # Seconds a displaced pod was down before running again
+        self.used_core_seconds = 0.0
+        self.total_core_seconds = 0.0
+        self.healthy_node_seconds = 0.0
+        self.pending_pod_seconds = 0.0
+
+        for i, cores in enumerate(node_cores):
+            node = self.state.add_node(cores)
+            rack = i % failures.racks
+            self.rack_of[node.id] = rack
+            self.rack_nodes[rack].append(node.id)
+            self.epoch[node.id] = 0
+        for rack in range(failures.racks):
+            self.rack_failure[rack] = failures.rack_uptime.sample(self.rng)
+            self._push(self.rack_failure[rack], self._rack_down, rack)
+        for node_id in self.rack_of:
+            self._node_up(node_id)
+        self._push(workload.next_arrival(self.rng), self._arrival)
+
+    def _push(self, at, handler, *args):
+        if at != math.inf:
+            self.seq += 1
+            heapq.heappush(self.events, (at, self.seq, handler, args))
+
+    def _on_state_change(self, kind, event_type, obj):
+        if kind != "pod":
+            return
+        if event_type == "ADDED":
+            self.location[obj.id] = obj.assigned_node
+        elif event_type == "DELETED":
+            self.location.pop(obj.id, None)
+        else:
+            previous = self.location[obj.id]
+            self.location[obj.id] = obj.assigned_node
+            if previous in self.down_since:
+                self.pod_recoveries.append(self.clock.now - self.down_since[previous])
+
+    # ---- Nodes and racks ----
+
+    def _node_up(self, node_id):
+        """Start a node: draw its next failure and record its last heartbeat before it"""
+        self.epoch[node_id] += 1
+        failure = self.clock.now + self.failures.node_uptime.sample(self.rng)
+        self._push(failure, self._node_down, node_id, self.epoch[node_id])
+        stop = min(failure, self.rack_failure[self.rack_of[node_id]])
+        last_heartbeat = max(self.clock.now, stop - self.rng.uniform(0, self.heartbeat_interval))
+        if node_id in self.down_since:
+            if self.state.is_healthy(node_id):
+                self.stats["repaired_before_detection"] += 1
+            else:
+                # Pods that waited on the node simply run again there
+                for _ in self.state.pods_on_node(node_id):
+                    self.pod_recoveries.append(self.clock.now - self.down_since[node_id])
+            del self.down_since[node_id]
+        self.state.record_heartbeat(node_id, last_heartbeat)
+
+    def _stop(self, node_id):
+        self.epoch[node_id] += 1  # Cancels the node's pending failure
+        self.down_since[node_id] = self.clock.now
+
+    def _node_down(self, node_id, epoch):
+        if epoch != self.epoch[node_id]:
+            return
+        self.stats["node_failures"] += 1
+        self.broken.add(node_id)
+        self._stop(node_id)
+        self._push(self.clock.now + self.failures.node_repair.sample(self.rng), self._node_repaired, node_id)
+
+    def _node_repaired(self, node_id):
+        self.broken.discard(node_id)
+        if self.rack_of[node_id] not in self.racks_down:
+            self._node_up(node_id)
+
+    def _rack_down(self, rack):
+        self.stats["rack_failures"] += 1
+        self.racks_down.add(rack)
+        for node_id in self.rack_nodes[rack]:
+            if node_id not in self.down_since:
+                self._stop(node_id)
+        self._push(self.clock.now + self.failures.rack_repair.sample(self.rng), self._rack_repaired, rack)
+
+    def _rack_repaired(self, rack):
+        self.racks_down.discard(rack)
+        self.rack_failure[rack] = self.clock.now + self.failures.rack_uptime.sample(self.rng)
+        self._push(self.rack_failure[rack], self._rack_down, rack)
+        for node_id in self.rack_nodes[rack]:
+            if node_id not in self.broken:
+                self._node_up(node_id)
+
+    def _detect(self):
+        """Let the health monitor fail nodes whose heartbeat deadline has passed"""
+        moved = len(self.pod_recoveries)
+        expired = self.monitor.check_expired(self.clock.now)
+        if not expired:
+            return
+        rescheduled = len(self.pod_recoveries) - moved
+        queued = sum(len(self.state.pods_on_node(node_id)) for node_id in expired)
+        self.stats["detected"] += len(expired)
+        self.stats["displaced"] += rescheduled + queued
+        self.stats["rescheduled_at_once"] += rescheduled
+        self.stats["displaced_queued"] += queued
+        for node_id in expired:
+            self.detection_lags.append(self.clock.now - self.down_since[node_id])
+
+    # ---- Pods ----
+
+    def _arrival(self):
+        self.stats["arrived"] += 1
+        cpu_cores, run_time = self.workload.sample(self.rng)
+        pod = self.scheduler.schedule(cpu_cores)
+        if pod:
+            self.stats["placed_at_once"] += 1
+            self._push(self.clock.now + run_time, self._completion, pod.id)
+        else:
+            self.stats["queued"] += 1
+            self.runtime[self.queue.add(cpu_cores)["id"]] = run_time
+        self._push(self.clock.now + self.workload.next_arrival(self.rng), self._arrival)
+
+    def _completion(self, pod_id):
+        self.stats["completed"] += 1
+        self.state.remove_pod(pod_id)
+
+    def _drain(self):
+        for pod in self.queue.drain():
+            run_time = self.runtime.pop(pod.id, None)
+            if run_time is not None:
+                self.pending_waits.append(self.clock.now - pod.creation_time)
+                self._push(self.clock.now + run_time, self._completion, pod.id)
+
+    # ---- Running ----
+
+    def _advance(self, at):
+        elapsed = at - self.clock.now
+        if elapsed > 0:
+            state = self.state
+            self.used_core_seconds += (state.total_cores - state.available_cores) * elapsed
+            self.total_core_seconds += state.total_cores * elapsed
+            self.healthy_node_seconds += state.healthy_nodes * elapsed
+            self.pending_pod_seconds += len(self.queue) * elapsed
+            self.clock.now = at
+
+    def run(self, duration):
+        """
+        Simulate the cluster for duration seconds of virtual time
+
+        Returns:
+            The statistics dict of report()
+        """
+        started = time.perf_counter()
+        end = self.clock.now + duration
+        with self.state.lock:
+            while True:
+                next_event = self.events[0][0] if self.events else math.inf
+                deadline = self.monitor.next_deadline()
+                if deadline is not None and deadline <= next_event:
+                    if deadline > end:
+                        break
+                    self._advance(deadline)
+                    self._detect()
+                else:
+                    if next_event > end:
+                        break
+                    at, _, handler, args = heapq.heappop(self.events)
+                    self._advance(at)
+                    handler(*args)
+                    self.stats["events"] += 1
+                self._drain()
+            self._advance(end)
+        return self.report(duration, time.perf_counter() - started)
+
+    def report(self, duration, wall_seconds):
+        """Return utilization, pending-time and rescheduling statistics"""
+        def distribution(values):
+            values = sorted(values)
+            return {
+                "count": len(values),
+                "mean": sum(values) / len(values) if values else 0.0,
+                "p50": percentile(values, 50),
+                "p95": percentile(values, 95),
+                "p99": percentile(values, 99),
+                "max": values[-1] if values else 0.0
+            }
+
+        return {
+            "simulated_seconds": duration,
+            "wall_seconds": wall_seconds,
+            "speedup": duration / wall_seconds if wall_seconds else math.inf,
+            "nodes": len(self.state.nodes),
+            "total_cores": self.state.total_cores,
+            "utilization": self.used_core_seconds / self.total_core_seconds if self.total_core_seconds else 0.0,
+            "healthy_node_fraction": self.healthy_node_seconds / (len(self.state.nodes) * duration)
+            if self.state.nodes and duration else 0.0,
+            "mean_pending_pods": self.pending_pod_seconds / duration if duration else 0.0,
+            "still_pending": len(self.queue),
+            **self.stats,
+            "pending_wait_seconds": distribution(self.pending_waits),
+            "detection_lag_seconds": distribution(self.detection_lags),
+            "pod_recovery_seconds": distribution(self.pod_recoveries)
+        }
+
+def format_duration(seconds):
+    for unit, size in (("d", DAY), ("h", HOUR), ("m", 60.0)):
+        if seconds >= size:
+            return "{:.1f}{}".format(seconds / size, unit)
+    return "{:.1f}s".format(seconds)
+
+def print_report(stats):
+    def waits(d):
+        return "mean {}  p50 {}  p95 {}  p99 {}  max {}".format(
+            *(format_duration(d[key]) for key in ("mean", "p50", "p95", "p99", "max")))
+
+    print("Simulated {} of {} nodes ({:,} cores) in {:.1f}s ({:,.0f}x real time, {:,} events)".format(
+        format_duration(stats["simulated_seconds"]), stats["nodes"], stats["total_cores"],
+        stats["wall_seconds"], stats["speedup"], stats["events"]))
+    print("Utilization      {:.1%} of all cores; {:.2%} of nodes healthy on average".format(
+        stats["utilization"], stats["healthy_node_fraction"]))
+    print("Pods             {:,} arrived, {:,} completed; {:,} placed at once, {:,} queued "
+          "({:,} still pending, {:.1f} pending on average)".format(
+              stats["arrived"], stats["completed"], stats["placed_at_once"], stats["queued"],
+              stats["still_pending"], stats["mean_pending_pods"]))
+    print("Pending wait     {}".format(waits(stats["pending_wait_seconds"])))
+    print("Failures         {:,} node, {:,} rack; {:,} detected (lag {}), {:,} repaired before detection".format(
+        stats["node_failures"], stats["rack_failures"], stats["detected"],
+        waits(stats["detection_lag_seconds"]), stats["repaired_before_detection"]))
+    print("Rescheduling     {:,} pods displaced: {:,} moved at once, {:,} queued".format(
+        stats["displaced"], stats["rescheduled_at_once"], stats["displaced_queued"]))
+    print("Pod recovery     {}".format(waits(stats["pod_recovery_seconds"])))
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate weeks of cluster operation on a virtual clock")
+    parser.add_argument("--nodes", type=int, default=500, help="Number of nodes")
+    parser.add_argument("--cores", default="4:0.5,8:0.3,16:0.2",
+                        help="CPU cores per node, e.g. 8 or 4:0.5,8:0.3,16:0.2")
+    parser.add_argument("--days", type=float, default=14, help="Simulated days")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    parser.add_argument("--policy", choices=POLICIES, help="Scheduling policy")
+    parser.add_argument("--timeout", type=float, default=15, help="Heartbeat timeout in seconds")
+    parser.add_argument("--interval", type=float, default=5, help="Heartbeat interval in seconds")
+
+    failures = parser.add_argument_group("failures")
+    failures.add_argument("--mtbf-hours", type=float, default=720, help="Mean hours between failures of a node")
+    failures.add_argument("--mttr-minutes", type=float, default=30, help="Mean minutes to repair a node")
+    failures.add_argument("--failure-shape", type=float, default=1.0,
+                          help="Weibull shape of node up times (1 exponential, <1 infant mortality, >1 wear-out)")
+    failures.add_argument("--failure-prob", type=float,
+                          help="Per-check failure probability as in node_failure_sim.py (replaces the MTBF/MTTR)")
+    failures.add_argument("--recovery-prob", type=float, default=0.3,
+                          help="Per-check recovery probability, used with --failure-prob")
+    failures.add_argument("--check-interval", type=float, default=5,
+                          help="Seconds between the checks the probabilities apply to")
+    failures.add_argument("--racks", type=int, default=20, help="Racks the nodes are spread over")
+    failures.add_argument("--rack-mtbf-hours", type=float, default=2160,
+                          help="Mean hours between failures of a rack (0 disables rack failures)")
+    failures.add_argument("--rack-mttr-minutes", type=float, default=60, help="Mean minutes to repair a rack")
+
+    workload = parser.add_argument_group("workload")
+    workload.add_argument("--load", type=float, default=0.7,
+                          help="Offered load as a fraction of all cores")
+    workload.add_argument("--pod-hours", type=float, default=2, help="Mean hours a pod runs")
+    workload.add_argument("--pod-cores", default="1:0.5,2:0.3,4:0.2", help="CPU cores requested per pod")
+
+    parser.add_argument("--json", action="store_true", help="Print the statistics as JSON")
+    parser.add_argument("--verbose", action="store_true", help="Log every failure and rescheduling")
+    args = parser.parse_args()
+
+    if not args.verbose:
+        for name in ("api_server", "health_monitor", "pending", "scheduler"):
+            logging.getLogger(name).setLevel(logging.ERROR)
+
+    racks = dict(racks=max(1, args.racks), rack_mtbf=args.rack_mtbf_hours * HOUR or None,
+                 rack_mttr=args.rack_mttr_minutes * 60, shape=args.failure_shape)
+    if args.failure_prob is not None:
+        model = FailureModel.from_probabilities(args.failure_prob, args.recovery_prob, args.check_interval, **racks)
+    else:
+        model = FailureModel(node_mtbf=args.mtbf_hours * HOUR or None, node_mttr=args.mttr_minutes * 60, **racks)
+
+    rng = random.Random(args.seed)
+    cores, weights = parse_core_distribution(args.cores)
+    node_cores = rng.choices(cores, weights, k=args.nodes)
+    pod_cores, pod_weights = parse_core_distribution(args.pod_cores)
+    load = Workload.for_load(args.load, sum(node_cores), args.pod_hours * HOUR, pod_cores, pod_weights)
+
+    simulation = ClusterSimulation(node_cores, model, load, heartbeat_timeout=args.timeout,
+                                   heartbeat_interval=args.interval, policy=args.policy, seed=args.seed)
+    stats = simulation.run(args.days * DAY)
+    if args.json:
+        print(json.dumps(stats, indent=2))
+    else:
+        print_report(stats)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,515 @@
+import array
+import bisect
+import operator
+import sys
+import time
+import threading
+import types
+
+# Pod priority classes and their rank; higher ranks are placed first and may preempt lower ones
+PRIORITY_CLASSES = {"high": 2, "normal": 1, "low": 0}
+DEFAULT_PRIORITY = "normal"
+
+# Resources of every pod that needs only CPU, shared rather than an empty dict per pod
+NO_RESOURCES = types.MappingProxyType({})
+
+
+def id_sequence(item_id, kind=None):
+    """
+    Return the creation sequence number of a node or pod id ("pod-42" -> 42)
+
+    Args:
+        item_id: Id to parse
+        kind: "node" or "pod" to also require that kind of id
+
+    Raises:
+        ValueError: If the id is not of that form
+    """
+    if not isinstance(item_id, str):
+        raise ValueError("Invalid id: {}".format(item_id))
+    prefix, _, sequence = item_id.rpartition("-")
+    if kind is not None and prefix != kind:
+        raise ValueError("Not a {} id: {}".format(kind, item_id))
+    return int(sequence)
+
+
+class Record:
+    """
+    Base of the slotted node and pod records held by ClusterState
+
+    Fields are attributes (pod.cpu_cores); a record has no __dict__, so
+    assigning a field it does not declare raises AttributeError.
+    to_dict() returns the JSON representation.
+    """
+    __slots__ = ()
+
+    def __repr__(self):
+        return "{}({})".format(type(self).__name__, self.to_dict())
+
+
+class Node(Record):
+    __slots__ = ("id", "seq", "cpu_cores", "available_cores", "resources", "available_resources",
+                 "pods", "status")
+
+    def __init__(self, node_id, seq, cpu_cores, resources):
+        self.id = node_id
+        self.seq = seq                # Integer part of the id
+        self.cpu_cores = cpu_cores
+        self.available_cores = cpu_cores
+        self.resources = resources
+        self.available_resources = dict(resources)
+        self.pods = set()             # Ids of the pods on the node
+        self.status = "Healthy"
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "cpu_cores": self.cpu_cores,
+            "available_cores": self.available_cores,
+            "resources": self.resources.copy(),
+            "available_resources": self.available_resources.copy(),
+            "pods": list(self.pods),
+            "status": self.status
+        }
+
+
+class Pod(Record):
+    __slots__ = ("id", "seq", "cpu_cores", "resources", "priority", "assigned_node", "creation_time")
+
+    def __init__(self, pod_id, seq, cpu_cores, resources, priority, assigned_node, creation_time):
+        self.id = pod_id
+        self.seq = seq                      # Integer part of the id
+        self.cpu_cores = cpu_cores
+        self.resources = resources
+        self.priority = priority
+        self.assigned_node = assigned_node  # The node's own id string, shared by all of its pods
+        self.creation_time = creation_time
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "cpu_cores": self.cpu_cores,
+            "resources": self.resources.copy(),
+            "priority": self.priority,
+            "assigned_node": self.assigned_node,
+            "creation_time": self.creation_time
+        }
+
+
+class IdOrder:
+    def __init__(self, kind):
+        """
+        Append-only list of ids in creation order, for cursor pagination
+
+        Ids are almost always created with increasing sequence numbers, so
+        resuming after a cursor is a bisect. The sequence numbers are kept
+        in a machine-integer array. Removed ids are skipped while iterating
+        and compacted away once they make up half of the list.
+
+        Args:
+            kind: "node" or "pod", the only ids accepted as cursors
+        """
+        self.kind = kind
+        self.seqs = array.array("q")
+        self.ids = []
+        self.removed = 0
+
+    def append(self, item_id, seq):
+        """Add an id with its sequence number"""
+        if self.seqs and seq <= self.seqs[-1]:
+            # An id reserved earlier (e.g. a pod that waited in the pending queue)
+            i = bisect.bisect_left(self.seqs, seq)
+            if i < len(self.ids) and self.ids[i] == item_id:
+                self.removed -= 1  # Re-added (e.g. an evicted pod) before its entry was compacted
+                return
+            self.seqs.insert(i, seq)
+            self.ids.insert(i, item_id)
+            return
+        self.seqs.append(seq)
+        self.ids.append(item_id)
+
+    def remove(self, live):
+        """Record a removal; live is the dict of ids still present"""
+        self.removed += 1
+        if self.removed > 1024 and self.removed * 2 > len(self.ids):
+            kept = [i for i, item_id in enumerate(self.ids) if item_id in live]
+            self.ids = [self.ids[i] for i in kept]
+            self.seqs = array.array("q", [self.seqs[i] for i in kept])
+            self.removed = 0
+
+    def after(self, cursor, live):
+        """Yield live ids created after the cursor id (from the start if None)"""
+        start = 0 if cursor is None else bisect.bisect_right(self.seqs, id_sequence(cursor, self.kind))
+        for i in range(start, len(self.ids)):
+            item_id = self.ids[i]
+            if item_id in live:
+                yield item_id
+
+
+class ClusterState:
+    def __init__(self, clock=time.time):
+        """
+        Initialize an empty cluster state
+
+        Nodes and pods are slotted Node and Pod records keyed by id, so
+        every lookup is O(1). Each node's `pods` is a set of pod ids, which
+        doubles as the pod-by-node reverse index, so removing or moving a
+        pod never scans a list. Records are converted to their JSON shape
+        (to_dict) only where they leave the process.
+
+        CPU is accounted in cpu_cores/available_cores. Any other resources
+        (memory, GPUs, extended resources) are {name: amount} mappings:
+        resources and available_resources on nodes, resources on pods (the
+        shared read-only NO_RESOURCES when a pod needs only CPU). A pod may
+        only request resources its node provides. Pods also carry a
+        priority class (see PRIORITY_CLASSES).
+
+        Methods do not lock on their own: callers (API handlers and the
+        health monitor) hold `lock` around each whole operation, so a
+        multi-step change such as draining a node is applied atomically.
+        Listeners are notified while the lock is held.
+
+        Args:
+            clock: Function returning the current time in seconds; the
+                simulator passes a virtual clock
+        """
+        self.clock = clock
+        self.lock = threading.RLock()
+        self.nodes = {}           # {node_id: node}
+        self.pods = {}            # {pod_id: pod}
+        self.node_heartbeat = {}  # {node_id: last_seen_timestamp}
+        self.node_metrics = {}    # {node_id: load metrics from the latest heartbeat}
+        self.pods_by_node = {}    # {node_id: set of pod ids}
+        self.node_id_counter = 1
+        self.pod_id_counter = 1
+        self.listeners = []       # Callbacks notified of every change
+        self.reservation_listeners = []  # Callbacks notified of pod ids reserved ahead of their pod
+
+        # Running aggregates, updated on every mutation
+        self.total_cores = 0
+        self.available_cores = 0
+        self.healthy_nodes = 0
+        self.total_resources = {}      # {resource: total over all nodes}
+        self.available_resources = {}  # {resource: available over all nodes}
+
+        self.node_order = IdOrder("node")
+        self.pod_order = IdOrder("pod")
+
+    def subscribe(self, listener):
+        """
+        Register a callback invoked as listener(kind, event_type, obj) on change
+
+        kind is "node" or "pod"; event_type is "ADDED", "MODIFIED" or
+        "DELETED", plus "HEARTBEAT" for nodes.
+        """
+        self.listeners.append(listener)
+
+    def subscribe_reservations(self, listener):
+        """Register a callback invoked as listener(pod_id) when reserve_pod_id hands out an id"""
+        self.reservation_listeners.append(listener)
+
+    def _notify(self, kind, event_type, obj):
+        for listener in self.listeners:
+            listener(kind, event_type, obj)
+
+    @staticmethod
+    def _add_totals(totals, resources, sign):
+        for name, amount in resources.items():
+            totals[name] = totals.get(name, 0) + sign * amount
+
+    def _reserve(self, node, pod, sign):
+        """Take a pod's resources from its node (sign 1) or give them back (sign -1)"""
+        node.available_cores -= sign * pod.cpu_cores
+        self.available_cores -= sign * pod.cpu_cores
+        if pod.resources:
+            self._add_totals(node.available_resources, pod.resources, -sign)
+            self._add_totals(self.available_resources, pod.resources, -sign)
+
+    # ---- Nodes ----
+
+    def add_node(self, cpu_cores, node_id=None, resources=None):
+        """
+        Register a new node and initialize its heartbeat
+
+        Args:
+            cpu_cores: Number of CPU cores the node provides
+            node_id: ID to restore the node under (a new ID is assigned if None)
+            resources: Other resources the node provides, {name: amount}
+
+        Returns:
+            The newly created node
+        """
+        if node_id is None:
+            seq = self.node_id_counter
+            node_id = "node-{}".format(seq)
+        else:
+            seq = id_sequence(node_id)
+        self.node_id_counter = max(self.node_id_counter, seq + 1)
+
+        resources = dict(resources or {})
+        node = Node(node_id, seq, cpu_cores, resources)
+        self.nodes[node_id] = node
+        self.pods_by_node[node_id] = node.pods
+        self.node_heartbeat[node_id] = self.clock()
+        self.node_order.append(node_id, seq)
+
+        self.total_cores += cpu_cores
+        self.available_cores += cpu_cores
+        self.healthy_nodes += 1
+        self._add_totals(self.total_resources, resources, 1)
+        self._add_totals(self.available_resources, resources, 1)
+        self._notify("node", "ADDED", node)
+        return node
+
+    def get_node(self, node_id):
+        """Return the node with the given id, or None"""
+        return self.nodes.get(node_id)
+
+    def remove_node(self, node_id):
+        """
+        Remove a node from the cluster
+
+        Pods still bound to the node are left untouched; callers are expected
+        to reschedule or remove them first.
+
+        Args:
+            node_id: ID of the node to remove
+
+        Returns:
+            The removed node, or None if it did not exist
+        """
+        node = self.nodes.pop(node_id, None)
+        if node is None:
+            return None
+        self.pods_by_node.pop(node_id, None)
+        self.node_heartbeat.pop(node_id, None)
+        self.node_metrics.pop(node_id, None)
+        self.node_order.remove(self.nodes)
+
+        self.total_cores -= node.cpu_cores
+        self.available_cores -= node.available_cores
+        self._add_totals(self.total_resources, node.resources, -1)
+        self._add_totals(self.available_resources, node.available_resources, -1)
+        if node.status == "Healthy":
+            self.healthy_nodes -= 1
+        self._notify("node", "DELETED", node)
+        return node
+
+    def record_heartbeat(self, node_id, timestamp=None, metrics=None):
+        """
+        Record a heartbeat for a node
+
+        A timestamp older than the node's last heartbeat (e.g. a delayed
+        batch) never moves it backwards.
+
+        Args:
+            node_id: ID of the node
+            timestamp: When the heartbeat was sent (defaults to now)
+            metrics: Optional load metrics reported with the heartbeat
+
+        Returns:
+            True if the node is known, False otherwise
+        """
+        last_seen = self.node_heartbeat.get(node_id)
+        if last_seen is None:
+            return False
+        if timestamp is None:
+            timestamp = self.clock()
+        if timestamp > last_seen:
+            self.node_heartbeat[node_id] = timestamp
+        if metrics:
+            self.node_metrics[node_id] = metrics
+        self._notify("node", "HEARTBEAT", self.nodes[node_id])
+        return True
+
+    def set_node_status(self, node_id, status):
+        """
+        Set a node's health status ("Healthy" or "Unhealthy")
+
+        Returns:
+            True if the status changed, False otherwise
+        """
+        node = self.nodes.get(node_id)
+        if node is None or node.status == status:
+            return False
+        node.status = status
+        self.healthy_nodes += 1 if status == "Healthy" else -1
+        self._notify("node", "MODIFIED", node)
+        return True
+
+    def node_status(self, node_id):
+        """Return "Healthy", "Unhealthy" or "Unknown" for a node"""
+        node = self.nodes.get(node_id)
+        return node.status if node else "Unknown"
+
+    def is_healthy(self, node_id):
+        """Return True if the node is registered and healthy"""
+        return self.node_status(node_id) == "Healthy"
+
+    def pods_on_node(self, node_id):
+        """Return the set of pod ids assigned to a node (empty if unknown)"""
+        return self.pods_by_node.get(node_id, set())
+
+    # ---- Pods ----
+
+    def add_pod(self, cpu_cores, node_id, pod_id=None, creation_time=None, resources=None,
+                priority=DEFAULT_PRIORITY):
+        """
+        Create a pod and bind it to a node, reserving its CPU cores and other resources
+
+        Args:
+            cpu_cores: CPU cores required by the pod
+            node_id: ID of the node the pod is placed on
+            pod_id: ID to restore the pod under (a new ID is assigned if None)
+            creation_time: Original creation time of a restored pod
+            resources: Other resources the pod requires, {name: amount}
+            priority: Priority class of the pod
+
+        Returns:
+            The newly created pod
+        """
+        node = self.nodes[node_id]
+        if pod_id is None:
+            pod_id = self._next_pod_id()
+        seq = id_sequence(pod_id)
+        self.pod_id_counter = max(self.pod_id_counter, seq + 1)
+        pod = Pod(pod_id, seq, cpu_cores, dict(resources) if resources else NO_RESOURCES,
+                  sys.intern(priority), node.id,
+                  self.clock() if creation_time is None else creation_time)
+
+        self._reserve(node, pod, 1)
+        node.pods.add(pod_id)
+        self.pods[pod_id] = pod
+        self.pod_order.append(pod_id, seq)
+        self._notify("pod", "ADDED", pod)
+        self._notify("node", "MODIFIED", node)
+        return pod
+
+    def _next_pod_id(self):
+        pod_id = "pod-{}".format(self.pod_id_counter)
+        self.pod_id_counter += 1
+        return pod_id
+
+    def reserve_pod_id(self):
+        """
+        Allocate a pod id now for a pod that will be created later with add_pod
+
+        Reservation listeners are told, so logs can keep the id from being
+        handed out again after a restart.
+        """
+        pod_id = self._next_pod_id()
+        for listener in self.reservation_listeners:
+            listener(pod_id)
+        return pod_id
+
+    def get_pod(self, pod_id):
+        """Return the pod with the given id, or None"""
+        return self.pods.get(pod_id)
+
+    def remove_pod(self, pod_id):
+        """
+        Remove a pod and free its resources on the assigned node
+
+        Returns:
+            The removed pod, or None if it did not exist
+        """
+        pod = self.pods.pop(pod_id, None)
+        if pod is None:
+            return None
+        self.pod_order.remove(self.pods)
+        self._notify("pod", "DELETED", pod)
+
+        node = self.nodes.get(pod.assigned_node)
+        if node is not None:
+            self._reserve(node, pod, -1)
+            node.pods.discard(pod_id)
+            self._notify("node", "MODIFIED", node)
+        return pod
+
+    def move_pod(self, pod_id, target_node_id):
+        """
+        Move a pod to another node, updating resource accounting on both nodes
+
+        Args:
+            pod_id: ID of the pod to move
+            target_node_id: ID of the node receiving the pod
+        """
+        pod = self.pods[pod_id]
+        target = self.nodes[target_node_id]
+
+        source = self.nodes.get(pod.assigned_node)
+        if source is not None:
+            self._reserve(source, pod, -1)
+            source.pods.discard(pod_id)
+            self._notify("node", "MODIFIED", source)
+
+        pod.assigned_node = target.id
+        self._reserve(target, pod, 1)
+        target.pods.add(pod_id)
+        self._notify("pod", "MODIFIED", pod)
+        self._notify("node", "MODIFIED", target)
+
+    def clear(self):
+        """
+        Remove every pod and node, notifying listeners, and reset the id counters
+
+        Used before loading a full copy of the state from elsewhere.
+        """
+        for pod_id in list(self.pods):
+            self.remove_pod(pod_id)
+        for node_id in list(self.nodes):
+            self.remove_node(node_id)
+        self.node_id_counter = 1
+        self.pod_id_counter = 1
+
+    # ---- Queries ----
+
+    def summary(self):
+        """Return cluster-wide totals from the running aggregates in O(1)"""
+        used_cores = self.total_cores - self.available_cores
+        return {
+            "total_nodes": len(self.nodes),
+            "healthy_nodes": self.healthy_nodes,
+            "unhealthy_nodes": len(self.nodes) - self.healthy_nodes,
+            "total_cores": self.total_cores,
+            "available_cores": self.available_cores,
+            "used_cores": used_cores,
+            "utilization": used_cores / self.total_cores if self.total_cores else 0.0,
+            "total_pods": len(self.pods),
+            "resources": {
+                name: {"total": total, "available": self.available_resources.get(name, 0)}
+                for name, total in self.total_resources.items()
+            }
+        }
+
+    def iter_nodes(self, cursor=None):
+        """
+        Yield nodes in registration order, starting after the cursor node id
+
+        Raises:
+            ValueError: If the cursor is not a node id
+        """
+        for node_id in self.node_order.after(cursor, self.nodes):
+            yield self.nodes[node_id]
+
+    def iter_pods(self, cursor=None, node_id=None):
+        """
+        Yield pods in creation order, starting after the cursor pod id
+
+        Args:
+            cursor: Last pod id already returned (None to start at the beginning)
+            node_id: Only yield pods assigned to this node
+
+        Raises:
+            ValueError: If the cursor is not a pod id
+        """
+        if node_id is None:
+            for pod_id in self.pod_order.after(cursor, self.pods):
+                yield self.pods[pod_id]
+            return
+
+        start = -1 if cursor is None else id_sequence(cursor, "pod")
+        pods = sorted((self.pods[pod_id] for pod_id in self.pods_on_node(node_id)), key=operator.attrgetter("seq"))
+        for pod in pods:
+            if pod.seq > start:
+                yield pod
@@ -0,0 +1,139 @@
+import json
+import math
+import os
+import random
+import threading
+import time
+
+# Fault map shared by node_sim.py agents and node_failure_sim.py when neither is given another
+DEFAULT_FAULT_MAP = "node_faults.json"
+
+# Fault modes
+DROP = "drop"    # Every heartbeat is lost (crash or network partition)
+DELAY = "delay"  # Heartbeats arrive "seconds" late
+LOSS = "loss"    # Each heartbeat is lost with "probability"
+FLAP = "flap"    # Heartbeats are lost for the first "down" fraction of every "period" seconds
+MODES = (DROP, DELAY, LOSS, FLAP)
+
+
+def validate_fault(fault):
+    """
+    Check a fault and return it with its defaults filled in
+
+    Raises:
+        ValueError: If the fault is malformed
+    """
+    mode = fault.get("mode")
+    if mode not in MODES:
+        raise ValueError("Unknown fault mode: {}".format(mode))
+    fault = dict(fault)
+    fault.setdefault("since", time.time())
+    if mode == DELAY and not fault.get("seconds", 0) > 0:
+        raise ValueError("A delay fault needs positive seconds")
+    if mode == LOSS and not 0 <= fault.get("probability", -1) <= 1:
+        raise ValueError("A loss fault needs a probability between 0 and 1")
+    if mode == FLAP:
+        fault.setdefault("down", 0.5)
+        if not fault.get("period", 0) > 0 or not 0 < fault["down"] < 1:
+            raise ValueError("A flap fault needs a positive period and a down fraction between 0 and 1")
+    return fault
+
+
+def outage_start(fault, now):
+    """
+    Return when the heartbeat outage a fault is causing at `now` began
+
+    Returns:
+        A timestamp, or None for partial loss, which has no definite start
+    """
+    if fault["mode"] == FLAP:
+        cycles = math.floor((now - fault["since"]) / fault["period"])
+        return fault["since"] + max(cycles, 0) * fault["period"]
+    if fault["mode"] == LOSS:
+        return None
+    return fault["since"]
+
+
+def write_fault_map(path, faults):
+    """
+    Replace the fault map atomically, so agents never read a partial file
+
+    Args:
+        path: Fault map file
+        faults: {node_id: fault}
+    """
+    temporary = "{}.{}.tmp".format(path, os.getpid())
+    with open(temporary, "w") as f:
+        json.dump({"faults": faults}, f)
+    os.replace(temporary, path)
+
+
+class FaultMap:
+    def __init__(self, path=DEFAULT_FAULT_MAP, check_interval=0.5, rng=None):
+        """
+        Node agents' view of the faults injected into their heartbeats
+
+        The file is re-read only when its modification time or size
+        changes, and checked at most every check_interval seconds, so
+        thousands of agents in one process share a single cheap stat. A
+        missing file means no faults.
+
+        Args:
+            path: Fault map file written by write_fault_map()
+            check_interval: Minimum seconds between checks of the file
+            rng: random.Random for loss faults (the random module if None)
+        """
+        self.path = path
+        self.check_interval = check_interval
+        self.rng = rng or random
+        self.faults = {}
+        self.signature = None
+        self.checked = 0.0
+        self.lock = threading.Lock()
+
+    def refresh(self):
+        """Reload the file if it changed since the last check"""
+        now = time.monotonic()
+        with self.lock:
+            if now - self.checked < self.check_interval:
+                return
+            self.checked = now
+            try:
+                stat = os.stat(self.path)
+            except FileNotFoundError:
+                self.faults, self.signature = {}, None
+                return
+            signature = (stat.st_mtime_ns, stat.st_size)
+            if signature == self.signature:
+                return
+            try:
+                with open(self.path) as f:
+                    self.faults = json.load(f).get("faults", {})
+                self.signature = signature
+            except (OSError, ValueError):
+                pass  # Keep the previous faults; the file is retried on the next check
+
+    def heartbeat_delay(self, node_id, now=None):
+        """
+        Decide the fate of a node's heartbeat
+
+        Returns:
+            None if the heartbeat is lost, otherwise the seconds it is held back (0 if unaffected)
+        """
+        self.refresh()
+        fault = self.faults.get(node_id)
+        if fault is None:
+            return 0
+        if now is None:
+            now = time.time()
+        mode = fault["mode"]
+        if mode == DROP:
+            return None
+        if mode == DELAY:
+            return fault["seconds"]
+        if mode == LOSS:
+            return None if self.rng.random() < fault["probability"] else 0
+        if now < fault["since"]:
+            return 0
+        phase = (now - fault["since"]) % fault["period"]
+        return None if phase < fault["down"] * fault["period"] else 0
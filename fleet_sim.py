@@ -0,0 +1,195 @@
+import asyncio
+import argparse
+import random
+import time
+
+import aiohttp
+
+from fault_injection import DEFAULT_FAULT_MAP, FaultMap
+from node_sim import SimulatedNode
+from stats import percentile
+
+# Change if your server is running elsewhere
+API_SERVER_URL = "http://localhost:5002"
+
+def parse_core_distribution(spec):
+    """
+    Parse a core distribution such as "4,8,16" or "4:0.5,8:0.3,16:0.2"
+
+    Returns:
+        (core counts, weights)
+    """
+    cores, weights = [], []
+    for part in spec.split(","):
+        value, _, weight = part.partition(":")
+        cores.append(int(value))
+        weights.append(float(weight) if weight else 1.0)
+    return cores, weights
+
+class AsyncSimulatedNode(SimulatedNode):
+    """SimulatedNode that registers and heartbeats on a shared asyncio session"""
+
+    async def register_node_async(self, session):
+        async with session.post("{}/add_node".format(API_SERVER_URL), json={"cpu_cores": self.cpu_cores}) as response:
+            if response.status == 200:
+                self.node_id = (await response.json())['node_id']
+            return response.status == 200
+
+    async def send_heartbeat_async(self, session, timestamp=None):
+        async with session.post("{}/heartbeat".format(API_SERVER_URL),
+                                json={"node_id": self.node_id, "metrics": self.metrics(),
+                                      "timestamp": timestamp or time.time()}) as response:
+            await response.read()
+            return response.status == 200
+
+class FleetSimulator:
+    def __init__(self, node_count, cores, weights, heartbeat_interval=5, jitter=0.1,
+                 connections=100, seed=None, faults=None):
+        """
+        Simulate a fleet of nodes from one asyncio event loop
+
+        All nodes share a single pooled HTTP session. Each node's first
+        heartbeat is offset by a random fraction of the interval and every
+        later interval is jittered, so heartbeats arrive spread out rather
+        than in synchronized bursts.
+
+        Args:
+            node_count: Number of nodes to simulate
+            cores: Possible CPU core counts per node
+            weights: Relative weight of each core count
+            heartbeat_interval: Mean seconds between heartbeats of one node
+            jitter: Fraction by which each interval is randomly stretched or shrunk
+            connections: Maximum concurrent connections in the pool
+            seed: Random seed for the core distribution and timing
+            faults: FaultMap whose injected faults drop or delay heartbeats
+        """
+        self.rng = random.Random(seed)
+        self.nodes = [
+            AsyncSimulatedNode(cpu_cores=c, heartbeat_interval=heartbeat_interval)
+            for c in self.rng.choices(cores, weights=weights, k=node_count)
+        ]
+        self.heartbeat_interval = heartbeat_interval
+        self.jitter = jitter
+        self.connections = connections
+        self.faults = faults
+        self.latencies = []  # Heartbeat round-trip times since the last report
+        self.sent = 0
+        self.errors = 0
+        self.dropped = 0     # Heartbeats lost to injected faults
+
+    async def _register_all(self, session):
+        semaphore = asyncio.Semaphore(self.connections)
+
+        async def register(node):
+            async with semaphore:
+                try:
+                    return await node.register_node_async(session)
+                except aiohttp.ClientError:
+                    return False
+
+        results = await asyncio.gather(*(register(node) for node in self.nodes))
+        return sum(1 for ok in results if ok)
+
+    async def _heartbeat_loop(self, session, node):
+        await asyncio.sleep(self.rng.uniform(0, self.heartbeat_interval))
+        while True:
+            start = time.perf_counter()
+            timestamp = time.time()
+            held = self.faults.heartbeat_delay(node.node_id, timestamp) if self.faults else 0
+            if held is None:
+                self.dropped += 1
+            elif held:
+                # Held in transit: it arrives late with its original timestamp, off the schedule
+                asyncio.ensure_future(self._deliver(session, node, timestamp, held))
+            else:
+                await self._deliver(session, node, timestamp)
+            elapsed = time.perf_counter() - start
+            delay = self.heartbeat_interval * (1 + self.rng.uniform(-self.jitter, self.jitter))
+            await asyncio.sleep(max(0, delay - elapsed))
+
+    async def _deliver(self, session, node, timestamp, held=0):
+        """Send one heartbeat taken at timestamp, after holding it back held seconds"""
+        if held:
+            await asyncio.sleep(held)
+        sent = time.perf_counter()
+        try:
+            ok = await node.send_heartbeat_async(session, timestamp)
+        except aiohttp.ClientError:
+            ok = False
+        if ok:
+            self.sent += 1
+            self.latencies.append(time.perf_counter() - sent)
+        else:
+            self.errors += 1
+
+    def report(self, window):
+        """Print and reset heartbeat statistics for the last window seconds"""
+        latencies = sorted(self.latencies)
+        print("[FLEET] {:>8.0f} hb/s  errors {:<6} dropped {:<6} p50 {:>7.1f}ms  p90 {:>7.1f}ms  p99 {:>7.1f}ms  "
+              "max {:>7.1f}ms".format(
+            self.sent / window, self.errors, self.dropped,
+            percentile(latencies, 50) * 1000, percentile(latencies, 90) * 1000,
+            percentile(latencies, 99) * 1000, (latencies[-1] if latencies else 0) * 1000))
+        self.latencies = []
+        self.sent = 0
+        self.errors = 0
+        self.dropped = 0
+
+    async def run(self, duration=None, report_interval=10):
+        """
+        Register every node, then heartbeat until the duration elapses
+
+        Args:
+            duration: Seconds to run after registration (None runs forever)
+            report_interval: Seconds between throughput/latency reports
+        """
+        connector = aiohttp.TCPConnector(limit=self.connections)
+        timeout = aiohttp.ClientTimeout(total=30)
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+            start = time.perf_counter()
+            registered = await self._register_all(session)
+            print("[INFO] Registered {}/{} nodes in {:.1f}s".format(
+                registered, len(self.nodes), time.perf_counter() - start))
+
+            tasks = [asyncio.ensure_future(self._heartbeat_loop(session, node))
+                     for node in self.nodes if node.node_id]
+            end = None if duration is None else time.perf_counter() + duration
+            try:
+                while end is None or time.perf_counter() < end:
+                    window = report_interval if end is None else min(report_interval, end - time.perf_counter())
+                    await asyncio.sleep(max(0, window))
+                    self.report(max(window, 1e-9))
+            finally:
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+def main():
+    global API_SERVER_URL
+    parser = argparse.ArgumentParser(description="Simulate a large fleet of nodes with asyncio")
+    parser.add_argument("--server", default=API_SERVER_URL, help="API server URL")
+    parser.add_argument("--nodes", type=int, default=1000, help="Number of nodes to simulate")
+    parser.add_argument("--cores", default="4,8,16",
+                        help="Core distribution, e.g. 4,8,16 or 4:0.5,8:0.3,16:0.2")
+    parser.add_argument("--interval", type=float, default=5, help="Heartbeat interval in seconds")
+    parser.add_argument("--jitter", type=float, default=0.1, help="Interval jitter as a fraction (0.0 to 1.0)")
+    parser.add_argument("--connections", type=int, default=100, help="HTTP connection pool size")
+    parser.add_argument("--duration", type=float, help="Seconds to run (default: forever)")
+    parser.add_argument("--report-interval", type=float, default=10, help="Seconds between reports")
+    parser.add_argument("--seed", type=int, help="Random seed")
+    parser.add_argument("--faults", default=DEFAULT_FAULT_MAP,
+                        help="Fault map written by node_failure_sim.py to obey")
+    args = parser.parse_args()
+
+    API_SERVER_URL = args.server
+    cores, weights = parse_core_distribution(args.cores)
+    fleet = FleetSimulator(args.nodes, cores, weights, heartbeat_interval=args.interval,
+                           jitter=args.jitter, connections=args.connections, seed=args.seed,
+                           faults=FaultMap(args.faults))
+    try:
+        asyncio.run(fleet.run(args.duration, args.report_interval))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,13 @@
 import time
+import heapq
 import threading
 import logging
 
+from cluster_state import id_sequence
+from metrics import Counter, Histogram
+from pending import PendingQueue
+from scheduler import Scheduler
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -9,27 +15,58 @@ logging.basicConfig(
 )
 logger = logging.getLogger('health_monitor')
 
+NODE_FAILURES = Counter("cluster_node_failures_total", "Nodes marked unhealthy after missing heartbeats")
+DETECTION_LAG_SECONDS = Histogram("cluster_failure_detection_lag_seconds",
+                                  "Time from a node's heartbeat deadline to its failure being detected")
+RESCHEDULE_SECONDS = Histogram("cluster_failure_reschedule_duration_seconds",
+                               "Time to reschedule the pods of nodes that failed together")
+
 class HealthMonitor:
-    def __init__(self, nodes, node_heartbeat, pods, heartbeat_timeout=15):
+    def __init__(self, state, heartbeat_timeout=15, scheduler=None, queue=None):
         """
         Initialize the health monitor
         
+        Expiry is tracked with a min-heap of heartbeat deadlines
+        (last heartbeat + timeout), holding at most one entry per node. The
+        monitor thread sleeps until the earliest deadline, so failures are
+        detected as soon as the timeout elapses and each wake-up only touches
+        nodes whose deadline has passed.
+        
+        Pods displaced by every node that fails in one check are placed
+        together as a single batch, largest first, through the scheduler's
+        capacity index. Pods that fit nowhere stay bound to their failed
+        node and join the pending queue, which places them when capacity
+        appears (a node joins or recovers, or a pod is removed).
+        
+        Lock order is the cluster state lock first, then the monitor's own
+        condition; the monitor thread only holds the condition while waiting.
+        
         Args:
-            nodes: List of nodes in the cluster
-            node_heartbeat: Dictionary tracking last heartbeat time for each node
-            pods: List of all pods in the cluster
+            state: ClusterState holding the cluster's nodes, pods and heartbeats
             heartbeat_timeout: Time in seconds after which a node is considered unhealthy
+            scheduler: Scheduler used to place displaced pods (one is created if None)
+            queue: PendingQueue for pods that fit nowhere (one is created if None)
         """
-        self.nodes = nodes
-        self.node_heartbeat = node_heartbeat
-        self.pods = pods
+        self.state = state
         self.heartbeat_timeout = heartbeat_timeout
+        self.scheduler = scheduler if scheduler is not None else Scheduler(state)
+        self.queue = queue if queue is not None else PendingQueue(state, self.scheduler)
         self.running = False
         self.thread = None
-        self.failed_nodes = set()  # Track nodes that have failed
+        self.deadlines = []        # Min-heap of (deadline, node_id)
+        self.scheduled = {}        # {node_id: deadline currently in the heap}
+        self.condition = threading.Condition()
+        
+        with state.lock, self.condition:
+            for node_id, last_seen in state.node_heartbeat.items():
+                self._schedule(node_id, last_seen + heartbeat_timeout)
+            state.subscribe(self._on_state_change)
         
     def start(self):
         """Start the health monitoring thread"""
+        with self.state.lock:
+            # Pods may have been displaced while another monitor (or none) was running
+            self.queue.reset()
         self.running = True
         self.thread = threading.Thread(target=self._monitor_health)
         self.thread.daemon = True  # Thread will exit when main program exits
@@ -38,95 +75,125 @@ class HealthMonitor:
         
     def stop(self):
         """Stop the health monitoring thread"""
-        self.running = False
+        with self.condition:
+            self.running = False
+            self.condition.notify()
         if self.thread:
             self.thread.join(timeout=1)  # Wait for thread to finish
         logger.info("Health monitor stopped")
-        
-    def _monitor_health(self):
-        """Continuously monitor node health and handle failures"""
-        while self.running:
-            current_time = time.time()
-            
-            # Check each node's heartbeat status
-            for node in list(self.nodes):  # Create a copy of the list for safe iteration
-                node_id = node["id"]
-                
-                # If no heartbeat or too old, mark as unhealthy
-                if node_id not in self.node_heartbeat or current_time - self.node_heartbeat[node_id] > self.heartbeat_timeout:
-                    if node_id not in self.failed_nodes:
-                        logger.warning(f"Node {node_id} has failed! Last heartbeat: {self.node_heartbeat.get(node_id, 'None')}")
-                        self.failed_nodes.add(node_id)
-                        self._handle_node_failure(node)
-                else:
-                    # If node was previously failed but is now healthy, remove from failed set
-                    if node_id in self.failed_nodes:
-                        logger.info(f"Node {node_id} has recovered!")
-                        self.failed_nodes.remove(node_id)
-            
-            # Sleep for a while before next check
-            time.sleep(5)
     
-    def _handle_node_failure(self, failed_node):
+    def next_deadline(self):
+        """Return the earliest pending heartbeat deadline, or None"""
+        with self.condition:
+            return self.deadlines[0][0] if self.deadlines else None
+        
+    def check_expired(self, current_time=None):
         """
-        Handle a node failure by rescheduling its pods to other healthy nodes
+        Fail every node whose heartbeat deadline has passed
         
         Args:
-            failed_node: The node that has failed
-        """
-        logger.info(f"Handling failure of node {failed_node['id']}")
+            current_time: Time to check against (defaults to the state's clock)
         
-        # Get all pods assigned to the failed node
-        pods_to_reschedule = [pod for pod in self.pods if pod["assigned_node"] == failed_node["id"]]
+        Returns:
+            List of node ids that were marked as failed
+        """
+        if current_time is None:
+            current_time = self.state.clock()
         
-        if not pods_to_reschedule:
-            logger.info(f"No pods to reschedule from failed node {failed_node['id']}")
-            return
+        expired = []
+        with self.state.lock:
+            with self.condition:
+                while self.deadlines and self.deadlines[0][0] <= current_time:
+                    deadline, node_id = heapq.heappop(self.deadlines)
+                    if self.scheduled.get(node_id) != deadline:
+                        continue  # Superseded entry
+                    del self.scheduled[node_id]
+                
+                    last_seen = self.state.node_heartbeat.get(node_id)
+                    if last_seen is None:
+                        continue  # Node was removed
+                    if last_seen + self.heartbeat_timeout > current_time:
+                        # Heartbeats arrived since this entry was pushed
+                        self._schedule(node_id, last_seen + self.heartbeat_timeout)
+                    elif self.state.is_healthy(node_id):
+                        expired.append(node_id)
+                        DETECTION_LAG_SECONDS.observe(current_time - deadline)
         
-        logger.info(f"Found {len(pods_to_reschedule)} pods to reschedule from node {failed_node['id']}")
+            for node_id in expired:
+                logger.warning(f"Node {node_id} has failed! Last heartbeat: {self.state.node_heartbeat.get(node_id, 'None')}")
+                self.state.set_node_status(node_id, "Unhealthy")
+            if expired:
+                NODE_FAILURES.inc(len(expired))
+                self._handle_node_failures([self.state.nodes[node_id] for node_id in expired])
+        return expired
         
-        # Try to reschedule each pod
-        for pod in pods_to_reschedule:
-            self._reschedule_pod(pod, failed_node)
+    def _monitor_health(self):
+        """Sleep until the next heartbeat deadline and handle failures"""
+        while self.running:
+            with self.condition:
+                if not self.deadlines:
+                    self.condition.wait()
+                else:
+                    delay = self.deadlines[0][0] - time.time()
+                    if delay > 0:
+                        self.condition.wait(delay)
+                if not self.running:
+                    break
+            self.check_expired()
+    
+    def _schedule(self, node_id, deadline):
+        """Push a deadline for a node that has no entry in the heap (condition held)"""
+        self.scheduled[node_id] = deadline
+        heapq.heappush(self.deadlines, (deadline, node_id))
+        if self.deadlines[0][1] == node_id:
+            self.condition.notify()
+    
+    def _on_state_change(self, kind, event_type, obj):
+        """Track heartbeats, registrations and removals (cluster state lock held)"""
+        if kind == "pod" or event_type == "MODIFIED":
+            return
+        node_id = obj.id
+        with self.condition:
+            if event_type == "DELETED":
+                self.scheduled.pop(node_id, None)
+                return
+            
+            last_seen = self.state.node_heartbeat[node_id]
+            if last_seen + self.heartbeat_timeout <= self.state.clock():
+                return  # A stale heartbeat (delayed or replayed) does not show the node is alive
+            
+            if obj.status == "Unhealthy":
+                logger.info(f"Node {node_id} has recovered!")
+                self.state.set_node_status(node_id, "Healthy")
+            
+            # Later heartbeats only move the deadline, which is re-checked on expiry
+            if node_id not in self.scheduled:
+                self._schedule(node_id, last_seen + self.heartbeat_timeout)
     
-    def _reschedule_pod(self, pod, failed_node):
+    def _handle_node_failures(self, failed_nodes):
         """
-        Reschedule a pod from a failed node to a healthy node
+        Reschedule the pods of failed nodes to healthy nodes as one batch
+        
+        Pods that cannot be placed join the pending queue.
         
         Args:
-            pod: The pod to reschedule
-            failed_node: The node that failed
+            failed_nodes: The nodes that have failed
         """
-        cpu_req = pod["cpu_cores"]
-        pod_id = pod["id"]
+        displaced = []
+        for node in failed_nodes:
+            displaced.extend(sorted(self.state.pods_on_node(node.id), key=id_sequence))
         
-        logger.info(f"Attempting to reschedule pod {pod_id} requiring {cpu_req} CPU cores")
+        if not displaced:
+            logger.info(f"No pods to reschedule from {len(failed_nodes)} failed node(s)")
+            return
         
-        # Find a healthy node with enough capacity
-        for node in self.nodes:
-            # Skip the failed node and any other unhealthy nodes
-            if node["id"] == failed_node["id"] or node["id"] in self.failed_nodes:
-                continue
-                
-            # If node has enough capacity, schedule the pod there
-            if node["available_cores"] >= cpu_req:
-                logger.info(f"Rescheduling pod {pod_id} to node {node['id']}")
-                
-                # Update pod assignment
-                pod["assigned_node"] = node["id"]
-                
-                # Update node resources
-                node["available_cores"] -= cpu_req
-                node["pods"].append(pod_id)
-                
-                # Remove pod from failed node's list (even though the node is down,
-                # we keep the data structure clean)
-                if pod_id in failed_node["pods"]:
-                    failed_node["pods"].remove(pod_id)
-                
-                logger.info(f"Successfully rescheduled pod {pod_id} to node {node['id']}")
-                return
+        logger.info(f"Rescheduling {len(displaced)} pods from {len(failed_nodes)} failed node(s)")
+        started = time.perf_counter()
+        unplaced = self.scheduler.reschedule(displaced)
+        RESCHEDULE_SECONDS.observe(time.perf_counter() - started)
+        logger.info(f"Rescheduled {len(displaced) - len(unplaced)} pods")
         
-        # If we get here, we couldn't reschedule the pod
-        logger.warning(f"Failed to reschedule pod {pod_id} - no suitable node available")
-        # We'll keep the pod in the list so we can try to reschedule it later when new nodes join
+        if unplaced:
+            logger.warning(f"{len(unplaced)} pods could not be rescheduled - no suitable node available; "
+                           f"they will be placed when capacity is added")
+            self.queue.add_displaced(unplaced)
@@ -1,23 +1,109 @@
-import requests
-import json
 import time
+import argparse
 
-def list_nodes():
-    while True:  # Infinite loop
+from cluster_client import ClusterClient, ClusterError
+
+API_SERVER_URL = "http://localhost:5002"
+
+class NodeWatcher:
+    def __init__(self, api_url, redraw_interval=1.0, client=None):
+        """
+        Keep a local cache of cluster nodes up to date with the /watch feed
+
+        The cache is filled once from /list_nodes, then only deltas are
+        applied. After a disconnect the watch resumes from the last resource
+        version seen; if the server no longer holds that version, the cache
+        is rebuilt from a fresh list. Resource versions are per replica, so
+        every request goes to the one server at api_url.
+
+        Args:
+            api_url: URL of the API server
+            redraw_interval: Minimum seconds between screen redraws
+            client: ClusterClient to reach the server through (one of its own if omitted)
+        """
+        self.api_url = api_url
+        self.redraw_interval = redraw_interval
+        self.client = client or ClusterClient(api_url, timeout=10)
+        self.nodes = {}  # {node_id: node}
+        self.resource_version = None
+        self.last_draw = 0
+
+    def relist(self):
+        """Rebuild the cache from a full node list"""
+        nodes = {}
+        cursor = None
+        while True:
+            data = self.client.list_page("/list_nodes", 1000, cursor)
+            if cursor is None:
+                # Later pages are read separately and may already hold changes made after
+                # this version; the watch resumes from it and replays them over the cache
+                self.resource_version = data.get("resource_version", 0)
+            for node in data.get("nodes", []):
+                node["pod_count"] = len(node.pop("pods", []))
+                nodes[node["id"]] = node
+            cursor = data.get("next_cursor")
+            if not cursor:
+                break
+        self.nodes = nodes
+
+    def apply(self, event):
+        """Apply one watch event to the cache"""
+        node = event["object"]
+        if event["type"] == "DELETED":
+            self.nodes.pop(node["id"], None)
+        else:
+            node["metrics"] = self.nodes.get(node["id"], {}).get("metrics", {})
+            self.nodes[node["id"]] = node
+        self.resource_version = event["resource_version"]
+
+    def watch(self):
+        """
+        Stream node events into the cache until the connection ends
+
+        Returns:
+            False if the resource version expired and a relist is needed
+        """
         try:
-            response = requests.get('http://localhost:5002/list_nodes')
-            if response.status_code == 200:
-                data = response.json()
-                # Clear screen (optional, makes it feel more dynamic)
-                print("\033c", end="")  # Works on most terminals
-                print("Cluster Node Status:\n")
-                print(json.dumps(data, indent=4))  # Pretty print the nodes
-            else:
-                print(f"Failed to fetch nodes. Status Code: {response.status_code}")
-        except Exception as e:
-            print(f"Error: {str(e)}")
-
-        time.sleep(1)  
+            for event in self.client.watch("node", self.resource_version):
+                self.apply(event)
+                self.draw()
+        except ClusterError as e:
+            if e.status == 410:
+                return False
+            raise
+        return True
+
+    def draw(self, force=False):
+        if not force and time.time() - self.last_draw < self.redraw_interval:
+            return
+        self.last_draw = time.time()
+        print("\033c", end="")  # Works on most terminals
+        print("Cluster Node Status (resource version {}):\n".format(self.resource_version))
+        print(" {:<15} {:<10} {:<15} {:<6}".format("NODE ID", "STATUS", "AVAILABLE/TOTAL", "PODS"))
+        for node in self.nodes.values():
+            print(" {:<15} {:<10} {:<15} {:<6}".format(
+                node["id"], node["status"],
+                "{}/{}".format(node["available_cores"], node["cpu_cores"]), node["pod_count"]))
+        healthy = sum(1 for node in self.nodes.values() if node["status"] == "Healthy")
+        print("\nTotal: {} nodes, {} healthy".format(len(self.nodes), healthy))
+
+    def run(self):
+        while True:
+            try:
+                if self.resource_version is None:
+                    self.relist()
+                    self.draw(force=True)
+                if not self.watch():
+                    self.resource_version = None  # Version expired; list again
+            except (ClusterError, ValueError) as e:
+                print(f"Error: {str(e)}")
+                time.sleep(1)
+
+def list_nodes(api_url=API_SERVER_URL):
+    NodeWatcher(api_url).run()
 
 if __name__ == "__main__":
-    list_nodes()
+    parser = argparse.ArgumentParser(description="Watch cluster nodes")
+    parser.add_argument("--server", default=API_SERVER_URL, help="API server URL")
+    args = parser.parse_args()
+    list_nodes(args.server)
@@ -0,0 +1,197 @@
+import abc
+import bisect
+import math
+import threading
+
+# Upper bounds in seconds of the default latency histogram buckets
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+                   0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join('{}="{}"'.format(name, _escape(value)) for name, value in pairs) + "}"
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value)
+
+
+class Registry:
+    def __init__(self):
+        """Collection of metrics rendered together in the Prometheus text format"""
+        self.metrics = []
+        self.lock = threading.Lock()
+
+    def register(self, metric):
+        with self.lock:
+            self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        """Return every metric in the Prometheus text exposition format"""
+        with self.lock:
+            metrics = list(self.metrics)
+        lines = []
+        for metric in metrics:
+            lines.append("# HELP {} {}".format(metric.name, metric.documentation))
+            lines.append("# TYPE {} {}".format(metric.name, metric.kind))
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+# Registry that metrics join unless given another
+REGISTRY = Registry()
+
+
+class _Metric(abc.ABC):
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY):
+        """
+        Base of a metric family with optional labels
+
+        Each distinct set of label values gets a child created on first use
+        and cached, so after warm-up recording a value is a dict lookup plus
+        an update under the family's own lock (uncontended in the common
+        case; the cluster state lock is never taken).
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+        self.children = {}
+        if not self.labelnames:
+            self.children[()] = self._new_child()
+        if registry is not None:
+            registry.register(self)
+
+    def labels(self, *values):
+        """Return the child for a set of label values (in labelnames order)"""
+        child = self.children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError("{} takes labels {}".format(self.name, self.labelnames))
+            with self.lock:
+                child = self.children.setdefault(values, self._new_child())
+        return child
+
+    @abc.abstractmethod
+    def _new_child(self):
+        """Return the value holder for one set of label values"""
+
+    @abc.abstractmethod
+    def samples(self):
+        """Return the family's sample lines in the text format"""
+
+
+class _CounterChild:
+    __slots__ = ("lock", "value")
+
+    def __init__(self, lock):
+        self.lock = lock
+        self.value = 0
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+
+class Counter(_Metric):
+    """A value that only goes up, such as requests served"""
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild(self.lock)
+
+    def inc(self, amount=1):
+        self.children[()].inc(amount)
+
+    def samples(self):
+        with self.lock:
+            values = [(labels, child.value) for labels, child in self.children.items()]
+        return ["{}{} {}".format(self.name, _format_labels(self.labelnames, labels), _format_value(value))
+                for labels, value in values]
+
+
+class _HistogramChild:
+    __slots__ = ("lock", "bounds", "counts", "sum")
+
+    def __init__(self, lock, bounds):
+        self.lock = lock
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # Per bucket, not cumulative; the last is +Inf
+        self.sum = 0.0
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.bounds, value)
+        with self.lock:
+            self.counts[i] += 1
+            self.sum += value
+
+
+class Histogram(_Metric):
+    """Distribution of observed values, such as request latencies, in fixed buckets"""
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS, registry=REGISTRY):
+        self.bounds = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self):
+        return _HistogramChild(self.lock, self.bounds)
+
+    def observe(self, value):
+        self.children[()].observe(value)
+
+    def samples(self):
+        with self.lock:
+            values = [(labels, list(child.counts), child.sum) for labels, child in self.children.items()]
+        lines = []
+        for labels, counts, total in values:
+            cumulative = 0
+            for bound, count in zip(self.bounds + (math.inf,), counts):
+                cumulative += count
+                lines.append("{}_bucket{} {}".format(
+                    self.name, _format_labels(self.labelnames, labels, [("le", _format_value(float(bound)))]),
+                    cumulative))
+            label_text = _format_labels(self.labelnames, labels)
+            lines.append("{}_sum{} {}".format(self.name, label_text, _format_value(total)))
+            lines.append("{}_count{} {}".format(self.name, label_text, cumulative))
+        return lines
+
+
+class Gauge(_Metric):
+    """A value read when metrics are collected, such as the number of healthy nodes"""
+    kind = "gauge"
+
+    def __init__(self, name, documentation, function, labelnames=(), registry=REGISTRY):
+        """
+        Args:
+            function: Called at collection time; returns the value, or with
+                labelnames a dict of {tuple of label values: value}
+        """
+        self.function = function
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self):
+        return None
+
+    def samples(self):
+        values = self.function()
+        if not self.labelnames:
+            values = {(): values}
+        return ["{}{} {}".format(self.name, _format_labels(self.labelnames, labels), _format_value(value))
+                for labels, value in values.items()]
@@ -1,8 +1,14 @@
-import requests
 import time
 import random
 import argparse
 import logging
+import threading
+
+from cluster_client import ClusterClient, ClusterError
+from fault_injection import (DEFAULT_FAULT_MAP, DELAY, DROP, FLAP, LOSS, outage_start, validate_fault,
+                             write_fault_map)
+from list_nodes import NodeWatcher
+from stats import percentile
 
 # Configure logging
 logging.basicConfig(
@@ -14,125 +20,299 @@ logger = logging.getLogger('node_failure_sim')
 # API Server URL
 API_SERVER_URL = "http://localhost:5002"
 
+class FailureObserver(NodeWatcher):
+    def __init__(self, api_url, client=None):
+        """
+        Measure how the API server reacts to injected faults, from its /watch feed
+
+        For every node the server marks unhealthy while a fault is injected,
+        the detection latency is the time from the start of the heartbeat
+        outage to the event, and the rescheduling time runs until the node
+        reports no pods left. Nodes marked unhealthy without an outage of
+        their own (partial loss, or no fault at all) are counted separately.
+        """
+        super().__init__(api_url, client=client)
+        self.lock = threading.Lock()
+        self.ready = threading.Event()
+        self.faults = {}          # {node_id: fault currently injected}
+        self.awaiting = {}        # {node_id: outage start} of failed nodes whose pods are still bound
+        self.detections = []      # Seconds from outage start to the node being marked unhealthy
+        self.reschedules = []     # Seconds from outage start to the node holding no pods
+        self.unexplained = 0      # Failures of nodes without a definite outage
+        self.recovered_first = 0  # Failed nodes that recovered before all their pods moved
+
+    def relist(self):
+        super().relist()
+        self.ready.set()
+
+    def apply(self, event):
+        node = event["object"]
+        previous = self.nodes.get(node["id"])
+        super().apply(event)
+        if event["type"] == "DELETED":
+            with self.lock:
+                self.awaiting.pop(node["id"], None)
+            return
+        now = time.time()
+        with self.lock:
+            if node["status"] == "Unhealthy" and previous is not None and previous["status"] == "Healthy":
+                fault = self.faults.get(node["id"])
+                started = outage_start(fault, now) if fault else None
+                if started is None:
+                    self.unexplained += 1
+                else:
+                    self.detections.append(now - started)
+                    self.awaiting[node["id"]] = started
+            started = self.awaiting.get(node["id"])
+            if started is None:
+                return
+            if node["pod_count"] == 0:
+                self.reschedules.append(now - started)
+                del self.awaiting[node["id"]]
+            elif node["status"] == "Healthy":
+                self.recovered_first += 1
+                del self.awaiting[node["id"]]
+
+    def draw(self, force=False):
+        pass  # Measures only; nothing is shown
+
+    def summary(self):
+        with self.lock:
+            detections = sorted(self.detections)
+            reschedules = sorted(self.reschedules)
+            return {
+                "detected": len(detections),
+                "detection_latency": {pct: percentile(detections, pct) for pct in (50, 95, 100)},
+                "rescheduled": len(reschedules),
+                "rescheduling_time": {pct: percentile(reschedules, pct) for pct in (50, 95, 100)},
+                "still_rescheduling": len(self.awaiting),
+                "recovered_before_rescheduled": self.recovered_first,
+                "unexplained_failures": self.unexplained
+            }
+
 class NodeFailureSimulator:
-    def __init__(self, api_url, failure_probability=0.2, recovery_probability=0.3):
+    def __init__(self, api_url, failure_probability=0.2, recovery_probability=0.3,
+                 fault_map=DEFAULT_FAULT_MAP, seed=None):
         """
         Initialize a node failure simulator
-        
+
+        Faults are injected through a fault map file that node_sim.py and
+        fleet_sim.py agents read before each heartbeat, so a simulated
+        failure really stops (or delays, or thins out) the node's heartbeats
+        and the API server's health monitor has to detect it. Any number of
+        nodes change with one atomic rewrite of the file.
+
         Args:
             api_url: URL of the API server
             failure_probability: Probability of a node failing during each check (0.0 to 1.0)
             recovery_probability: Probability of a failed node recovering (0.0 to 1.0)
+            fault_map: Fault map file the node agents obey
+            seed: Random seed for choosing nodes
         """
         self.api_url = api_url
         self.failure_probability = failure_probability
         self.recovery_probability = recovery_probability
-        self.failed_nodes = set()  # Set of nodes that are currently failed
-        
+        self.fault_map = fault_map
+        self.rng = random.Random(seed)
+        self.faults = {}  # {node_id: fault currently injected}
+        self.client = ClusterClient(api_url)
+        self.observer = FailureObserver(api_url, client=self.client)
+
     def get_nodes(self):
         """Get the list of nodes from the API server"""
         try:
-            response = requests.get(f"{self.api_url}/list_nodes")
-            if response.status_code == 200:
-                return response.json().get("nodes", [])
-            else:
-                logger.error(f"Failed to get nodes: {response.status_code} - {response.text}")
-                return []
-        except Exception as e:
-            logger.error(f"Error getting nodes: {e}")
+            return self.client.list_nodes()
+        except ClusterError as e:
+            logger.error(f"Failed to get nodes: {e}")
             return []
-            
+
+    def inject(self, node_ids, fault):
+        """
+        Apply a fault to many nodes at once
+
+        Args:
+            node_ids: IDs of the nodes to affect
+            fault: Fault such as {"mode": "drop"}, {"mode": "delay", "seconds": 20},
+                {"mode": "loss", "probability": 0.5} or {"mode": "flap", "period": 40, "down": 0.5}
+
+        Raises:
+            ValueError: If the fault is malformed
+        """
+        fault = validate_fault(fault)
+        with self.observer.lock:
+            for node_id in node_ids:
+                self.faults[node_id] = fault
+            self.observer.faults = dict(self.faults)
+        write_fault_map(self.fault_map, self.faults)
+
+    def clear(self, node_ids=None):
+        """Remove the faults of the given nodes (all nodes if None)"""
+        with self.observer.lock:
+            for node_id in list(self.faults) if node_ids is None else node_ids:
+                self.faults.pop(node_id, None)
+            self.observer.faults = dict(self.faults)
+        write_fault_map(self.fault_map, self.faults)
+
     def simulate_node_failure(self, node_id):
         """
         Simulate a node failure by stopping heartbeats
-        
+
         Args:
             node_id: ID of the node to fail
         """
-        if node_id in self.failed_nodes:
+        if node_id in self.faults:
             logger.info(f"Node {node_id} is already failed")
             return
-            
+
         logger.info(f"Simulating failure of node {node_id}")
-        self.failed_nodes.add(node_id)
-        
+        self.inject([node_id], {"mode": DROP})
+
     def simulate_node_recovery(self, node_id):
         """
         Simulate a node recovery by resuming heartbeats
-        
+
         Args:
             node_id: ID of the node to recover
         """
-        if node_id not in self.failed_nodes:
+        if node_id not in self.faults:
             logger.info(f"Node {node_id} is not failed")
             return
-            
+
         logger.info(f"Simulating recovery of node {node_id}")
-        
-        # Send a heartbeat to simulate the node coming back online
-        try:
-            response = requests.post(f"{self.api_url}/heartbeat", json={"node_id": node_id})
-            if response.status_code == 200:
-                self.failed_nodes.remove(node_id)
-                logger.info(f"Node {node_id} has recovered")
-            else:
-                logger.error(f"Failed to recover node {node_id}: {response.status_code} - {response.text}")
-        except Exception as e:
-            logger.error(f"Error recovering node {node_id}: {e}")
-    
+        self.clear([node_id])
+
+    def start_observer(self):
+        """Start measuring from the watch feed (before injecting faults)"""
+        threading.Thread(target=self.observer.run, daemon=True).start()
+        if not self.observer.ready.wait(10):
+            logger.warning("Could not list nodes; measurements start with the first watch event")
+
+    def _pick(self, fraction):
+        """Choose a random fraction of the healthy, fault-free nodes"""
+        nodes = [node["id"] for node in self.get_nodes()
+                 if node["status"] == "Healthy" and node["id"] not in self.faults]
+        return self.rng.sample(nodes, max(1, round(fraction * len(nodes)))) if nodes else []
+
     def run_simulation(self, duration_seconds):
         """
         Run the failure simulation for a specified duration
-        
+
         Args:
             duration_seconds: How long to run the simulation
         """
         logger.info(f"Starting node failure simulation for {duration_seconds} seconds")
-        
+
         end_time = time.time() + duration_seconds
-        
+
         while time.time() < end_time:
             # Get the current list of nodes
             nodes = self.get_nodes()
-            
+
             if not nodes:
                 logger.warning("No nodes found in the cluster")
                 time.sleep(5)
                 continue
-            
+
             # First, check if any failed nodes should recover
-            for node_id in list(self.failed_nodes):  # Use list to avoid modifying during iteration
-                if random.random() < self.recovery_probability:
+            for node_id in list(self.faults):  # Use list to avoid modifying during iteration
+                if self.rng.random() < self.recovery_probability:
                     self.simulate_node_recovery(node_id)
-            
+
             # Then, check if any healthy nodes should fail
             for node in nodes:
                 node_id = node["id"]
-                if node["status"] == "Healthy" and node_id not in self.failed_nodes:
-                    if random.random() < self.failure_probability:
+                if node["status"] == "Healthy" and node_id not in self.faults:
+                    if self.rng.random() < self.failure_probability:
                         self.simulate_node_failure(node_id)
-            
+
             # Sleep for a bit before the next iteration
             time.sleep(5)
-        
+
         logger.info("Simulation complete")
 
+    def run_scenario(self, fault, fraction, hold_seconds, settle_seconds=30):
+        """
+        Inject one fault into a random fraction of the nodes at once, then heal it
+
+        A drop fault over many nodes is a network partition; flap, loss and
+        delay faults degrade the nodes' heartbeats instead of cutting them.
+
+        Args:
+            fault: Fault to inject (see inject())
+            fraction: Fraction of the healthy nodes to affect
+            hold_seconds: Seconds the fault stays in place
+            settle_seconds: Seconds to keep measuring after it is healed
+        """
+        node_ids = self._pick(fraction)
+        logger.info(f"Injecting {fault['mode']} into {len(node_ids)} nodes for {hold_seconds}s")
+        self.inject(node_ids, fault)
+        time.sleep(hold_seconds)
+        logger.info(f"Healing {len(node_ids)} nodes")
+        self.clear(node_ids)
+        time.sleep(settle_seconds)
+        logger.info("Scenario complete")
+
+    def report(self):
+        """Log the measured detection latency and time to full rescheduling"""
+        summary = self.observer.summary()
+        detection = summary["detection_latency"]
+        rescheduling = summary["rescheduling_time"]
+        logger.info(f"Failures detected: {summary['detected']} "
+                    f"(latency p50 {detection[50]:.1f}s, p95 {detection[95]:.1f}s, max {detection[100]:.1f}s)")
+        logger.info(f"Nodes fully rescheduled: {summary['rescheduled']} "
+                    f"(time p50 {rescheduling[50]:.1f}s, p95 {rescheduling[95]:.1f}s, max {rescheduling[100]:.1f}s); "
+                    f"{summary['still_rescheduling']} still waiting, "
+                    f"{summary['recovered_before_rescheduled']} recovered first")
+        if summary["unexplained_failures"]:
+            logger.info(f"Failures without a full outage (partial loss or no fault): "
+                        f"{summary['unexplained_failures']}")
+        return summary
+
 def main():
     parser = argparse.ArgumentParser(description="Simulate node failures in the cluster")
     parser.add_argument("--server", default="http://localhost:5002", help="API server URL")
     parser.add_argument("--duration", type=int, default=300, help="Simulation duration in seconds")
     parser.add_argument("--failure-prob", type=float, default=0.2, help="Node failure probability (0.0 to 1.0)")
     parser.add_argument("--recovery-prob", type=float, default=0.3, help="Node recovery probability (0.0 to 1.0)")
-    
+    parser.add_argument("--faults", default=DEFAULT_FAULT_MAP, help="Fault map file the node agents obey")
+    parser.add_argument("--scenario", choices=["random", "partition", DELAY, LOSS, FLAP], default="random",
+                        help="random failures, or one fault applied to --fraction of the nodes at once")
+    parser.add_argument("--fraction", type=float, default=0.2, help="Fraction of nodes a scenario affects")
+    parser.add_argument("--delay", type=float, default=20, help="Seconds heartbeats are delayed (delay)")
+    parser.add_argument("--loss", type=float, default=0.5, help="Probability a heartbeat is lost (loss)")
+    parser.add_argument("--period", type=float, default=40, help="Seconds per up/down cycle (flap)")
+    parser.add_argument("--down", type=float, default=0.5, help="Fraction of each cycle spent down (flap)")
+    parser.add_argument("--settle", type=float, default=30, help="Seconds to keep measuring after a scenario")
+    parser.add_argument("--seed", type=int, help="Random seed")
+
     args = parser.parse_args()
-    
+
     simulator = NodeFailureSimulator(
         args.server,
         failure_probability=args.failure_prob,
-        recovery_probability=args.recovery_prob
+        recovery_probability=args.recovery_prob,
+        fault_map=args.faults,
+        seed=args.seed
     )
-    
-    simulator.run_simulation(args.duration)
+
+    faults = {
+        "partition": {"mode": DROP},
+        DELAY: {"mode": DELAY, "seconds": args.delay},
+        LOSS: {"mode": LOSS, "probability": args.loss},
+        FLAP: {"mode": FLAP, "period": args.period, "down": args.down}
+    }
+    simulator.start_observer()
+    try:
+        if args.scenario == "random":
+            simulator.run_simulation(args.duration)
+        else:
+            simulator.run_scenario(faults[args.scenario], args.fraction, args.duration, args.settle)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        # Agents resume heartbeating once their faults are gone
+        simulator.clear()
+        simulator.report()
 
 if __name__ == "__main__":
     main()
@@ -1,34 +1,309 @@
-import docker
-from time import sleep
+import collections
+import concurrent.futures
+import itertools
+import json
+import logging
+import threading
+import time
+import uuid
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger('node_manager')
+
+
+class DockerBackend:
+    def __init__(self, image="ubuntu", command="sleep infinity"):
+        """
+        Provisioning backend that runs each node as a Docker container
+
+        The Docker client is created on first use, so a manager can be
+        built (and its fake-backed siblings used) where no daemon runs.
+
+        Args:
+            image: Image the node containers run
+            command: Command that keeps a node container running
+        """
+        self.image = image
+        self.command = command
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        with self._lock:
+            if self._client is None:
+                import docker
+                self._client = docker.from_env()
+            return self._client
+
+    def launch(self, name, cpu_cores, resources=None):
+        """Start a node container of a size. Returns its id"""
+        environment = {"CPU_CORES": str(cpu_cores)}  # Simulate CPU core environment
+        if resources:
+            environment["RESOURCES"] = json.dumps(resources)
+        container = self.client.containers.run(
+            self.image,
+            command=self.command,  # Keep the container running
+            detach=True,
+            name=name,
+            environment=environment,
+        )
+        return container.id
+
+    def assign(self, handle, name, cpu_cores, resources=None):
+        """
+        Turn a warm node into a named node
+
+        Only the name changes: a container's environment is fixed when it
+        starts, so the warm node must have been launched with this size.
+        """
+        self.client.containers.get(handle).rename(name)
+
+    def destroy(self, handle):
+        self.client.containers.get(handle).remove(force=True)
+
+    def is_running(self, handle):
+        return self.client.containers.get(handle).status == "running"
+
+
+class FakeBackend:
+    def __init__(self, launch_delay=0.0, assign_delay=0.0, teardown_delay=0.0):
+        """
+        Provisioning backend that keeps nodes in-process, for tests and benchmarks without Docker
+
+        Args:
+            launch_delay: Seconds each launch takes (a container or VM boot)
+            assign_delay: Seconds turning a warm node into a named one takes
+            teardown_delay: Seconds each removal takes
+        """
+        self.launch_delay = launch_delay
+        self.assign_delay = assign_delay
+        self.teardown_delay = teardown_delay
+        self.names = {}  # {handle: name} of running nodes
+        self.sizes = {}  # {handle: (cpu_cores, {resource: amount})} each node was launched with
+        self.ids = itertools.count(1)
+        self.lock = threading.Lock()
+
+    def launch(self, name, cpu_cores, resources=None):
+        time.sleep(self.launch_delay)
+        with self.lock:
+            handle = "fake-{}".format(next(self.ids))
+            self.names[handle] = name
+            self.sizes[handle] = (cpu_cores, dict(resources or {}))
+        return handle
+
+    def assign(self, handle, name, cpu_cores, resources=None):
+        time.sleep(self.assign_delay)
+        with self.lock:
+            if handle not in self.names:
+                raise KeyError("No such node: {}".format(handle))
+            if self.sizes[handle] != (cpu_cores, dict(resources or {})):
+                raise ValueError("Node {} was launched with another size".format(handle))
+            self.names[handle] = name
+
+    def destroy(self, handle):
+        time.sleep(self.teardown_delay)
+        with self.lock:
+            if self.names.pop(handle, None) is None:
+                raise KeyError("No such node: {}".format(handle))
+            self.sizes.pop(handle, None)
+
+    def is_running(self, handle):
+        return handle in self.names
+
+    def fail(self, handle):
+        """Make a node stop running, as if its container crashed"""
+        with self.lock:
+            self.names.pop(handle, None)
+            self.sizes.pop(handle, None)
+
+
+def _size_key(cpu_cores, resources):
+    return cpu_cores, tuple(sorted((resources or {}).items()))
+
 
 class NodeManager:
-    def __init__(self):
-        self.client = docker.from_env()
+    def __init__(self, backend=None, pool_size=0, workers=8, prefix="node", shapes=()):
+        """
+        Launch and remove simulated physical nodes through a provisioning backend
+
+        Up to pool_size nodes of each of the given shapes are kept warm,
+        launched ahead of demand with that shape's cores and resources.
+        Adding a node claims a warm one of the same shape when there is
+        one, which only names it, and otherwise launches a node cold; each
+        claim launches a replacement in the background. Every node gets a
+        unique name (prefix, cores and a random suffix), so any number of
+        nodes with the same core count coexist.
 
-    def launch_node(self, cpu_cores):
+        Launches and removals run on a thread pool of `workers` threads:
+        add_node() and remove_node() wait for theirs, submit_add() and
+        submit_remove() return a Future.
+
+        Args:
+            backend: DockerBackend, FakeBackend or another object with
+                launch/assign/destroy/is_running (a DockerBackend if None)
+            pool_size: Warm nodes kept ready per shape
+            workers: Launches and removals run at the same time
+            prefix: Start of every node name
+            shapes: (cpu_cores, {resource: amount}) node shapes kept warm
+
+        Raises:
+            ValueError: If warm nodes are asked for without a shape
+        """
+        if pool_size and not shapes:
+            raise ValueError("A warm pool needs the node shapes to keep warm")
+        self.backend = backend if backend is not None else DockerBackend()
+        self.pool_size = pool_size
+        self.prefix = prefix
+        self.shapes = {_size_key(cores, resources): (cores, dict(resources)) for cores, resources in shapes}
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers,
+                                                              thread_name_prefix="node_manager")
+        self.lock = threading.Lock()
+        self.warm = {key: collections.deque() for key in self.shapes}  # {shape: handles of idle warm nodes}
+        self.warming = dict.fromkeys(self.shapes, 0)                    # {shape: warm launches in flight}
+        self.nodes = {}                  # {handle: node} of nodes handed out
+        self.launched = {"warm": 0, "cold": 0}
+        self.closed = False
+
+    def _name(self, label):
+        return "{}-{}-{}".format(self.prefix, label, uuid.uuid4().hex[:12])
+
+    def fill_pool(self):
+        """Launch warm nodes in the background until every shape's pool is full; returns their Futures"""
+        launches = []
+        with self.lock:
+            if self.closed:
+                return []
+            for key in self.shapes:
+                count = max(self.pool_size - len(self.warm[key]) - self.warming[key], 0)
+                self.warming[key] += count
+                launches.extend([key] * count)
+        return [self.executor.submit(self._warm_one, key) for key in launches]
+
+    def _warm_one(self, key):
+        cpu_cores, resources = self.shapes[key]
+        try:
+            handle = self.backend.launch(self._name("{}c-warm".format(cpu_cores)), cpu_cores, resources)
+        except Exception as e:
+            logger.error("Error launching a warm node: %s", e)
+            handle = None
+        with self.lock:
+            self.warming[key] -= 1
+            if handle is not None and not self.closed:
+                self.warm[key].append(handle)
+                return handle
+        if handle is not None:
+            self._destroy(handle)  # Shut down while it was launching
+        return None
+
+    def launch_node(self, cpu_cores, resources=None):
+        """
+        Provide a node, from the warm pool of its shape if possible
+
+        Returns:
+            (backend handle, True if it came warm), or None if the launch failed
+        """
+        name = self._name("{}c".format(cpu_cores))
+        pool = self.warm.get(_size_key(cpu_cores, resources))
+        while pool is not None:
+            with self.lock:
+                handle = pool.popleft() if pool else None
+            if handle is None:
+                break
+            self.fill_pool()
+            try:
+                self.backend.assign(handle, name, cpu_cores, resources)
+                return handle, True
+            except Exception as e:
+                logger.warning("Discarding warm node %s: %s", handle, e)
+                self._destroy(handle)
         try:
-            # Simulate node launch by starting a Docker container
-            container = self.client.containers.run(
-                "ubuntu",  # Using a basic Ubuntu image for simulation
-                command="sleep infinity",  # Keep the container running
-                detach=True,
-                name="node_{}_cores".format(cpu_cores),
-                environment={"CPU_CORES": str(cpu_cores)},  # Simulate CPU core environment
-            )
-            print("Node launched with container ID: {}".format(container.id))
-            return container.id
+            return self.backend.launch(name, cpu_cores, resources), False
         except Exception as e:
-            print("Error launching node: {}".format(e))
+            logger.error("Error launching node: %s", e)
             return None
 
-    def add_node(self, cpu_cores):
-        container_id = self.launch_node(cpu_cores)
-        if container_id:
-            node = {
-                "id": container_id,
-                "cpu_cores": cpu_cores,
-                "health": "healthy"
+    def add_node(self, cpu_cores, resources=None):
+        """
+        Launch a node and wait for it
+
+        Returns:
+            The node, or None if the launch failed
+        """
+        started = time.perf_counter()
+        launched = self.launch_node(cpu_cores, resources)
+        if launched is None:
+            return None
+        handle, warm = launched
+        node = {
+            "id": handle,
+            "cpu_cores": cpu_cores,
+            "resources": dict(resources or {}),
+            "health": "healthy",
+            "warm": warm,
+            "launch_seconds": time.perf_counter() - started
+        }
+        with self.lock:
+            self.nodes[handle] = node
+            self.launched["warm" if warm else "cold"] += 1
+        logger.info("Node added: %s with %d CPU cores (%s)", handle, cpu_cores, "warm" if warm else "cold")
+        return node
+
+    def submit_add(self, cpu_cores, resources=None):
+        """Launch a node on the thread pool; returns a Future of add_node()"""
+        return self.executor.submit(self.add_node, cpu_cores, resources)
+
+    def _destroy(self, handle):
+        try:
+            self.backend.destroy(handle)
+            return True
+        except Exception as e:
+            logger.error("Error removing node %s: %s", handle, e)
+            return False
+
+    def remove_node(self, node_id):
+        """Remove a node and wait for it; returns True on success"""
+        with self.lock:
+            self.nodes.pop(node_id, None)
+        removed = self._destroy(node_id)
+        if removed:
+            logger.info("Node removed: %s", node_id)
+        return removed
+
+    def submit_remove(self, node_id):
+        """Remove a node on the thread pool; returns a Future of remove_node()"""
+        return self.executor.submit(self.remove_node, node_id)
+
+    def is_running(self, node_id):
+        """True if the node is still running"""
+        try:
+            return self.backend.is_running(node_id)
+        except Exception:
+            return False
+
+    def stats(self):
+        """Return the warm pool's size and how nodes were provided"""
+        with self.lock:
+            return {
+                "warm_idle": sum(map(len, self.warm.values())),
+                "warming": sum(self.warming.values()),
+                "nodes": len(self.nodes),
+                "launched_warm": self.launched["warm"],
+                "launched_cold": self.launched["cold"]
             }
-            print("Node added: {}".format(node))
-            return node
-        return None
+
+    def shutdown(self):
+        """Finish launches and removals in flight and remove the idle warm nodes"""
+        with self.lock:
+            self.closed = True
+        self.executor.shutdown(wait=True)
+        with self.lock:
+            idle = [handle for pool in self.warm.values() for handle in pool]
+            for pool in self.warm.values():
+                pool.clear()
+        for handle in idle:
+            self._destroy(handle)
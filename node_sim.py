@@ -1,33 +1,97 @@
-import requests
 import time
+import heapq
+import random
+import argparse
 import threading
 
+from cluster_client import ClusterClient, ClusterError
+from fault_injection import DEFAULT_FAULT_MAP, FaultMap
+
 # Change if your server is running elsewhere
 API_SERVER_URL = "http://localhost:5002"
 
 class SimulatedNode:
-    def __init__(self, cpu_cores=4):
+    def __init__(self, cpu_cores=4, heartbeat_interval=5, faults=None, client=None):
+        """
+        Args:
+            cpu_cores: CPU cores the node registers with
+            heartbeat_interval: Seconds between heartbeats
+            faults: FaultMap whose injected faults drop or delay this node's heartbeats
+            client: ClusterClient to reach the server through, shared between
+                nodes to share its connections (one of its own if omitted)
+        """
         self.cpu_cores = cpu_cores
+        self.heartbeat_interval = heartbeat_interval
+        self.faults = faults
+        self._client = client
         self.node_id = None
+        self.cpu_load = 0.0  # Simulated load, reported with each heartbeat
+        self.pods = {}       # {pod_id: cpu_cores} of the pods on this node, from heartbeat responses
+        self.pod_usage = {}  # {pod_id: fraction of its request it currently uses}
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = ClusterClient(API_SERVER_URL)
+        return self._client
 
     def register_node(self):
         print("[INFO] Registering node...")
-        response = requests.post("{}/add_node".format(API_SERVER_URL), json={"cpu_cores": self.cpu_cores})
-        if response.status_code == 200:
-            self.node_id = response.json()['node_id']
+        try:
+            self.node_id = self.client.add_node(self.cpu_cores)['node_id']
             print("[SUCCESS] Node registered with ID: {}".format(self.node_id))
-        else:
-            print("[ERROR] Failed to register node: {}".format(response.text))
+        except ClusterError as e:
+            print("[ERROR] Failed to register node: {}".format(e))
+
+    def metrics(self):
+        """Return load metrics to piggyback on the next heartbeat"""
+        # Random walk so consecutive samples look like a real load curve
+        self.cpu_load = min(1.0, max(0.0, self.cpu_load + random.uniform(-0.1, 0.1)))
+        return {"cpu_load": round(self.cpu_load, 2)}
+
+    def usage(self):
+        """Return the CPU cores each pod uses, to piggyback on the next heartbeat"""
+        usage = {}
+        for pod_id, cpu_cores in self.pods.items():
+            # Each pod wanders around its own share of its request, bursting a little above it
+            fraction = self.pod_usage.get(pod_id)
+            if fraction is None:
+                fraction = random.uniform(0.1, 0.9)
+            fraction = min(1.2, max(0.0, fraction + random.uniform(-0.05, 0.05)))
+            self.pod_usage[pod_id] = fraction
+            usage[pod_id] = round(cpu_cores * fraction, 3)
+        return usage
+
+    def set_pods(self, pods):
+        """Track the pods the server reports on this node"""
+        self.pods = pods
+        self.pod_usage = {pod_id: self.pod_usage[pod_id] for pod_id in pods if pod_id in self.pod_usage}
+
+    def deliver(self, timestamp, metrics, usage):
+        """Send a heartbeat taken at timestamp"""
+        try:
+            response = self.client.heartbeat(self.node_id, metrics, usage, timestamp)
+            self.set_pods(response.get("pods", {}))
+            print("[HEARTBEAT] Sent from {}".format(self.node_id))
+        except ClusterError as e:
+            print("[ERROR] Heartbeat failed: {}".format(e))
 
     def send_heartbeat(self):
         while True:
             if self.node_id:
-                response = requests.post("{}/heartbeat".format(API_SERVER_URL), json={"node_id": self.node_id})
-                if response.status_code == 200:
-                    print("[HEARTBEAT] Sent from {}".format(self.node_id))
+                timestamp = time.time()
+                delay = self.faults.heartbeat_delay(self.node_id, timestamp) if self.faults else 0
+                if delay is None:
+                    print("[FAULT] Heartbeat from {} dropped".format(self.node_id))
+                elif delay:
+                    # Held in transit, as in relay mode: it arrives late with its original
+                    # timestamp, while the next heartbeats are taken on schedule
+                    timer = threading.Timer(delay, self.deliver, (timestamp, self.metrics(), self.usage()))
+                    timer.daemon = True
+                    timer.start()
                 else:
-                    print("[ERROR] Heartbeat failed: {}".format(response.text))
-            time.sleep(5)  # Send heartbeat every 5 seconds
+                    self.deliver(timestamp, self.metrics(), self.usage())
+            time.sleep(self.heartbeat_interval)
 
     def start(self):
         self.register_node()
@@ -35,7 +99,103 @@ class SimulatedNode:
             t = threading.Thread(target=self.send_heartbeat)
             t.start()
 
+class HeartbeatRelay:
+    def __init__(self, nodes, heartbeat_interval=5, faults=None, client=None):
+        """
+        Send heartbeats for many local nodes through one connection
+
+        Every interval, the relay posts one /heartbeats request carrying a
+        heartbeat (with metrics and pod usage) for each registered node,
+        instead of one request per node. The response lists each node's
+        pods, whose usage the next batch reports.
+
+        Injected faults apply per node: dropped heartbeats are left out of
+        the batch, and delayed ones are held back and sent in a later batch
+        with their original timestamp, as if they had been slow in transit.
+
+        Args:
+            nodes: SimulatedNode instances to heartbeat for
+            heartbeat_interval: Seconds between batches
+            faults: FaultMap of injected heartbeat faults
+            client: ClusterClient whose keep-alive connection every batch reuses
+        """
+        self.nodes = nodes
+        self.heartbeat_interval = heartbeat_interval
+        self.faults = faults
+        self.delayed = []  # Min-heap of (due time, sequence, heartbeat) held back by delay faults
+        self.delayed_seq = 0
+        self.client = client or ClusterClient(API_SERVER_URL)
+
+    def send_batch(self):
+        """Send one heartbeat for every registered node"""
+        timestamp = time.time()
+        batch = []
+        nodes = {}
+        for node in self.nodes:
+            if not node.node_id:
+                continue
+            nodes[node.node_id] = node
+            heartbeat = {"node_id": node.node_id, "timestamp": timestamp, "metrics": node.metrics(),
+                         "usage": node.usage()}
+            delay = self.faults.heartbeat_delay(node.node_id, timestamp) if self.faults else 0
+            if delay is None:
+                continue
+            if delay:
+                self.delayed_seq += 1
+                heapq.heappush(self.delayed, (timestamp + delay, self.delayed_seq, heartbeat))
+            else:
+                batch.append(heartbeat)
+        while self.delayed and self.delayed[0][0] <= timestamp:
+            batch.append(heapq.heappop(self.delayed)[2])
+        if not batch:
+            return
+        try:
+            result = self.client.heartbeats(batch, include_pods=True)
+        except ClusterError as e:
+            print("[ERROR] Heartbeat batch failed: {}".format(e))
+            return
+        for node_id, pods in result.get("pods", {}).items():
+            if node_id in nodes:
+                nodes[node_id].set_pods(pods)
+        print("[HEARTBEAT] Relayed {} heartbeats".format(result.get("received", 0)))
+        if result.get("unknown"):
+            print("[WARNING] Unknown nodes: {}".format(", ".join(result["unknown"])))
+
+    def run(self):
+        while True:
+            self.send_batch()
+            time.sleep(self.heartbeat_interval)
+
+    def start(self):
+        for node in self.nodes:
+            node.register_node()
+        t = threading.Thread(target=self.run)
+        t.start()
+
 if __name__ == "__main__":
-    cpu_cores = int(input("Enter CPU cores for this node: "))
-    node = SimulatedNode(cpu_cores=cpu_cores)
-    node.start()
+    parser = argparse.ArgumentParser(description="Simulate cluster nodes that send heartbeats")
+    parser.add_argument("--server", default=API_SERVER_URL, help="API server URL")
+    parser.add_argument("--cpu-cores", type=int, help="CPU cores per node (prompted if omitted)")
+    parser.add_argument("--count", type=int, default=1, help="Number of nodes to simulate")
+    parser.add_argument("--interval", type=float, default=5, help="Heartbeat interval in seconds")
+    parser.add_argument("--relay", action="store_true",
+                        help="Send all nodes' heartbeats in one batched request per interval")
+    parser.add_argument("--faults", default=DEFAULT_FAULT_MAP,
+                        help="Fault map written by node_failure_sim.py to obey")
+    args = parser.parse_args()
+
+    API_SERVER_URL = args.server
+    cpu_cores = args.cpu_cores
+    if cpu_cores is None:
+        cpu_cores = int(input("Enter CPU cores for this node: "))
+
+    faults = FaultMap(args.faults)
+    # One connection pool for every node, with a connection per heartbeat thread
+    client = ClusterClient(API_SERVER_URL, pool_size=max(10, args.count))
+    nodes = [SimulatedNode(cpu_cores=cpu_cores, heartbeat_interval=args.interval, faults=faults, client=client)
+             for _ in range(args.count)]
+    if args.relay:
+        HeartbeatRelay(nodes, heartbeat_interval=args.interval, faults=faults, client=client).start()
+    else:
+        for node in nodes:
+            node.start()
@@ -0,0 +1,268 @@
+import collections
+import logging
+
+from cluster_state import DEFAULT_PRIORITY, PRIORITY_CLASSES, id_sequence
+from metrics import Histogram
+
+logger = logging.getLogger('pending')
+
+PENDING_WAIT_SECONDS = Histogram("cluster_pending_wait_seconds", "Time pods waited in the pending queue before placement",
+                                 buckets=(0.01, 0.1, 0.5, 1, 5, 15, 30, 60, 300, 900, 3600))
+
+def _covers(size, cpu_cores, resources):
+    """True if a bucket's request is at least cpu_cores and resources in every resource"""
+    requested = dict(size[1])
+    return size[0] >= cpu_cores and all(requested.get(name, 0) >= amount
+                                        for name, amount in resources.items())
+
+class PendingQueue:
+    def __init__(self, state, scheduler, wait_samples=1000):
+        """
+        Queue of pods waiting for capacity, drained when capacity appears
+
+        Two kinds of pods wait here: new pods launched with queueing
+        requested (their pod id is reserved up front) and pods displaced
+        from failed nodes that fit nowhere (they stay bound to the failed
+        node until moved).
+
+        Pods are bucketed by priority class and request (CPU cores plus any
+        other resources), FIFO within a bucket. Capacity changes (a node joining or recovering, a pod being
+        removed) only mark the queue for draining; drain() runs at the end
+        of the operation, under the same lock. Draining visits priority
+        classes highest first and, within one, only buckets whose request
+        fits the largest free space in the capacity index. A bucket is
+        abandoned at its first miss, as are all that request at least as
+        much of every resource, so freeing
+        one core costs a few index lookups rather than a pass over the
+        whole queue. Lower priorities backfill whatever is left.
+
+        Args:
+            state: ClusterState the pods are placed into
+            scheduler: Scheduler whose index and policy choose nodes
+            wait_samples: Number of recent wait times kept for percentiles
+        """
+        self.state = state
+        self.scheduler = scheduler
+        self.entries = {}      # {pod_id: entry}, oldest first
+        self.buckets = {}      # {priority: {(cpu_cores, resources): deque of (seq, pod_id)}}
+        self.displaced = {}    # {node_id: set of pod ids waiting to leave it}
+        self.unhealthy = set()  # Nodes known to be unhealthy
+        self.depth = {name: 0 for name in PRIORITY_CLASSES}  # Queued pods per priority class
+        self.demand = {}       # {(cpu_cores, resources): queued pods with that request}
+        self.seq = 0
+        self.dirty = False     # Capacity may have appeared since the last drain
+
+        self.placed = 0
+        self.total_wait = 0.0
+        self.waits = collections.deque(maxlen=wait_samples)
+
+        with state.lock:
+            self.reset()
+            state.subscribe(self._on_state_change)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, pod_id):
+        return pod_id in self.entries
+
+    def _push(self, pod_id, cpu_cores, resources, priority, displaced, enqueued_at=None):
+        self.seq += 1
+        entry = {
+            "id": pod_id,
+            "cpu_cores": cpu_cores,
+            "resources": resources,
+            "priority": priority,
+            "enqueued_at": self.state.clock() if enqueued_at is None else enqueued_at,
+            "displaced": displaced,
+            "seq": self.seq
+        }
+        self.entries[pod_id] = entry
+        self.depth[priority] += 1
+        size = (cpu_cores, tuple(sorted(resources.items())))
+        self.demand[size] = self.demand.get(size, 0) + 1
+        sizes = self.buckets.setdefault(PRIORITY_CLASSES[priority], {})
+        sizes.setdefault(size, collections.deque()).append((self.seq, pod_id))
+        return entry
+
+    def add(self, cpu_cores, priority=DEFAULT_PRIORITY, resources=None, pod_id=None):
+        """
+        Queue a new pod, reserving its pod id (or keeping pod_id, for an evicted pod)
+
+        Raises:
+            ValueError: If the priority class is unknown
+
+        Returns:
+            The queue entry
+        """
+        if priority not in PRIORITY_CLASSES:
+            raise ValueError("Unknown priority class: {}".format(priority))
+        if pod_id is None:
+            pod_id = self.state.reserve_pod_id()
+        return self._push(pod_id, cpu_cores, resources or {}, priority, False)
+
+    def add_displaced(self, pod_ids):
+        """Queue pods bound to failed nodes until they can be moved"""
+        for pod_id in pod_ids:
+            pod = self.state.pods[pod_id]
+            self._push(pod_id, pod.cpu_cores, pod.resources, pod.priority, True)
+            self.displaced.setdefault(pod.assigned_node, set()).add(pod_id)
+
+    def reset(self):
+        """
+        Rebuild the queue from the cluster state (state lock held)
+
+        Drops every queued new pod and queues each pod bound to an unhealthy
+        node, as after a restart or on taking over leadership, when the
+        state is all that is known to be current.
+        """
+        self.entries = {}
+        self.buckets = {}
+        self.displaced = {}
+        self.depth = {name: 0 for name in PRIORITY_CLASSES}
+        self.demand = {}
+        self.unhealthy = set(node_id for node_id, node in self.state.nodes.items()
+                             if node.status != "Healthy")
+        for node_id in sorted(self.unhealthy, key=id_sequence):
+            self.add_displaced(sorted(self.state.pods_on_node(node_id), key=id_sequence))
+        self.dirty = bool(self.entries)
+
+    def _pop(self, pod_id):
+        entry = self.entries.pop(pod_id, None)
+        if entry is not None:
+            self.depth[entry["priority"]] -= 1
+            size = (entry["cpu_cores"], tuple(sorted(entry["resources"].items())))
+            if self.demand[size] == 1:
+                del self.demand[size]
+            else:
+                self.demand[size] -= 1
+        return entry  # The stale bucket item is skipped when reached
+
+    def remove(self, pod_id):
+        """Take a pod out of the queue; returns its entry or None"""
+        entry = self._pop(pod_id)
+        if entry is not None and entry["displaced"]:
+            pod = self.state.pods.get(pod_id)
+            if pod is not None:
+                self.displaced.get(pod.assigned_node, set()).discard(pod_id)
+        return entry
+
+    def _on_state_change(self, kind, event_type, obj):
+        """Note capacity changes and drop displaced pods that no longer wait (state lock held)"""
+        if kind == "node":
+            node_id = obj.id
+            if event_type == "ADDED":
+                self.dirty = True
+            elif event_type == "MODIFIED":
+                if obj.status != "Healthy":
+                    self.unhealthy.add(node_id)
+                elif node_id in self.unhealthy:
+                    self.unhealthy.discard(node_id)
+                    self.dirty = True
+                    # Pods displaced from a recovered node simply stay there
+                    for pod_id in self.displaced.pop(node_id, ()):
+                        self._pop(pod_id)
+            elif event_type == "DELETED":
+                self.unhealthy.discard(node_id)
+                self.displaced.pop(node_id, None)
+        elif event_type in ("DELETED", "MODIFIED"):
+            entry = self.entries.get(obj.id)
+            if entry is not None and entry["displaced"]:
+                self.remove(obj.id)  # Removed, or moved off its failed node
+            if event_type == "DELETED" and obj.assigned_node not in self.unhealthy:
+                self.dirty = True
+
+    def capacity_changed(self):
+        """Mark the queue for draining when capacity appeared other than through a state change"""
+        self.dirty = True
+
+    def _stale(self, item):
+        """True if a bucket item was removed from the queue (or re-queued since)"""
+        seq, pod_id = item
+        entry = self.entries.get(pod_id)
+        return entry is None or entry["seq"] != seq
+
+    def drain(self):
+        """
+        Place as many queued pods as fit, if capacity appeared since the last drain
+
+        Returns:
+            List of pods created or moved
+        """
+        if not self.dirty:
+            return []
+        self.dirty = False
+        if not self.entries:
+            return []
+
+        placed = []
+        now = self.state.clock()
+        for priority in sorted(self.buckets, reverse=True):
+            sizes = self.buckets[priority]
+            limit = self.scheduler.index.max_available()
+            fitting = {size: queue for size, queue in sizes.items() if size[0] <= limit}
+            while fitting:
+                # Oldest head among the buckets that may still fit
+                oldest = None
+                for size, queue in list(fitting.items()):
+                    while queue and self._stale(queue[0]):
+                        queue.popleft()
+                    if not queue:
+                        del fitting[size]
+                        del sizes[size]
+                    elif oldest is None or queue[0][0] < fitting[oldest][0][0]:
+                        oldest = size
+                if oldest is None:
+                    break
+
+                cpu, resources = oldest[0], dict(oldest[1])
+                node = self.scheduler.select_node(cpu, resources=resources)
+                if node is None:
+                    # Nothing fits this request, so nothing larger fits either
+                    for size in [size for size in fitting if _covers(size, cpu, resources)]:
+                        del fitting[size]
+                    continue
+
+                entry = self._pop(fitting[oldest].popleft()[1])
+                if entry["displaced"]:
+                    pod = self.state.pods[entry["id"]]
+                    self.displaced.get(pod.assigned_node, set()).discard(entry["id"])
+                    self.state.move_pod(entry["id"], node.id)
+                else:
+                    pod = self.state.add_pod(cpu, node.id, pod_id=entry["id"],
+                                             creation_time=entry["enqueued_at"], resources=resources,
+                                             priority=entry["priority"])
+                placed.append(pod)
+
+                wait = now - entry["enqueued_at"]
+                self.placed += 1
+                self.total_wait += wait
+                self.waits.append(wait)
+                PENDING_WAIT_SECONDS.observe(wait)
+            if not sizes:
+                del self.buckets[priority]
+
+        if placed:
+            logger.info("Placed %d pending pods, %d still pending", len(placed), len(self.entries))
+        return placed
+
+    def iter_entries(self):
+        """Yield queued pods, oldest first"""
+        return iter(self.entries.values())
+
+    def stats(self):
+        """Return queue depth and wait-time metrics"""
+        oldest = next(iter(self.entries.values()), None)
+        waits = sorted(self.waits)
+        return {
+            "depth": len(self.entries),
+            "by_priority": dict(self.depth),
+            "oldest_wait_seconds": self.state.clock() - oldest["enqueued_at"] if oldest else 0.0,
+            "placed_total": self.placed,
+            "wait_seconds_total": self.total_wait,
+            "recent_wait_seconds": {
+                "mean": sum(waits) / len(waits) if waits else 0.0,
+                "p50": waits[int(0.5 * (len(waits) - 1))] if waits else 0.0,
+                "p99": waits[int(0.99 * (len(waits) - 1))] if waits else 0.0
+            }
+        }
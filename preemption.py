@@ -0,0 +1,254 @@
+import bisect
+import logging
+
+from cluster_state import DEFAULT_PRIORITY, PRIORITY_CLASSES
+from metrics import Counter
+from scheduler import CapacityIndex
+
+logger = logging.getLogger('preemption')
+
+PREEMPTIONS = Counter("cluster_preemptions_total", "Pods placed by evicting lower-priority pods")
+EVICTIONS = Counter("cluster_preempted_pods_total", "Pods evicted to make room for higher-priority pods")
+
+class Preemptor:
+    def __init__(self, state, scheduler, queue, max_candidates=8):
+        """
+        Frees room for a pod by evicting lower-priority pods from one node
+
+        Each node keeps its pods grouped by priority rank, with the CPU
+        cores they hold per rank. For every rank r below the highest there
+        is a capacity index of healthy nodes keyed by the cores they would
+        have free if every pod of rank r or lower were evicted. A pod of
+        rank p therefore looks for a node at rank 0 first, then 1, up to
+        p - 1: the first rank with a fitting node bounds the highest
+        priority that has to be evicted, and within it the index yields
+        the nodes that need the least freed first. Victims on a node are
+        picked lowest priority first; within a rank, the smallest pod that
+        covers the whole remaining shortfall is taken, or failing that the
+        pod covering most of it. Any victim that is not needed after all is
+        then spared, highest priority first. Of the first max_candidates
+        nodes that work, the one evicting the fewest pods (then the fewest
+        cores) wins.
+
+        Pod changes only update the per-node groups; the indexes are
+        refreshed for the changed nodes on the next preemption.
+
+        Evicted pods go back through the scheduler: they are moved to
+        other nodes where they fit and otherwise wait in the pending queue
+        under their own id and priority.
+
+        Args:
+            state: ClusterState holding the cluster's nodes and pods
+            scheduler: Scheduler whose placements and cordons are respected
+            queue: PendingQueue for evicted pods that fit nowhere else
+            max_candidates: Fitting nodes compared before choosing
+        """
+        self.state = state
+        self.scheduler = scheduler
+        self.queue = queue
+        self.max_candidates = max_candidates
+        self.ranks = sorted(PRIORITY_CLASSES.values())[:-1]  # Ranks that can be evicted
+
+        self.by_node = {}      # {node_id: {rank: {pod_id: None}}}
+        self.cores = {}        # {node_id: {rank: cores held by pods of that rank}}
+        self.placement = {}    # {pod_id: node_id it is counted on}
+        self.indexes = {rank: CapacityIndex() for rank in self.ranks}
+        self.stale = set()     # Nodes whose index entries are out of date
+        self.evicted = 0
+
+        for node_id in state.nodes:
+            self.stale.add(node_id)
+        for pod in state.pods.values():
+            self._count(pod, pod.assigned_node)
+        state.subscribe(self._on_state_change)
+
+    def _count(self, pod, node_id):
+        rank = PRIORITY_CLASSES[pod.priority]
+        self.by_node.setdefault(node_id, {}).setdefault(rank, {})[pod.id] = None
+        cores = self.cores.setdefault(node_id, {})
+        cores[rank] = cores.get(rank, 0) + pod.cpu_cores
+        self.placement[pod.id] = node_id
+        self.stale.add(node_id)
+
+    def _uncount(self, pod):
+        node_id = self.placement.pop(pod.id, None)
+        if node_id is None:
+            return
+        groups = self.by_node.get(node_id)
+        if groups is not None:  # Unless the node itself was removed first
+            rank = PRIORITY_CLASSES[pod.priority]
+            del groups[rank][pod.id]
+            self.cores[node_id][rank] -= pod.cpu_cores
+            self.stale.add(node_id)
+
+    def _on_state_change(self, kind, event_type, obj):
+        if kind == "pod":
+            if event_type in ("MODIFIED", "DELETED"):
+                self._uncount(obj)
+            if event_type in ("ADDED", "MODIFIED"):
+                self._count(obj, obj.assigned_node)
+        elif event_type == "DELETED":
+            self.by_node.pop(obj.id, None)
+            self.cores.pop(obj.id, None)
+            self.stale.add(obj.id)
+        elif event_type != "HEARTBEAT":
+            self.stale.add(obj.id)
+
+    def _refresh(self):
+        """Bring the per-rank indexes up to date for every changed node"""
+        for node_id in self.stale:
+            node = self.state.nodes.get(node_id)
+            if node is None:
+                for index in self.indexes.values():
+                    index.forget(node_id)
+                continue
+            if node.status != "Healthy" or node_id in self.scheduler.cordoned:
+                for index in self.indexes.values():
+                    index.discard(node_id)
+                continue
+            cores = self.cores.get(node_id, {})
+            freeable = node.available_cores
+            for rank in self.ranks:
+                freeable += cores.get(rank, 0)
+                self.indexes[rank].add(node_id, freeable)
+        self.stale = set()
+
+    def victims(self, node, groups, max_rank, cpu_req, resources):
+        """
+        Return the cheapest victims on a node for a request, or None
+
+        Args:
+            node: Node to make room on
+            groups: The node's pods, {rank: pod ids}
+            max_rank: Highest priority rank that may be evicted
+            cpu_req: CPU cores required
+            resources: Other resources required, {name: amount}
+        """
+        free_cores = node.available_cores
+        free = dict(node.available_resources)
+
+        def shortfall(cores, amounts):
+            """Return {resource: amount still missing}, with CPU cores under None"""
+            missing = {None: cpu_req - cores} if cores < cpu_req else {}
+            for name, amount in resources.items():
+                if amounts.get(name, 0) < amount:
+                    missing[name] = amount - amounts.get(name, 0)
+            return missing
+
+        def fits(cores, amounts):
+            return not shortfall(cores, amounts)
+
+        def frees(pod, name):
+            return pod.cpu_cores if name is None else pod.resources.get(name, 0)
+
+        victims = []
+        missing = shortfall(free_cores, free)
+        for rank in range(max_rank + 1):
+            if not missing:
+                break
+            pods = [self.state.pods[pod_id] for pod_id in groups.get(rank, ())]
+            if not resources:
+                # CPU only: bisect the rank's pods by cores
+                pods.sort(key=lambda pod: pod.cpu_cores)
+                sizes = [pod.cpu_cores for pod in pods]
+                while missing and pods:
+                    i = bisect.bisect_left(sizes, missing[None])
+                    pod = pods.pop(i if i < len(pods) else -1)
+                    sizes.pop(i if i < len(sizes) else -1)
+                    victims.append(pod)
+                    free_cores += pod.cpu_cores
+                    missing = shortfall(free_cores, free)
+                continue
+            while missing and pods:
+                # The smallest pod that covers the whole shortfall, else the one covering most of it
+                enough = [pod for pod in pods
+                          if all(frees(pod, name) >= amount for name, amount in missing.items())]
+                if enough:
+                    pod = min(enough, key=lambda pod: (pod.cpu_cores, sum(pod.resources.values())))
+                else:
+                    pod = max(pods, key=lambda pod: (
+                        sum(min(frees(pod, name), amount) / amount for name, amount in missing.items()),
+                        -pod.cpu_cores))
+                pods.remove(pod)
+                victims.append(pod)
+                free_cores += pod.cpu_cores
+                for name, amount in pod.resources.items():
+                    free[name] = free.get(name, 0) + amount
+                missing = shortfall(free_cores, free)
+        if missing:
+            return None
+
+        # Spare victims that turned out not to be needed, highest priority and smallest first
+        needed = []
+        for pod in sorted(victims, key=lambda pod: (-PRIORITY_CLASSES[pod.priority], pod.cpu_cores)):
+            remaining = dict(free)
+            for name, amount in pod.resources.items():
+                remaining[name] -= amount
+            if fits(free_cores - pod.cpu_cores, remaining):
+                free_cores -= pod.cpu_cores
+                free = remaining
+            else:
+                needed.append(pod)
+        return needed
+
+    def find(self, cpu_req, priority=DEFAULT_PRIORITY, resources=None):
+        """
+        Choose a node and the pods to evict from it for a new pod
+
+        Returns:
+            (node_id, list of victim pods), or None if no eviction of
+            lower-priority pods makes room
+        """
+        resources = resources or {}
+        self._refresh()
+        for rank in self.ranks:
+            if rank >= PRIORITY_CLASSES[priority]:
+                break
+            best = None
+            found = 0
+            for node_id in self.indexes[rank].iter_best_fit(cpu_req):
+                victims = self.victims(self.state.nodes[node_id], self.by_node.get(node_id, {}),
+                                       rank, cpu_req, resources)
+                if victims is None:
+                    continue
+                cost = (len(victims), sum(pod.cpu_cores for pod in victims))
+                if best is None or cost < best[0]:
+                    best = (cost, node_id, victims)
+                found += 1
+                if found == self.max_candidates:
+                    break
+            if best is not None:
+                return best[1], best[2]
+        return None
+
+    def preempt(self, cpu_req, priority=DEFAULT_PRIORITY, resources=None):
+        """
+        Place a pod by evicting lower-priority pods from one node
+
+        Returns:
+            (created pod, list of (evicted pod id, node it moved to or None
+            if it is pending)), or (None, []) if preemption cannot help
+        """
+        choice = self.find(cpu_req, priority, resources)
+        if choice is None:
+            return None, []
+        node_id, victims = choice
+
+        victim_ids = [pod.id for pod in victims]
+        unplaced = set(self.scheduler.reschedule(victim_ids, exclude=node_id))
+        evicted = []
+        for pod in victims:
+            if pod.id in unplaced:
+                self.state.remove_pod(pod.id)
+                self.queue.add(pod.cpu_cores, pod.priority, pod.resources, pod_id=pod.id)
+                evicted.append((pod.id, None))
+            else:
+                evicted.append((pod.id, pod.assigned_node))
+        self.evicted += len(victims)
+        PREEMPTIONS.inc()
+        EVICTIONS.inc(len(victims))
+
+        pod = self.state.add_pod(cpu_req, node_id, resources=resources, priority=priority)
+        logger.info("Pod %s preempted %d pods on node %s (%d pending)",
+                    pod.id, len(victims), node_id, len(unplaced))
+        return pod, evicted
@@ -0,0 +1,413 @@
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from wal import RecordEncoder, apply_record, capture_snapshot, load_snapshot
+
+logger = logging.getLogger('replication')
+
+LEADER = "leader"
+FOLLOWER = "follower"
+CANDIDATE = "candidate"
+
+class Replicator:
+    def __init__(self, state, monitor, self_url, peers, election_timeout=0.5,
+                 heartbeat_interval=0.1, max_entries=100000, batch_size=1000):
+        """
+        Raft-style leader election and log replication between API servers
+
+        Every replica holds a full copy of the cluster state. The leader
+        accepts writes: each node and pod change it applies is appended to
+        the replicated log (as a WAL record tagged with the leader's term)
+        and shipped to the followers, which apply it to their own state and
+        serve reads from it. A write is acknowledged once a majority of
+        replicas hold it, so it survives the loss of a minority.
+
+        A follower that hears nothing from a leader for a randomized
+        election timeout starts an election; it wins with the votes of a
+        majority whose logs are not more recent than its own. Only the
+        leader runs the health monitor, and on winning it gives every
+        healthy node a fresh heartbeat deadline, since heartbeats are not
+        replicated.
+
+        Each append carries the index and term of the entry before it; a
+        follower whose log does not hold that entry refuses, and the leader
+        steps back one entry at a time (straight to the follower's last
+        entry if it is shorter) until the logs agree. Followers apply
+        entries as they arrive, so one holding entries the leader does not
+        have (a deposed leader's uncommitted changes) cannot undo them and
+        is reset from a full snapshot instead, as is a follower that needs
+        entries the leader has already dropped from its log.
+
+        Lock order is the cluster state lock first, then the replicator's
+        own condition. No lock is held during network calls.
+
+        Args:
+            state: ClusterState this replica serves
+            monitor: HealthMonitor to run while this replica is leader
+            self_url: URL at which peers reach this replica
+            peers: URLs of the other replicas
+            election_timeout: Minimum seconds without a leader before an election
+            heartbeat_interval: Seconds between leader heartbeats to each follower
+            max_entries: Log entries kept for catching up followers
+            batch_size: Maximum entries sent in one request
+        """
+        self.state = state
+        self.monitor = monitor
+        self.self_url = self_url
+        self.peers = list(peers)
+        self.election_timeout = election_timeout
+        self.heartbeat_interval = heartbeat_interval
+        self.max_entries = max_entries
+        self.batch_size = batch_size
+
+        self.condition = threading.Condition()
+        self.role = FOLLOWER
+        self.term = 0
+        self.voted_for = None
+        self.leader_url = None
+        self.last_contact = time.time()
+
+        # Log entries (term, record) after base_index; base_term is the term at base_index
+        self.entries = []
+        self.base_index = 0
+        self.base_term = 0
+        self.lsn = 0             # Index of the last entry
+        self.durable_lsn = 0     # Commit index: highest entry held by a majority
+        self.match_index = {}    # {peer: highest entry known to be replicated there}
+
+        self.running = False
+        self.threads = []
+        self.session = requests.Session()
+        self.pool = ThreadPoolExecutor(max_workers=max(1, len(self.peers)))  # Vote requests
+
+        with state.lock:
+            self.encoder = RecordEncoder(state)
+            state.subscribe(self._on_state_change)
+            state.subscribe_reservations(self._on_reservation)
+
+    # ---- Log ----
+
+    def _term_at(self, index):
+        if index == self.base_index:
+            return self.base_term
+        return self.entries[index - self.base_index - 1][0]
+
+    def _append(self, term, record):
+        """Append an entry (condition held)"""
+        self.entries.append((term, record))
+        self.lsn += 1
+        if len(self.entries) > self.max_entries:
+            # Followers still needing the dropped entries get a snapshot instead
+            drop = len(self.entries) - self.max_entries
+            self.base_term = self.entries[drop - 1][0]
+            self.base_index += drop
+            del self.entries[:drop]
+
+    def _on_state_change(self, kind, event_type, obj):
+        """Log the leader's own changes (cluster state lock held)"""
+        record = self.encoder.encode(kind, event_type, obj)
+        if record is not None:
+            self._log(record)
+
+    def _on_reservation(self, pod_id):
+        """Log a pod id the leader reserved, so a new leader does not hand it out again"""
+        self._log(self.encoder.encode_reservation(pod_id))
+
+    def _log(self, record):
+        """Append a record to the replicated log while leading"""
+        with self.condition:
+            if self.role != LEADER:
+                return  # Followers change their state only by applying the leader's log
+            self._append(self.term, record)
+            if not self.peers:
+                self.durable_lsn = self.lsn
+            self.condition.notify_all()
+
+    def wait_durable(self, lsn, timeout=None):
+        """
+        Block until the entries up to lsn are held by a majority
+
+        Returns:
+            False if this replica stopped leading before they were, or
+            they were not within timeout seconds (e.g. followers are
+            partitioned away)
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        with self.condition:
+            term = self.term
+            while self.durable_lsn < lsn:
+                if self.role != LEADER or self.term != term or not self.running:
+                    return False
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.condition.wait(remaining)
+            return True
+
+    def _advance_commit(self):
+        """Move the commit index to the highest entry a majority holds (condition held)"""
+        matched = sorted(list(self.match_index.values()) + [self.lsn], reverse=True)
+        majority = matched[len(matched) // 2]
+        # Only an entry of this term commits by counting replicas: an older one held by a
+        # majority can still be overwritten by a leader that never had it. It commits along
+        # with the first entry of this term after it.
+        if majority > self.durable_lsn and majority >= self.base_index \
+                and self._term_at(majority) == self.term:
+            self.durable_lsn = majority
+            self.condition.notify_all()
+
+    # ---- Roles ----
+
+    def is_leader(self):
+        with self.condition:
+            return self.role == LEADER
+
+    def status(self):
+        with self.condition:
+            return {
+                "role": self.role,
+                "term": self.term,
+                "leader": self.leader_url,
+                "self": self.self_url,
+                "last_index": self.lsn,
+                "commit_index": self.durable_lsn
+            }
+
+    def _step_down(self, term, leader_url=None):
+        """Follow a newer term (condition held)"""
+        if term > self.term:
+            self.term = term
+            self.voted_for = None
+        if self.role != FOLLOWER:
+            logger.info("Stepping down to follower in term {}".format(self.term))
+        self.role = FOLLOWER
+        self.leader_url = leader_url
+        self.last_contact = time.time()
+        self.condition.notify_all()
+
+    def _become_leader(self, term):
+        with self.state.lock, self.condition:
+            if self.role != CANDIDATE or self.term != term:
+                return
+            self.role = LEADER
+            self.leader_url = self.self_url
+            self.match_index = {peer: 0 for peer in self.peers}
+            self._advance_commit()
+            # Heartbeats went to the previous leader; give every healthy node a full timeout
+            for node_id, node in list(self.state.nodes.items()):
+                if node.status == "Healthy":
+                    self.state.record_heartbeat(node_id)
+            self.condition.notify_all()
+        logger.info("Elected leader for term {}".format(term))
+        for peer in self.peers:
+            thread = threading.Thread(target=self._replicate_to, args=(peer, term))
+            thread.daemon = True
+            thread.start()
+
+    def start(self):
+        """Start the election timer"""
+        self.running = True
+        thread = threading.Thread(target=self._run)
+        thread.daemon = True
+        thread.start()
+        self.threads.append(thread)
+        logger.info("Replica {} started with peers {}".format(self.self_url, ", ".join(self.peers)))
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.role = FOLLOWER
+            self.condition.notify_all()
+        for thread in self.threads:
+            thread.join(timeout=1)
+        if self.monitor.running:
+            self.monitor.stop()
+
+    def _run(self):
+        """Run elections when the leader goes quiet and the monitor while leading"""
+        timeout = self.election_timeout * (1 + random.random())
+        while True:
+            with self.condition:
+                if not self.running:
+                    return
+                self.condition.wait(self.heartbeat_interval / 2)
+                leading = self.role == LEADER
+                expired = not leading and time.time() - self.last_contact > timeout
+
+            # Start and stop the monitor here, never while a request holds the state lock
+            if leading and not self.monitor.running:
+                self.monitor.start()
+            elif not leading and self.monitor.running:
+                self.monitor.stop()
+
+            if expired:
+                self._run_election()
+                timeout = self.election_timeout * (1 + random.random())
+
+    def _run_election(self):
+        with self.condition:
+            self.role = CANDIDATE
+            self.term += 1
+            self.voted_for = self.self_url
+            self.leader_url = None
+            self.last_contact = time.time()
+            term = self.term
+            request = {"term": term, "candidate": self.self_url,
+                       "last_index": self.lsn, "last_term": self._term_at(self.lsn)}
+        logger.info("Starting election for term {}".format(term))
+
+        votes = 1
+        futures = [self.pool.submit(self._post, peer, "/replication/vote", request) for peer in self.peers]
+        for future in futures:
+            response = future.result()
+            if response is None:
+                continue
+            with self.condition:
+                if response["term"] > self.term:
+                    self._step_down(response["term"])
+                    return
+            if response.get("granted"):
+                votes += 1
+        if votes * 2 > len(self.peers) + 1:
+            self._become_leader(term)
+
+    # ---- Leader side ----
+
+    def _post(self, peer, path, body, timeout=None):
+        try:
+            response = self.session.post(peer + path, json=body,
+                                         timeout=timeout or self.election_timeout)
+            return response.json() if response.status_code == 200 else None
+        except (requests.exceptions.RequestException, ValueError):
+            return None
+
+    def _replicate_to(self, peer, term):
+        """Ship log entries (or a snapshot) to one follower for as long as term lasts"""
+        with self.condition:
+            next_index = self.lsn + 1
+        while True:
+            with self.condition:
+                if self.role != LEADER or self.term != term or not self.running:
+                    return
+                if next_index > self.lsn:
+                    self.condition.wait(self.heartbeat_interval)
+                    if self.role != LEADER or self.term != term or not self.running:
+                        return
+                prev_index = next_index - 1
+                needs_snapshot = prev_index < self.base_index
+                if not needs_snapshot:
+                    start = prev_index - self.base_index
+                    request = {
+                        "term": term, "leader": self.self_url,
+                        "prev_index": prev_index, "prev_term": self._term_at(prev_index),
+                        "entries": self.entries[start:start + self.batch_size],
+                        "commit_index": self.durable_lsn, "last_index": self.lsn
+                    }
+
+            if needs_snapshot:
+                response = self._send_snapshot(peer, term)
+            else:
+                response = self._post(peer, "/replication/append", request)
+            if response is None:
+                time.sleep(self.heartbeat_interval)
+                continue
+
+            next_index = self._on_append_response(peer, response, next_index)
+            if next_index is None:
+                return
+
+    def _on_append_response(self, peer, response, next_index):
+        """
+        Return the next entry to send a follower after its response
+
+        Returns:
+            None if the follower knows a newer term and this replica stepped down
+        """
+        with self.condition:
+            if response["term"] > self.term:
+                self._step_down(response["term"])
+                return None
+            if response.get("success"):
+                self.match_index[peer] = response["last_index"]
+                self._advance_commit()
+                return response["last_index"] + 1
+            if response.get("reset") or "last_index" not in response:
+                return 0  # Below base_index, so the follower is reset from a snapshot
+            # Logs differ before next_index: step back one entry, or to the end of a shorter log
+            return max(0, min(next_index - 1, response["last_index"] + 1))
+
+    def _send_snapshot(self, peer, term):
+        with self.state.lock, self.condition:
+            if self.role != LEADER or self.term != term:
+                return None
+            request = {"term": term, "leader": self.self_url, "last_index": self.lsn,
+                       "last_term": self._term_at(self.lsn), "snapshot": capture_snapshot(self.state)}
+        logger.info("Sending snapshot at index {} to {}".format(request["last_index"], peer))
+        return self._post(peer, "/replication/snapshot", request, timeout=60)
+
+    # ---- Follower side (called with the cluster state lock held) ----
+
+    def _accept_leader(self, term, leader_url):
+        """Return False if the term is stale, else follow its leader (condition held)"""
+        if term < self.term:
+            return False
+        if term > self.term or self.role != FOLLOWER or self.leader_url != leader_url:
+            self._step_down(term, leader_url)
+        self.last_contact = time.time()
+        return True
+
+    def handle_vote(self, request):
+        with self.condition:
+            if request["term"] > self.term:
+                self._step_down(request["term"])
+            up_to_date = (request["last_term"], request["last_index"]) >= (self._term_at(self.lsn), self.lsn)
+            granted = (request["term"] == self.term and up_to_date
+                       and self.voted_for in (None, request["candidate"]))
+            if granted:
+                self.voted_for = request["candidate"]
+                self.last_contact = time.time()
+            return {"term": self.term, "granted": granted}
+
+    def handle_append(self, request):
+        with self.condition:
+            if not self._accept_leader(request["term"], request["leader"]):
+                return {"term": self.term, "success": False}
+            prev_index = request["prev_index"]
+            if prev_index < self.base_index:
+                # Entries this replica dropped cannot be compared; only a snapshot helps
+                return {"term": self.term, "success": False, "reset": True}
+            if prev_index > self.lsn or self._term_at(prev_index) != request["prev_term"]:
+                return {"term": self.term, "success": False, "last_index": self.lsn}
+            index = prev_index
+            for term, record in request["entries"]:
+                index += 1
+                if index <= self.lsn:
+                    if self._term_at(index) == term:
+                        continue  # Already held, e.g. a resent batch
+                    # A deposed leader's changes are applied already and cannot be undone
+                    return {"term": self.term, "success": False, "reset": True}
+                apply_record(self.state, record)
+                self._append(term, record)
+            if self.lsn > request["last_index"]:
+                return {"term": self.term, "success": False, "reset": True}
+            self.durable_lsn = max(self.durable_lsn, min(request["commit_index"], index))
+            return {"term": self.term, "success": True, "last_index": index}
+
+    def handle_snapshot(self, request):
+        with self.condition:
+            if not self._accept_leader(request["term"], request["leader"]):
+                return {"term": self.term, "success": False}
+        self.state.clear()
+        load_snapshot(self.state, request["snapshot"])
+        with self.condition:
+            self.encoder = RecordEncoder(self.state)
+            self.entries = []
+            self.base_index = self.lsn = self.durable_lsn = request["last_index"]
+            self.base_term = request["last_term"]
+            logger.info("Loaded snapshot at index {}".format(self.lsn))
+            return {"term": self.term, "success": True, "last_index": self.lsn}
@@ -0,0 +1,263 @@
+import numpy as np
+
+# Column of every resource vector holding CPU cores
+CPU = "cpu"
+MEMORY = "memory"
+
+FIRST_FIT = "first_fit"
+BEST_FIT = "best_fit"
+WORST_FIT = "worst_fit"
+DOMINANT_RESOURCE = "dominant_resource"
+BALANCED_ALLOCATION = "balanced_allocation"
+
+
+def parse_count(value, what, allow_zero=False):
+    """
+    Read a whole number of CPU cores or resource units from request data
+
+    Integers and integer strings are accepted; booleans, fractions and
+    anything else are not.
+
+    Args:
+        value: Value from the request
+        what: Name of the value for the error message
+        allow_zero: Whether zero is accepted (otherwise it must be positive)
+
+    Raises:
+        ValueError: If the value is not such a number
+    """
+    if isinstance(value, bool) or (isinstance(value, float) and not value.is_integer()):
+        raise ValueError("{} must be an integer".format(what))
+    try:
+        count = int(value)
+    except (TypeError, ValueError):
+        raise ValueError("{} must be an integer".format(what))
+    if count < 0 or (count == 0 and not allow_zero):
+        raise ValueError("{} must be {}".format(what, "non-negative" if allow_zero else "positive"))
+    return count
+
+
+def normalize_resources(resources):
+    """
+    Validate a {name: amount} resource request or capacity
+
+    CPU is not part of it (it is given as cpu_cores). Amounts must be
+    non-negative integers; zero amounts are dropped.
+
+    Raises:
+        ValueError: If the resources are malformed
+    """
+    if resources is None:
+        return {}
+    if not isinstance(resources, dict):
+        raise ValueError("Resources must be an object of name: amount")
+    normalized = {}
+    for name, amount in resources.items():
+        if name in (CPU, "cpu_cores"):
+            raise ValueError("CPU is given as cpu_cores, not as a resource")
+        amount = parse_count(amount, "Resource {}".format(name), allow_zero=True)
+        if amount:
+            normalized[str(name)] = amount
+    return normalized
+
+
+def parse_resources(data):
+    """
+    Read the non-CPU resources of a node or pod from request data
+
+    Memory (MiB) may be given at the top level as "memory"; any resource,
+    including extended ones such as "gpu", may be given in "resources".
+
+    Raises:
+        ValueError: If the resources are malformed
+    """
+    resources = data.get("resources")
+    if data.get(MEMORY) is not None:
+        if resources is not None and not isinstance(resources, dict):
+            raise ValueError("Resources must be an object of name: amount")
+        resources = dict(resources or {}, **{MEMORY: data[MEMORY]})
+    return normalize_resources(resources)
+
+
+class ResourceMatrix:
+    def __init__(self):
+        """
+        Columnar store of every node's resource capacity and availability
+
+        Each node owns a row, in registration order, of two float arrays
+        (capacity and available) with one column per resource name, CPU
+        first; a column is added the first time a resource appears. A fit
+        check against every node is then one vectorized comparison, and the
+        vector policies score all fitting nodes in one pass as well.
+
+        Node changes are only noted by update() and written to the arrays
+        on the next query, so clusters that never need the matrix (CPU-only
+        pods under a CPU policy) pay a dict insert per change, not an
+        array write.
+        """
+        self.columns = [CPU]       # Resource name of each column
+        self._column = {CPU: 0}    # {resource: column}
+        self.capacity = np.zeros((16, 1))
+        self.available = np.zeros((16, 1))
+        self.schedulable = np.zeros(16, dtype=bool)
+
+        self._slots = {}       # {node_id: row}
+        self._slot_nodes = []  # row -> node_id (None once the node is forgotten)
+        self._forgotten = 0
+        self._stale = {}       # {node_id: (node, schedulable)} changes not yet written
+
+    def __contains__(self, node_id):
+        self.flush()
+        slot = self._slots.get(node_id)
+        return slot is not None and bool(self.schedulable[slot])
+
+    def update(self, node, schedulable):
+        """Note that a node was added or changed; its row is refreshed on the next query"""
+        self._stale[node.id] = (node, schedulable)
+
+    def flush(self):
+        """Write every noted change to the arrays"""
+        if self._stale:
+            stale, self._stale = self._stale, {}
+            for node, schedulable in stale.values():
+                self.set_node(node, schedulable)
+
+    def set_node(self, node, schedulable):
+        """Add or refresh a node's row from its current availability"""
+        slot = self._slots.get(node.id)
+        if slot is None:
+            slot = self._assign_slot(node.id)
+            self.capacity[slot, 0] = node.cpu_cores
+            for name, amount in node.resources.items():
+                column = self._column_of(name)  # May widen the arrays
+                self.capacity[slot, column] = amount
+        self.available[slot, 0] = node.available_cores
+        for name, amount in node.available_resources.items():
+            self.available[slot, self._column[name]] = amount
+        self.schedulable[slot] = schedulable
+
+    def set_schedulable(self, node_id, schedulable):
+        self.flush()
+        slot = self._slots.get(node_id)
+        if slot is not None:
+            self.schedulable[slot] = schedulable
+
+    def reserve(self, node_id, cpu_req, resources):
+        """Subtract a planned pod from a node's row (cluster state untouched)"""
+        self.flush()
+        slot = self._slots[node_id]
+        self.available[slot, 0] -= cpu_req
+        for name, amount in resources.items():
+            self.available[slot, self._column[name]] -= amount
+
+    def forget(self, node_id):
+        """Drop a node's row"""
+        self._stale.pop(node_id, None)
+        slot = self._slots.pop(node_id, None)
+        if slot is None:
+            return
+        self._slot_nodes[slot] = None
+        self.schedulable[slot] = False
+        self.capacity[slot] = 0
+        self.available[slot] = 0
+        self._forgotten += 1
+
+    def vector(self, cpu_req, resources):
+        """Return the request as a row vector, or None if it needs a resource no node has"""
+        self.flush()
+        request = np.zeros(len(self.columns))
+        request[0] = cpu_req
+        for name, amount in resources.items():
+            column = self._column.get(name)
+            if column is None:
+                return None
+            request[column] = amount
+        return request
+
+    def fits(self, request):
+        """Return the rows of schedulable nodes with room for the request vector"""
+        self.flush()
+        rows = len(self._slot_nodes)
+        mask = self.schedulable[:rows] & (self.available[:rows] >= request).all(axis=1)
+        return np.flatnonzero(mask)
+
+    def select(self, policy, cpu_req, resources):
+        """
+        Return the id of the node a policy chooses for a request, or None
+
+        first_fit takes the earliest registered node that fits; best_fit
+        and worst_fit leave it the fewest or most free CPU cores (other
+        resources only have to fit); dominant_resource takes the node where
+        the request uses the largest share of the free capacity of its
+        scarcest resource; balanced_allocation takes the node whose
+        resources end up the most evenly used. Ties go to the earliest
+        registered node.
+        """
+        request = self.vector(cpu_req, resources)
+        if request is None:
+            return None
+        rows = self.fits(request)
+        if not len(rows):
+            return None
+        if policy == FIRST_FIT:
+            return self._slot_nodes[rows[0]]
+        return self._slot_nodes[rows[np.argmin(self.score(policy, rows, request))]]
+
+    def score(self, policy, rows, request):
+        """Score fitting rows for a request; lower is better"""
+        available = self.available[rows]
+        if policy == BEST_FIT:
+            return available[:, 0] - request[0]
+        if policy == WORST_FIT:
+            return request[0] - available[:, 0]
+        if policy == DOMINANT_RESOURCE:
+            share = np.divide(request, available, out=np.zeros_like(available), where=available > 0)
+            return -share.max(axis=1)
+        if policy == BALANCED_ALLOCATION:
+            capacity = self.capacity[rows]
+            provided = capacity > 0
+            used = np.divide(capacity - available + request, capacity,
+                             out=np.zeros_like(capacity), where=provided)
+            count = np.maximum(provided.sum(axis=1), 1)
+            mean = used.sum(axis=1) / count
+            return (((used - mean[:, None]) ** 2) * provided).sum(axis=1) / count
+        raise ValueError("Unknown scheduling policy: {}".format(policy))
+
+    # ---- Internals ----
+
+    def _column_of(self, name):
+        column = self._column.get(name)
+        if column is None:
+            column = self._column[name] = len(self.columns)
+            self.columns.append(name)
+            pad = np.zeros((len(self.capacity), 1))
+            self.capacity = np.hstack([self.capacity, pad])
+            self.available = np.hstack([self.available, pad])
+        return column
+
+    def _assign_slot(self, node_id):
+        if len(self._slot_nodes) == len(self.schedulable):
+            self._grow()
+        slot = len(self._slot_nodes)
+        self._slot_nodes.append(node_id)
+        self._slots[node_id] = slot
+        return slot
+
+    def _grow(self):
+        """Compact forgotten rows, or double the arrays when they are full"""
+        if self._forgotten * 2 >= len(self._slot_nodes):
+            live = [slot for slot, node_id in enumerate(self._slot_nodes) if node_id is not None]
+            size = len(self.schedulable)
+        else:
+            live = list(range(len(self._slot_nodes)))
+            size = 2 * len(self.schedulable)
+        capacity = np.zeros((size, len(self.columns)))
+        available = np.zeros((size, len(self.columns)))
+        schedulable = np.zeros(size, dtype=bool)
+        capacity[:len(live)] = self.capacity[live]
+        available[:len(live)] = self.available[live]
+        schedulable[:len(live)] = self.schedulable[live]
+        self.capacity, self.available, self.schedulable = capacity, available, schedulable
+        self._slot_nodes = [self._slot_nodes[slot] for slot in live]
+        self._slots = {node_id: slot for slot, node_id in enumerate(self._slot_nodes)}
+        self._forgotten = 0
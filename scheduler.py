@@ -0,0 +1,520 @@
+import bisect
+import logging
+import math
+import time
+
+from cluster_state import DEFAULT_PRIORITY
+from metrics import Counter, Histogram
+from resources import (BALANCED_ALLOCATION, BEST_FIT, DOMINANT_RESOURCE, FIRST_FIT,
+                       WORST_FIT, ResourceMatrix)
+
+logger = logging.getLogger('scheduler')
+
+SCHEDULING_SECONDS = Histogram("cluster_scheduling_duration_seconds",
+                               "Time the scheduler took to place pods, by operation", ("operation",))
+SCHEDULING_ATTEMPTS = Counter("cluster_scheduling_attempts_total",
+                              "Pods the scheduler tried to place, by operation and result", ("operation", "result"))
+
+POLICIES = (FIRST_FIT, BEST_FIT, WORST_FIT, DOMINANT_RESOURCE, BALANCED_ALLOCATION)
+# Policies that score every resource, not just CPU
+VECTOR_POLICIES = (DOMINANT_RESOURCE, BALANCED_ALLOCATION)
+
+
+class CapacityIndex:
+    def __init__(self):
+        """
+        Index of schedulable nodes ordered by available cores
+
+        Nodes are kept in buckets keyed by available cores, with the distinct
+        core levels in a sorted list, so best-fit and worst-fit are a bisect
+        away. First-fit uses a max segment tree over registration order to
+        find the leftmost node with enough capacity in O(log n).
+        """
+        self._cores = {}    # {node_id: available_cores}
+        self._buckets = {}  # {available_cores: {node_id: None}} (ordered set)
+        self._levels = []   # Sorted distinct available_cores with a non-empty bucket
+
+        self._slots = {}      # {node_id: slot in registration order}
+        self._slot_nodes = []  # slot -> node_id (None once the node is forgotten)
+        self._size = 1        # Number of leaves in the segment tree
+        self._tree = [-1, -1]
+
+    def __contains__(self, node_id):
+        return node_id in self._cores
+
+    def __len__(self):
+        return len(self._cores)
+
+    def add(self, node_id, available_cores):
+        """Add a node, or update it if it is already indexed"""
+        if node_id in self._cores:
+            self.update(node_id, available_cores)
+            return
+        self._cores[node_id] = available_cores
+        self._bucket_add(node_id, available_cores)
+
+        slot = self._slots.get(node_id)
+        if slot is None:
+            slot = self._assign_slot(node_id)
+        self._tree_set(slot, available_cores)
+
+    def update(self, node_id, available_cores):
+        """Record a new available core count for an indexed node"""
+        old = self._cores.get(node_id)
+        if old is None or old == available_cores:
+            return
+        self._bucket_remove(node_id, old)
+        self._cores[node_id] = available_cores
+        self._bucket_add(node_id, available_cores)
+        self._tree_set(self._slots[node_id], available_cores)
+
+    def discard(self, node_id):
+        """Stop offering a node for placement, keeping its first-fit position"""
+        old = self._cores.pop(node_id, None)
+        if old is None:
+            return
+        self._bucket_remove(node_id, old)
+        self._tree_set(self._slots[node_id], -1)
+
+    def forget(self, node_id):
+        """Drop a node entirely, including its first-fit position"""
+        self.discard(node_id)
+        slot = self._slots.pop(node_id, None)
+        if slot is not None:
+            self._slot_nodes[slot] = None
+
+    def available_cores(self, node_id):
+        """Return the indexed available cores for a node, or None"""
+        return self._cores.get(node_id)
+
+    # ---- Queries ----
+
+    def max_available(self):
+        """Return the most available cores on any indexed node (-1 if none)"""
+        return self._levels[-1] if self._levels else -1
+
+    def first_fit(self, cpu_req):
+        """Return the earliest registered node with at least cpu_req free cores"""
+        tree = self._tree
+        if tree[1] < cpu_req:
+            return None
+        pos = 1
+        while pos < self._size:
+            pos *= 2
+            if tree[pos] < cpu_req:
+                pos += 1
+        return self._slot_nodes[pos - self._size]
+
+    def best_fit(self, cpu_req):
+        """Return a node left with the fewest free cores after placing cpu_req"""
+        i = bisect.bisect_left(self._levels, cpu_req)
+        if i == len(self._levels):
+            return None
+        return next(iter(self._buckets[self._levels[i]]))
+
+    def worst_fit(self, cpu_req):
+        """Return a node left with the most free cores after placing cpu_req"""
+        if not self._levels or self._levels[-1] < cpu_req:
+            return None
+        return next(iter(self._buckets[self._levels[-1]]))
+
+    def iter_best_fit(self, cpu_req):
+        """Yield nodes with at least cpu_req free cores, fewest free cores first"""
+        for level in self._levels[bisect.bisect_left(self._levels, cpu_req):]:
+            yield from self._buckets[level]
+
+    def select(self, policy, cpu_req):
+        """Return a node id chosen by the given policy, or None"""
+        if policy == BEST_FIT:
+            return self.best_fit(cpu_req)
+        if policy == WORST_FIT:
+            return self.worst_fit(cpu_req)
+        return self.first_fit(cpu_req)
+
+    # ---- Internals ----
+
+    def _bucket_add(self, node_id, cores):
+        bucket = self._buckets.get(cores)
+        if bucket is None:
+            bucket = self._buckets[cores] = {}
+            bisect.insort(self._levels, cores)
+        bucket[node_id] = None
+
+    def _bucket_remove(self, node_id, cores):
+        bucket = self._buckets[cores]
+        del bucket[node_id]
+        if not bucket:
+            del self._buckets[cores]
+            del self._levels[bisect.bisect_left(self._levels, cores)]
+
+    def _assign_slot(self, node_id):
+        if len(self._slot_nodes) == self._size:
+            self._rebuild()
+        slot = len(self._slot_nodes)
+        self._slot_nodes.append(node_id)
+        self._slots[node_id] = slot
+        return slot
+
+    def _rebuild(self):
+        """Compact forgotten slots and double the tree when it is full"""
+        live = [node_id for node_id in self._slot_nodes if node_id is not None]
+        size = 1
+        while size < 2 * len(live) or size < 2:
+            size *= 2
+        self._size = size
+        self._tree = [-1] * (2 * size)
+        self._slot_nodes = live
+        self._slots = {}
+        for slot, node_id in enumerate(live):
+            self._slots[node_id] = slot
+            self._tree[size + slot] = self._cores.get(node_id, -1)
+        for pos in range(size - 1, 0, -1):
+            self._tree[pos] = max(self._tree[2 * pos], self._tree[2 * pos + 1])
+
+    def _tree_set(self, slot, value):
+        tree = self._tree
+        pos = slot + self._size
+        tree[pos] = value
+        pos //= 2
+        while pos:
+            best = max(tree[2 * pos], tree[2 * pos + 1])
+            if tree[pos] == best:
+                break
+            tree[pos] = best
+            pos //= 2
+
+
+class Scheduler:
+    def __init__(self, state, policy=FIRST_FIT):
+        """
+        Pod scheduler backed by a capacity index of healthy nodes
+
+        The index is kept in sync through ClusterState change notifications:
+        nodes leave it when marked unhealthy and return when they recover.
+        Callers hold the cluster state lock while scheduling.
+
+        Pods that only need CPU, placed by a CPU policy, go through the
+        capacity index. Pods that also need memory or other resources, and
+        the vector policies (dominant_resource, balanced_allocation), go
+        through a ResourceMatrix holding every node's resources as columns,
+        where the fit check and scoring run over all nodes at once.
+
+        The capacity index holds each node's available cores, or after
+        pack_by_usage() the room left by what its pods actually use.
+
+        Args:
+            state: ClusterState holding the cluster's nodes and pods
+            policy: Default placement policy (one of POLICIES)
+        """
+        self.state = state
+        self.policy = FIRST_FIT
+        self.set_policy(policy)
+        self.index = CapacityIndex()
+        self.matrix = ResourceMatrix()
+        self.cordoned = set()  # Nodes excluded from placement until removed
+        self.usage = None      # UsageStore once packing by observed usage
+        self.overcommit = 1.0
+        self.estimated = {}    # {node_id: cores its pods are expected to use}
+        self.pod_estimates = {}  # {pod_id: (node_id, cores counted for it)}
+
+        for node in state.nodes.values():
+            healthy = node.status == "Healthy"
+            if healthy:
+                self.index.add(node.id, self.capacity(node))
+            self.matrix.update(node, healthy)
+        state.subscribe(self._on_state_change)
+
+    def set_policy(self, policy):
+        """
+        Change the server-wide default policy
+
+        Raises:
+            ValueError: If the policy is unknown
+        """
+        if policy not in POLICIES:
+            raise ValueError("Unknown scheduling policy: {}".format(policy))
+        self.policy = policy
+
+    def pack_by_usage(self, usage, overcommit=1.5):
+        """
+        Place CPU-only pods by the cores pods actually use rather than by their requests
+
+        A node's capacity in the index becomes the smaller of the room
+        left under overcommit times its cores for requests, and its cores
+        minus the expected usage of its pods: their usage percentile from
+        the UsageStore, or their request until they have one. The expected
+        usage per node is kept up to date as pods come and go and as
+        estimates change. Pods that need other resources, and the vector
+        policies, still place by requests. Call once, under the state lock.
+
+        Args:
+            usage: UsageStore providing the pods' estimates
+            overcommit: Most requested cores per core of a node (at least 1)
+
+        Raises:
+            ValueError: If overcommit is below 1
+        """
+        if overcommit < 1:
+            raise ValueError("The overcommit ratio must be at least 1")
+        self.usage = usage
+        self.overcommit = overcommit
+        self.estimated = {node_id: 0.0 for node_id in self.state.nodes}
+        self.pod_estimates = {}
+        for pod in self.state.pods.values():
+            self._count_pod(pod)
+        usage.subscribe(self._on_estimates)
+        for node in self.state.nodes.values():
+            self._reindex(node)
+
+    def capacity(self, node):
+        """Return the cores the index offers on a node"""
+        if self.usage is None:
+            return node.available_cores
+        requested = node.cpu_cores - node.available_cores
+        room = min(node.cpu_cores * self.overcommit - requested,
+                   node.cpu_cores - self.estimated.get(node.id, 0.0))
+        return max(int(math.floor(room + 1e-9)), 0)
+
+    def _reindex(self, node):
+        if node.id in self.index:
+            self.index.update(node.id, self.capacity(node))
+
+    def _count_pod(self, pod):
+        """Add a pod's expected usage to its node"""
+        cores = self.usage.get_estimate(pod.id)
+        if cores is None:
+            cores = pod.cpu_cores
+        node_id = pod.assigned_node
+        self.pod_estimates[pod.id] = (node_id, cores)
+        self.estimated[node_id] = self.estimated.get(node_id, 0.0) + cores
+
+    def _uncount_pod(self, pod_id):
+        """Take a pod's expected usage off its node; returns the node id"""
+        node_id, cores = self.pod_estimates.pop(pod_id)
+        if node_id in self.estimated:
+            self.estimated[node_id] -= cores
+        return node_id
+
+    def _on_estimates(self, changes):
+        """Move nodes in the index as their pods' usage estimates change (state lock held)"""
+        touched = set()
+        for pod_id in changes:
+            if pod_id in self.pod_estimates:
+                touched.add(self._uncount_pod(pod_id))
+                self._count_pod(self.state.pods[pod_id])
+        for node_id in touched:
+            node = self.state.nodes.get(node_id)
+            if node is not None:
+                self._reindex(node)
+
+    def cordon(self, node_id):
+        """Stop placing new pods on a node until it is removed"""
+        self.cordoned.add(node_id)
+        self.index.discard(node_id)
+        self.matrix.set_schedulable(node_id, False)
+
+    def uncordon(self, node_id):
+        """Let new pods be placed on a cordoned node again"""
+        self.cordoned.discard(node_id)
+        node = self.state.nodes.get(node_id)
+        if node is not None:
+            self._on_state_change("node", "MODIFIED", node)
+
+    def select_node(self, cpu_req, policy=None, resources=None):
+        """
+        Choose a healthy node with at least cpu_req available cores and room for resources
+
+        Args:
+            cpu_req: CPU cores required by the pod
+            policy: Placement policy for this request (defaults to the server-wide one)
+            resources: Other resources required by the pod, {name: amount}
+
+        Returns:
+            The chosen node, or None if no healthy node fits
+
+        Raises:
+            ValueError: If the policy is unknown
+        """
+        if policy is None:
+            policy = self.policy
+        elif policy not in POLICIES:
+            raise ValueError("Unknown scheduling policy: {}".format(policy))
+
+        if resources or policy in VECTOR_POLICIES:
+            node_id = self.matrix.select(policy, cpu_req, resources or {})
+        else:
+            node_id = self.index.select(policy, cpu_req)
+        if node_id is None:
+            return None
+        return self.state.nodes[node_id]
+
+    def schedule(self, cpu_req, policy=None, resources=None, priority=DEFAULT_PRIORITY):
+        """
+        Place a new pod on a node chosen by the policy
+
+        Returns:
+            The created pod, or None if no healthy node fits
+        """
+        started = time.perf_counter()
+        node = self.select_node(cpu_req, policy, resources)
+        SCHEDULING_SECONDS.labels("schedule").observe(time.perf_counter() - started)
+        if node is None:
+            SCHEDULING_ATTEMPTS.labels("schedule", "unschedulable").inc()
+            return None
+        SCHEDULING_ATTEMPTS.labels("schedule", "scheduled").inc()
+        return self.state.add_pod(cpu_req, node.id, resources=resources, priority=priority)
+
+    def plan_batch(self, cpu_requests, policy=None, resources=None):
+        """
+        Plan placements for a batch of pods, largest requests first
+
+        Placing in decreasing order turns the policy into its bin-packing
+        "decreasing" variant (first-fit-decreasing for first_fit). Planned
+        cores are reserved in the index only, so cluster state is untouched
+        until the plan is committed or released.
+
+        Args:
+            cpu_requests: List of CPU cores required by each pod
+            policy: Placement policy (defaults to the server-wide one)
+            resources: List of other resources required by each pod (None if CPU only)
+
+        Returns:
+            List of node ids aligned with cpu_requests (None where a pod does not fit)
+
+        Raises:
+            ValueError: If the policy is unknown
+        """
+        if resources is None:
+            resources = [None] * len(cpu_requests)
+        # The matrix only needs the reservations if some placement in the batch reads it
+        vector = any(resources) or (policy or self.policy) in VECTOR_POLICIES
+        order = sorted(range(len(cpu_requests)), key=lambda i: cpu_requests[i], reverse=True)
+        plan = [None] * len(cpu_requests)
+        for i in order:
+            node = self.select_node(cpu_requests[i], policy, resources[i])
+            if node is None:
+                continue
+            node_id = node.id
+            plan[i] = node_id
+            self.index.update(node_id, self.index.available_cores(node_id) - cpu_requests[i])
+            if vector:
+                self.matrix.reserve(node_id, cpu_requests[i], resources[i] or {})
+        return plan
+
+    def release_plan(self, plan):
+        """Undo the index reservations made by plan_batch"""
+        for node_id in set(plan):
+            node = self.state.nodes.get(node_id)
+            if node is not None and node_id in self.index:
+                self.index.update(node_id, self.capacity(node))
+                self.matrix.update(node, True)
+
+    def schedule_batch(self, cpu_requests, policy=None, gang=False, resources=None,
+                       priority=DEFAULT_PRIORITY):
+        """
+        Place a batch of pods in one pass
+
+        Args:
+            cpu_requests: List of CPU cores required by each pod
+            policy: Placement policy (defaults to the server-wide one)
+            gang: If True, place either every pod or none of them
+            resources: List of other resources required by each pod (None if CPU only)
+            priority: Priority class of every pod in the batch
+
+        Returns:
+            List of created pods aligned with cpu_requests (None where a pod was not placed)
+
+        Raises:
+            ValueError: If the policy is unknown
+        """
+        started = time.perf_counter()
+        plan = self.plan_batch(cpu_requests, policy, resources)
+        if resources is None:
+            resources = [None] * len(cpu_requests)
+
+        # Committing through ClusterState re-applies the reservations to the index
+        self.release_plan(plan)
+        if gang and None in plan:
+            plan = [None] * len(cpu_requests)
+        self._record("batch", started, plan)
+        return [
+            self.state.add_pod(cpu_req, node_id, resources=pod_resources, priority=priority)
+            if node_id is not None else None
+            for cpu_req, node_id, pod_resources in zip(cpu_requests, plan, resources)
+        ]
+
+    def reschedule(self, pod_ids, policy=None, exclude=None):
+        """
+        Move existing pods to healthy nodes, planned as one batch
+
+        All pods are placed against the capacity index in a single pass,
+        largest first, instead of one node search per pod.
+
+        Args:
+            pod_ids: IDs of the pods to move
+            policy: Placement policy (defaults to the server-wide one)
+            exclude: ID of a node the pods must not be moved to
+
+        Returns:
+            IDs of the pods that did not fit anywhere (left where they were)
+        """
+        pods = [self.state.pods[pod_id] for pod_id in pod_ids]
+        if exclude is not None:
+            self.index.discard(exclude)
+            self.matrix.set_schedulable(exclude, False)
+        try:
+            started = time.perf_counter()
+            plan = self.plan_batch([pod.cpu_cores for pod in pods], policy,
+                                   [pod.resources for pod in pods])
+            self.release_plan(plan)
+            self._record("reschedule", started, plan)
+        finally:
+            if exclude in self.state.nodes:
+                self._on_state_change("node", "MODIFIED", self.state.nodes[exclude])
+        unplaced = []
+        for pod, node_id in zip(pods, plan):
+            if node_id is None:
+                unplaced.append(pod.id)
+            else:
+                self.state.move_pod(pod.id, node_id)
+        return unplaced
+
+    @staticmethod
+    def _record(operation, started, plan):
+        """Record how long a batch took to plan and how many of its pods fit"""
+        SCHEDULING_SECONDS.labels(operation).observe(time.perf_counter() - started)
+        unplaced = plan.count(None)
+        SCHEDULING_ATTEMPTS.labels(operation, "scheduled").inc(len(plan) - unplaced)
+        SCHEDULING_ATTEMPTS.labels(operation, "unschedulable").inc(unplaced)
+
+    def _on_state_change(self, kind, event_type, obj):
+        if kind != "node":
+            if self.usage is not None:
+                self._on_pod_change(event_type, obj)
+            return
+        node_id = obj.id
+        if event_type in ("ADDED", "MODIFIED"):
+            schedulable = obj.status == "Healthy" and node_id not in self.cordoned
+            if schedulable:
+                self.index.add(node_id, self.capacity(obj))
+            else:
+                self.index.discard(node_id)
+            self.matrix.update(obj, schedulable)
+        elif event_type == "DELETED":
+            self.cordoned.discard(node_id)
+            self.index.forget(node_id)
+            self.matrix.forget(node_id)
+            self.estimated.pop(node_id, None)
+
+    def _on_pod_change(self, event_type, pod):
+        """Keep the expected usage per node in step with pods (its node's change follows)"""
+        if event_type == "ADDED":
+            self._count_pod(pod)
+        elif event_type == "DELETED":
+            self._uncount_pod(pod.id)
+        elif event_type == "MODIFIED":
+            # Moved: the source node's change was already notified
+            source = self.state.nodes.get(self._uncount_pod(pod.id))
+            self._count_pod(pod)
+            if source is not None:
+                self._reindex(source)
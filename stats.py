@@ -0,0 +1,9 @@
+"""Summary statistics shared by the simulators and benchmarks"""
+
+
+def percentile(sorted_values, pct):
+    """Return the pct-th percentile (0-100) of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[index]
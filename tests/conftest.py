@@ -0,0 +1,43 @@
+import threading
+
+import pytest
+from werkzeug.serving import make_server
+
+import api_server
+from cluster_state import ClusterState
+from health_monitor import HealthMonitor
+from pending import PendingQueue
+from preemption import Preemptor
+from scheduler import Scheduler
+from usage import UsageStore
+from watch import EventLog
+
+
+@pytest.fixture
+def state(monkeypatch):
+    """A fresh, empty cluster behind the API server for one test"""
+    state = ClusterState()
+    monkeypatch.setattr(api_server, "state", state)
+    scheduler = Scheduler(state)
+    pending = PendingQueue(state, scheduler)
+    monkeypatch.setattr(api_server, "scheduler", scheduler)
+    monkeypatch.setattr(api_server, "pending", pending)
+    monkeypatch.setattr(api_server, "preemptor", Preemptor(state, scheduler, pending))
+    monkeypatch.setattr(api_server, "monitor", HealthMonitor(state, scheduler=scheduler, queue=pending))
+    monkeypatch.setattr(api_server, "events", EventLog(state))
+    monkeypatch.setattr(api_server, "usage", UsageStore(state))
+    return state
+
+
+@pytest.fixture
+def client(state):
+    return api_server.app.test_client()
+
+
+@pytest.fixture
+def server_url(state):
+    """URL of the API server, serving on a free local port for one test"""
+    server = make_server("127.0.0.1", 0, api_server.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield "http://127.0.0.1:{}".format(server.server_port)
+    server.shutdown()
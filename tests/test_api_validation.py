@@ -0,0 +1,45 @@
+import pytest
+
+BAD_COUNTS = [0, -2, [4], "four", 1.5, True, None]
+
+
+@pytest.mark.parametrize("cpu_cores", BAD_COUNTS)
+def test_add_node_rejects_bad_cpu_cores(client, cpu_cores):
+    response = client.post("/add_node", json={"cpu_cores": cpu_cores})
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize("cpu_cores", BAD_COUNTS)
+def test_launch_pod_rejects_bad_cpu_cores(client, cpu_cores):
+    response = client.post("/launch_pod", json={"cpu_cores": cpu_cores})
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize("cpu_cores", BAD_COUNTS)
+def test_launch_pods_rejects_bad_cpu_cores(client, cpu_cores):
+    response = client.post("/launch_pods", json={"cpu_cores": [1, cpu_cores]})
+    assert response.status_code == 400
+
+
+def test_whole_numbers_are_accepted(client):
+    assert client.post("/add_node", json={"cpu_cores": "4"}).status_code == 200
+    assert client.post("/launch_pod", json={"cpu_cores": 2.0}).status_code == 200
+
+
+def test_rejected_requests_leave_capacity_alone(client):
+    client.post("/add_node", json={"cpu_cores": 4})
+    client.post("/launch_pod", json={"cpu_cores": -8})
+    assert client.get("/list_nodes").get_json()["nodes"][0]["available_cores"] == 4
+
+
+@pytest.mark.parametrize("priority", [["high"], {"high": 1}, 2, "urgent"])
+def test_bad_priority_is_a_bad_request(client, priority):
+    client.post("/add_node", json={"cpu_cores": 4})
+    assert client.post("/launch_pod", json={"cpu_cores": 1, "priority": priority}).status_code == 400
+    assert client.post("/launch_pods", json={"cpu_cores": [1], "priority": priority}).status_code == 400
+
+
+@pytest.mark.parametrize("item_id", [["node-1"], {"id": "node-1"}, 1])
+def test_ids_must_be_strings(client, item_id):
+    assert client.post("/remove_node", json={"node_id": item_id}).status_code == 400
+    assert client.post("/remove_pod", json={"pod_id": item_id}).status_code == 400
@@ -0,0 +1,57 @@
+import asyncio
+
+from aiohttp.test_utils import TestClient, TestServer
+
+import api_server
+import async_server
+from health_monitor import HealthMonitor
+from replication import Replicator
+
+
+def call(*requests):
+    """Send (method, path, json body) requests to the async app; returns [(status, body)]"""
+    async def send():
+        async with TestClient(TestServer(async_server.create_app())) as client:
+            results = []
+            for method, path, body in requests:
+                response = await client.request(method, path, json=body)
+                results.append((response.status, await response.json()))
+            return results
+    return asyncio.run(send())
+
+
+def test_serves_the_same_handlers_as_flask(state):
+    (status, added), (_, launched), (_, nodes) = call(
+        ("POST", "/add_node", {"cpu_cores": 4}),
+        ("POST", "/launch_pod", {"cpu_cores": 3}),
+        ("GET", "/list_nodes", None))
+
+    assert status == 200
+    assert launched["pod"]["assigned_node"] == added["node_id"]
+    assert nodes["nodes"][0]["available_cores"] == 1
+    assert state.pods_on_node(added["node_id"]) == {launched["pod"]["id"]}
+
+
+def test_malformed_body_is_a_bad_request(state):
+    async def send():
+        async with TestClient(TestServer(async_server.create_app())) as client:
+            response = await client.post("/add_node", data="{not json", headers={"Content-Type": "application/json"})
+            return response.status
+    assert asyncio.run(send()) == 400
+
+
+def test_replication_requests_run_off_the_event_loop(state, monkeypatch):
+    replica = Replicator(state, HealthMonitor(state), "http://127.0.0.1:8", ["http://127.0.0.1:9"])
+    monkeypatch.setattr(api_server, "replica", replica)
+
+    async def send():
+        async with TestClient(TestServer(async_server.create_app())) as client:
+            bad = await client.post("/replication/vote", data="{not json",
+                                    headers={"Content-Type": "application/json"})
+            vote = await client.post("/replication/vote",
+                                     json={"term": 1, "candidate": "a", "last_index": 0, "last_term": 0})
+            return bad.status, vote.status, await vote.json()
+
+    bad, status, vote = asyncio.run(send())
+    assert bad == 400
+    assert status == 200 and vote == {"term": 1, "granted": True}
@@ -0,0 +1,179 @@
+import time
+
+import pytest
+
+import api_server
+from autoscaler import Autoscaler, parse_shape, plan_nodes
+from cluster_state import ClusterState
+from node_manager import FakeBackend, NodeManager
+from pending import PendingQueue
+from scheduler import Scheduler
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def clock():
+    return [1000.0]
+
+
+@pytest.fixture
+def cluster(clock):
+    state = ClusterState(clock=lambda: clock[0])
+    scheduler = Scheduler(state)
+    queue = PendingQueue(state, scheduler)
+    manager = NodeManager(FakeBackend())
+    autoscalers = []
+
+    def make(**options):
+        options.setdefault("scale_in_after", 60)
+        autoscaler = Autoscaler(state, scheduler, queue, manager, **options)
+        autoscalers.append(autoscaler)
+        return autoscaler
+
+    yield state, queue, manager, make
+    for autoscaler in autoscalers:
+        autoscaler.stop()
+
+
+def test_parse_shape():
+    assert parse_shape("8") == (8, {})
+    assert parse_shape("16:memory=65536,gpu=1") == (16, {"memory": 65536, "gpu": 1})
+    for text in ("", "0", "big", "8:gpu"):
+        with pytest.raises(ValueError):
+            parse_shape(text)
+
+
+def test_plan_packs_small_backlogs_onto_small_nodes():
+    shapes = [(4, {}), (16, {})]
+    assert plan_nodes({(1, ()): 3}, shapes) == ([(4, {})], 0)
+    assert plan_nodes({(2, ()): 20}, shapes) == ([(16, {}), (16, {}), (16, {})], 0)
+
+
+def test_plan_counts_nodes_in_flight_and_the_limit():
+    shapes = [(8, {})]
+    assert plan_nodes({(4, ()): 2}, shapes, in_flight=[(8, {})]) == ([], 0)
+    assert plan_nodes({(4, ()): 6}, shapes, limit=2) == ([(8, {}), (8, {})], 2)
+
+
+def test_plan_skips_pods_no_shape_fits():
+    shapes = [(8, {})]
+    assert plan_nodes({(16, ()): 1, (2, (("gpu", 1),)): 1}, shapes) == ([], 2)
+    assert plan_nodes({(2, (("gpu", 1),)): 3}, [(8, {}), (8, {"gpu": 2})]) == ([(8, {"gpu": 2}), (8, {"gpu": 2})], 0)
+
+
+def test_pending_pods_get_a_node_and_are_placed(cluster):
+    state, queue, manager, make = cluster
+    autoscaler = make(shapes=[(4, {}), (16, {})])
+    with state.lock:
+        pod_id = queue.add(3)["id"]
+
+    launches, drained = autoscaler.evaluate()
+
+    assert launches == [(4, {})] and drained is None
+    wait_for(lambda: pod_id in state.pods)
+    node_id = state.pods[pod_id].assigned_node
+    assert node_id in autoscaler.provisioned and len(manager.backend.names) == 1
+    # The launched node covers the demand; nothing more is added
+    assert autoscaler.evaluate() == ([], None)
+
+
+def test_max_nodes_caps_scale_out(cluster):
+    state, queue, manager, make = cluster
+    autoscaler = make(shapes=[(4, {})], max_nodes=2)
+    with state.lock:
+        for _ in range(5):
+            queue.add(4)
+
+    launches, _ = autoscaler.evaluate()
+
+    assert len(launches) == 2
+    wait_for(lambda: len(state.nodes) == 2)
+    assert autoscaler.status()["pods_over_max_nodes"] == 3
+
+
+def test_min_nodes_are_kept(cluster):
+    state, queue, manager, make = cluster
+    autoscaler = make(shapes=[(4, {}), (8, {})], min_nodes=2)
+    assert autoscaler.evaluate()[0] == [(4, {}), (4, {})]
+    wait_for(lambda: len(state.nodes) == 2)
+    assert autoscaler.evaluate() == ([], None)
+
+
+def test_idle_node_is_drained_after_scale_in_after(cluster, clock):
+    state, queue, manager, make = cluster
+    autoscaler = make(shapes=[(4, {})])
+    with state.lock:
+        pod_id = queue.add(2)["id"]
+    autoscaler.evaluate()
+    wait_for(lambda: pod_id in state.pods)
+    node_id = state.pods[pod_id].assigned_node
+
+    with state.lock:
+        state.remove_pod(pod_id)
+        state.add_node(4)  # Somewhere to run pods once the node is gone
+    assert autoscaler.evaluate() == ([], None)  # Underused from now
+    clock[0] += 59
+    assert autoscaler.evaluate() == ([], None)
+    clock[0] += 1
+    assert autoscaler.evaluate() == ([], node_id)
+
+    assert node_id not in state.nodes
+    wait_for(lambda: not manager.backend.names)
+
+
+def test_node_whose_pods_fit_nowhere_else_is_kept(cluster, clock):
+    state, queue, manager, make = cluster
+    autoscaler = make(shapes=[(8, {})], scale_in_utilization=0.5, scale_out_utilization=0.99)
+    with state.lock:
+        pod_id = queue.add(1)["id"]
+    autoscaler.evaluate()
+    wait_for(lambda: pod_id in state.pods)
+    with state.lock:
+        # A full node nobody provisioned, so the pod has nowhere to go
+        state.add_pod(4, state.add_node(4).id)
+
+    autoscaler.evaluate()
+    clock[0] += 60
+    assert autoscaler.evaluate() == ([], None)
+    assert state.pods[pod_id].assigned_node in autoscaler.provisioned
+
+
+def test_node_removed_through_the_api_is_torn_down(cluster):
+    state, queue, manager, make = cluster
+    autoscaler = make(min_nodes=1)
+    autoscaler.evaluate()
+    wait_for(lambda: state.nodes)
+    node_id, = state.nodes
+
+    with state.lock:
+        state.remove_node(node_id)
+
+    assert not autoscaler.provisioned
+    wait_for(lambda: not manager.backend.names)
+
+
+def test_follower_does_not_scale(cluster):
+    state, queue, manager, make = cluster
+    autoscaler = make(min_nodes=1, active=lambda: False)
+    assert autoscaler.evaluate() == ([], None)
+    assert not autoscaler.provisioning
+
+
+def test_rejected_request_is_demand(client, state, monkeypatch):
+    autoscaler = Autoscaler(state, api_server.scheduler, api_server.pending, NodeManager(FakeBackend()),
+                            shapes=[(8, {})])
+    monkeypatch.setattr(api_server, "autoscaler", autoscaler)
+    try:
+        assert client.post("/launch_pod", json={"cpu_cores": 6, "queue": False}).status_code == 503
+        assert autoscaler.evaluate()[0] == [(8, {})]
+        wait_for(lambda: state.nodes)
+        assert client.post("/launch_pod", json={"cpu_cores": 6, "queue": False}).status_code == 200
+        assert client.get("/autoscaler").get_json()["provisioned_nodes"] == list(state.nodes)
+    finally:
+        autoscaler.stop()
@@ -0,0 +1,84 @@
+import asyncio
+import time
+
+import pytest
+
+from cluster_client import AsyncClusterClient, ClusterClient, ClusterError
+
+
+@pytest.fixture
+def client(server_url):
+    with ClusterClient(server_url, backoff=0.01) as client:
+        yield client
+
+
+def test_gpu_pod_lands_on_gpu_node(client):
+    client.add_node(8)
+    gpu_node = client.add_node(8, {"gpu": 2})["node_id"]
+
+    pod = client.launch_pod(1, {"gpu": 1})["pod"]
+
+    assert pod["assigned_node"] == gpu_node
+    assert pod["resources"] == {"gpu": 1}
+
+
+def test_error_responses_raise_with_their_status(client):
+    with pytest.raises(ClusterError) as error:
+        client.launch_pod(4)
+    assert error.value.status == 503
+    assert error.value.body["message"] == "No suitable node available"
+
+    with pytest.raises(ClusterError) as error:
+        client.remove_pod("pod-404")
+    assert error.value.status == 404
+
+
+def test_unreachable_server_raises_after_retries():
+    client = ClusterClient("http://127.0.0.1:9", retries=2, backoff=0.01)
+    with pytest.raises(ClusterError) as error:
+        client.ping()
+    assert error.value.status is None
+
+
+def test_only_idempotent_requests_are_retried_after_reaching_the_server():
+    client = ClusterClient(retries=2)
+    assert client._should_retry(1, idempotent=True, status=503)
+    assert not client._should_retry(1, idempotent=True, status=400)
+    assert not client._should_retry(1, idempotent=False, status=503)
+    assert client._should_retry(1, idempotent=False, connect_failed=True)
+    assert not client._should_retry(3, idempotent=True, status=503)
+
+
+def test_listing_follows_every_page(client):
+    node_ids = [client.add_node(2)["node_id"] for _ in range(5)]
+    assert [node["id"] for node in client.iter_pages("/list_nodes", "nodes", page_size=2)] == node_ids
+    assert len(client.list_nodes(status="Healthy")) == 5
+
+
+def test_parallel_launches_share_the_pool(client, state):
+    client.add_node(4)
+    results = client.launch_pods_parallel([1] * 6, workers=6)
+
+    placed = [result for result in results if not isinstance(result, ClusterError)]
+    assert len(placed) == 4 and len(state.pods) == 4
+    assert all(result.status == 503 for result in results if isinstance(result, ClusterError))
+
+
+def test_heartbeat_carries_its_timestamp(client, state):
+    node_id = client.add_node(2)["node_id"]
+    state.node_heartbeat[node_id] -= 10
+    taken = time.time() - 3
+
+    assert client.heartbeat(node_id, {"cpu_load": 0.5}, timestamp=taken)["pods"] == {}
+    assert state.node_heartbeat[node_id] == taken
+
+
+def test_async_client(server_url):
+    async def run():
+        async with AsyncClusterClient(server_url) as client:
+            node_id = (await client.add_node(4, {"gpu": 1}))["node_id"]
+            pod = (await client.launch_pod(1, {"gpu": 1}))["pod"]
+            return node_id, pod
+
+    node_id, pod = asyncio.run(run())
+    assert pod["assigned_node"] == node_id
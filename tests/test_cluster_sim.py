@@ -0,0 +1,34 @@
+import pytest
+
+from cluster_sim import DAY, HOUR, ClusterSimulation, FailureModel, Workload
+
+WALL_CLOCK = ("wall_seconds", "speedup")
+
+
+def simulate(seed, days=2, **failures):
+    node_cores = [4, 8, 16] * 10
+    model = FailureModel(node_mtbf=failures.pop("node_mtbf", 2 * DAY), node_mttr=1800, racks=3,
+                         rack_mtbf=failures.pop("rack_mtbf", None), **failures)
+    load = Workload.for_load(0.7, sum(node_cores), 2 * HOUR, [1, 2, 4], [0.5, 0.3, 0.2])
+    stats = ClusterSimulation(node_cores, model, load, seed=seed).run(days * DAY)
+    return {key: value for key, value in stats.items() if key not in WALL_CLOCK}
+
+
+def test_same_seed_gives_the_same_run():
+    assert simulate(3) == simulate(3)
+    assert simulate(3) != simulate(4)
+
+
+def test_failures_are_detected_within_the_heartbeat_window():
+    stats = simulate(1, days=4)
+    lags = stats["detection_lag_seconds"]
+    assert lags["count"] > 0
+    # Detected one timeout after the last heartbeat, which is up to one interval before the failure
+    assert 10 <= lags["mean"] and lags["max"] <= 15
+    assert 0 < stats["utilization"] < 1
+
+
+def test_no_failures_keeps_every_node_healthy():
+    stats = simulate(2, node_mtbf=None)
+    assert stats["detection_lag_seconds"]["count"] == 0
+    assert stats["healthy_node_fraction"] == pytest.approx(1.0)
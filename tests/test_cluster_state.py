@@ -0,0 +1,93 @@
+import pytest
+
+from cluster_state import ClusterState
+
+
+def assert_indexes_consistent(state):
+    for node_id, node in state.nodes.items():
+        assert state.pods_by_node[node_id] is node.pods
+        assert node.available_cores == node.cpu_cores - sum(
+            state.pods[pod_id].cpu_cores for pod_id in node.pods)
+    for pod_id, pod in state.pods.items():
+        assert pod_id in state.pods_by_node[pod.assigned_node]
+    assert set(state.pods_by_node) == set(state.nodes) == set(state.node_heartbeat)
+
+
+def test_indexes_follow_adds_moves_and_removes():
+    state = ClusterState()
+    first = state.add_node(4)
+    second = state.add_node(8)
+    pods = [state.add_pod(2, first.id), state.add_pod(1, first.id), state.add_pod(3, second.id)]
+    assert_indexes_consistent(state)
+
+    state.move_pod(pods[0].id, second.id)
+    assert_indexes_consistent(state)
+    assert state.pods_on_node(first.id) == {pods[1].id}
+
+    assert state.remove_pod(pods[1].id) is pods[1]
+    assert state.remove_pod(pods[1].id) is None
+    assert_indexes_consistent(state)
+    assert first.available_cores == 4
+
+    state.remove_node(first.id)
+    assert_indexes_consistent(state)
+    assert state.get_node(first.id) is None
+    assert state.pods_on_node(first.id) == set()
+
+
+def test_ids_are_never_reused():
+    state = ClusterState()
+    node = state.add_node(4)
+    pod = state.add_pod(1, node.id)
+    state.remove_pod(pod.id)
+    state.remove_node(node.id)
+
+    assert state.add_node(4).id != node.id
+    assert state.add_pod(1, state.add_node(2).id).id != pod.id
+
+
+def test_node_status_changes_are_notified():
+    state = ClusterState()
+    events = []
+    state.subscribe(lambda kind, event_type, obj: events.append((kind, event_type, obj.id)))
+    node_id = state.add_node(4).id
+
+    assert state.node_status(node_id) == "Healthy"
+    assert state.set_node_status(node_id, "Unhealthy")
+    assert not state.set_node_status(node_id, "Unhealthy")
+    assert state.record_heartbeat(node_id, timestamp=1000)
+    assert events == [("node", "ADDED", node_id), ("node", "MODIFIED", node_id), ("node", "HEARTBEAT", node_id)]
+    assert state.node_status("node-404") == "Unknown"
+    assert not state.record_heartbeat("node-404")
+
+
+def test_pods_launched_through_the_api_are_indexed(client, state):
+    node_id = client.post("/add_node", json={"cpu_cores": 4}).get_json()["node_id"]
+    pod_id = client.post("/launch_pod", json={"cpu_cores": 3}).get_json()["pod"]["id"]
+
+    assert state.pods_on_node(node_id) == {pod_id}
+    assert client.post("/remove_pod", json={"pod_id": pod_id}).status_code == 200
+    assert client.get("/list_nodes").get_json()["nodes"][0]["available_cores"] == 4
+    assert_indexes_consistent(state)
+
+
+def test_heartbeats_never_move_back():
+    state = ClusterState()
+    node_id = state.add_node(4).id
+    latest = state.node_heartbeat[node_id] + 10
+    state.record_heartbeat(node_id, timestamp=latest)
+    state.record_heartbeat(node_id, timestamp=latest - 5)
+    assert state.node_heartbeat[node_id] == latest
+
+
+def test_records_are_slotted():
+    state = ClusterState()
+    node = state.add_node(4)
+    pod = state.add_pod(1, node.id)
+    for record in (node, pod):
+        assert not hasattr(record, "__dict__")
+        with pytest.raises(AttributeError):
+            record.cpu = 2
+        with pytest.raises(TypeError):
+            record["cpu_cores"]
+    assert pod.to_dict()["assigned_node"] == node.id
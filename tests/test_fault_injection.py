@@ -0,0 +1,90 @@
+import json
+import random
+
+import pytest
+
+from fault_injection import FaultMap, outage_start, validate_fault, write_fault_map
+
+
+@pytest.mark.parametrize("fault", [
+    {"mode": "crash"},
+    {"mode": "delay"},
+    {"mode": "delay", "seconds": 0},
+    {"mode": "loss"},
+    {"mode": "loss", "probability": 1.5},
+    {"mode": "flap"},
+    {"mode": "flap", "period": 10, "down": 1},
+])
+def test_malformed_faults_are_rejected(fault):
+    with pytest.raises(ValueError):
+        validate_fault(fault)
+
+
+def test_validation_fills_in_defaults():
+    fault = validate_fault({"mode": "flap", "period": 10})
+    assert fault["down"] == 0.5 and "since" in fault
+    assert validate_fault({"mode": "drop", "since": 5}) == {"mode": "drop", "since": 5}
+
+
+def test_outage_start():
+    assert outage_start({"mode": "drop", "since": 100}, 130) == 100
+    assert outage_start({"mode": "delay", "seconds": 2, "since": 100}, 130) == 100
+    assert outage_start({"mode": "loss", "probability": 0.5, "since": 100}, 130) is None
+    # A flapping node's outage starts with the current cycle
+    flap = {"mode": "flap", "period": 10, "down": 0.5, "since": 100}
+    assert outage_start(flap, 123) == 120
+    assert outage_start(flap, 95) == 100
+
+
+def fault_map(tmp_path, faults, **options):
+    path = str(tmp_path / "faults.json")
+    write_fault_map(path, faults)
+    return path, FaultMap(path, check_interval=0, **options)
+
+
+def test_heartbeat_delay_by_mode(tmp_path):
+    path, faults = fault_map(tmp_path, {
+        "node-1": {"mode": "drop", "since": 0},
+        "node-2": {"mode": "delay", "seconds": 3, "since": 0},
+        "node-3": {"mode": "loss", "probability": 1, "since": 0},
+        "node-4": {"mode": "loss", "probability": 0, "since": 0},
+    })
+    assert faults.heartbeat_delay("node-1") is None
+    assert faults.heartbeat_delay("node-2") == 3
+    assert faults.heartbeat_delay("node-3") is None
+    assert faults.heartbeat_delay("node-4") == 0
+    assert faults.heartbeat_delay("node-5") == 0
+
+
+def test_partial_loss_follows_the_rng(tmp_path):
+    path, faults = fault_map(tmp_path, {"node-1": {"mode": "loss", "probability": 0.3, "since": 0}},
+                             rng=random.Random(7))
+    lost = sum(faults.heartbeat_delay("node-1") is None for _ in range(1000))
+    assert 250 < lost < 350
+
+
+def test_flap_phases(tmp_path):
+    path, faults = fault_map(tmp_path, {"node-1": {"mode": "flap", "period": 10, "down": 0.3, "since": 100}})
+    assert faults.heartbeat_delay("node-1", now=95) == 0  # Not started yet
+    assert faults.heartbeat_delay("node-1", now=101) is None
+    assert faults.heartbeat_delay("node-1", now=104) == 0
+    assert faults.heartbeat_delay("node-1", now=112) is None
+
+
+def test_missing_file_means_no_faults(tmp_path):
+    path, faults = fault_map(tmp_path, {"node-1": {"mode": "drop", "since": 0}})
+    assert faults.heartbeat_delay("node-1") is None
+    tmp_path.joinpath("faults.json").unlink()
+    assert faults.heartbeat_delay("node-1") == 0
+    assert FaultMap(str(tmp_path / "absent.json")).heartbeat_delay("node-1") == 0
+
+
+def test_partially_written_file_keeps_previous_faults(tmp_path):
+    path, faults = fault_map(tmp_path, {"node-1": {"mode": "drop", "since": 0}})
+    assert faults.heartbeat_delay("node-1") is None
+    with open(path, "w") as f:
+        f.write(json.dumps({"faults": {}})[:5])
+    assert faults.heartbeat_delay("node-1") is None
+
+    write_fault_map(path, {})
+    assert faults.heartbeat_delay("node-1") == 0
@@ -0,0 +1,41 @@
+import asyncio
+import time
+
+import fleet_sim
+from fault_injection import FaultMap, write_fault_map
+from fleet_sim import FleetSimulator, parse_core_distribution
+
+
+def test_core_distribution_weights_default_to_one():
+    assert parse_core_distribution("4:0.5,8:0.3,16") == ([4, 8, 16], [0.5, 0.3, 1.0])
+
+
+def test_fleet_registers_and_heartbeats_every_node(server_url, state, monkeypatch):
+    monkeypatch.setattr(fleet_sim, "API_SERVER_URL", server_url)
+    heartbeats = set()
+    state.subscribe(lambda kind, event_type, obj: event_type == "HEARTBEAT" and heartbeats.add(obj.id))
+    simulator = FleetSimulator(20, [2, 4], [1, 1], heartbeat_interval=0.2, connections=4, seed=1)
+
+    asyncio.run(simulator.run(duration=1, report_interval=10))
+
+    assert sorted(node.cpu_cores for node in state.nodes.values()) == sorted(
+        node.cpu_cores for node in simulator.nodes)
+    assert heartbeats == set(state.nodes)
+
+
+def test_delayed_heartbeats_arrive_late_with_their_timestamp(server_url, state, monkeypatch, tmp_path):
+    monkeypatch.setattr(fleet_sim, "API_SERVER_URL", server_url)
+    path = str(tmp_path / "faults.json")
+    write_fault_map(path, {"node-1": {"mode": "delay", "seconds": 0.5, "since": 0}})
+    arrivals = {}
+    state.subscribe(lambda kind, event_type, obj: event_type == "HEARTBEAT" and arrivals.setdefault(
+        obj.id, []).append(time.time() - state.node_heartbeat[obj.id]))
+    simulator = FleetSimulator(2, [2], [1], heartbeat_interval=0.1, connections=4, seed=1,
+                               faults=FaultMap(path, check_interval=0))
+
+    asyncio.run(simulator.run(duration=1.5, report_interval=10))
+
+    assert min(arrivals["node-1"]) >= 0.45
+    assert max(arrivals["node-2"]) < 0.45
+    # Held back in transit, not rate-limited: the delayed node keeps the schedule
+    assert len(arrivals["node-1"]) >= len(arrivals["node-2"]) - 6
@@ -0,0 +1,150 @@
+import api_server
+from cluster_state import ClusterState
+from health_monitor import HealthMonitor
+
+
+def make_cluster(*cores):
+    """
+    A monitor with a 15 second timeout over nodes of the given cores
+
+    Returns:
+        (state, monitor, node ids, time of every node's last heartbeat)
+    """
+    state = ClusterState()
+    monitor = HealthMonitor(state, heartbeat_timeout=15)
+    node_ids = [state.add_node(count).id for count in cores]
+    start = max(state.node_heartbeat.values())
+    for node_id in node_ids:
+        state.record_heartbeat(node_id, timestamp=start)
+    return state, monitor, node_ids, start
+
+
+def test_node_fails_once_its_deadline_passes():
+    state, monitor, (node_id,), t = make_cluster(4)
+
+    assert monitor.check_expired(t + 14) == []
+    assert monitor.check_expired(t + 15) == [node_id]
+    assert state.node_status(node_id) == "Unhealthy"
+    assert monitor.check_expired(t + 30) == []
+
+
+def test_heartbeats_move_the_deadline_without_growing_the_heap():
+    state, monitor, (node_id,), t = make_cluster(4)
+    for offset in range(1, 100):
+        state.record_heartbeat(node_id, timestamp=t + offset)
+    assert len(monitor.deadlines) == 1
+
+    assert monitor.check_expired(t + 20) == []
+    assert monitor.next_deadline() == t + 114
+    assert monitor.check_expired(t + 114) == [node_id]
+
+
+def test_only_expired_nodes_fail():
+    state, monitor, (quiet, busy), t = make_cluster(4, 4)
+    state.record_heartbeat(busy, timestamp=t + 10)
+    assert monitor.check_expired(t + 20) == [quiet]
+
+
+def test_failed_node_pods_move_to_healthy_nodes():
+    state, monitor, (failed, healthy), t = make_cluster(4, 4)
+    pod_id = state.add_pod(3, failed).id
+    state.record_heartbeat(healthy, timestamp=t + 10)
+
+    monitor.check_expired(t + 20)
+
+    assert state.get_pod(pod_id).assigned_node == healthy
+    assert state.get_node(failed).available_cores == 4
+
+
+
+def test_pods_of_nodes_failing_together_are_placed_as_one_batch():
+    state, monitor, (first, second, healthy), t = make_cluster(4, 4, 8)
+    pods = [state.add_pod(3, first).id, state.add_pod(1, first).id, state.add_pod(4, second).id]
+    state.record_heartbeat(healthy, timestamp=t + 10)
+
+    assert monitor.check_expired(t + 20) == [first, second]
+
+    assert {state.get_pod(pod_id).assigned_node for pod_id in pods} == {healthy}
+    assert state.get_node(healthy).available_cores == 0
+    assert len(monitor.queue) == 0
+
+
+def test_pods_that_fit_nowhere_wait_for_a_new_node():
+    state, monitor, (failed, small), t = make_cluster(4, 2)
+    pod_id = state.add_pod(3, failed).id
+    state.record_heartbeat(small, timestamp=t + 10)
+
+    monitor.check_expired(t + 20)
+    assert pod_id in monitor.queue
+    assert state.get_pod(pod_id).assigned_node == failed
+
+    added = state.add_node(4).id
+    assert [pod.id for pod in monitor.queue.drain()] == [pod_id]
+    assert state.get_pod(pod_id).assigned_node == added
+    assert len(monitor.queue) == 0
+
+
+def test_removed_pod_leaves_the_pending_queue():
+    state, monitor, (failed,), t = make_cluster(4)
+    pod_id = state.add_pod(3, failed).id
+    monitor.check_expired(t + 20)
+    assert pod_id in monitor.queue
+
+    state.remove_pod(pod_id)
+    assert pod_id not in monitor.queue
+
+
+def test_pending_pods_stay_when_their_node_recovers():
+    state, monitor, (failed,), t = make_cluster(4)
+    pod_id = state.add_pod(3, failed).id
+    monitor.check_expired(t + 20)
+
+    state.record_heartbeat(failed, timestamp=t + 21)
+    assert pod_id not in monitor.queue
+    assert monitor.queue.drain() == []
+    assert state.get_pod(pod_id).assigned_node == failed
+
+def test_heartbeat_recovers_failed_node():
+    state, monitor, (node_id,), t = make_cluster(4)
+    monitor.check_expired(t + 20)
+    state.record_heartbeat(node_id, timestamp=t + 21)
+
+    assert state.node_status(node_id) == "Healthy"
+    assert monitor.check_expired(t + 35) == []
+    assert monitor.check_expired(t + 36) == [node_id]
+
+
+def test_removed_node_is_dropped():
+    state, monitor, (node_id,), t = make_cluster(4)
+    state.remove_node(node_id)
+    assert monitor.check_expired(t + 20) == []
+
+
+def test_server_stops_placing_pods_on_failed_nodes(client, state):
+    first = client.post("/add_node", json={"cpu_cores": 4}).get_json()["node_id"]
+    second = client.post("/add_node", json={"cpu_cores": 4}).get_json()["node_id"]
+    now = state.node_heartbeat[second]
+    state.record_heartbeat(second, timestamp=now + 10)
+
+    api_server.monitor.check_expired(now + 20)
+
+    nodes = {node["id"]: node["status"] for node in client.get("/list_nodes").get_json()["nodes"]}
+    assert nodes == {first: "Unhealthy", second: "Healthy"}
+    assert client.post("/launch_pod", json={"cpu_cores": 1}).get_json()["pod"]["assigned_node"] == second
+
+
+def test_stale_heartbeat_after_expiry_does_not_recover_node():
+    state = ClusterState()
+    monitor = HealthMonitor(state, heartbeat_timeout=15)
+    node_id = state.add_node(4).id
+    now = state.node_heartbeat[node_id]
+    state.node_heartbeat[node_id] = now - 20
+    assert monitor.check_expired(now + 15) == [node_id]
+
+    # A heartbeat held back in transit arrives with a timestamp already past its deadline
+    state.record_heartbeat(node_id, timestamp=now - 16)
+    assert state.node_status(node_id) == "Unhealthy"
+    assert monitor.check_expired(now + 30) == []
+
+    state.record_heartbeat(node_id)
+    assert state.node_status(node_id) == "Healthy"
@@ -0,0 +1,65 @@
+import time
+
+
+def add_nodes(client, count):
+    return [client.post("/add_node", json={"cpu_cores": 4}).get_json()["node_id"] for _ in range(count)]
+
+
+def test_batch_updates_every_node_and_reports_unknown_ones(client, state):
+    node_ids = add_nodes(client, 2)
+    sent = time.time()
+    body = client.post("/heartbeats", json={"heartbeats": [
+        {"node_id": node_ids[0], "timestamp": sent},
+        node_ids[1],
+        {"node_id": "node-404"},
+    ]}).get_json()
+
+    assert body["received"] == 2
+    assert body["unknown"] == ["node-404"]
+    assert state.node_heartbeat[node_ids[0]] == sent
+
+
+def test_duplicates_coalesce_to_the_latest_heartbeat(client, state):
+    node_id, = add_nodes(client, 1)
+    now = time.time()
+    body = client.post("/heartbeats", json={"heartbeats": [
+        {"node_id": node_id, "timestamp": now, "metrics": {"cpu_load": 0.5}},
+        {"node_id": node_id, "timestamp": now - 5, "metrics": {"cpu_load": 0.9}},
+    ]}).get_json()
+
+    assert body["received"] == 1
+    assert state.node_heartbeat[node_id] == now
+    assert state.node_metrics[node_id] == {"cpu_load": 0.5}
+
+
+def test_future_timestamps_are_capped(client, state):
+    node_id, = add_nodes(client, 1)
+    client.post("/heartbeats", json={"heartbeats": [{"node_id": node_id, "timestamp": time.time() + 3600}]})
+    assert state.node_heartbeat[node_id] <= time.time()
+
+
+def test_bad_batches_are_rejected(client):
+    node_id, = add_nodes(client, 1)
+    assert client.post("/heartbeats", json={"heartbeats": node_id}).status_code == 400
+    assert client.post("/heartbeats", json={"heartbeats": [{"node_id": node_id, "timestamp": "soon"}]}).status_code == 400
+
+
+def test_delayed_heartbeat_keeps_its_timestamp(client, state):
+    node_id, = add_nodes(client, 1)
+    state.node_heartbeat[node_id] -= 10
+    taken = time.time() - 3
+    assert client.post("/heartbeat", json={"node_id": node_id, "timestamp": taken}).status_code == 200
+    assert state.node_heartbeat[node_id] == taken
+
+
+def test_single_heartbeat_future_timestamp_is_capped(client, state):
+    node_id, = add_nodes(client, 1)
+    client.post("/heartbeat", json={"node_id": node_id, "timestamp": time.time() + 3600})
+    assert state.node_heartbeat[node_id] <= time.time()
+
+
+def test_single_heartbeat_bad_timestamp(client):
+    node_id, = add_nodes(client, 1)
+    response = client.post("/heartbeat", json={"node_id": node_id, "timestamp": "soon"})
+    assert response.status_code == 400
+    assert response.get_json()["message"] == "Heartbeat timestamp must be a number"
@@ -0,0 +1,74 @@
+import pytest
+
+
+def add_nodes(client, *cores):
+    return [client.post("/add_node", json={"cpu_cores": count}).get_json()["node_id"] for count in cores]
+
+
+def pages(client, path, key, **params):
+    """Follow next_cursor through every page; returns the ids of each page"""
+    result, cursor = [], None
+    while True:
+        query = dict(params, **({"cursor": cursor} if cursor else {}))
+        body = client.get(path, query_string=query).get_json()
+        result.append([item["id"] for item in body[key]])
+        cursor = body["next_cursor"]
+        if cursor is None:
+            return result
+
+
+def test_summary_follows_every_change(client, state):
+    node_ids = add_nodes(client, 4, 8)
+    pod_ids = [client.post("/launch_pod", json={"cpu_cores": 3}).get_json()["pod"]["id"] for _ in range(3)]
+    client.post("/remove_pod", json={"pod_id": pod_ids[0]})
+    state.set_node_status(node_ids[1], "Unhealthy")
+
+    summary = client.get("/cluster_summary").get_json()
+
+    assert summary["total_nodes"] == 2 and summary["healthy_nodes"] == 1 and summary["unhealthy_nodes"] == 1
+    assert summary["total_cores"] == 12
+    assert summary["available_cores"] == sum(node.available_cores for node in state.nodes.values()) == 6
+    assert summary["total_pods"] == 2
+    assert summary["utilization"] == 0.5
+
+
+def test_pages_cover_every_node_once(client):
+    node_ids = add_nodes(client, *[4] * 7)
+    client.post("/remove_node", json={"node_id": node_ids[3]})
+
+    result = pages(client, "/list_nodes", "nodes", limit=3)
+
+    assert [len(page) for page in result] == [3, 3]
+    assert sum(result, []) == node_ids[:3] + node_ids[4:]
+
+
+def test_pod_pages_filter_by_node(client):
+    first, second = add_nodes(client, 8, 8)
+    pod_ids = [client.post("/launch_pod", json={"cpu_cores": 1}).get_json()["pod"]["id"] for _ in range(5)]
+    client.post("/remove_node", json={"node_id": first, "force": True})  # Moves every pod to the second node
+    extra = client.post("/launch_pod", json={"cpu_cores": 1}).get_json()["pod"]["id"]
+
+    assert sum(pages(client, "/list_pods", "pods", limit=2), []) == pod_ids + [extra]
+    assert sum(pages(client, "/list_pods", "pods", limit=4, node=second), []) == pod_ids + [extra]
+
+
+def test_nodes_filter_by_free_cores_and_status(client, state):
+    small, large, failed = add_nodes(client, 2, 8, 8)
+    state.set_node_status(failed, "Unhealthy")
+
+    assert pages(client, "/list_nodes", "nodes", min_free_cores=4) == [[large, failed]]
+    assert pages(client, "/list_nodes", "nodes", status="healthy") == [[small, large]]
+
+
+@pytest.mark.parametrize("path, query", [
+    ("/list_pods", {"cursor": "node-1"}),
+    ("/list_pods", {"cursor": "node-1", "node": "node-1"}),
+    ("/list_nodes", {"cursor": "pod-1"}),
+    ("/list_nodes", {"cursor": "first"}),
+    ("/list_nodes", {"limit": "0"}),
+    ("/list_pods", {"limit": "ten"}),
+])
+def test_bad_page_parameters_are_rejected(client, path, query):
+    add_nodes(client, 4)
+    client.post("/launch_pod", json={"cpu_cores": 1})
+    assert client.get(path, query_string=query).status_code == 400
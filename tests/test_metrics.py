@@ -0,0 +1,70 @@
+import pytest
+
+from metrics import CONTENT_TYPE, Counter, Gauge, Histogram, Registry, _Metric
+
+
+def test_counter_text():
+    registry = Registry()
+    requests = Counter("requests_total", "Requests served", ("route", "status"), registry=registry)
+    requests.labels("/add_node", 200).inc()
+    requests.labels("/add_node", 200).inc(2)
+    requests.labels('/a"b', 404).inc()
+
+    assert registry.render() == (
+        '# HELP requests_total Requests served\n'
+        '# TYPE requests_total counter\n'
+        'requests_total{route="/add_node",status="200"} 3\n'
+        'requests_total{route="/a\\"b",status="404"} 1\n')
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = Registry()
+    latency = Histogram("latency_seconds", "Latency", buckets=(0.1, 1), registry=registry)
+    for value in (0.05, 0.1, 0.5, 3):
+        latency.observe(value)
+
+    assert registry.render().splitlines()[2:] == [
+        'latency_seconds_bucket{le="0.1"} 2',
+        'latency_seconds_bucket{le="1"} 3',
+        'latency_seconds_bucket{le="+Inf"} 4',
+        'latency_seconds_sum 3.65',
+        'latency_seconds_count 4']
+
+
+def test_gauge_reads_its_function_at_collection():
+    registry = Registry()
+    values = {("Healthy",): 2}
+    Gauge("nodes", "Nodes", lambda: values, ("status",), registry=registry)
+    values[("Unhealthy",)] = 1.0
+
+    assert registry.render().splitlines()[2:] == ['nodes{status="Healthy"} 2', 'nodes{status="Unhealthy"} 1']
+
+
+def test_wrong_label_count_is_rejected():
+    counter = Counter("c_total", "C", ("a", "b"), registry=None)
+    with pytest.raises(ValueError):
+        counter.labels("x")
+
+
+def test_metric_families_must_define_children_and_samples():
+    with pytest.raises(TypeError):
+        _Metric("m", "M", registry=None)
+
+    class Incomplete(_Metric):
+        def samples(self):
+            return []
+    with pytest.raises(TypeError):
+        Incomplete("m", "M", registry=None)
+
+
+def test_metrics_endpoint(client):
+    client.post("/add_node", json={"cpu_cores": 4})
+    client.post("/launch_pod", json={"cpu_cores": 1})
+
+    response = client.get("/metrics")
+    assert response.content_type == CONTENT_TYPE
+    lines = response.get_data(as_text=True).splitlines()
+    assert 'cluster_nodes{status="Healthy"} 1' in lines
+    assert 'cluster_cpu_cores{state="available"} 3' in lines
+    assert any(line.startswith('cluster_http_requests_total{route="/launch_pod",method="POST",status="200"} ')
+               for line in lines)
@@ -0,0 +1,75 @@
+import concurrent.futures
+import time
+
+import pytest
+
+from node_manager import FakeBackend, NodeManager
+
+
+@pytest.fixture
+def manager():
+    manager = NodeManager(FakeBackend(), pool_size=2, shapes=[(4, {}), (8, {"gpu": 1})])
+    concurrent.futures.wait(manager.fill_pool())
+    yield manager
+    manager.shutdown()
+
+
+def test_warm_node_has_the_requested_size(manager):
+    node = manager.add_node(8, {"gpu": 1})
+    assert node["warm"]
+    assert manager.backend.sizes[node["id"]] == (8, {"gpu": 1})
+
+
+def test_size_without_a_pool_launches_cold(manager):
+    node = manager.add_node(16)
+    assert not node["warm"]
+    assert manager.backend.sizes[node["id"]] == (16, {})
+    assert manager.stats()["warm_idle"] == 4
+
+
+def test_claimed_warm_node_is_replaced(manager):
+    for _ in range(3):
+        assert manager.add_node(4)["warm"]
+    # Each claim launched its replacement on the thread pool
+    deadline = time.time() + 5
+    while manager.stats()["warm_idle"] < 4:
+        assert time.time() < deadline, "timed out"
+        time.sleep(0.01)
+    stats = manager.stats()
+    assert stats["launched_warm"] == 3 and stats["warming"] == 0
+
+
+def test_warm_pool_needs_shapes():
+    with pytest.raises(ValueError):
+        NodeManager(FakeBackend(), pool_size=2)
+
+
+def test_concurrent_adds_get_distinct_nodes():
+    manager = NodeManager(FakeBackend(launch_delay=0.05), workers=8)
+    try:
+        futures = [manager.submit_add(4) for _ in range(8)]
+        nodes = [future.result() for future in futures]
+    finally:
+        manager.shutdown()
+    assert len({node["id"] for node in nodes}) == 8
+    assert len(set(manager.backend.names.values())) == 8
+
+
+def test_remove_and_failure(manager):
+    node = manager.add_node(4)
+    assert manager.is_running(node["id"])
+    assert manager.remove_node(node["id"])
+    assert not manager.is_running(node["id"])
+    assert not manager.remove_node(node["id"])
+
+    node = manager.add_node(4)
+    manager.backend.fail(node["id"])
+    assert not manager.is_running(node["id"])
+
+
+def test_shutdown_removes_idle_warm_nodes():
+    manager = NodeManager(FakeBackend(), pool_size=2, shapes=[(4, {})])
+    concurrent.futures.wait(manager.fill_pool())
+    node = manager.add_node(4)
+    manager.shutdown()
+    assert list(manager.backend.names) == [node["id"]]
@@ -0,0 +1,114 @@
+from cluster_state import ClusterState
+from pending import PendingQueue
+from scheduler import Scheduler
+
+
+def make_queue(*cores):
+    state = ClusterState()
+    scheduler = Scheduler(state)
+    node_ids = [state.add_node(count).id for count in cores]
+    return state, PendingQueue(state, scheduler), node_ids
+
+
+def fill(state, node_id):
+    """Take every free core of a node with one pod"""
+    return state.add_pod(state.get_node(node_id).available_cores, node_id).id
+
+
+def test_queued_pod_keeps_its_reserved_id():
+    state, queue, (node_id,) = make_queue(4)
+    blocker = fill(state, node_id)
+    entry = queue.add(2)
+    assert queue.drain() == []
+
+    state.remove_pod(blocker)
+    placed = queue.drain()
+
+    assert [pod.id for pod in placed] == [entry["id"]]
+    assert state.get_pod(entry["id"]).assigned_node == node_id
+    assert len(queue) == 0
+
+
+def test_higher_priority_first_then_oldest_first():
+    state, queue, (node_id,) = make_queue(4)
+    blocker = fill(state, node_id)
+    first_normal = queue.add(2)["id"]
+    second_normal = queue.add(2)["id"]
+    high = queue.add(2, "high")["id"]
+
+    state.remove_pod(blocker)
+    assert [pod.id for pod in queue.drain()] == [high, first_normal]
+    assert list(queue.entries) == [second_normal]
+    assert queue.stats()["by_priority"] == {"high": 0, "normal": 1, "low": 0}
+
+
+def test_lower_priority_backfills_what_higher_cannot_use():
+    state, queue, (node_id,) = make_queue(4)
+    blocker = fill(state, node_id)
+    queue.add(6, "high")
+    low = queue.add(1, "low")["id"]
+
+    state.remove_pod(blocker)
+    assert [pod.id for pod in queue.drain()] == [low]
+    assert queue.depth["high"] == 1
+
+
+def test_drain_does_nothing_until_capacity_appears():
+    state, queue, (node_id,) = make_queue(4)
+    fill(state, node_id)
+    queue.add(1)
+    assert queue.drain() == []
+
+    state.add_node(2)
+    assert len(queue.drain()) == 1
+
+
+def test_cancelled_pod_is_skipped():
+    state, queue, (node_id,) = make_queue(4)
+    blocker = fill(state, node_id)
+    cancelled = queue.add(2)["id"]
+    kept = queue.add(2)["id"]
+    assert queue.remove(cancelled)["id"] == cancelled
+
+    state.remove_pod(blocker)
+    assert [pod.id for pod in queue.drain()] == [kept]
+    assert cancelled not in state.pods
+
+
+def test_reset_queues_pods_of_unhealthy_nodes():
+    state, queue, (failed, spare) = make_queue(4, 4)
+    pod_id = state.add_pod(3, failed).id
+    queue.add(1)
+    state.set_node_status(failed, "Unhealthy")
+
+    queue.reset()
+    assert list(queue.entries) == [pod_id]
+    assert [pod.id for pod in queue.drain()] == [pod_id]
+    assert state.get_pod(pod_id).assigned_node == spare
+
+
+def test_api_queues_pods_and_places_them_when_a_node_joins(client):
+    response = client.post("/launch_pod", json={"cpu_cores": 2, "queue": True})
+    assert response.status_code == 202
+    pod_id = response.get_json()["pod"]["id"]
+    assert client.post("/launch_pod", json={"cpu_cores": 2}).status_code == 503
+
+    listed = client.get("/pending_pods").get_json()
+    assert listed["depth"] == 1 and listed["pods"][0]["id"] == pod_id
+
+    node_id = client.post("/add_node", json={"cpu_cores": 4}).get_json()["node_id"]
+    pods = client.get("/list_pods").get_json()["pods"]
+    assert [(pod["id"], pod["assigned_node"]) for pod in pods] == [(pod_id, node_id)]
+    assert client.get("/pending_pods").get_json()["depth"] == 0
+
+
+def test_api_cancels_a_pending_pod(client):
+    pod_id = client.post("/launch_pod", json={"cpu_cores": 2, "queue": True}).get_json()["pod"]["id"]
+    assert client.post("/remove_pod", json={"pod_id": pod_id}).get_json()["message"] == "Pending pod cancelled"
+    client.post("/add_node", json={"cpu_cores": 4})
+    assert client.get("/list_pods").get_json()["pods"] == []
+
+
+def test_unknown_priority_is_a_bad_request(client):
+    response = client.post("/launch_pod", json={"cpu_cores": 2, "priority": "urgent"})
+    assert response.status_code == 400
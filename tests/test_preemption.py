@@ -0,0 +1,102 @@
+from cluster_state import ClusterState
+from pending import PendingQueue
+from preemption import Preemptor
+from scheduler import Scheduler
+
+
+def make_cluster():
+    state = ClusterState()
+    scheduler = Scheduler(state)
+    queue = PendingQueue(state, scheduler)
+    return state, Preemptor(state, scheduler, queue), queue
+
+
+def test_evicts_smallest_pod_that_frees_enough():
+    state, preemptor, _ = make_cluster()
+    with state.lock:
+        node_id = state.add_node(4).id
+        state.add_pod(3, node_id, priority="low")
+        small = state.add_pod(1, node_id, priority="low")
+
+        chosen, victims = preemptor.find(1, "high")
+
+    assert chosen == node_id
+    assert [pod.id for pod in victims] == [small.id]
+
+
+def test_evicts_several_pods_when_none_frees_enough_alone():
+    state, preemptor, _ = make_cluster()
+    with state.lock:
+        node_id = state.add_node(6).id
+        state.add_pod(1, node_id, priority="low")
+        medium = state.add_pod(2, node_id, priority="low")
+        large = state.add_pod(3, node_id, priority="low")
+
+        _, victims = preemptor.find(5, "high")
+
+    assert sorted(pod.id for pod in victims) == sorted([medium.id, large.id])
+
+
+def test_lowest_priority_goes_first():
+    state, preemptor, _ = make_cluster()
+    with state.lock:
+        node_id = state.add_node(4).id
+        state.add_pod(2, node_id, priority="normal")
+        low = state.add_pod(2, node_id, priority="low")
+
+        _, victims = preemptor.find(2, "high")
+
+    assert [pod.id for pod in victims] == [low.id]
+
+
+def test_never_evicts_equal_or_higher_priority():
+    state, preemptor, _ = make_cluster()
+    with state.lock:
+        node_id = state.add_node(4).id
+        state.add_pod(4, node_id, priority="normal")
+
+        assert preemptor.find(2, "normal") is None
+        assert preemptor.find(2, "low") is None
+
+
+def test_prefers_the_node_evicting_the_fewest_pods():
+    state, preemptor, _ = make_cluster()
+    with state.lock:
+        many = state.add_node(4).id
+        for _ in range(4):
+            state.add_pod(1, many, priority="low")
+        one = state.add_node(4).id
+        state.add_pod(4, one, priority="low")
+
+        chosen, victims = preemptor.find(4, "high")
+
+    assert chosen == one and len(victims) == 1
+
+
+def test_evicted_pods_move_or_wait_under_their_own_id():
+    state, preemptor, queue = make_cluster()
+    with state.lock:
+        full = state.add_node(4).id
+        spare = state.add_node(1).id
+        moved = state.add_pod(1, full, priority="low").id
+        waiting = state.add_pod(3, full, priority="low").id
+
+        pod, evicted = preemptor.preempt(4, "high")
+
+    assert pod.assigned_node == full
+    assert sorted(evicted) == sorted([(moved, spare), (waiting, None)])
+    assert waiting in queue and queue.entries[waiting]["priority"] == "low"
+
+
+def test_api_preempts_for_a_higher_priority_pod(client):
+    client.post("/add_node", json={"cpu_cores": 4})
+    low = client.post("/launch_pod", json={"cpu_cores": 4, "priority": "low"}).get_json()["pod"]["id"]
+
+    response = client.post("/launch_pod", json={"cpu_cores": 2, "priority": "high"})
+    assert response.status_code == 200
+    assert [pod["id"] for pod in response.get_json()["preempted"]] == [low]
+    assert [pod["id"] for pod in client.get("/pending_pods").get_json()["pods"]] == [low]
+
+    # A low-priority pod has nothing lower to evict
+    client.post("/launch_pod", json={"cpu_cores": 2, "priority": "high"})
+    assert client.post("/launch_pod", json={"cpu_cores": 1, "priority": "low"}).status_code == 503
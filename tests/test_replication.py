@@ -0,0 +1,241 @@
+import json
+import time
+
+import api_server
+from cluster_state import ClusterState
+from health_monitor import HealthMonitor
+from replication import LEADER, Replicator
+from wal import capture_snapshot
+
+# Nothing listens here, so the followers never answer
+UNREACHABLE = ["http://127.0.0.1:9", "http://127.0.0.1:10"]
+
+HANDLERS = {"/replication/vote": "handle_vote", "/replication/append": "handle_append",
+            "/replication/snapshot": "handle_snapshot"}
+
+
+def make_replica(peers=UNREACHABLE, url="http://127.0.0.1:8", **options):
+    state = ClusterState()
+    replica = Replicator(state, HealthMonitor(state), url, peers, **options)
+    replica.running = True
+    return state, replica
+
+
+def make_leader():
+    state, replica = make_replica()
+    replica.role = LEADER
+    replica.term = 1
+    return state, replica
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+class Network:
+    """Replicas in one process, whose requests reach each other without HTTP"""
+
+    def __init__(self, size):
+        urls = ["http://replica-{}".format(i) for i in range(size)]
+        self.replicas = {}
+        self.up = set(urls)
+        for url in urls:
+            state, replica = make_replica([peer for peer in urls if peer != url], url,
+                                          election_timeout=0.1, heartbeat_interval=0.02)
+            replica.running = False
+            replica._post = self._sender(url)
+            self.replicas[url] = replica
+
+    def _sender(self, source):
+        def post(peer, path, body, timeout=None):
+            if source not in self.up or peer not in self.up:
+                return None
+            target = self.replicas[peer]
+            with target.state.lock:
+                # Through JSON, as over HTTP
+                response = getattr(target, HANDLERS[path])(json.loads(json.dumps(body)))
+            return json.loads(json.dumps(response))
+        return post
+
+    def start(self):
+        for replica in self.replicas.values():
+            replica.start()
+
+    def stop(self):
+        for replica in self.replicas.values():
+            replica.stop()
+
+    def leaders(self):
+        return [r for url, r in self.replicas.items() if url in self.up and r.is_leader()]
+
+    def wait_for_leader(self):
+        wait_for(lambda: len(self.leaders()) == 1)
+        return self.leaders()[0]
+
+
+def test_write_without_quorum_fails_within_commit_timeout(monkeypatch):
+    state, replica = make_leader()
+    with state.lock:
+        state.add_node(4)
+    monkeypatch.setattr(api_server, "execute", lambda handler, data: ({}, 200, [(replica, replica.lsn)]))
+    monkeypatch.setattr(api_server, "commit_timeout", 0.2)
+
+    started = time.time()
+    body, status = api_server.dispatch(None, {})
+
+    assert status == 503
+    assert body["message"] == api_server.COMMIT_FAILED
+    assert time.time() - started < 2
+
+
+def test_election_replication_and_failover():
+    network = Network(3)
+    network.start()
+    try:
+        leader = network.wait_for_leader()
+        with leader.state.lock:
+            node_id = leader.state.add_node(4).id
+            lsn = leader.lsn
+        assert leader.wait_durable(lsn, timeout=5)
+        for replica in network.replicas.values():
+            wait_for(lambda: node_id in replica.state.nodes)
+
+        # The old leader goes away; the others elect one of themselves in a later term
+        network.up.discard(leader.self_url)
+        new_leader = network.wait_for_leader()
+        assert new_leader is not leader and new_leader.term > leader.term
+        with new_leader.state.lock:
+            new_leader.state.add_node(8)
+            lsn = new_leader.lsn
+        assert new_leader.wait_durable(lsn, timeout=5)
+    finally:
+        network.stop()
+
+
+def test_vote_needs_an_up_to_date_log():
+    state, replica = make_leader()
+    with state.lock:
+        state.add_node(4)
+    replica.role = "follower"
+
+    stale = {"term": 2, "candidate": "a", "last_index": 0, "last_term": 0}
+    assert not replica.handle_vote(stale)["granted"]
+    current = {"term": 2, "candidate": "b", "last_index": 1, "last_term": 1}
+    assert replica.handle_vote(current)["granted"]
+    # One vote per term
+    assert not replica.handle_vote(dict(current, candidate="c"))["granted"]
+
+
+def test_entry_of_an_earlier_term_commits_only_with_one_of_the_current_term():
+    state, replica = make_leader()
+    with state.lock:
+        state.add_node(4)
+    # Elected in a later term while entry 1 from term 1 was not yet committed
+    replica.term = 2
+    replica.match_index = {peer: 1 for peer in UNREACHABLE}
+    with replica.condition:
+        replica._advance_commit()
+    assert replica.durable_lsn == 0
+
+    with state.lock:
+        state.add_node(4)
+    replica.match_index[UNREACHABLE[0]] = 2
+    with replica.condition:
+        replica._advance_commit()
+    assert replica.durable_lsn == 2
+
+
+def make_cluster(nodes, max_entries=100000):
+    """A leader without peers that logged nodes node additions, and an empty follower"""
+    leader_state, leader = make_replica(peers=[])
+    leader.max_entries = max_entries
+    leader.role = LEADER
+    leader.term = 1
+    with leader_state.lock:
+        for _ in range(nodes):
+            leader_state.add_node(4)
+    follower_state, follower = make_replica(peers=[])
+    return leader, follower_state, follower
+
+
+def append(leader, follower, prev_index, count=None):
+    """Send leader's entries after prev_index to the follower as one append request"""
+    start = prev_index - leader.base_index
+    entries = leader.entries[start:] if count is None else leader.entries[start:start + count]
+    request = {"term": leader.term, "leader": leader.self_url, "prev_index": prev_index,
+               "prev_term": leader._term_at(prev_index), "entries": [list(entry) for entry in entries],
+               "commit_index": leader.durable_lsn, "last_index": leader.lsn}
+    with follower.state.lock:
+        return follower.handle_append(request)
+
+
+def test_follower_one_entry_behind_catches_up_without_snapshot():
+    leader, follower_state, follower = make_cluster(3)
+    assert append(leader, follower, 0, count=2)["success"]
+
+    # The leader assumed the follower held every entry
+    response = append(leader, follower, 3)
+    assert not response["success"] and not response.get("reset")
+    next_index = leader._on_append_response("follower", response, 4)
+    assert next_index == 3
+
+    response = append(leader, follower, next_index - 1)
+    assert response == {"term": 1, "success": True, "last_index": 3}
+    assert len(follower_state.nodes) == 3
+
+
+def test_resent_batch_is_harmless():
+    leader, follower_state, follower = make_cluster(3)
+    assert append(leader, follower, 0)["success"]
+    assert append(leader, follower, 0) == {"term": 1, "success": True, "last_index": 3}
+    assert follower.lsn == 3 and len(follower_state.nodes) == 3
+
+
+def test_mismatched_term_steps_back_one_entry():
+    leader, follower_state, follower = make_cluster(3)
+    assert append(leader, follower, 0)["success"]
+    follower.entries[-1] = (0, follower.entries[-1][1])  # Entry 3 came from another leader
+
+    response = append(leader, follower, 3)
+    assert not response["success"]
+    assert leader._on_append_response("follower", response, 4) == 3
+
+    # Entry 3 differs and is already applied, so the follower asks for a snapshot
+    response = append(leader, follower, 2)
+    assert response.get("reset")
+    assert leader._on_append_response("follower", response, 3) - 1 < leader.base_index
+
+
+def test_follower_behind_leader_log_gets_snapshot():
+    leader, follower_state, follower = make_cluster(10, max_entries=4)
+    assert leader.base_index == 6
+
+    response = append(leader, follower, 6)
+    assert response == {"term": 1, "success": False, "last_index": 0}
+    next_index = leader._on_append_response("follower", response, 7)
+    assert next_index - 1 < leader.base_index
+
+
+def test_snapshot_install_replaces_follower_state():
+    leader, follower_state, follower = make_cluster(10, max_entries=4)
+    with leader.state.lock:
+        leader.state.add_pod(2, "node-1")
+        request = {"term": 1, "leader": leader.self_url, "last_index": leader.lsn,
+                   "last_term": leader._term_at(leader.lsn), "snapshot": capture_snapshot(leader.state)}
+    with follower_state.lock:
+        follower_state.add_node(16)  # Not in the leader's log; the snapshot drops it
+
+    with follower_state.lock:
+        assert follower.handle_snapshot(json.loads(json.dumps(request)))["success"]
+    assert sorted(follower_state.nodes) == sorted(leader.state.nodes)
+    assert follower_state.pods["pod-1"].assigned_node == "node-1"
+    assert follower.base_index == follower.lsn == follower.durable_lsn == leader.lsn
+
+    # Later entries follow on from the snapshot
+    with leader.state.lock:
+        leader.state.add_node(4)
+    assert append(leader, follower, leader.lsn - 1)["success"]
+    assert len(follower_state.nodes) == 11
@@ -0,0 +1,102 @@
+import random
+
+import pytest
+
+from cluster_state import ClusterState
+from resources import (BALANCED_ALLOCATION, BEST_FIT, DOMINANT_RESOURCE, FIRST_FIT, WORST_FIT,
+                       normalize_resources, parse_count)
+from scheduler import Scheduler
+
+
+def test_parse_count():
+    assert parse_count("3", "CPU cores") == 3
+    assert parse_count(2.0, "CPU cores") == 2
+    assert parse_count(0, "Resource gpu", allow_zero=True) == 0
+    for value in (0, -1, True, 1.5, "x", None, [1]):
+        with pytest.raises(ValueError):
+            parse_count(value, "CPU cores")
+    with pytest.raises(ValueError, match="non-negative"):
+        parse_count(-1, "Resource gpu", allow_zero=True)
+
+
+def test_normalize_resources():
+    assert normalize_resources({"memory": "1024", "gpu": 0}) == {"memory": 1024}
+    assert normalize_resources(None) == {}
+    for bad in ({"cpu": 1}, {"gpu": -1}, {"gpu": 0.5}, {"gpu": [1]}, [1]):
+        with pytest.raises(ValueError):
+            normalize_resources(bad)
+
+
+def python_fits(state, cpu_req, resources):
+    """The per-node loop the matrix replaces"""
+    return {node_id for node_id, node in state.nodes.items()
+            if node.status == "Healthy" and node.available_cores >= cpu_req
+            and all(node.available_resources.get(name, 0) >= amount for name, amount in resources.items())}
+
+
+def test_vector_fit_matches_a_per_node_check():
+    rng = random.Random(7)
+    state = ClusterState()
+    scheduler = Scheduler(state)
+    for _ in range(60):
+        resources = {"memory": rng.choice([4096, 16384])}
+        if rng.random() < 0.3:
+            resources["gpu"] = rng.randint(1, 4)
+        state.add_node(rng.choice([4, 8, 16]), resources=resources)
+    for node_id in rng.sample(sorted(state.nodes), 10):
+        state.set_node_status(node_id, "Unhealthy")
+
+    for _ in range(100):
+        cpu_req = rng.randint(1, 8)
+        resources = {"memory": rng.choice([512, 2048, 8192])}
+        if rng.random() < 0.5:
+            resources["gpu"] = rng.randint(1, 3)
+        expected = python_fits(state, cpu_req, resources)
+        matrix = scheduler.matrix
+        request = matrix.vector(cpu_req, resources)
+        assert {matrix._slot_nodes[row] for row in matrix.fits(request)} == expected
+
+        node = scheduler.select_node(cpu_req, FIRST_FIT, resources)
+        if node is None:
+            assert not expected
+        else:
+            assert node.id in expected
+            state.add_pod(cpu_req, node.id, resources=resources)
+
+
+def test_policies_choose_by_all_resources():
+    state = ClusterState()
+    scheduler = Scheduler(state)
+    small = state.add_node(4, resources={"memory": 4096}).id
+    large = state.add_node(16, resources={"memory": 65536}).id
+    gpu = state.add_node(8, resources={"memory": 8192, "gpu": 2}).id
+
+    assert scheduler.select_node(2, BEST_FIT).id == small
+    assert scheduler.select_node(2, WORST_FIT).id == large
+    assert scheduler.select_node(2, FIRST_FIT, {"gpu": 1}).id == gpu
+    assert scheduler.select_node(2, FIRST_FIT, {"tpu": 1}) is None
+    # The request is the largest share of the small node's memory
+    assert scheduler.select_node(1, DOMINANT_RESOURCE, {"memory": 4096}).id == small
+    # Memory-heavy pod on the node where it evens out CPU and memory use
+    assert scheduler.select_node(1, BALANCED_ALLOCATION, {"memory": 32768}).id == large
+
+
+def test_api_places_pods_by_memory_and_gpus(client):
+    client.post("/add_node", json={"cpu_cores": 8, "memory": 4096})
+    gpu = client.post("/add_node", json={"cpu_cores": 8, "resources": {"memory": 16384, "gpu": 1}}).get_json()["node_id"]
+
+    pod = client.post("/launch_pod", json={"cpu_cores": 1, "memory": 8192}).get_json()["pod"]
+    assert pod["assigned_node"] == gpu
+    assert client.post("/launch_pod", json={"cpu_cores": 1, "resources": {"gpu": 2}}).status_code == 503
+
+    summary = client.get("/cluster_summary").get_json()
+    assert summary["resources"]["memory"] == {"total": 20480, "available": 12288}
+
+
+def test_api_rejects_bad_resources(client):
+    for body in ({"cpu_cores": 2, "memory": -1}, {"cpu_cores": 2, "resources": {"gpu": "two"}},
+                 {"cpu_cores": 2, "resources": [1]}):
+        assert client.post("/add_node", json=body).status_code == 400
+        assert client.post("/launch_pod", json=body).status_code == 400
+    response = client.post("/launch_pods", json={"cpu_cores": [1, 2], "resources": [{"gpu": 1}]})
+    assert response.status_code == 400
@@ -0,0 +1,78 @@
+import pytest
+
+from cluster_state import ClusterState
+from scheduler import BEST_FIT, FIRST_FIT, WORST_FIT, Scheduler
+
+
+@pytest.fixture
+def cluster():
+    """Nodes with 8, 2 and 4 free cores, in that order"""
+    state = ClusterState()
+    scheduler = Scheduler(state)
+    node_ids = [state.add_node(cores).id for cores in (8, 2, 4)]
+    return state, scheduler, node_ids
+
+
+@pytest.mark.parametrize("policy, expected", [(FIRST_FIT, 0), (BEST_FIT, 2), (WORST_FIT, 0)])
+def test_policies_pick_their_node(cluster, policy, expected):
+    state, scheduler, node_ids = cluster
+    assert scheduler.select_node(3, policy).id == node_ids[expected]
+
+
+def test_first_fit_skips_full_nodes_in_registration_order(cluster):
+    state, scheduler, node_ids = cluster
+    scheduler.schedule(7, FIRST_FIT)
+    assert scheduler.select_node(2, FIRST_FIT).id == node_ids[1]
+    assert scheduler.select_node(3, FIRST_FIT).id == node_ids[2]
+    assert scheduler.select_node(5, FIRST_FIT) is None
+
+
+def test_index_follows_pod_removal(cluster):
+    state, scheduler, node_ids = cluster
+    pod = scheduler.schedule(8, BEST_FIT)
+    assert scheduler.select_node(5) is None
+    state.remove_pod(pod.id)
+    assert scheduler.select_node(5).id == node_ids[0]
+
+
+def test_unhealthy_nodes_are_skipped(cluster):
+    state, scheduler, node_ids = cluster
+    state.set_node_status(node_ids[0], "Unhealthy")
+    assert scheduler.select_node(3, WORST_FIT).id == node_ids[2]
+
+    state.set_node_status(node_ids[0], "Healthy")
+    assert scheduler.select_node(3, WORST_FIT).id == node_ids[0]
+
+
+def test_unknown_policy_is_rejected(cluster):
+    state, scheduler, node_ids = cluster
+    with pytest.raises(ValueError):
+        scheduler.select_node(1, "random_fit")
+
+
+def test_batch_packs_largest_pods_first():
+    state = ClusterState()
+    scheduler = Scheduler(state)
+    small, large = state.add_node(3).id, state.add_node(5).id
+
+    pods = scheduler.schedule_batch([2, 3, 3], BEST_FIT)
+
+    assert [pod.assigned_node for pod in pods] == [large, small, large]
+
+
+def test_gang_batch_places_all_or_nothing():
+    state = ClusterState()
+    scheduler = Scheduler(state)
+    node_id = state.add_node(4).id
+
+    assert scheduler.schedule_batch([2, 2, 2], gang=True) == [None, None, None]
+    assert state.get_node(node_id).available_cores == 4
+    assert all(scheduler.schedule_batch([2, 2], gang=True))
+
+
+def test_launch_pods_reports_each_pod(client):
+    client.post("/add_node", json={"cpu_cores": 4})
+    body = client.post("/launch_pods", json={"cpu_cores": [3, 2, 1]}).get_json()
+
+    assert [result["status"] for result in body["results"]] == ["scheduled", "unschedulable", "scheduled"]
+    assert (body["scheduled"], body["failed"]) == (2, 1)
@@ -0,0 +1,7 @@
+from stats import percentile
+
+
+def test_percentile_of_sorted_values():
+    values = list(range(1, 101))
+    assert (percentile(values, 50), percentile(values, 99), percentile(values, 100)) == (51, 99, 100)
+    assert percentile([], 50) == 0.0
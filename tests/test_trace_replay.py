@@ -0,0 +1,62 @@
+import pytest
+
+from trace_replay import (ADD_NODE, ARRIVE, DEPART, ApiDriver, InProcessDriver, generate_trace, read_trace,
+                          replay, stranded_fraction, write_trace)
+
+
+def small_trace(**options):
+    return generate_trace(20, 300, ([4, 8], [1, 1]), ([1, 2, 4], [3, 2, 1]), failures=3, seed=5, **options)
+
+
+@pytest.mark.parametrize("binary", [False, True])
+def test_trace_files_round_trip(tmp_path, binary):
+    events = small_trace()
+    path = tmp_path / "trace"
+    write_trace(str(path), events, binary=binary)
+    assert read_trace(str(path)) == events
+
+
+def test_binary_traces_hold_cpu_and_memory_only(tmp_path):
+    events = [(0.0, ADD_NODE, 1, 4, {"memory": 1024}, "normal"), (1.0, ARRIVE, 1, 1, {"gpu": 1}, "high")]
+    with pytest.raises(ValueError):
+        write_trace(str(tmp_path / "trace"), events, binary=True)
+    write_trace(str(tmp_path / "trace.jsonl"), events)
+    assert read_trace(str(tmp_path / "trace.jsonl")) == events
+
+
+def test_malformed_event_names_its_line(tmp_path):
+    path = tmp_path / "trace.jsonl"
+    path.write_text('{"time": 0, "event": "add_node", "node": 1, "cpu_cores": 4}\n{"time": 1, "event": "explode"}\n')
+    with pytest.raises(ValueError, match="line 2"):
+        read_trace(str(path))
+
+
+def test_generated_trace_is_reproducible_and_ordered():
+    events = small_trace()
+    assert events == small_trace()
+    assert [event[0] for event in events] == sorted(event[0] for event in events)
+    assert sum(1 for event in events if event[1] == ARRIVE) == sum(1 for event in events if event[1] == DEPART)
+
+
+def test_in_process_replay_accounts_for_every_arrival():
+    results = replay(small_trace(), InProcessDriver("best_fit"), sample_every=50)
+    assert results["arrived"] == 300
+    assert results["placed"] + results["rejected"] == 300
+    assert 0 <= results["stranded_cores_mean"] <= 1
+
+
+def test_stranded_fraction():
+    assert stranded_fraction([1, 1, 6], 2) == 0.25
+    assert stranded_fraction([], 2) == 0.0
+
+
+def test_api_replay_cleans_up_after_itself(server_url, state):
+    events = generate_trace(5, 40, ([4], [1]), ([1, 2], [1, 1]), seed=1)
+    driver = ApiDriver("first_fit", api_url=server_url, heartbeat_interval=0.1)
+    try:
+        results = replay(events, driver, sample_every=10)
+    finally:
+        driver.close()
+    assert results["placed"] + results["rejected"] == 40
+    assert results["skipped"] == 0
+    assert not state.nodes and not state.pods
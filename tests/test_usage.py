@@ -0,0 +1,140 @@
+import pytest
+
+from cluster_state import ClusterState
+from scheduler import Scheduler
+from usage import UsageStore
+
+
+@pytest.fixture
+def cluster():
+    """A 4-core node running pod-1 (2 cores) and pod-2 (1 core)"""
+    state = ClusterState()
+    with state.lock:
+        node_id = state.add_node(4).id
+        state.add_pod(2, node_id)
+        state.add_pod(1, node_id)
+    return state, node_id
+
+
+def record(store, node_id, samples, start=0, pod_id="pod-1"):
+    for i, cores in enumerate(samples):
+        store.record(node_id, {pod_id: cores}, start + i)
+
+
+def test_record_keeps_only_pods_on_the_node(cluster):
+    state, node_id = cluster
+    store = UsageStore(state)
+    assert store.record(node_id, {"pod-1": 1.5, "pod-404": 1}) == 1
+    assert store.record("node-404", {"pod-1": 1}) == 0
+    assert store.history("pod-1") == [{"time": pytest.approx(state.clock(), abs=5), "cores": 1.5}]
+    assert store.history("pod-404") == []
+
+
+@pytest.mark.parametrize("usage", [[1], {"pod-1": "lots"}, {"pod-1": -1}, {"pod-1": float("inf")}])
+def test_malformed_usage_is_rejected(cluster, usage):
+    state, node_id = cluster
+    with pytest.raises(ValueError):
+        UsageStore(state).record(node_id, usage)
+
+
+def test_estimate_needs_min_samples(cluster):
+    state, node_id = cluster
+    store = UsageStore(state, percentile=50, min_samples=3)
+    changes = []
+    store.subscribe(changes.append)
+    record(store, node_id, [1, 3])
+    assert store.get_estimate("pod-1") is None and changes == []
+    record(store, node_id, [2], start=2)
+    assert store.get_estimate("pod-1") == 2
+    assert changes == [{"pod-1": 2}]
+
+
+def test_raw_samples_wrap_and_rollups_keep_mean_and_peak(cluster):
+    state, node_id = cluster
+    store = UsageStore(state, tiers=((0, 3), (10, 2)))
+    record(store, node_id, [1, 3, 2, 4, 5, 6, 7], start=0)  # Times 0-6, all in bucket 0
+    assert [s["cores"] for s in store.history("pod-1")] == [5, 6, 7]
+    assert store.history("pod-1", 10) == []  # The bucket is still open
+
+    record(store, node_id, [8], start=10)
+    assert store.history("pod-1", 10) == [{"time": 0, "mean": 4, "max": 7}]
+    record(store, node_id, [2], start=20)
+    record(store, node_id, [3], start=30)
+    assert [s["time"] for s in store.history("pod-1", 10)] == [10, 20]
+    with pytest.raises(ValueError):
+        store.history("pod-1", 60)
+
+
+def test_late_sample_joins_the_open_bucket(cluster):
+    state, node_id = cluster
+    store = UsageStore(state, tiers=((0, 10), (10, 4)))
+    record(store, node_id, [1], start=15)
+    record(store, node_id, [3], start=5)
+    record(store, node_id, [1], start=25)
+    assert store.history("pod-1", 10) == [{"time": 10, "mean": 2, "max": 3}]
+
+
+def test_rows_of_removed_pods_are_reused_and_arrays_grow(cluster):
+    state, node_id = cluster
+    store = UsageStore(state, rows=1)
+    record(store, node_id, [1])
+    row = store.rows["pod-1"]
+    with state.lock:
+        state.remove_pod("pod-1")
+        pod_id = state.add_pod(1, node_id).id
+    record(store, node_id, [0.5], pod_id=pod_id)
+    assert store.rows[pod_id] == row
+    assert store.history(pod_id) == [{"time": 0, "cores": 0.5}]
+
+    record(store, node_id, [0.25], pod_id="pod-2")
+    assert store.size > 1 and store.history("pod-2") == [{"time": 0, "cores": 0.25}]
+
+
+def test_packing_by_usage_overcommits_idle_pods(cluster):
+    state, node_id = cluster
+    store = UsageStore(state, min_samples=2)
+    scheduler = Scheduler(state)
+    with state.lock:
+        scheduler.pack_by_usage(store, overcommit=2)
+    # Until they report, pods count at their requests: 1 core left
+    assert scheduler.select_node(2) is None
+
+    with state.lock:
+        for t in range(2):
+            store.record(node_id, {"pod-1": 0.5, "pod-2": 0.5}, t)
+    assert scheduler.select_node(2).id == node_id
+    # Only the 3 cores the pods leave unused are offered
+    assert scheduler.select_node(4) is None
+
+
+def test_overcommit_caps_requests(cluster):
+    state, node_id = cluster
+    store = UsageStore(state, min_samples=1)
+    scheduler = Scheduler(state)
+    with state.lock:
+        scheduler.pack_by_usage(store, overcommit=1.25)
+        store.record(node_id, {"pod-1": 0, "pod-2": 0})
+    # Idle pods leave all 4 cores, but requests may only reach 5
+    assert scheduler.select_node(2).id == node_id
+    assert scheduler.select_node(3) is None
+
+
+def test_overcommit_below_one_is_rejected(cluster):
+    state, node_id = cluster
+    with pytest.raises(ValueError):
+        Scheduler(state).pack_by_usage(UsageStore(state), overcommit=0.5)
+
+
+def test_heartbeat_usage_and_history(client, state):
+    node_id = client.post("/add_node", json={"cpu_cores": 4}).get_json()["node_id"]
+    pod_id = client.post("/launch_pod", json={"cpu_cores": 2}).get_json()["pod"]["id"]
+
+    body = client.post("/heartbeat", json={"node_id": node_id, "usage": {pod_id: 1.25}}).get_json()
+    assert body["pods"] == {pod_id: 2}
+    history = client.get("/pod_usage?pod_id={}".format(pod_id)).get_json()
+    assert [sample["cores"] for sample in history["samples"]] == [1.25]
+    assert history["estimate"] is None
+
+    assert client.post("/heartbeat", json={"node_id": node_id, "usage": {pod_id: -1}}).status_code == 400
+    assert client.get("/pod_usage?pod_id={}&resolution=7".format(pod_id)).status_code == 400
+    assert client.get("/pod_usage?pod_id=pod-404").status_code == 404
@@ -0,0 +1,138 @@
+import json
+import os
+
+import pytest
+
+from cluster_state import ClusterState
+from pending import PendingQueue
+from scheduler import Scheduler
+from wal import SNAPSHOT_FILE, WriteAheadLog, list_segments, segment_path
+
+
+def open_cluster(directory, **options):
+    state = ClusterState()
+    wal = WriteAheadLog(state, str(directory), fsync=False, **options)
+    wal.start()
+    return state, wal
+
+
+def contents(state):
+    return ({node_id: (node.cpu_cores, node.available_cores, node.status)
+             for node_id, node in state.nodes.items()},
+            {pod_id: (pod.cpu_cores, pod.assigned_node) for pod_id, pod in state.pods.items()})
+
+
+def build(state):
+    """Make one of every logged change"""
+    with state.lock:
+        first, second, gone = (state.add_node(cores).id for cores in (4, 8, 2))
+        pods = [state.add_pod(2, first).id for _ in range(2)]
+        state.add_pod(3, second)
+        state.move_pod(pods[0], second)
+        state.remove_pod(pods[1])
+        state.set_node_status(first, "Unhealthy")
+        state.remove_node(gone)
+
+
+def test_recovery_replays_the_log(tmp_path):
+    state, wal = open_cluster(tmp_path)
+    build(state)
+    assert wal.wait_durable(timeout=5)
+    wal.stop()
+
+    recovered, wal = open_cluster(tmp_path)
+    wal.stop()
+    assert contents(recovered) == contents(state)
+
+
+def test_recovery_from_snapshot_and_later_log(tmp_path):
+    state, wal = open_cluster(tmp_path)
+    build(state)
+    wal.snapshot()
+    with state.lock:
+        state.add_pod(1, "node-2")
+    assert wal.wait_durable(timeout=5)
+    wal.stop()
+    assert min(list_segments(str(tmp_path))) == json.load(open(tmp_path / SNAPSHOT_FILE))["segment"]
+
+    recovered, wal = open_cluster(tmp_path)
+    wal.stop()
+    assert contents(recovered) == contents(state)
+
+
+def test_removed_ids_are_not_reused_after_a_snapshot(tmp_path):
+    state, wal = open_cluster(tmp_path)
+    build(state)
+    wal.snapshot()
+    wal.stop()
+
+    recovered, wal = open_cluster(tmp_path)
+    with recovered.lock:
+        node_id = recovered.add_node(1).id
+        pod_id = recovered.add_pod(1, node_id).id
+    wal.stop()
+    assert (node_id, pod_id) == ("node-4", "pod-4")
+
+
+def test_partial_last_record_is_ignored(tmp_path):
+    state, wal = open_cluster(tmp_path)
+    build(state)
+    wal.stop()
+    segment = segment_path(str(tmp_path), list_segments(str(tmp_path))[-1])
+    with open(segment, "a") as f:
+        f.write('{"op": "node_added", "id": "no')
+
+    recovered, wal = open_cluster(tmp_path)
+    wal.stop()
+    assert contents(recovered) == contents(state)
+
+
+def test_corrupt_record_inside_the_log_fails_recovery(tmp_path):
+    state, wal = open_cluster(tmp_path)
+    build(state)
+    wal.stop()
+    segment = segment_path(str(tmp_path), list_segments(str(tmp_path))[-1])
+    with open(segment) as f:
+        lines = f.readlines()
+    lines[1] = "garbage\n"
+    with open(segment, "w") as f:
+        f.writelines(lines)
+
+    with pytest.raises(ValueError):
+        open_cluster(tmp_path)
+
+
+def test_snapshots_bound_the_log(tmp_path):
+    state, wal = open_cluster(tmp_path, snapshot_every=10)
+    with state.lock:
+        node_id = state.add_node(64).id
+    for _ in range(50):
+        with state.lock:
+            state.remove_pod(state.add_pod(1, node_id).id)
+        assert wal.wait_durable(timeout=5)
+    wal.stop()
+
+    assert os.path.exists(tmp_path / SNAPSHOT_FILE)
+    assert len(list_segments(str(tmp_path))) <= 2
+    recovered, wal = open_cluster(tmp_path)
+    wal.stop()
+    assert contents(recovered) == contents(state)
+
+
+def test_pending_pod_ids_are_not_reused_after_recovery(tmp_path):
+    state, wal = open_cluster(tmp_path)
+    with state.lock:
+        node_id = state.add_node(2).id
+        placed = state.add_pod(2, node_id).id
+        # No room left, so the pod waits under an id the client is already given
+        queued = PendingQueue(state, Scheduler(state)).add(2)["id"]
+    assert wal.wait_durable(timeout=5)
+    wal.stop()
+
+    recovered, wal = open_cluster(tmp_path)
+    with recovered.lock:
+        assert placed in recovered.pods
+        new_pod = recovered.add_pod(1, node_id).id
+    wal.stop()
+
+    assert new_pod not in (placed, queued)
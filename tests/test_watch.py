@@ -0,0 +1,65 @@
+import json
+
+import api_server
+from list_nodes import NodeWatcher
+from watch import EventLog
+
+
+def read_events(client, **params):
+    """Return the first batch of events a watch with these parameters streams"""
+    response = client.get("/watch", query_string=params, buffered=False)
+    try:
+        chunk = next(iter(response.response))
+    finally:
+        response.close()
+    chunk = chunk.decode() if isinstance(chunk, bytes) else chunk
+    return [json.loads(line[len("data: "):]) for line in chunk.splitlines() if line.startswith("data: ")]
+
+
+def test_watch_resumes_after_the_listed_version(client):
+    node_id = client.post("/add_node", json={"cpu_cores": 4}).get_json()["node_id"]
+    version = client.get("/list_nodes").get_json()["resource_version"]
+    pod = client.post("/launch_pod", json={"cpu_cores": 3}).get_json()["pod"]
+
+    events = read_events(client, resource_version=version)
+
+    assert [(event["kind"], event["type"]) for event in events] == [("pod", "ADDED"), ("node", "MODIFIED")]
+    assert events[0]["object"]["id"] == pod["id"]
+    assert events[1]["object"] == {"id": node_id, "cpu_cores": 4, "available_cores": 1,
+                                   "resources": {}, "available_resources": {},
+                                   "status": "Healthy", "pod_count": 1}
+    assert [event["resource_version"] for event in events] == [version + 1, version + 2]
+
+
+def test_watch_filters_by_kind(client):
+    client.post("/add_node", json={"cpu_cores": 4})
+    client.post("/launch_pod", json={"cpu_cores": 1})
+    assert {event["kind"] for event in read_events(client, kind="pod")} == {"pod"}
+
+
+def test_expired_version_must_list_again(client, state, monkeypatch):
+    monkeypatch.setattr(api_server, "events", EventLog(state, capacity=2))
+    for _ in range(4):
+        client.post("/add_node", json={"cpu_cores": 4})
+
+    assert client.get("/watch", query_string={"resource_version": 1}).status_code == 410
+    assert client.get("/watch", query_string={"resource_version": "latest"}).status_code == 400
+    assert len(read_events(client, resource_version=2)) == 2
+
+
+def test_watcher_cache_matches_a_fresh_list_after_replay(server_url, client):
+    for cores in (2, 4, 8):
+        client.post("/add_node", json={"cpu_cores": cores})
+    watcher = NodeWatcher(server_url)
+    watcher.relist()
+
+    client.post("/launch_pod", json={"cpu_cores": 2})
+    client.post("/remove_node", json={"node_id": "node-2"})
+    events, _ = api_server.events.since(watcher.resource_version, "node")
+    for event in events:
+        watcher.apply(event)
+
+    fresh = NodeWatcher(server_url)
+    fresh.relist()
+    assert {node_id: node["available_cores"] for node_id, node in watcher.nodes.items()} == {
+        node_id: node["available_cores"] for node_id, node in fresh.nodes.items()}
@@ -0,0 +1,473 @@
+import argparse
+import json
+import math
+import random
+import struct
+import threading
+import time
+
+from cluster_client import ClusterClient, ClusterError
+from cluster_state import DEFAULT_PRIORITY, PRIORITY_CLASSES, ClusterState, id_sequence
+from fleet_sim import parse_core_distribution
+from resources import MEMORY, parse_resources
+from scheduler import Scheduler, POLICIES
+from stats import percentile
+
+API_SERVER_URL = "http://localhost:5002"
+
+# Trace event types, in the order of their binary codes
+ADD_NODE = "add_node"
+REMOVE_NODE = "remove_node"
+FAIL_NODE = "fail_node"
+RECOVER_NODE = "recover_node"
+ARRIVE = "arrive"
+DEPART = "depart"
+EVENTS = (ADD_NODE, REMOVE_NODE, FAIL_NODE, RECOVER_NODE, ARRIVE, DEPART)
+NODE_EVENTS = (ADD_NODE, REMOVE_NODE, FAIL_NODE, RECOVER_NODE)
+
+# Binary traces: this header, then one record per event of
+# (time, event code, node or pod number, CPU cores, memory, priority rank)
+BINARY_MAGIC = b"CTRACE1\n"
+RECORD = struct.Struct("<dBIIIB")
+PRIORITY_NAMES = {rank: name for name, rank in PRIORITY_CLASSES.items()}
+
+# ---- Trace files ----
+
+def read_jsonl_trace(path):
+    """
+    Read a JSONL trace, one event object per line
+
+    Node events carry "node" and, for add_node, "cpu_cores" plus optional
+    "memory"/"resources"; pod events carry "pod" and, for arrive,
+    "cpu_cores", optional "memory"/"resources" and "priority".
+
+    Returns:
+        List of (time, event, id, cpu_cores, resources, priority) tuples
+
+    Raises:
+        ValueError: If an event is malformed
+    """
+    events = []
+    with open(path) as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                data = json.loads(line)
+                event = data["event"]
+                if event not in EVENTS:
+                    raise ValueError("unknown event {}".format(event))
+                item_id = data["node"] if event in NODE_EVENTS else data["pod"]
+                priority = data.get("priority", DEFAULT_PRIORITY)
+                if priority not in PRIORITY_CLASSES:
+                    raise ValueError("unknown priority class {}".format(priority))
+                events.append((float(data["time"]), event, item_id, int(data.get("cpu_cores", 0)),
+                               parse_resources(data), priority))
+            except (KeyError, TypeError, ValueError) as e:
+                raise ValueError("{} line {}: invalid event: {}".format(path, line_number, e))
+    return events
+
+def read_binary_trace(path):
+    """
+    Read a binary trace (see RECORD)
+
+    Returns:
+        List of (time, event, id, cpu_cores, resources, priority) tuples
+
+    Raises:
+        ValueError: If the file is not a binary trace
+    """
+    with open(path, "rb") as f:
+        if f.read(len(BINARY_MAGIC)) != BINARY_MAGIC:
+            raise ValueError("{} is not a binary trace".format(path))
+        data = f.read()
+    if len(data) % RECORD.size:
+        raise ValueError("{} ends with a partial record".format(path))
+    return [(at, EVENTS[code], item_id, cpu_cores, {MEMORY: memory} if memory else {}, PRIORITY_NAMES[rank])
+            for at, code, item_id, cpu_cores, memory, rank in RECORD.iter_unpack(data)]
+
+def read_trace(path):
+    """Read a trace in either format, detected from its first bytes"""
+    with open(path, "rb") as f:
+        binary = f.read(len(BINARY_MAGIC)) == BINARY_MAGIC
+    return read_binary_trace(path) if binary else read_jsonl_trace(path)
+
+def write_trace(path, events, binary=False):
+    """
+    Write events as a JSONL or binary trace
+
+    Binary traces are about a third of the size and load several times
+    faster, but hold integer ids and CPU and memory only.
+
+    Raises:
+        ValueError: If an event cannot be stored in the binary format
+    """
+    if not binary:
+        with open(path, "w") as f:
+            for at, event, item_id, cpu_cores, resources, priority in events:
+                record = {"time": at, "event": event, "node" if event in NODE_EVENTS else "pod": item_id}
+                if event in (ADD_NODE, ARRIVE):
+                    record["cpu_cores"] = cpu_cores
+                    if resources:
+                        record["resources"] = resources
+                if event == ARRIVE and priority != DEFAULT_PRIORITY:
+                    record["priority"] = priority
+                f.write(json.dumps(record) + "\n")
+        return
+
+    numbers = {}  # Non-integer ids get numbers in order of appearance
+    with open(path, "wb") as f:
+        f.write(BINARY_MAGIC)
+        for at, event, item_id, cpu_cores, resources, priority in events:
+            if set(resources) - {MEMORY}:
+                raise ValueError("Binary traces only hold CPU and memory, not {}".format(sorted(resources)))
+            if not isinstance(item_id, int):
+                item_id = numbers.setdefault((event in NODE_EVENTS, item_id), len(numbers) + 1)
+            f.write(RECORD.pack(at, EVENTS.index(event), item_id, cpu_cores, resources.get(MEMORY, 0),
+                                PRIORITY_CLASSES[priority]))
+
+def generate_trace(nodes, pods, node_cores, pod_cores, load=0.8, mean_duration=600.0, failures=0,
+                   mean_repair=300.0, seed=0):
+    """
+    Generate a synthetic trace
+
+    Nodes are added at time 0. Pods arrive as a Poisson process sized to
+    offer the given load, and run for log-normal (heavy-tailed) durations.
+    Each failure takes a random node down for an exponential repair time.
+
+    Args:
+        nodes: Number of nodes
+        pods: Number of pod arrivals
+        node_cores: (core counts, weights) of nodes
+        pod_cores: (core counts, weights) of pod requests
+        load: Offered load as a fraction of all cores
+        mean_duration: Mean seconds a pod runs
+        failures: Number of node failures
+        mean_repair: Mean seconds a failed node stays down
+        seed: Random seed
+
+    Returns:
+        List of events sorted by time
+    """
+    rng = random.Random(seed)
+    cores = rng.choices(node_cores[0], node_cores[1], k=nodes)
+    events = [(0.0, ADD_NODE, i + 1, c, {}, DEFAULT_PRIORITY) for i, c in enumerate(cores)]
+
+    mean_request = sum(c * w for c, w in zip(*pod_cores)) / sum(pod_cores[1])
+    rate = load * sum(cores) / (mean_duration * mean_request)
+    sigma = 1.0
+    mu = math.log(mean_duration) - sigma ** 2 / 2
+    at = 0.0
+    for pod in range(1, pods + 1):
+        at += rng.expovariate(rate)
+        events.append((at, ARRIVE, pod, rng.choices(*pod_cores)[0], {}, DEFAULT_PRIORITY))
+        events.append((at + rng.lognormvariate(mu, sigma), DEPART, pod, 0, {}, DEFAULT_PRIORITY))
+
+    for _ in range(failures):
+        node = rng.randint(1, nodes)
+        down = rng.uniform(0, at)
+        events.append((down, FAIL_NODE, node, 0, {}, DEFAULT_PRIORITY))
+        events.append((down + rng.expovariate(1 / mean_repair), RECOVER_NODE, node, 0, {}, DEFAULT_PRIORITY))
+    events.sort(key=lambda event: event[0])
+    return events
+
+# ---- Drivers ----
+
+class InProcessDriver:
+    def __init__(self, policy):
+        """
+        Replay target that runs the scheduler directly on a fresh cluster state
+
+        Node failures mark the node unhealthy and move its pods as one
+        batch; pods that fit nowhere else are evicted.
+        """
+        self.state = ClusterState()
+        self.scheduler = Scheduler(self.state)
+        self.policy = policy
+
+    def add_node(self, cpu_cores, resources):
+        return self.state.add_node(cpu_cores, resources=resources).id
+
+    def remove_node(self, node_id):
+        """Remove a node; returns the number of pods evicted"""
+        if node_id not in self.state.nodes:
+            return 0
+        self.scheduler.cordon(node_id)
+        evicted = self._evacuate(node_id)
+        self.state.remove_node(node_id)
+        return evicted
+
+    def fail_node(self, node_id):
+        """Mark a node unhealthy; returns the number of pods evicted"""
+        if not self.state.set_node_status(node_id, "Unhealthy"):
+            return 0
+        return self._evacuate(node_id)
+
+    def recover_node(self, node_id):
+        self.state.set_node_status(node_id, "Healthy")
+
+    def _evacuate(self, node_id):
+        pod_ids = sorted(self.state.pods_on_node(node_id), key=id_sequence)
+        unplaced = self.scheduler.reschedule(pod_ids, self.policy)
+        for pod_id in unplaced:
+            self.state.remove_pod(pod_id)
+        return len(unplaced)
+
+    def launch(self, cpu_cores, resources, priority):
+        """Place a pod; returns its id, or None if it was rejected"""
+        pod = self.scheduler.schedule(cpu_cores, self.policy, resources, priority)
+        return pod.id if pod else None
+
+    def remove_pod(self, pod_id):
+        self.state.remove_pod(pod_id)
+
+    def free_cores(self):
+        """Return the free CPU cores of every healthy node"""
+        return [node.available_cores for node in self.state.nodes.values() if node.status == "Healthy"]
+
+    def close(self):
+        pass
+
+class ApiDriver:
+    def __init__(self, policy, api_url=API_SERVER_URL, heartbeat_interval=5, connections=4):
+        """
+        Replay target that drives a live API server through one pooled ClusterClient
+
+        The driver heartbeats for every node it added, so nodes stay
+        healthy however long the replay takes. Failures are detected by a
+        live server in real time only, so failure and recovery events are
+        skipped. On close every pod and node the replay created is removed,
+        leaving the server as it was for the next policy.
+        """
+        self.api_url = api_url
+        self.policy = policy
+        # One connection more than requested, for the heartbeat thread
+        self.client = ClusterClient(api_url, pool_size=connections + 1)
+        self.nodes = set()
+        self.pods = set()
+        self.lock = threading.Lock()
+        self.running = True
+        self.heartbeat_interval = heartbeat_interval
+        self.thread = threading.Thread(target=self._heartbeat_loop, daemon=True)
+        self.thread.start()
+
+    def _heartbeat_loop(self):
+        while self.running:
+            with self.lock:
+                node_ids = list(self.nodes)
+            if node_ids:
+                try:
+                    self.client.heartbeats(node_ids)
+                except ClusterError:
+                    pass
+            time.sleep(self.heartbeat_interval)
+
+    def add_node(self, cpu_cores, resources):
+        try:
+            node_id = self.client.add_node(cpu_cores, resources)["node_id"]
+        except ClusterError as e:
+            raise RuntimeError("Could not add a node: {}".format(e)) from e
+        with self.lock:
+            self.nodes.add(node_id)
+        return node_id
+
+    def remove_node(self, node_id):
+        try:
+            self.client.remove_node(node_id, force=True)
+        except ClusterError:
+            pass
+        with self.lock:
+            self.nodes.discard(node_id)
+        return 0  # The server does not report evictions
+
+    def fail_node(self, node_id):
+        raise NotImplementedError
+
+    recover_node = fail_node
+
+    def launch(self, cpu_cores, resources, priority):
+        try:
+            pod = self.client.launch_pod(cpu_cores, resources, priority, self.policy, preempt=False)["pod"]
+        except ClusterError:
+            return None
+        self.pods.add(pod["id"])
+        return pod["id"]
+
+    def remove_pod(self, pod_id):
+        self.pods.discard(pod_id)
+        try:
+            self.client.remove_pod(pod_id)
+        except ClusterError:
+            pass
+
+    def free_cores(self):
+        return [node["available_cores"] for node in self.client.iter_pages("/list_nodes", "nodes", page_size=1000)
+                if node["status"] == "Healthy" and node["id"] in self.nodes]
+
+    def close(self):
+        self.running = False
+        for pod_id in list(self.pods):
+            self.remove_pod(pod_id)
+        for node_id in list(self.nodes):
+            self.remove_node(node_id)
+        self.thread.join(timeout=self.heartbeat_interval + 1)
+        self.client.close()
+
+# ---- Replay ----
+
+def stranded_fraction(free_cores, request):
+    """Share of free cores on nodes with too few free cores for a typical request"""
+    total = sum(free_cores)
+    if not total:
+        return 0.0
+    return sum(cores for cores in free_cores if cores < request) / total
+
+def replay(events, driver, sample_every=1000):
+    """
+    Replay a trace against a driver as fast as it goes, ignoring trace times
+
+    Departures of pods that were rejected or evicted are ignored. Every
+    sample_every events the free cores of all healthy nodes are sampled
+    to measure fragmentation: the share of free cores stranded on nodes
+    that cannot fit the trace's mean pod request.
+
+    Returns:
+        Dict of throughput, latency, rejection and fragmentation statistics
+    """
+    arrivals = [cpu_cores for _, event, _, cpu_cores, _, _ in events if event == ARRIVE]
+    typical = sum(arrivals) / len(arrivals) if arrivals else 1
+    nodes, pods = {}, {}
+    latencies = []
+    samples = []
+    counts = {"arrived": 0, "placed": 0, "rejected": 0, "evicted": 0, "skipped": 0}
+
+    started = time.perf_counter()
+    for i, (_, event, item_id, cpu_cores, resources, priority) in enumerate(events, 1):
+        if event == ARRIVE:
+            counts["arrived"] += 1
+            launched = time.perf_counter()
+            pod_id = driver.launch(cpu_cores, resources, priority)
+            latencies.append(time.perf_counter() - launched)
+            if pod_id is None:
+                counts["rejected"] += 1
+            else:
+                counts["placed"] += 1
+                pods[item_id] = pod_id
+        elif event == DEPART:
+            pod_id = pods.pop(item_id, None)
+            if pod_id is not None:
+                driver.remove_pod(pod_id)
+        elif event == ADD_NODE:
+            nodes[item_id] = driver.add_node(cpu_cores, resources)
+        elif item_id in nodes:
+            try:
+                if event == REMOVE_NODE:
+                    counts["evicted"] += driver.remove_node(nodes.pop(item_id))
+                elif event == FAIL_NODE:
+                    counts["evicted"] += driver.fail_node(nodes[item_id])
+                else:
+                    driver.recover_node(nodes[item_id])
+            except NotImplementedError:
+                counts["skipped"] += 1
+        if i % sample_every == 0:
+            paused = time.perf_counter()
+            samples.append(stranded_fraction(driver.free_cores(), typical))
+            started += time.perf_counter() - paused  # Sampling is not part of the replay
+    elapsed = time.perf_counter() - started
+    samples.append(stranded_fraction(driver.free_cores(), typical))
+
+    latencies.sort()
+    return dict(counts, **{
+        "events": len(events),
+        "seconds": elapsed,
+        "events_per_second": len(events) / elapsed if elapsed else 0.0,
+        "placements_per_second": counts["placed"] / elapsed if elapsed else 0.0,
+        "latency_seconds": {
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99),
+            "max": latencies[-1] if latencies else 0.0
+        },
+        "rejection_rate": counts["rejected"] / counts["arrived"] if counts["arrived"] else 0.0,
+        "stranded_cores_mean": sum(samples) / len(samples),
+        "stranded_cores_final": samples[-1]
+    })
+
+def print_results(results):
+    print("{:<20} {:>10} {:>8} {:>8} {:>8} {:>9} {:>9} {:>8}".format(
+        "POLICY", "EVENTS/S", "P50 us", "P99 us", "MAX us", "REJECTED", "STRANDED", "EVICTED"))
+    print("-" * 87)
+    for policy, stats in results.items():
+        latency = stats["latency_seconds"]
+        print("{:<20} {:>10,.0f} {:>8.1f} {:>8.1f} {:>8.0f} {:>9.2%} {:>9.2%} {:>8,}".format(
+            policy, stats["events_per_second"], latency["p50"] * 1e6, latency["p99"] * 1e6,
+            latency["max"] * 1e6, stats["rejection_rate"], stats["stranded_cores_mean"], stats["evicted"]))
+    skipped = max(stats["skipped"] for stats in results.values())
+    if skipped:
+        print("{} node failure/recovery events skipped (only replayed in-process)".format(skipped))
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay workload traces against the scheduler")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("replay", help="Replay a trace once per policy")
+    run.add_argument("trace", help="JSONL or binary trace file")
+    run.add_argument("--policies", nargs="+", choices=POLICIES, default=list(POLICIES),
+                     help="Policies to compare")
+    run.add_argument("--server", help="Replay against this API server instead of an in-process scheduler")
+    run.add_argument("--sample-every", type=int, default=1000,
+                     help="Events between fragmentation samples")
+    run.add_argument("--json", action="store_true", help="Print the statistics as JSON")
+
+    generate = commands.add_parser("generate", help="Write a synthetic trace")
+    generate.add_argument("output", help="Trace file to write")
+    generate.add_argument("--binary", action="store_true", help="Write the binary format")
+    generate.add_argument("--nodes", type=int, default=200, help="Number of nodes")
+    generate.add_argument("--pods", type=int, default=100000, help="Number of pod arrivals")
+    generate.add_argument("--cores", default="4:0.5,8:0.3,16:0.2", help="CPU cores per node")
+    generate.add_argument("--pod-cores", default="1:0.4,2:0.3,4:0.2,8:0.1", help="CPU cores per pod")
+    generate.add_argument("--load", type=float, default=0.9, help="Offered load as a fraction of all cores")
+    generate.add_argument("--pod-seconds", type=float, default=600, help="Mean seconds a pod runs")
+    generate.add_argument("--failures", type=int, default=0, help="Number of node failures")
+    generate.add_argument("--seed", type=int, default=0, help="Random seed")
+
+    convert = commands.add_parser("convert", help="Convert a trace between JSONL and binary")
+    convert.add_argument("input", help="Trace file to read")
+    convert.add_argument("output", help="Trace file to write")
+    convert.add_argument("--binary", action="store_true", help="Write the binary format")
+
+    args = parser.parse_args()
+
+    if args.command == "generate":
+        events = generate_trace(args.nodes, args.pods, parse_core_distribution(args.cores),
+                                parse_core_distribution(args.pod_cores), args.load, args.pod_seconds,
+                                args.failures, seed=args.seed)
+        write_trace(args.output, events, args.binary)
+        print("Wrote {:,} events to {}".format(len(events), args.output))
+        return
+    if args.command == "convert":
+        events = read_trace(args.input)
+        write_trace(args.output, events, args.binary)
+        print("Wrote {:,} events to {}".format(len(events), args.output))
+        return
+
+    loaded = time.perf_counter()
+    events = read_trace(args.trace)
+    print("Loaded {:,} events in {:.2f}s".format(len(events), time.perf_counter() - loaded))
+    results = {}
+    for policy in args.policies:
+        if args.server:
+            driver = ApiDriver(policy, args.server)
+        else:
+            driver = InProcessDriver(policy)
+        try:
+            results[policy] = replay(events, driver, args.sample_every)
+        finally:
+            driver.close()
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_results(results)
+
+if __name__ == "__main__":
+    main()
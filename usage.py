@@ -0,0 +1,243 @@
+import math
+
+import numpy as np
+
+# (seconds per sample, samples kept) of each tier. The first keeps every
+# reported sample; the others are rollups of it into fixed time buckets:
+# 60 raw samples (5 minutes at the default heartbeat interval), 2 hours of
+# minutes and a day of 10-minute buckets.
+DEFAULT_TIERS = ((0, 60), (60, 120), (600, 144))
+
+
+class UsageStore:
+    def __init__(self, state, tiers=DEFAULT_TIERS, percentile=95, min_samples=6, rows=1024):
+        """
+        Time series of the CPU cores each pod actually uses, as reported by its node
+
+        Every tracked pod owns one row in a set of preallocated numpy arrays
+        (one per tier), used as fixed-size ring buffers: appending a sample
+        writes one column, and a heartbeat's samples for all of its pods are
+        written together with vectorized indexing. Rollup tiers accumulate
+        the raw samples of their current bucket (sum, count and max) and
+        write its mean and peak when a later bucket starts, so memory per
+        pod is fixed whatever the retention. Rows of removed pods are
+        reused; the arrays double when they run out.
+
+        After each sample the pod's usage estimate, the given percentile of
+        its raw samples, is recomputed; pods with fewer than min_samples
+        samples have none. Listeners registered with subscribe() receive
+        {pod_id: estimate or None} for every estimate that changed.
+
+        Callers hold the cluster state lock.
+
+        Args:
+            state: ClusterState whose pods report usage
+            tiers: (seconds per sample, samples kept) per tier, the first with 0 seconds
+            percentile: Percentile of the raw samples used as a pod's estimate
+            min_samples: Raw samples a pod needs before it has an estimate
+            rows: Pods the arrays initially have room for
+        """
+        self.tiers = tuple((int(resolution), int(length)) for resolution, length in tiers)
+        if not self.tiers or self.tiers[0][0] != 0:
+            raise ValueError("The first tier must keep every sample (0 seconds per sample)")
+        self.state = state
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.rows = {}       # {pod_id: row}
+        self.free = []       # Rows released by removed pods
+        self.listeners = []
+        self.size = 0
+
+        count = len(self.tiers)
+        self.times = [np.zeros((0, length)) for _, length in self.tiers]
+        self.means = [np.zeros((0, length), np.float32) for _, length in self.tiers]
+        self.peaks = [None] + [np.zeros((0, length), np.float32) for _, length in self.tiers[1:]]
+        self.head = np.zeros((0, count), np.intp)     # Next column written, per tier
+        self.count = np.zeros((0, count), np.intp)    # Samples held, per tier
+        self.bucket = np.zeros((0, count), np.int64)  # Open rollup bucket (-1 if none)
+        self.total = np.zeros((0, count))             # Sum of its samples
+        self.samples = np.zeros((0, count), np.intp)  # Number of its samples
+        self.peak = np.zeros((0, count), np.float32)  # Largest of its samples
+        self.estimate = np.zeros(0, np.float32)       # Percentile of the raw samples (NaN if none)
+        self._grow(rows)
+
+        with state.lock:
+            state.subscribe(self._on_state_change)
+
+    def subscribe(self, listener):
+        """Call listener({pod_id: estimate or None}) whenever estimates change"""
+        self.listeners.append(listener)
+
+    def _grow(self, rows):
+        """Append rows to every array"""
+        def extend(array, fill):
+            block = np.full((rows,) + array.shape[1:], fill, array.dtype)
+            return np.concatenate([array, block])
+
+        self.times = [extend(array, 0) for array in self.times]
+        self.means = [extend(array, np.nan) for array in self.means]
+        self.peaks = [None if array is None else extend(array, np.nan) for array in self.peaks]
+        self.head = extend(self.head, 0)
+        self.count = extend(self.count, 0)
+        self.bucket = extend(self.bucket, -1)
+        self.total = extend(self.total, 0)
+        self.samples = extend(self.samples, 0)
+        self.peak = extend(self.peak, 0)
+        self.estimate = extend(self.estimate, np.nan)
+        self.free.extend(range(self.size + rows - 1, self.size - 1, -1))
+        self.size += rows
+
+    def _row(self, pod_id):
+        """Return the pod's row, taking a fresh one for a pod seen for the first time"""
+        row = self.rows.get(pod_id)
+        if row is not None:
+            return row
+        if not self.free:
+            self._grow(max(self.size, 16))
+        row = self.free.pop()
+        self.rows[pod_id] = row
+        self.means[0][row] = np.nan  # Unfilled raw samples sort last when taking percentiles
+        self.head[row] = 0
+        self.count[row] = 0
+        self.bucket[row] = -1
+        self.samples[row] = 0
+        self.estimate[row] = np.nan
+        return row
+
+    def _on_state_change(self, kind, event_type, obj):
+        """Release the row of a removed pod (state lock held)"""
+        if kind == "pod" and event_type == "DELETED":
+            row = self.rows.pop(obj.id, None)
+            if row is not None:
+                self.free.append(row)
+
+    def record(self, node_id, usage, timestamp=None):
+        """
+        Store one usage sample per pod from a node's heartbeat
+
+        Pods that are not (or no longer) on the node are ignored.
+
+        Args:
+            node_id: ID of the reporting node
+            usage: {pod_id: CPU cores used}
+            timestamp: When the node measured it (defaults to the state's clock)
+
+        Returns:
+            Number of samples stored
+
+        Raises:
+            ValueError: If the usage is malformed
+        """
+        if not isinstance(usage, dict):
+            raise ValueError("Usage must be an object of pod_id: cores")
+        pods = self.state.pods_on_node(node_id)
+        pod_ids, values = [], []
+        for pod_id, cores in usage.items():
+            try:
+                cores = float(cores)
+            except (TypeError, ValueError):
+                raise ValueError("Usage of pod {} must be a number".format(pod_id))
+            if not 0 <= cores < math.inf:
+                raise ValueError("Usage of pod {} must not be negative".format(pod_id))
+            if pod_id in pods:
+                pod_ids.append(pod_id)
+                values.append(cores)
+        if not pod_ids:
+            return 0
+
+        rows = np.fromiter((self._row(pod_id) for pod_id in pod_ids), np.intp, len(pod_ids))
+        values = np.asarray(values, np.float32)
+        self._append(rows, values, self.state.clock() if timestamp is None else timestamp)
+        self._update_estimates(pod_ids, rows)
+        return len(pod_ids)
+
+    def _write(self, tier, rows, times, means, peaks):
+        """Append one sample per row to a tier's ring buffers"""
+        length = self.tiers[tier][1]
+        head = self.head[rows, tier]
+        self.times[tier][rows, head] = times
+        self.means[tier][rows, head] = means
+        if self.peaks[tier] is not None:
+            self.peaks[tier][rows, head] = peaks
+        self.head[rows, tier] = (head + 1) % length
+        self.count[rows, tier] = np.minimum(self.count[rows, tier] + 1, length)
+
+    def _append(self, rows, values, timestamp):
+        self._write(0, rows, timestamp, values, None)
+        for tier, (resolution, _) in enumerate(self.tiers[1:], 1):
+            open_bucket = self.bucket[rows, tier]
+            # A late sample joins the open bucket rather than reopening an older one
+            bucket = np.maximum(open_bucket, math.floor(timestamp / resolution))
+            closed = (bucket != open_bucket) & (self.samples[rows, tier] > 0)
+            if closed.any():
+                done = rows[closed]
+                self._write(tier, done, self.bucket[done, tier] * resolution,
+                            self.total[done, tier] / self.samples[done, tier], self.peak[done, tier])
+            opened = rows[bucket != open_bucket]
+            self.bucket[opened, tier] = bucket[bucket != open_bucket]
+            self.total[opened, tier] = 0
+            self.samples[opened, tier] = 0
+            self.peak[opened, tier] = 0
+            self.total[rows, tier] += values
+            self.samples[rows, tier] += 1
+            self.peak[rows, tier] = np.maximum(self.peak[rows, tier], values)
+
+    def _update_estimates(self, pod_ids, rows):
+        """Recompute the estimates of the given pods and tell listeners which changed"""
+        counts = self.count[rows, 0]
+        ordered = np.sort(self.means[0][rows], axis=1)  # Unfilled (NaN) samples sort last
+        ranks = np.maximum((counts - 1) * self.percentile // 100, 0)
+        estimates = ordered[np.arange(len(rows)), ranks]
+        estimates[counts < self.min_samples] = np.nan
+        previous = self.estimate[rows]
+        self.estimate[rows] = estimates
+
+        changed = {}
+        for pod_id, estimate, old in zip(pod_ids, estimates.tolist(), previous.tolist()):
+            if estimate != old and not (math.isnan(estimate) and math.isnan(old)):
+                changed[pod_id] = None if math.isnan(estimate) else estimate
+        if changed:
+            for listener in self.listeners:
+                listener(changed)
+
+    def get_estimate(self, pod_id):
+        """Return the pod's usage percentile in cores, or None while it has too few samples"""
+        row = self.rows.get(pod_id)
+        if row is None:
+            return None
+        estimate = float(self.estimate[row])
+        return None if math.isnan(estimate) else estimate
+
+    def resolutions(self):
+        """Return the seconds per sample of every tier (0 for raw samples)"""
+        return [resolution for resolution, _ in self.tiers]
+
+    def history(self, pod_id, resolution=0):
+        """
+        Return a pod's samples at one resolution, oldest first
+
+        Rollup tiers hold completed buckets only, each as its start time,
+        mean and peak.
+
+        Returns:
+            List of {"time", "cores"} (raw) or {"time", "mean", "max"} (rollups);
+            empty for a pod that reported nothing
+
+        Raises:
+            ValueError: If no tier has that resolution
+        """
+        tiers = self.resolutions()
+        if resolution not in tiers:
+            raise ValueError("Resolution must be one of {}".format(tiers))
+        tier = tiers.index(resolution)
+        row = self.rows.get(pod_id)
+        if row is None:
+            return []
+        count = int(self.count[row, tier])
+        columns = (self.head[row, tier] - count + np.arange(count)) % self.tiers[tier][1]
+        times = self.times[tier][row, columns].tolist()
+        means = self.means[tier][row, columns].tolist()
+        if self.peaks[tier] is None:
+            return [{"time": t, "cores": round(m, 3)} for t, m in zip(times, means)]
+        peaks = self.peaks[tier][row, columns].tolist()
+        return [{"time": t, "mean": round(m, 3), "max": round(p, 3)} for t, m, p in zip(times, means, peaks)]
@@ -0,0 +1,374 @@
+import json
+import logging
+import os
+import threading
+import time
+
+from cluster_state import DEFAULT_PRIORITY, id_sequence
+
+logger = logging.getLogger('wal')
+
+SNAPSHOT_FILE = "snapshot.json"
+SEGMENT_PREFIX = "wal-"
+SEGMENT_SUFFIX = ".log"
+
+def segment_path(directory, number):
+    return os.path.join(directory, "{}{:08d}{}".format(SEGMENT_PREFIX, number, SEGMENT_SUFFIX))
+
+def list_segments(directory):
+    """Return the numbers of the log segments in a directory, oldest first"""
+    numbers = []
+    for name in os.listdir(directory):
+        if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX):
+            numbers.append(int(name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)]))
+    return sorted(numbers)
+
+def _fsync_directory(directory):
+    """Make renames and new files in a directory durable (no-op where unsupported)"""
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+def apply_record(state, record):
+    """Apply one log record to the cluster state"""
+    op = record["op"]
+    if op == "node_added":
+        state.add_node(record["cpu_cores"], node_id=record["id"], resources=record.get("resources"))
+    elif op == "node_status":
+        state.set_node_status(record["id"], record["status"])
+    elif op == "node_deleted":
+        state.remove_node(record["id"])
+    elif op == "pod_added":
+        state.add_pod(record["cpu_cores"], record["node"], pod_id=record["id"],
+                      creation_time=record["creation_time"], resources=record.get("resources"),
+                      priority=record.get("priority", DEFAULT_PRIORITY))
+    elif op == "pod_moved":
+        state.move_pod(record["id"], record["node"])
+    elif op == "pod_deleted":
+        state.remove_pod(record["id"])
+    elif op == "pod_id_reserved":
+        state.pod_id_counter = max(state.pod_id_counter, id_sequence(record["id"]) + 1)
+    else:
+        raise ValueError("Unknown log record: {}".format(op))
+
+class RecordEncoder:
+    def __init__(self, state):
+        """
+        Turn ClusterState change notifications into log records
+
+        Node core accounting follows from the pod records, so of the many
+        node MODIFIED notifications only actual status changes are recorded.
+        """
+        self.node_status = {node_id: node.status for node_id, node in state.nodes.items()}
+
+    def encode(self, kind, event_type, obj):
+        """Return the log record for a change, or None if it needs none"""
+        if kind == "node":
+            if event_type == "ADDED":
+                self.node_status[obj.id] = obj.status
+                record = {"op": "node_added", "id": obj.id, "cpu_cores": obj.cpu_cores}
+                if obj.resources:
+                    record["resources"] = obj.resources
+                return record
+            if event_type == "MODIFIED":
+                if self.node_status.get(obj.id) == obj.status:
+                    return None
+                self.node_status[obj.id] = obj.status
+                return {"op": "node_status", "id": obj.id, "status": obj.status}
+            if event_type == "DELETED":
+                self.node_status.pop(obj.id, None)
+                return {"op": "node_deleted", "id": obj.id}
+            return None
+        if event_type == "ADDED":
+            record = {"op": "pod_added", "id": obj.id, "cpu_cores": obj.cpu_cores,
+                      "node": obj.assigned_node, "creation_time": obj.creation_time}
+            if obj.resources:
+                record["resources"] = obj.resources
+            if obj.priority != DEFAULT_PRIORITY:
+                record["priority"] = obj.priority
+            return record
+        if event_type == "MODIFIED":
+            return {"op": "pod_moved", "id": obj.id, "node": obj.assigned_node}
+        return {"op": "pod_deleted", "id": obj.id}
+
+    @staticmethod
+    def encode_reservation(pod_id):
+        """Return the record of a pod id handed out before its pod exists (e.g. a queued pod)"""
+        return {"op": "pod_id_reserved", "id": pod_id}
+
+def capture_snapshot(state):
+    """Return a compact copy of every node and pod (cluster state lock held)"""
+    return {
+        "node_id_counter": state.node_id_counter,
+        "pod_id_counter": state.pod_id_counter,
+        # Resources and priority are appended only when set, keeping plain entries short
+        "nodes": [[n.id, n.cpu_cores, n.status] + ([n.resources] if n.resources else [])
+                  for n in state.nodes.values()],
+        "pods": [[p.id, p.cpu_cores, p.assigned_node, p.creation_time] + _pod_extras(p)
+                 for p in state.pods.values()]
+    }
+
+def _pod_extras(pod):
+    if pod.priority != DEFAULT_PRIORITY:
+        return [pod.resources.copy(), pod.priority]
+    return [pod.resources] if pod.resources else []
+
+def load_snapshot(state, snapshot):
+    """Rebuild nodes and pods from a snapshot into an empty cluster state"""
+    for node_id, cpu_cores, status, *resources in sorted(snapshot["nodes"], key=lambda n: id_sequence(n[0])):
+        state.add_node(cpu_cores, node_id=node_id, resources=resources[0] if resources else None)
+        if status != "Healthy":
+            state.set_node_status(node_id, status)
+    for pod_id, cpu_cores, node_id, creation_time, *extras in sorted(snapshot["pods"],
+                                                                    key=lambda p: id_sequence(p[0])):
+        state.add_pod(cpu_cores, node_id, pod_id=pod_id, creation_time=creation_time,
+                      resources=extras[0] if extras else None,
+                      priority=extras[1] if len(extras) > 1 else DEFAULT_PRIORITY)
+    # Removed nodes and pods must never have their ids handed out again
+    state.node_id_counter = max(state.node_id_counter, snapshot["node_id_counter"])
+    state.pod_id_counter = max(state.pod_id_counter, snapshot["pod_id_counter"])
+
+def recover(state, directory):
+    """
+    Rebuild the cluster state from the latest snapshot and the log after it
+
+    A partially written final record (the process died mid-write) is
+    ignored; a corrupt record anywhere else raises ValueError. Recovered
+    nodes start with a fresh heartbeat, so they get a full timeout to
+    report in before being marked unhealthy.
+
+    Args:
+        state: Empty ClusterState to load into (caller holds its lock)
+        directory: Data directory holding the snapshot and log segments
+
+    Returns:
+        (number of the last segment found or 0, records replayed)
+    """
+    first_segment = 0
+    snapshot_file = os.path.join(directory, SNAPSHOT_FILE)
+    if os.path.exists(snapshot_file):
+        with open(snapshot_file) as f:
+            snapshot = json.load(f)
+        load_snapshot(state, snapshot)
+        first_segment = snapshot["segment"]
+
+    segments = [n for n in list_segments(directory) if n >= first_segment]
+    replayed = 0
+    for number in segments:
+        with open(segment_path(directory, number)) as f:
+            lines = f.read().split("\n")
+        # A complete log ends with a newline, leaving an empty last element
+        for i, line in enumerate(lines):
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                if i == len(lines) - 1:
+                    logger.warning("Ignoring partially written record at the end of segment {}".format(number))
+                    break
+                raise ValueError("Corrupt record in segment {} line {}".format(number, i + 1))
+            apply_record(state, record)
+            replayed += 1
+    return (segments[-1] if segments else first_segment), replayed
+
+class WriteAheadLog:
+    def __init__(self, state, directory, fsync=True, snapshot_every=100000):
+        """
+        Durable append-only log of cluster changes, with periodic snapshots
+
+        Node and pod changes are encoded while the cluster state lock is
+        held (so the log order is the order they were applied) and appended
+        to an in-memory buffer. A background thread writes the buffer out and
+        fsyncs it; every record that arrived while the previous fsync was
+        running is committed by the next one, so many requests share one
+        fsync and none of them pays for it while holding the lock. Callers
+        that must not acknowledge a change before it is durable wait with
+        wait_durable() after releasing the lock.
+
+        Once snapshot_every records have been logged, the state is written
+        to a snapshot and the log segments it covers are deleted, which
+        bounds both disk usage and recovery time.
+
+        Any state already in the directory is recovered into `state` first.
+        Heartbeats are not logged.
+
+        Args:
+            state: ClusterState to record (and recover into)
+            directory: Data directory for the snapshot and log segments
+            fsync: Force each commit to disk (False leaves it to the OS)
+            snapshot_every: Logged records between automatic snapshots
+        """
+        self.state = state
+        self.directory = directory
+        self.fsync = fsync
+        self.snapshot_every = snapshot_every
+        self.running = False
+        self.thread = None
+
+        # Lock order: cluster state lock, then io_lock, then condition
+        self.io_lock = threading.Lock()        # Held while writing to the segment file
+        self.snapshot_lock = threading.Lock()  # One snapshot at a time, taken before the state lock
+        self.condition = threading.Condition()
+        self.buffer = []                       # Encoded records not yet written
+        self.lsn = 0                           # Sequence number of the last logged record
+        self.durable_lsn = 0                   # Last record known to be on disk
+        self.snapshot_lsn = 0                  # lsn covered by the latest snapshot
+
+        os.makedirs(directory, exist_ok=True)
+        with state.lock:
+            last_segment, replayed = recover(state, directory)
+            if state.nodes or replayed:
+                logger.info("Recovered {} nodes and {} pods ({} log records replayed)".format(
+                    len(state.nodes), len(state.pods), replayed))
+            self.encoder = RecordEncoder(state)
+            self.segment = last_segment + 1
+            self.file = open(segment_path(directory, self.segment), "a")
+            state.subscribe(self._on_state_change)
+            state.subscribe_reservations(self._on_reservation)
+
+    def _on_state_change(self, kind, event_type, obj):
+        """Encode a change as a log record (cluster state lock held)"""
+        record = self.encoder.encode(kind, event_type, obj)
+        if record is not None:
+            self._log(record)
+
+    def _on_reservation(self, pod_id):
+        """Log a reserved pod id, so it is not handed out again after recovery (cluster state lock held)"""
+        self._log(self.encoder.encode_reservation(pod_id))
+
+    def _log(self, record):
+        """Queue a record for the next commit"""
+        line = json.dumps(record, separators=(",", ":")) + "\n"
+        with self.condition:
+            self.buffer.append(line)
+            self.lsn += 1
+            self.condition.notify_all()
+
+    def start(self):
+        """Start the background commit thread"""
+        self.running = True
+        self.thread = threading.Thread(target=self._commit_loop)
+        self.thread.daemon = True
+        self.thread.start()
+        logger.info("Write-ahead log started in {}".format(self.directory))
+
+    def stop(self):
+        """Commit everything buffered and stop the commit thread"""
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        if self.thread:
+            self.thread.join(timeout=5)
+        self._commit()
+        logger.info("Write-ahead log stopped")
+
+    def _write(self, lines):
+        """Write and sync records to the current segment (io_lock held)"""
+        self.file.write("".join(lines))
+        self.file.flush()
+        if self.fsync:
+            os.fsync(self.file.fileno())
+
+    def _commit(self):
+        """Write out every buffered record; returns the number committed"""
+        with self.io_lock:
+            with self.condition:
+                lines, lsn = self.buffer, self.lsn
+                self.buffer = []
+            if lines:
+                self._write(lines)
+            with self.condition:
+                self.durable_lsn = max(self.durable_lsn, lsn)
+                self.condition.notify_all()
+        return len(lines)
+
+    def _commit_loop(self):
+        while True:
+            with self.condition:
+                while self.running and not self.buffer:
+                    self.condition.wait()
+                if not self.running:
+                    return
+            try:
+                self._commit()
+                if self.lsn - self.snapshot_lsn >= self.snapshot_every:
+                    self.snapshot()
+            except OSError as e:
+                logger.error("Write-ahead log commit failed: {}".format(e))
+
+    def wait_durable(self, lsn=None, timeout=None):
+        """
+        Block until every record up to lsn (default: all logged so far) is committed
+
+        Must not be called while holding the cluster state lock.
+
+        Returns:
+            True if the records are durable, False on timeout or if stopped
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        with self.condition:
+            if lsn is None:
+                lsn = self.lsn
+            while self.durable_lsn < lsn:
+                remaining = None if deadline is None else deadline - time.time()
+                if not self.running or (remaining is not None and remaining <= 0):
+                    return False
+                self.condition.wait(remaining)
+            return True
+
+    def snapshot(self):
+        """
+        Write a snapshot of the current state and drop the log it covers
+
+        The state is copied under the cluster state lock, at the same point
+        the log switches to a new segment; encoding and writing the snapshot
+        happen after the lock is released. Until the new snapshot replaces
+        the old one, the old snapshot plus every segment since it still
+        recovers the full state.
+
+        Returns:
+            The path of the snapshot file
+        """
+        with self.snapshot_lock:
+            return self._snapshot()
+
+    def _snapshot(self):
+        with self.state.lock, self.io_lock:
+            with self.condition:
+                lines, lsn = self.buffer, self.lsn
+                self.buffer = []
+            if lines:
+                self._write(lines)
+            self.file.close()
+            self.segment += 1
+            self.file = open(segment_path(self.directory, self.segment), "a")
+            with self.condition:
+                self.durable_lsn = max(self.durable_lsn, lsn)
+                self.condition.notify_all()
+
+            snapshot = capture_snapshot(self.state)
+            snapshot["segment"] = self.segment
+            self.snapshot_lsn = lsn
+
+        path = os.path.join(self.directory, SNAPSHOT_FILE)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(snapshot, f, separators=(",", ":"))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        _fsync_directory(self.directory)
+
+        for number in list_segments(self.directory):
+            if number < snapshot["segment"]:
+                os.remove(segment_path(self.directory, number))
+        logger.info("Snapshot written: {} nodes, {} pods".format(len(snapshot["nodes"]), len(snapshot["pods"])))
+        return path
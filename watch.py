@@ -0,0 +1,127 @@
+import collections
+import json
+import threading
+
+def serialize_node(node):
+    """Return the watch representation of a node (pod ids are summarized as a count)"""
+    return {
+        "id": node.id,
+        "cpu_cores": node.cpu_cores,
+        "available_cores": node.available_cores,
+        "resources": dict(node.resources),
+        "available_resources": dict(node.available_resources),
+        "status": node.status,
+        "pod_count": len(node.pods)
+    }
+
+def serialize_pod(pod):
+    """Return the watch representation of a pod"""
+    return pod.to_dict()
+
+class ResourceVersionExpired(Exception):
+    """Raised when a watch resumes from a version no longer held in the log"""
+
+class EventLog:
+    def __init__(self, state, capacity=10000):
+        """
+        Bounded log of node and pod changes for watch clients
+
+        Every ADDED, MODIFIED and DELETED notification from ClusterState is
+        stored with a monotonically increasing resource version. Clients
+        resume from the last version they saw; a version that has already
+        been evicted from the log raises ResourceVersionExpired, and the
+        client must list again.
+
+        Args:
+            state: ClusterState to record changes from
+            capacity: Number of most recent events kept for resuming watches
+        """
+        self.events = collections.deque(maxlen=capacity)
+        self.resource_version = 0
+        self.condition = threading.Condition()
+        self.async_waiters = set()  # {(event loop, asyncio.Event)} woken on append
+        state.subscribe(self._on_state_change)
+
+    def _on_state_change(self, kind, event_type, obj):
+        if event_type == "HEARTBEAT":
+            return
+        body = serialize_node(obj) if kind == "node" else serialize_pod(obj)
+        with self.condition:
+            self.resource_version += 1
+            self.events.append({
+                "type": event_type,
+                "kind": kind,
+                "resource_version": self.resource_version,
+                "object": body
+            })
+            self.condition.notify_all()
+            for loop, waiter in list(self.async_waiters):
+                try:
+                    loop.call_soon_threadsafe(waiter.set)
+                except RuntimeError:
+                    self.async_waiters.discard((loop, waiter))  # Loop already closed
+
+    def since(self, resource_version, kind=None):
+        """
+        Return the events after a resource version, oldest first
+
+        Args:
+            resource_version: Last version the client has seen
+            kind: Only return events for this kind ("node" or "pod")
+
+        Returns:
+            (events, version to resume from next time)
+
+        Raises:
+            ResourceVersionExpired: If events after that version were evicted
+        """
+        with self.condition:
+            latest = self.resource_version
+            if resource_version >= latest:
+                return [], resource_version
+            oldest = self.events[0]["resource_version"] if self.events else latest + 1
+            if resource_version < oldest - 1:
+                raise ResourceVersionExpired(resource_version)
+            # Versions are contiguous, so the position is an offset from the oldest event
+            start = resource_version - oldest + 1
+            events = [self.events[i] for i in range(start, len(self.events))]
+        if kind:
+            events = [event for event in events if event["kind"] == kind]
+        return events, latest
+
+    def wait(self, resource_version, timeout):
+        """Block until an event newer than resource_version exists or timeout elapses"""
+        with self.condition:
+            if self.resource_version <= resource_version:
+                self.condition.wait(timeout)
+
+def format_sse(event):
+    """Format an event as a Server-Sent Events message"""
+    return "id: {}\nevent: {}\ndata: {}\n\n".format(
+        event["resource_version"], event["type"], json.dumps(event))
+
+def parse_watch_params(args, last_event_id=None):
+    """
+    Parse the resource version and kind of a watch request
+
+    The version comes from the resource_version query argument, or from
+    the Last-Event-ID header that SSE clients send when reconnecting.
+
+    Raises:
+        ValueError: If the version is not an integer or the kind is unknown
+    """
+    resource_version = int(args.get("resource_version") or last_event_id or 0)
+    kind = args.get("kind") or None
+    if kind not in (None, "node", "pod"):
+        raise ValueError("kind must be node or pod")
+    return resource_version, kind
+
+def format_expired(resource_version):
+    """SSE message telling the client its version expired and it must list again"""
+    return "event: ERROR\ndata: {}\n\n".format(json.dumps({
+        "type": "ERROR", "code": 410,
+        "message": "Resource version {} is too old; list again".format(resource_version)
+    }))
+
+# Comment line sent while idle so proxies and clients keep the stream open
+SSE_KEEPALIVE = ": keepalive\n\n"
@@ -0,0 +1,47 @@
+"""
+WSGI entry point for production servers, e.g.:
+
+    gunicorn --workers 1 --threads 16 --bind 0.0.0.0:5002 wsgi:app
+
+Cluster state lives in this process, so run exactly one worker and scale
+with threads; every request already serializes on the cluster state lock.
+Set CLUSTER_DATA_DIR to persist the state across restarts, and
+CLUSTER_NO_FSYNC=1 to skip forcing log commits to disk (as --no-fsync).
+Set CLUSTER_PEERS (comma-separated URLs) with CLUSTER_ADVERTISE (this
+replica's URL) to run as one replica of a replicated control plane, and
+CLUSTER_COMMIT_TIMEOUT to change how many seconds a write waits for its
+commit (as --commit-timeout). Set CLUSTER_AUTOSCALE to "docker" or "fake"
+to add and remove nodes automatically (as --autoscale), with
+CLUSTER_NODE_SHAPES (space-separated, e.g. "4 16:memory=65536"),
+CLUSTER_MIN_NODES, CLUSTER_MAX_NODES and CLUSTER_WARM_NODES. Set
+CLUSTER_OVERCOMMIT to a ratio to place CPU-only pods by their observed
+usage (as --overcommit).
+"""
+import os
+
+import api_server
+from api_server import (app, enable_autoscaling, enable_persistence, enable_replication, enable_usage_packing,
+                        start_background)
+from autoscaler import parse_shape
+
+if os.environ.get("CLUSTER_COMMIT_TIMEOUT"):
+    api_server.commit_timeout = float(os.environ["CLUSTER_COMMIT_TIMEOUT"])
+if os.environ.get("CLUSTER_DATA_DIR"):
+    enable_persistence(os.environ["CLUSTER_DATA_DIR"], fsync=not os.environ.get("CLUSTER_NO_FSYNC"))
+if os.environ.get("CLUSTER_PEERS"):
+    if not os.environ.get("CLUSTER_ADVERTISE"):
+        raise RuntimeError("CLUSTER_PEERS is set, so CLUSTER_ADVERTISE must give the URL peers reach this replica at")
+    enable_replication(os.environ["CLUSTER_ADVERTISE"], os.environ["CLUSTER_PEERS"].split(","))
+if os.environ.get("CLUSTER_AUTOSCALE"):
+    from node_manager import DockerBackend, FakeBackend, NodeManager
+    if os.environ["CLUSTER_AUTOSCALE"] not in ("docker", "fake"):
+        raise RuntimeError("CLUSTER_AUTOSCALE must be docker or fake")
+    backend = DockerBackend() if os.environ["CLUSTER_AUTOSCALE"] == "docker" else FakeBackend()
+    shapes = [parse_shape(shape) for shape in os.environ.get("CLUSTER_NODE_SHAPES", "8").split()]
+    manager = NodeManager(backend, pool_size=int(os.environ.get("CLUSTER_WARM_NODES", 0)), shapes=shapes)
+    enable_autoscaling(manager, shapes=shapes,
+                       min_nodes=int(os.environ.get("CLUSTER_MIN_NODES", 0)),
+                       max_nodes=int(os.environ.get("CLUSTER_MAX_NODES", 100)))
+if os.environ.get("CLUSTER_OVERCOMMIT"):
+    enable_usage_packing(float(os.environ["CLUSTER_OVERCOMMIT"]))
+start_background()